@@ -6,6 +6,7 @@ Handles persistence of emails, providers, folders, and sync logs.
 import sqlite3
 import json
 import logging
+import re
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from pathlib import Path
@@ -15,6 +16,46 @@ from .providers.base import EmailMessage, EmailFolder, ProviderType
 
 logger = logging.getLogger(__name__)
 
+# Subquery for an email's attachment filenames, shared by the emails_fts
+# triggers and the backfill so both index exactly the same text.
+_FTS_ATTACHMENTS_SQL = (
+    "(SELECT group_concat(filename, ' ') FROM email_attachments WHERE email_id = {ref})"
+)
+
+_FTS_BACKFILL_SQL = f"""
+    INSERT INTO emails_fts (rowid, subject, sender, body, attachments)
+    SELECT e.id, e.subject,
+           COALESCE(e.from_address, '') || ' ' || COALESCE(e.from_name, ''),
+           COALESCE(e.body_text, e.body_preview, ''),
+           {_FTS_ATTACHMENTS_SQL.format(ref='e.id')}
+    FROM emails e
+"""
+
+
+def _build_fts_query(search: str) -> Optional[str]:
+    """
+    Turn free text typed into the inbox search box into an FTS5 MATCH query.
+
+    Every word becomes a quoted prefix term so partially typed words still
+    match ("gocard" finds "gocardless") and FTS5 operators typed by the user
+    are treated as plain text.  Returns None when there is nothing to search.
+    """
+    tokens = re.findall(r'\w+', search or '', flags=re.UNICODE)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _encode_cursor(received_at: Optional[str], email_id: int) -> str:
+    """Encode a keyset pagination cursor for the (received_at, id) ordering."""
+    return f"{received_at or ''}|{email_id}"
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by _encode_cursor. Raises ValueError if malformed."""
+    received_at, _, email_id = cursor.rpartition('|')
+    return received_at, int(email_id)
+
 
 class EmailStorage:
     """
@@ -29,6 +70,7 @@ class EmailStorage:
             db_path: Path to SQLite database file
         """
         self.db_path = Path(db_path)
+        self.fts_enabled = False
         self._init_database()
 
     @contextmanager
@@ -593,9 +635,102 @@ class EmailStorage:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_ignored_bank_txn ON ignored_bank_transactions(bank_account, transaction_date, amount)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_bank_stmt_txn_import ON bank_statement_transactions(import_id)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_bank_import_drafts_bank ON bank_import_drafts(bank_code)")
+            # Keyset pagination orders on COALESCE(received_at, '') so rows without a date still page
+            cursor.execute("DROP INDEX IF EXISTS idx_emails_received_id")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_received_key ON emails(COALESCE(received_at, '') DESC, id DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_attachments_email ON email_attachments(email_id)")
+
+            self.fts_enabled = self._init_fts(cursor)
 
             logger.info(f"Email database initialized at {self.db_path}")
 
+    def _init_fts(self, cursor) -> bool:
+        """
+        Create the emails_fts full-text index and the triggers that keep it in sync.
+
+        The index holds subject, sender (address and display name), body text and
+        attachment filenames, keyed by emails.id as rowid.  Existing mailboxes are
+        backfilled the first time the index is created.  Returns False if this
+        SQLite build has no FTS5, in which case searches fall back to LIKE.
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emails_fts'"
+        )
+        exists = cursor.fetchone() is not None
+
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                    subject,
+                    sender,
+                    body,
+                    attachments,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 not available, email search will use LIKE: {e}")
+            return False
+
+        new_row = (
+            "NEW.subject, "
+            "COALESCE(NEW.from_address, '') || ' ' || COALESCE(NEW.from_name, ''), "
+            "COALESCE(NEW.body_text, NEW.body_preview, '')"
+        )
+        attachments_new = _FTS_ATTACHMENTS_SQL.format(ref='NEW.id')
+        attachments_for = _FTS_ATTACHMENTS_SQL.format(ref='NEW.email_id')
+        attachments_old = _FTS_ATTACHMENTS_SQL.format(ref='OLD.email_id')
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS emails_fts_ai AFTER INSERT ON emails BEGIN
+                INSERT INTO emails_fts (rowid, subject, sender, body, attachments)
+                VALUES (NEW.id, {new_row}, {attachments_new});
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN
+                DELETE FROM emails_fts WHERE rowid = OLD.id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS emails_fts_au
+            AFTER UPDATE OF subject, from_address, from_name, body_text, body_preview ON emails BEGIN
+                DELETE FROM emails_fts WHERE rowid = OLD.id;
+                INSERT INTO emails_fts (rowid, subject, sender, body, attachments)
+                VALUES (NEW.id, {new_row}, {attachments_new});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS email_attachments_fts_ai AFTER INSERT ON email_attachments BEGIN
+                UPDATE emails_fts SET attachments = {attachments_for} WHERE rowid = NEW.email_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS email_attachments_fts_ad AFTER DELETE ON email_attachments BEGIN
+                UPDATE emails_fts SET attachments = {attachments_old} WHERE rowid = OLD.email_id;
+            END
+        """)
+
+        if not exists:
+            cursor.execute(_FTS_BACKFILL_SQL)
+            if cursor.rowcount > 0:
+                logger.info(f"Backfilled email search index with {cursor.rowcount} emails")
+
+        return True
+
+    def rebuild_search_index(self) -> int:
+        """Drop and repopulate the email full-text index. Returns the number of emails indexed."""
+        if not self.fts_enabled:
+            return 0
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM emails_fts")
+            cursor.execute(_FTS_BACKFILL_SQL)
+            indexed = cursor.rowcount
+            cursor.execute("INSERT INTO emails_fts (emails_fts) VALUES ('optimize')")
+            return indexed
+
     # ==================== Provider Methods ====================
 
     def add_provider(
@@ -787,11 +922,22 @@ class EmailStorage:
         search: Optional[str] = None,
         has_attachments: Optional[bool] = None,
         page: int = 1,
-        page_size: int = 50
+        page_size: int = 50,
+        cursor: Optional[str] = None,
+        include_total: bool = True
     ) -> Dict[str, Any]:
-        """Get emails with filtering and pagination."""
+        """
+        Get emails with filtering and pagination, newest first.
+
+        Search uses the emails_fts index when available.  Pass the
+        ``next_cursor`` from a previous result as ``cursor`` to page by
+        keyset on (received_at, id) instead of OFFSET, which stays fast deep
+        into large mailboxes.  Emails with no received_at sort last.
+        ``include_total=False`` skips the COUNT query for callers (e.g.
+        infinite scroll) that don't need it.
+        """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
+            db_cursor = conn.cursor()
 
             conditions = []
             params = []
@@ -825,9 +971,15 @@ class EmailStorage:
                 params.append(to_date.isoformat())
 
             if search:
-                conditions.append("(e.subject LIKE ? OR e.from_address LIKE ? OR e.body_preview LIKE ?)")
-                search_param = f"%{search}%"
-                params.extend([search_param, search_param, search_param])
+                if self.fts_enabled:
+                    fts_query = _build_fts_query(search)
+                    if fts_query:
+                        conditions.append("e.id IN (SELECT rowid FROM emails_fts WHERE emails_fts MATCH ?)")
+                        params.append(fts_query)
+                else:
+                    conditions.append("(e.subject LIKE ? OR e.from_address LIKE ? OR e.body_preview LIKE ?)")
+                    search_param = f"%{search}%"
+                    params.extend([search_param, search_param, search_param])
 
             if has_attachments is not None:
                 conditions.append("e.has_attachments = ?")
@@ -835,25 +987,39 @@ class EmailStorage:
 
             where_clause = " AND ".join(conditions) if conditions else "1=1"
 
-            # Get total count
-            cursor.execute(f"""
-                SELECT COUNT(*) as total FROM emails e WHERE {where_clause}
-            """, params)
-            total = cursor.fetchone()['total']
+            total = None
+            if include_total:
+                db_cursor.execute(f"""
+                    SELECT COUNT(*) as total FROM emails e WHERE {where_clause}
+                """, params)
+                total = db_cursor.fetchone()['total']
+
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if cursor:
+                cursor_received, cursor_id = _decode_cursor(cursor)
+                page_conditions.append(
+                    "(COALESCE(e.received_at, '') < ? OR (COALESCE(e.received_at, '') = ? AND e.id < ?))")
+                page_params.extend([cursor_received, cursor_received, cursor_id])
+                offset = 0
+            else:
+                offset = (page - 1) * page_size
+            page_where = " AND ".join(page_conditions) if page_conditions else "1=1"
 
-            # Get paginated results
-            offset = (page - 1) * page_size
-            cursor.execute(f"""
+            # Fetch one extra row to know whether another page follows
+            db_cursor.execute(f"""
                 SELECT e.*, p.name as provider_name
                 FROM emails e
                 JOIN email_providers p ON e.provider_id = p.id
-                WHERE {where_clause}
-                ORDER BY e.received_at DESC
+                WHERE {page_where}
+                ORDER BY COALESCE(e.received_at, '') DESC, e.id DESC
                 LIMIT ? OFFSET ?
-            """, params + [page_size, offset])
+            """, page_params + [page_size + 1, offset])
 
+            rows = db_cursor.fetchall()
+            has_more = len(rows) > page_size
             emails = []
-            for row in cursor.fetchall():
+            for row in rows[:page_size]:
                 email = dict(row)
                 if email.get('to_addresses'):
                     email['to_addresses'] = json.loads(email['to_addresses'])
@@ -861,14 +1027,63 @@ class EmailStorage:
                     email['cc_addresses'] = json.loads(email['cc_addresses'])
                 emails.append(email)
 
+            next_cursor = None
+            if has_more and emails:
+                next_cursor = _encode_cursor(emails[-1]['received_at'], emails[-1]['id'])
+
             return {
                 'emails': emails,
                 'total': total,
                 'page': page,
                 'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size
+                'total_pages': (total + page_size - 1) // page_size if total is not None else None,
+                'next_cursor': next_cursor
             }
 
+    def search_emails(
+        self,
+        query: str,
+        provider_id: Optional[int] = None,
+        category: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Relevance-ranked full-text search across subject, sender, body and attachment names.
+
+        Subject and sender hits rank above body hits.  Each result carries a
+        ``rank`` (lower is better) and a highlighted ``snippet`` of the body.
+        Returns an empty list when the query is empty or FTS5 is unavailable.
+        """
+        fts_query = _build_fts_query(query)
+        if not fts_query or not self.fts_enabled:
+            return []
+
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+
+            conditions = ["emails_fts MATCH ?"]
+            params: List[Any] = [fts_query]
+            if provider_id is not None:
+                conditions.append("e.provider_id = ?")
+                params.append(provider_id)
+            if category is not None:
+                conditions.append("e.category = ?")
+                params.append(category)
+
+            cursor.execute(f"""
+                SELECT e.id, e.provider_id, e.folder_id, e.from_address, e.from_name,
+                       e.subject, e.body_preview, e.received_at, e.is_read,
+                       e.has_attachments, e.category, e.linked_account,
+                       bm25(emails_fts, 10.0, 5.0, 1.0, 3.0) as rank,
+                       snippet(emails_fts, 2, '[', ']', '...', 12) as snippet
+                FROM emails_fts
+                JOIN emails e ON e.id = emails_fts.rowid
+                WHERE {' AND '.join(conditions)}
+                ORDER BY rank, e.received_at DESC, e.id DESC
+                LIMIT ?
+            """, params + [limit])
+            return [dict(row) for row in cursor.fetchall()]
+
     def get_emails_with_attachments(
         self,
         from_date: Optional[datetime] = None,
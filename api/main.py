@@ -30,6 +30,7 @@ import pandas as pd
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sql_rag.sql_connector import SQLConnector
+from sql_rag.connection_pools import ConnectionPoolRegistry
 from sql_rag.vector_db import VectorDB
 from sql_rag.llm import create_llm_instance
 
@@ -120,7 +121,8 @@ _request_company_id: contextvars.ContextVar[Optional[str]] = contextvars.Context
 
 # Registry of per-company resources (sql_connector, email_storage, etc.)
 # Keyed by company_id, lazily populated on first company switch or startup.
-_company_sql_connectors: Dict[str, SQLConnector] = {}
+# SQL connectors live in a pool registry (warmup + global connection budget).
+_company_sql_connectors: ConnectionPoolRegistry = ConnectionPoolRegistry()
 _company_email_storages: Dict[str, 'EmailStorage'] = {}
 _company_email_sync_managers: Dict[str, 'EmailSyncManager'] = {}
 _company_data: Dict[str, Dict[str, Any]] = {}  # company_id -> company dict
@@ -539,6 +541,7 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting SQL RAG API...")
     config = load_config()
+    _company_sql_connectors.configure(config)
 
     # Initialise active system from systems.json — match against config.ini server/database
     try:
@@ -1784,6 +1787,24 @@ async def list_active_sessions(request: Request):
         return {"success": False, "error": str(e)}
 
 
+@app.get("/api/admin/connection-pools")
+async def get_connection_pools(request: Request):
+    """Connection pool status for every company, with totals against the budget. Admin only."""
+    user = getattr(request.state, 'user', None)
+    if not user or not user.get('is_admin'):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"success": True, **_company_sql_connectors.status()}
+
+
+@app.post("/api/admin/connection-pools/warm")
+async def warm_connection_pools(request: Request, limit: int = Query(3, ge=1, le=20)):
+    """Pre-open connections for the most recently used companies. Admin only."""
+    user = getattr(request.state, 'user', None)
+    if not user or not user.get('is_admin'):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"success": True, "warming": _company_sql_connectors.warm_recent(limit)}
+
+
 @app.delete("/api/admin/sessions/{user_id}")
 async def clear_user_session(request: Request, user_id: int):
     """Clear all sessions for a specific user. Admin only."""
@@ -6120,9 +6141,11 @@ async def list_emails(
     to_date: Optional[str] = None,
     search: Optional[str] = None,
     page: int = 1,
-    page_size: int = 50
+    page_size: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
-    """List emails with filtering and pagination."""
+    """List emails with filtering and pagination (page number or keyset cursor)."""
     if not email_storage:
         raise HTTPException(status_code=503, detail="Email storage not initialized")
 
@@ -6141,7 +6164,9 @@ async def list_emails(
             to_date=to_dt,
             search=search,
             page=page,
-            page_size=page_size
+            page_size=page_size,
+            cursor=cursor,
+            include_total=include_total
         )
 
         # Add customer names for linked emails
@@ -6155,6 +6180,28 @@ async def list_emails(
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+@app.get("/api/email/search")
+async def search_emails(
+    q: str,
+    provider_id: Optional[int] = None,
+    category: Optional[str] = None,
+    limit: int = 50
+):
+    """Relevance-ranked full-text search over subject, sender, body and attachment names."""
+    if not email_storage:
+        raise HTTPException(status_code=503, detail="Email storage not initialized")
+
+    try:
+        results = email_storage.search_emails(
+            q,
+            provider_id=provider_id,
+            category=category,
+            limit=min(limit, 200)
+        )
+        return {"success": True, "emails": results, "count": len(results)}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
 @app.get("/api/email/messages/{email_id}")
 async def get_email_detail(email_id: int):
     """Get full email details."""
@@ -8958,6 +9005,11 @@ async def import_sales_receipts_batch(request: SalesReceiptBatchRequest):
     """
     Import multiple sales receipts into Opera SQL SE.
 
+    Receipts that fail validation are reported in `errors` ("Receipt N: ...")
+    and skipped. All valid receipts are posted in ONE transaction
+    (`"atomic": true` in the response): if posting fails none of them are
+    posted, and each gets a "Receipt N: Not posted - batch rolled back" error.
+
     Example request:
     {
         "receipts": [
@@ -8993,6 +9045,7 @@ async def import_sales_receipts_batch(request: SalesReceiptBatchRequest):
         return {
             "success": result.success,
             "validate_only": request.validate_only,
+            "atomic": True,  # valid receipts are posted all together or not at all
             "records_processed": result.records_processed,
             "records_imported": result.records_imported,
             "records_failed": result.records_failed,
@@ -10836,6 +10889,12 @@ async def get_import_locks_status():
     from sql_rag.import_lock import get_active_locks
     return {"locks": get_active_locks()}
 
+@app.get("/api/sql-statements/stats")
+async def get_sql_statement_stats():
+    """Call counts and timing per registered SQL statement (diagnostic)."""
+    from sql_rag.sql_statements import get_statement_stats
+    return {"statements": get_statement_stats()}
+
 # ============================================================
 # Opera 3 FoxPro API Endpoints
 # ============================================================
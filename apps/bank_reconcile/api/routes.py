@@ -2793,7 +2793,181 @@ async def list_pdf_files(
         return {"success": False, "files": [], "error": str(e)}
 
 
+class ExtractionJobRequest(BaseModel):
+    """Request body for queueing background PDF extraction."""
+    file_paths: List[str] = []
+    directory: Optional[str] = None
+
+
+def _resolve_extraction_files(body: ExtractionJobRequest) -> List[str]:
+    """Explicit file paths, or every PDF in the directory when none are given."""
+    if body.file_paths:
+        return [p for p in body.file_paths if Path(p).is_file()]
+    if body.directory and os.path.isdir(body.directory):
+        return sorted(
+            str(p) for p in Path(body.directory).iterdir()
+            if p.is_file() and p.suffix.lower() == '.pdf'
+        )
+    return []
+
+
+@router.post("/api/bank-import/extraction-jobs")
+async def create_bank_extraction_job(body: ExtractionJobRequest):
+    """
+    Queue bank statement PDFs for background extraction.
+
+    Returns immediately with a job id. Results land in the PDF extraction
+    cache, so a later preview-from-pdf for the same file is instant.
+    Poll GET /api/bank-import/extraction-jobs/{job_id} for progress.
+    """
+    try:
+        from sql_rag.statement_reconcile import StatementReconciler
+        from sql_rag.extraction_queue import get_extraction_queue
+
+        files = _resolve_extraction_files(body)
+        if not files:
+            return {"success": False, "error": "No PDF files found to extract"}
+
+        reconciler = StatementReconciler(sql_connector, config=config)
+        queue = get_extraction_queue(config)
+        company = current_company.get('id') if current_company else None
+        job = queue.submit_bank_job(reconciler, files, company=company)
+        return {"success": True, "job": job.to_dict(include_items=False)}
+    except Exception as e:
+        logger.error(f"Error creating extraction job: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@router.get("/api/bank-import/extraction-jobs")
+async def list_extraction_jobs(kind: Optional[str] = None):
+    """List recent background extraction jobs (newest first)."""
+    from sql_rag.extraction_queue import get_extraction_queue
+    jobs = get_extraction_queue(config).list_jobs(kind=kind)
+    return {"success": True, "jobs": [j.to_dict(include_items=False) for j in jobs]}
+
+
+@router.get("/api/bank-import/extraction-jobs/{job_id}")
+async def get_extraction_job(job_id: str):
+    """Progress of a background extraction job, with per-file status."""
+    from sql_rag.extraction_queue import get_extraction_queue
+    job = get_extraction_queue(config).get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Extraction job not found")
+    return {"success": True, "job": job.to_dict()}
+
+
+@router.delete("/api/bank-import/extraction-jobs/{job_id}")
+async def cancel_extraction_job(job_id: str):
+    """Cancel files in a job that have not started extracting yet."""
+    from sql_rag.extraction_queue import get_extraction_queue
+    if not get_extraction_queue(config).cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Extraction job not found")
+    return {"success": True}
+
+
+
+
+
+class StatementImportJob(BaseModel):
+    """One statement in a queued import: the same options as import-from-pdf."""
+    file_path: str
+    bank_code: str
+    auto_allocate: bool = False
+    auto_reconcile: bool = False
+    resume_import_id: Optional[int] = None
+    overrides: List[Dict[str, Any]] = []
+    selected_rows: List[int] = []
+    date_overrides: List[Dict[str, Any]] = []
+    rejected_refund_rows: List[int] = []
+    skip_overlap_check: bool = False
+
+
+class ImportJobsRequest(BaseModel):
+    """Request body for queueing statement imports across bank accounts."""
+    jobs: List[StatementImportJob]
+
 
+@router.post("/api/bank-import/import-jobs")
+async def create_import_jobs(request: Request, body: ImportJobsRequest):
+    """
+    Queue PDF statement imports for one or more bank accounts.
+
+    Statements for different banks are imported concurrently; statements for
+    the same bank run one after another in the order given. Returns
+    immediately with job ids. Poll GET /api/bank-import/import-jobs for
+    queue and progress state.
+    """
+    if not sql_connector:
+        raise HTTPException(status_code=503, detail="No database connection")
+
+    from sql_rag.import_scheduler import ImportJobFailed, get_import_scheduler
+
+    scheduler = get_import_scheduler(config)
+    current_user = getattr(request.state, 'user', None)
+    imported_by = current_user.get('username', 'Unknown') if current_user else 'Unknown'
+    company = current_company.get('id') if current_company else None
+    # Pin the company's resources now: the module globals are swapped on company switch
+    connector, storage = sql_connector, email_storage
+
+    jobs, errors = [], []
+    for spec in body.jobs:
+        if not os.path.exists(spec.file_path):
+            errors.append({"file_path": spec.file_path, "error": f"File not found: {spec.file_path}"})
+            continue
+        options = {
+            'overrides': spec.overrides,
+            'selected_rows': spec.selected_rows,
+            'date_overrides': spec.date_overrides,
+            'rejected_refund_rows': spec.rejected_refund_rows,
+            'skip_overlap_check': spec.skip_overlap_check,
+        }
+
+        def run(job, spec=spec, options=options):
+            result = _import_statement_pdf(
+                connector, storage, spec.file_path, spec.bank_code, options,
+                auto_allocate=spec.auto_allocate, auto_reconcile=spec.auto_reconcile,
+                resume_import_id=spec.resume_import_id, imported_by=imported_by,
+                progress=job.set_progress,
+            )
+            if not result.get('success') and not result.get('imported_count'):
+                # Nothing posted: surface the error so lock contention is retried
+                raise ImportJobFailed(result.get('error') or 'Import failed', result)
+            return result
+
+        job = scheduler.submit(spec.bank_code, run, lock_key=_bank_lock_key(spec.bank_code),
+                               label=os.path.basename(spec.file_path), company=company)
+        jobs.append(job.to_dict(include_result=False))
+
+    return {"success": bool(jobs), "jobs": jobs, "errors": errors, "queue": scheduler.queue_state()}
+
+
+@router.get("/api/bank-import/import-jobs")
+async def list_import_jobs(bank_code: Optional[str] = None):
+    """Queued and recent statement imports (newest first) with per-bank queue state."""
+    from sql_rag.import_scheduler import get_import_scheduler
+    scheduler = get_import_scheduler(config)
+    jobs = scheduler.list_jobs(bank_code=bank_code)
+    return {"success": True, "jobs": [j.to_dict(include_result=False) for j in jobs],
+            "queue": scheduler.queue_state()}
+
+
+@router.get("/api/bank-import/import-jobs/{job_id}")
+async def get_import_job(job_id: str):
+    """Progress of a queued statement import, with the import result once finished."""
+    from sql_rag.import_scheduler import get_import_scheduler
+    job = get_import_scheduler(config).get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return {"success": True, "job": job.to_dict()}
+
+
+@router.delete("/api/bank-import/import-jobs/{job_id}")
+async def cancel_import_job(job_id: str):
+    """Cancel a queued statement import that has not started."""
+    from sql_rag.import_scheduler import get_import_scheduler
+    if not get_import_scheduler(config).cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Import job not found or already started")
+    return {"success": True}
 
 
 @router.post("/api/bank-import/draft")
@@ -3373,14 +3547,37 @@ async def import_bank_statement_from_pdf(
     if not os.path.exists(file_path):
         return {"success": False, "error": f"File not found: {file_path}"}
 
+    # Get request body for overrides
+    body = await request.json() if request.headers.get('content-type') == 'application/json' else {}
+    current_user = getattr(request.state, 'user', None)
+    imported_by = current_user.get('username', 'Unknown') if current_user else 'Unknown'
+
+    return _import_statement_pdf(
+        sql_connector, email_storage, file_path, bank_code, body,
+        auto_allocate=auto_allocate, auto_reconcile=auto_reconcile,
+        resume_import_id=resume_import_id, imported_by=imported_by,
+        lock_key=_bank_lock_key(bank_code),
+    )
+
+
+def _import_statement_pdf(sql_connector, email_storage, file_path: str, bank_code: str, body: dict,
+                          auto_allocate: bool = False, auto_reconcile: bool = False,
+                          resume_import_id: Optional[int] = None, imported_by: str = 'Unknown',
+                          lock_key: Optional[str] = None, progress=None) -> dict:
+    """
+    Import a bank statement PDF into Opera SE (body of import-from-pdf).
+
+    The connector and email storage are passed in so scheduled imports keep
+    the company they were queued for. When lock_key is given the bank import
+    lock is taken here; the import scheduler passes None as it already holds
+    the lock. progress(done, total) is called as each line is processed.
+    """
     try:
         from sql_rag.bank_import import BankStatementImport
         from sql_rag.statement_reconcile import StatementReconciler
 
         filename = os.path.basename(file_path)
 
-        # Get request body for overrides
-        body = await request.json() if request.headers.get('content-type') == 'application/json' else {}
         overrides = body.get('overrides', [])
         selected_rows = body.get('selected_rows', [])
         date_overrides = body.get('date_overrides', [])
@@ -3505,7 +3702,7 @@ async def import_bank_statement_from_pdf(
 
         # Acquire bank-level import lock to prevent concurrent imports
         from sql_rag.import_lock import acquire_import_lock, release_import_lock
-        if not acquire_import_lock(_bank_lock_key(bank_code), locked_by="api", endpoint="import-from-pdf"):
+        if lock_key and not acquire_import_lock(lock_key, locked_by="api", endpoint="import-from-pdf"):
             return {"success": False, "error": f"Bank account {bank_code} is currently being imported by another user. Please wait for the current import to complete."}
 
         # Load already-posted lines for partial recovery (skip on resume)
@@ -3526,168 +3723,172 @@ async def import_bank_statement_from_pdf(
         skipped_duplicates = 0
         skipped_already_posted = 0
 
-        for txn in transactions:
-            # Skip rows not in selected_rows (if specified)
-            if selected_rows_set is not None and txn.row_number not in selected_rows_set:
-                skipped_not_selected += 1
-                continue
+        with importer.reference_data(transactions):
+            for done, txn in enumerate(transactions):
+                if progress:
+                    progress(done, len(transactions))
 
-            # Skip already-posted lines (partial recovery resume)
-            if txn.row_number in already_posted:
-                skipped_already_posted += 1
-                imported.append({
-                    "row": txn.row_number,
-                    "date": txn.date.isoformat(),
-                    "amount": txn.amount,
-                    "account": txn.manual_account or txn.matched_account or '',
-                    "account_name": txn.matched_name or '',
-                    "action": txn.action,
-                    "entry_number": already_posted[txn.row_number],
-                    "name": txn.name or '',
-                    "already_posted": True
-                })
-                continue
+                # Skip rows not in selected_rows (if specified)
+                if selected_rows_set is not None and txn.row_number not in selected_rows_set:
+                    skipped_not_selected += 1
+                    continue
 
-            # Skip rejected refunds
-            if txn.row_number in rejected_refund_set:
-                continue
+                # Skip already-posted lines (partial recovery resume)
+                if txn.row_number in already_posted:
+                    skipped_already_posted += 1
+                    imported.append({
+                        "row": txn.row_number,
+                        "date": txn.date.isoformat(),
+                        "amount": txn.amount,
+                        "account": txn.manual_account or txn.matched_account or '',
+                        "account_name": txn.matched_name or '',
+                        "action": txn.action,
+                        "entry_number": already_posted[txn.row_number],
+                        "name": txn.name or '',
+                        "already_posted": True
+                    })
+                    continue
 
-            # Handle bank transfers separately (paired entries in two banks)
-            if txn.action == 'bank_transfer' and not txn.is_duplicate:
-                bt_details = getattr(txn, 'bank_transfer_details', {}) or {}
-                dest_bank = bt_details.get('dest_bank') or txn.manual_account
-                if not dest_bank:
-                    errors.append({"row": txn.row_number, "error": "Bank transfer missing destination bank"})
+                # Skip rejected refunds
+                if txn.row_number in rejected_refund_set:
                     continue
 
-                amount = abs(txn.amount)
-                # Direction: negative = paying out (current bank is source), positive = receiving in
-                if txn.amount < 0:
-                    source, dest = bank_code, dest_bank
-                else:
-                    source, dest = dest_bank, bank_code
+                # Handle bank transfers separately (paired entries in two banks)
+                if txn.action == 'bank_transfer' and not txn.is_duplicate:
+                    bt_details = getattr(txn, 'bank_transfer_details', {}) or {}
+                    dest_bank = bt_details.get('dest_bank') or txn.manual_account
+                    if not dest_bank:
+                        errors.append({"row": txn.row_number, "error": "Bank transfer missing destination bank"})
+                        continue
 
-                try:
-                    from sql_rag.opera_sql_import import OperaSQLImport
-                    opera_import = OperaSQLImport(sql_connector)
-                    bt_result = opera_import.import_bank_transfer(
-                        source_bank=source,
-                        dest_bank=dest,
-                        amount_pounds=amount,
-                        reference=(bt_details.get('reference') or txn.reference or '')[:20],
-                        post_date=txn.date,
-                        comment=(bt_details.get('comment') or txn.memo or '')[:50],
-                        input_by='SQLRAG'
-                    )
-                    if bt_result.get('success'):
-                        imported.append({
-                            "row": txn.row_number,
-                            "date": txn.date.isoformat() if txn.date else None,
-                            "amount": txn.amount,
-                            "account": dest_bank if txn.amount < 0 else source,
-                            "account_name": f"Transfer {'to' if txn.amount < 0 else 'from'} {dest_bank if txn.amount < 0 else source}",
-                            "action": 'bank_transfer',
-                            "entry_number": bt_result.get('source_entry') or bt_result.get('dest_entry'),
-                            "name": txn.name or '',
-                            "memo": txn.memo or '',
-                            "reference": txn.reference or '',
-                            "allocated": False,
-                            "allocation_result": None
-                        })
+                    amount = abs(txn.amount)
+                    # Direction: negative = paying out (current bank is source), positive = receiving in
+                    if txn.amount < 0:
+                        source, dest = bank_code, dest_bank
                     else:
-                        errors.append({"row": txn.row_number, "error": bt_result.get('error', 'Bank transfer failed')})
-                except Exception as e:
-                    errors.append({"row": txn.row_number, "error": f"Bank transfer error: {str(e)}"})
-                continue
+                        source, dest = dest_bank, bank_code
 
-            if txn.action in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt') and not txn.is_duplicate:
-                account = txn.manual_account or txn.matched_account
-                if not account:
-                    skipped_incomplete += 1
-                    errors.append({"row": txn.row_number, "error": "Missing account"})
+                    try:
+                        from sql_rag.opera_sql_import import OperaSQLImport
+                        opera_import = OperaSQLImport(sql_connector)
+                        bt_result = opera_import.import_bank_transfer(
+                            source_bank=source,
+                            dest_bank=dest,
+                            amount_pounds=amount,
+                            reference=(bt_details.get('reference') or txn.reference or '')[:20],
+                            post_date=txn.date,
+                            comment=(bt_details.get('comment') or txn.memo or '')[:50],
+                            input_by='SQLRAG'
+                        )
+                        if bt_result.get('success'):
+                            imported.append({
+                                "row": txn.row_number,
+                                "date": txn.date.isoformat() if txn.date else None,
+                                "amount": txn.amount,
+                                "account": dest_bank if txn.amount < 0 else source,
+                                "account_name": f"Transfer {'to' if txn.amount < 0 else 'from'} {dest_bank if txn.amount < 0 else source}",
+                                "action": 'bank_transfer',
+                                "entry_number": bt_result.get('source_entry') or bt_result.get('dest_entry'),
+                                "name": txn.name or '',
+                                "memo": txn.memo or '',
+                                "reference": txn.reference or '',
+                                "allocated": False,
+                                "allocation_result": None
+                            })
+                        else:
+                            errors.append({"row": txn.row_number, "error": bt_result.get('error', 'Bank transfer failed')})
+                    except Exception as e:
+                        errors.append({"row": txn.row_number, "error": f"Bank transfer error: {str(e)}"})
                     continue
 
-                # Just-in-time duplicate check - catches entries that appeared since statement was processed
-                try:
-                    from sql_rag.opera_sql_import import OperaSQLImport as _OI
-                    _oi = _OI(sql_connector)
-                    acct_type = ('customer' if txn.action == 'sales_receipt'
-                                else 'customer_refund' if txn.action == 'sales_refund'
-                                else 'supplier' if txn.action == 'purchase_payment'
-                                else 'supplier_refund' if txn.action == 'purchase_refund'
-                                else 'transfer' if txn.action == 'bank_transfer'
-                                else 'nominal')
-                    dup_check = _oi.check_duplicate_before_posting(
-                        bank_account=bank_code,
-                        transaction_date=txn.date,
-                        amount_pounds=abs(txn.amount),
-                        account_code=account,
-                        account_type=acct_type,
-                        description=txn.name or ''
-                    )
-                    if dup_check['is_duplicate']:
-                        skipped_duplicates += 1
-                        errors.append({"row": txn.row_number, "error": f"Skipped - {dup_check['details']}"})
-                        logger.warning(f"Row {txn.row_number}: Pre-posting duplicate detected - {dup_check['details']}")
+                if txn.action in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt') and not txn.is_duplicate:
+                    account = txn.manual_account or txn.matched_account
+                    if not account:
+                        skipped_incomplete += 1
+                        errors.append({"row": txn.row_number, "error": "Missing account"})
                         continue
-                except Exception as dup_err:
-                    logger.warning(f"Row {txn.row_number}: Pre-posting duplicate check failed: {dup_err}")
 
-                try:
-                    result = importer.import_transaction(txn, validate_only=False)
-                    if result.success:
-                        import_record = {
-                            "row": txn.row_number,
-                            "date": txn.date.isoformat() if txn.date else None,
-                            "amount": txn.amount,
-                            "account": txn.manual_account or txn.matched_account,
-                            "account_name": txn.matched_name or '',
-                            "action": txn.action,
-                            "batch_ref": getattr(result, 'batch_ref', None) or getattr(result, 'batch_number', None),
-                            "entry_number": getattr(result, 'entry_number', None),
-                            "name": txn.name or '',
-                            "memo": txn.memo or '',
-                            "reference": txn.reference or '',
-                            "allocated": False,
-                            "allocation_result": None
-                        }
+                    # Just-in-time duplicate check - catches entries that appeared since statement was processed
+                    try:
+                        from sql_rag.opera_sql_import import OperaSQLImport as _OI
+                        _oi = _OI(sql_connector)
+                        acct_type = ('customer' if txn.action == 'sales_receipt'
+                                    else 'customer_refund' if txn.action == 'sales_refund'
+                                    else 'supplier' if txn.action == 'purchase_payment'
+                                    else 'supplier_refund' if txn.action == 'purchase_refund'
+                                    else 'transfer' if txn.action == 'bank_transfer'
+                                    else 'nominal')
+                        dup_check = _oi.check_duplicate_before_posting(
+                            bank_account=bank_code,
+                            transaction_date=txn.date,
+                            amount_pounds=abs(txn.amount),
+                            account_code=account,
+                            account_type=acct_type,
+                            description=txn.name or ''
+                        )
+                        if dup_check['is_duplicate']:
+                            skipped_duplicates += 1
+                            errors.append({"row": txn.row_number, "error": f"Skipped - {dup_check['details']}"})
+                            logger.warning(f"Row {txn.row_number}: Pre-posting duplicate detected - {dup_check['details']}")
+                            continue
+                    except Exception as dup_err:
+                        logger.warning(f"Row {txn.row_number}: Pre-posting duplicate check failed: {dup_err}")
 
-                        # Auto-allocate if enabled
-                        if auto_allocate and txn.action in ('sales_receipt', 'purchase_payment'):
-                            from sql_rag.opera_sql_import import OperaSQLImport
-                            opera_import = OperaSQLImport(sql_connector)
-                            account_code = txn.manual_account or txn.matched_account
-                            txn_ref = getattr(result, 'transaction_ref', None) or txn.reference or txn.name[:20]
-
-                            if txn.action == 'sales_receipt':
-                                alloc_result = opera_import.auto_allocate_receipt(
-                                    customer_account=account_code,
-                                    receipt_ref=txn_ref,
-                                    receipt_amount=abs(txn.amount),
-                                    allocation_date=txn.date,
-                                    bank_account=bank_code,
-                                    description=txn.memo or txn.name
-                                )
-                                import_record["allocated"] = alloc_result.get("success", False)
-                                import_record["allocation_result"] = alloc_result
-                            elif txn.action == 'purchase_payment':
-                                alloc_result = opera_import.auto_allocate_payment(
-                                    supplier_account=account_code,
-                                    payment_ref=txn_ref,
-                                    payment_amount=abs(txn.amount),
-                                    allocation_date=txn.date,
-                                    bank_account=bank_code,
-                                    description=txn.memo or txn.name
-                                )
-                                import_record["allocated"] = alloc_result.get("success", False)
-                                import_record["allocation_result"] = alloc_result
+                    try:
+                        result = importer.import_transaction(txn, validate_only=False)
+                        if result.success:
+                            import_record = {
+                                "row": txn.row_number,
+                                "date": txn.date.isoformat() if txn.date else None,
+                                "amount": txn.amount,
+                                "account": txn.manual_account or txn.matched_account,
+                                "account_name": txn.matched_name or '',
+                                "action": txn.action,
+                                "batch_ref": getattr(result, 'batch_ref', None) or getattr(result, 'batch_number', None),
+                                "entry_number": getattr(result, 'entry_number', None),
+                                "name": txn.name or '',
+                                "memo": txn.memo or '',
+                                "reference": txn.reference or '',
+                                "allocated": False,
+                                "allocation_result": None
+                            }
 
-                        imported.append(import_record)
-                    else:
-                        error_msg = '; '.join(result.errors) if result.errors else 'Import failed'
-                        errors.append({"row": txn.row_number, "error": error_msg})
-                except Exception as e:
-                    errors.append({"row": txn.row_number, "error": str(e)})
+                            # Auto-allocate if enabled
+                            if auto_allocate and txn.action in ('sales_receipt', 'purchase_payment'):
+                                from sql_rag.opera_sql_import import OperaSQLImport
+                                opera_import = OperaSQLImport(sql_connector)
+                                account_code = txn.manual_account or txn.matched_account
+                                txn_ref = getattr(result, 'transaction_ref', None) or txn.reference or txn.name[:20]
+
+                                if txn.action == 'sales_receipt':
+                                    alloc_result = opera_import.auto_allocate_receipt(
+                                        customer_account=account_code,
+                                        receipt_ref=txn_ref,
+                                        receipt_amount=abs(txn.amount),
+                                        allocation_date=txn.date,
+                                        bank_account=bank_code,
+                                        description=txn.memo or txn.name
+                                    )
+                                    import_record["allocated"] = alloc_result.get("success", False)
+                                    import_record["allocation_result"] = alloc_result
+                                elif txn.action == 'purchase_payment':
+                                    alloc_result = opera_import.auto_allocate_payment(
+                                        supplier_account=account_code,
+                                        payment_ref=txn_ref,
+                                        payment_amount=abs(txn.amount),
+                                        allocation_date=txn.date,
+                                        bank_account=bank_code,
+                                        description=txn.memo or txn.name
+                                    )
+                                    import_record["allocated"] = alloc_result.get("success", False)
+                                    import_record["allocation_result"] = alloc_result
+
+                            imported.append(import_record)
+                        else:
+                            error_msg = '; '.join(result.errors) if result.errors else 'Import failed'
+                            errors.append({"row": txn.row_number, "error": error_msg})
+                    except Exception as e:
+                        errors.append({"row": txn.row_number, "error": str(e)})
 
         # Calculate totals
         receipts_imported = sum(1 for t in imported if t['action'] == 'sales_receipt')
@@ -3724,10 +3925,6 @@ async def import_bank_statement_from_pdf(
                 total_payments = result.get('payments_imported', 0)
                 transactions_imported = total_receipts + total_payments
 
-                # Get current user
-                current_user = getattr(request.state, 'user', None)
-                imported_by = current_user.get('username', 'Unknown') if current_user else 'Unknown'
-
                 statement_date = statement_info_dict.get('statement_date')
                 if statement_date:
                     # Format for SQL
@@ -3923,11 +4120,14 @@ async def import_bank_statement_from_pdf(
                         "messages": [f"Auto-reconciliation error: {str(recon_err)}"]
                     }
 
-        release_import_lock(_bank_lock_key(bank_code))
+        if lock_key:
+            release_import_lock(lock_key)
         return result
 
     except Exception as e:
-        release_import_lock(_bank_lock_key(bank_code))
+        if lock_key:
+            from sql_rag.import_lock import release_import_lock
+            release_import_lock(lock_key)
         logger.error(f"Error importing PDF: {e}", exc_info=True)
         return {"success": False, "error": str(e)}
 
@@ -4271,144 +4471,145 @@ async def import_with_manual_overrides(
         skipped_not_selected = 0
         skipped_incomplete = 0
 
-        for txn in transactions:
-            # Skip rows not in selected_rows (if selected_rows is specified)
-            if selected_rows is not None and txn.row_number not in selected_rows:
-                skipped_not_selected += 1
-                continue
-
-            # Handle bank transfers separately (paired entries in two banks)
-            if txn.action == 'bank_transfer' and not txn.is_duplicate:
-                bt_details = getattr(txn, 'bank_transfer_details', {}) or {}
-                dest_bank = bt_details.get('dest_bank') or txn.manual_account
-                if not dest_bank:
-                    errors.append({"row": txn.row_number, "error": "Bank transfer missing destination bank"})
+        with importer.reference_data(transactions):
+            for txn in transactions:
+                # Skip rows not in selected_rows (if selected_rows is specified)
+                if selected_rows is not None and txn.row_number not in selected_rows:
+                    skipped_not_selected += 1
                     continue
 
-                amount = abs(txn.amount)
-                if txn.amount < 0:
-                    source, dest = bank_code, dest_bank
-                else:
-                    source, dest = dest_bank, bank_code
+                # Handle bank transfers separately (paired entries in two banks)
+                if txn.action == 'bank_transfer' and not txn.is_duplicate:
+                    bt_details = getattr(txn, 'bank_transfer_details', {}) or {}
+                    dest_bank = bt_details.get('dest_bank') or txn.manual_account
+                    if not dest_bank:
+                        errors.append({"row": txn.row_number, "error": "Bank transfer missing destination bank"})
+                        continue
 
-                try:
-                    from sql_rag.opera_sql_import import OperaSQLImport
-                    opera_import = OperaSQLImport(sql_connector)
-                    bt_result = opera_import.import_bank_transfer(
-                        source_bank=source,
-                        dest_bank=dest,
-                        amount_pounds=amount,
-                        reference=(bt_details.get('reference') or txn.reference or '')[:20],
-                        post_date=txn.date,
-                        comment=(bt_details.get('comment') or txn.memo or '')[:50],
-                        input_by='SQLRAG'
-                    )
-                    if bt_result.get('success'):
-                        imported.append({
-                            "row": txn.row_number,
-                            "account": dest_bank if txn.amount < 0 else source,
-                            "account_name": f"Transfer {'to' if txn.amount < 0 else 'from'} {dest_bank if txn.amount < 0 else source}",
-                            "amount": txn.amount,
-                            "action": 'bank_transfer',
-                            "entry_number": bt_result.get('source_entry') or bt_result.get('dest_entry'),
-                            "name": txn.name or '',
-                            "memo": txn.memo or '',
-                            "reference": txn.reference or '',
-                            "allocated": False,
-                            "allocation_result": None
-                        })
+                    amount = abs(txn.amount)
+                    if txn.amount < 0:
+                        source, dest = bank_code, dest_bank
                     else:
-                        errors.append({"row": txn.row_number, "error": bt_result.get('error', 'Bank transfer failed')})
-                except Exception as e:
-                    errors.append({"row": txn.row_number, "error": f"Bank transfer error: {str(e)}"})
-                continue
+                        source, dest = dest_bank, bank_code
 
-            if txn.action in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt') and not txn.is_duplicate:
-                # Validate mandatory data before import
-                account = txn.manual_account or txn.matched_account
-                if not account:
-                    skipped_incomplete += 1
-                    errors.append({
-                        "row": txn.row_number,
-                        "error": "Missing account - cannot import without customer/supplier assigned"
-                    })
+                    try:
+                        from sql_rag.opera_sql_import import OperaSQLImport
+                        opera_import = OperaSQLImport(sql_connector)
+                        bt_result = opera_import.import_bank_transfer(
+                            source_bank=source,
+                            dest_bank=dest,
+                            amount_pounds=amount,
+                            reference=(bt_details.get('reference') or txn.reference or '')[:20],
+                            post_date=txn.date,
+                            comment=(bt_details.get('comment') or txn.memo or '')[:50],
+                            input_by='SQLRAG'
+                        )
+                        if bt_result.get('success'):
+                            imported.append({
+                                "row": txn.row_number,
+                                "account": dest_bank if txn.amount < 0 else source,
+                                "account_name": f"Transfer {'to' if txn.amount < 0 else 'from'} {dest_bank if txn.amount < 0 else source}",
+                                "amount": txn.amount,
+                                "action": 'bank_transfer',
+                                "entry_number": bt_result.get('source_entry') or bt_result.get('dest_entry'),
+                                "name": txn.name or '',
+                                "memo": txn.memo or '',
+                                "reference": txn.reference or '',
+                                "allocated": False,
+                                "allocation_result": None
+                            })
+                        else:
+                            errors.append({"row": txn.row_number, "error": bt_result.get('error', 'Bank transfer failed')})
+                    except Exception as e:
+                        errors.append({"row": txn.row_number, "error": f"Bank transfer error: {str(e)}"})
                     continue
 
-                if not txn.action or txn.action not in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt'):
-                    skipped_incomplete += 1
-                    errors.append({
-                        "row": txn.row_number,
-                        "error": "Missing transaction type - cannot import without valid type assigned"
-                    })
-                    continue
+                if txn.action in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt') and not txn.is_duplicate:
+                    # Validate mandatory data before import
+                    account = txn.manual_account or txn.matched_account
+                    if not account:
+                        skipped_incomplete += 1
+                        errors.append({
+                            "row": txn.row_number,
+                            "error": "Missing account - cannot import without customer/supplier assigned"
+                        })
+                        continue
 
-                try:
-                    result = importer.import_transaction(txn)
-                    if result.success:
-                        import_record = {
+                    if not txn.action or txn.action not in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt'):
+                        skipped_incomplete += 1
+                        errors.append({
                             "row": txn.row_number,
-                            "account": txn.manual_account or txn.matched_account,
-                            "account_name": txn.matched_name or '',
-                            "amount": txn.amount,
-                            "action": txn.action,
-                            "batch_ref": getattr(result, 'batch_ref', None) or getattr(result, 'batch_number', None),
-                            "entry_number": getattr(result, 'entry_number', None),  # For auto-reconciliation
-                            "date": txn.date.isoformat() if txn.date else None,
-                            "name": txn.name or '',
-                            "memo": txn.memo or '',
-                            "reference": txn.reference or '',
-                            "allocated": False,
-                            "allocation_result": None
-                        }
+                            "error": "Missing transaction type - cannot import without valid type assigned"
+                        })
+                        continue
 
-                        # Auto-allocate if enabled
-                        if auto_allocate and txn.action in ('sales_receipt', 'purchase_payment'):
-                            from sql_rag.opera_sql_import import OperaSQLImport
-                            opera_import = OperaSQLImport(sql_connector)
-                            account_code = txn.manual_account or txn.matched_account
-                            # Get the reference from the import result
-                            txn_ref = getattr(result, 'transaction_ref', None) or txn.reference or txn.name[:20]
-
-                            if txn.action == 'sales_receipt':
-                                alloc_result = opera_import.auto_allocate_receipt(
-                                    customer_account=account_code,
-                                    receipt_ref=txn_ref,
-                                    receipt_amount=abs(txn.amount),
-                                    allocation_date=txn.date,
-                                    bank_account=bank_code,
-                                    description=txn.memo or txn.name
-                                )
-                                import_record["allocated"] = alloc_result.get("success", False)
-                                import_record["allocation_result"] = alloc_result
-                            elif txn.action == 'purchase_payment':
-                                alloc_result = opera_import.auto_allocate_payment(
-                                    supplier_account=account_code,
-                                    payment_ref=txn_ref,
-                                    payment_amount=abs(txn.amount),
-                                    allocation_date=txn.date,
-                                    bank_account=bank_code,
-                                    description=txn.memo or txn.name
+                    try:
+                        result = importer.import_transaction(txn)
+                        if result.success:
+                            import_record = {
+                                "row": txn.row_number,
+                                "account": txn.manual_account or txn.matched_account,
+                                "account_name": txn.matched_name or '',
+                                "amount": txn.amount,
+                                "action": txn.action,
+                                "batch_ref": getattr(result, 'batch_ref', None) or getattr(result, 'batch_number', None),
+                                "entry_number": getattr(result, 'entry_number', None),  # For auto-reconciliation
+                                "date": txn.date.isoformat() if txn.date else None,
+                                "name": txn.name or '',
+                                "memo": txn.memo or '',
+                                "reference": txn.reference or '',
+                                "allocated": False,
+                                "allocation_result": None
+                            }
+
+                            # Auto-allocate if enabled
+                            if auto_allocate and txn.action in ('sales_receipt', 'purchase_payment'):
+                                from sql_rag.opera_sql_import import OperaSQLImport
+                                opera_import = OperaSQLImport(sql_connector)
+                                account_code = txn.manual_account or txn.matched_account
+                                # Get the reference from the import result
+                                txn_ref = getattr(result, 'transaction_ref', None) or txn.reference or txn.name[:20]
+
+                                if txn.action == 'sales_receipt':
+                                    alloc_result = opera_import.auto_allocate_receipt(
+                                        customer_account=account_code,
+                                        receipt_ref=txn_ref,
+                                        receipt_amount=abs(txn.amount),
+                                        allocation_date=txn.date,
+                                        bank_account=bank_code,
+                                        description=txn.memo or txn.name
+                                    )
+                                    import_record["allocated"] = alloc_result.get("success", False)
+                                    import_record["allocation_result"] = alloc_result
+                                elif txn.action == 'purchase_payment':
+                                    alloc_result = opera_import.auto_allocate_payment(
+                                        supplier_account=account_code,
+                                        payment_ref=txn_ref,
+                                        payment_amount=abs(txn.amount),
+                                        allocation_date=txn.date,
+                                        bank_account=bank_code,
+                                        description=txn.memo or txn.name
+                                    )
+                                    import_record["allocated"] = alloc_result.get("success", False)
+                                    import_record["allocation_result"] = alloc_result
+
+                            imported.append(import_record)
+
+                            # Learn from manual assignment
+                            if txn.manual_account and importer.alias_manager:
+                                inferred_ledger = 'C' if txn.action in ('sales_receipt', 'sales_refund') else 'S'
+                                importer.alias_manager.save_alias(
+                                    bank_name=txn.name,
+                                    ledger_type=txn.manual_ledger_type or inferred_ledger,
+                                    account_code=txn.manual_account,
+                                    match_score=1.0,
+                                    created_by='MANUAL_IMPORT'
                                 )
-                                import_record["allocated"] = alloc_result.get("success", False)
-                                import_record["allocation_result"] = alloc_result
-
-                        imported.append(import_record)
-
-                        # Learn from manual assignment
-                        if txn.manual_account and importer.alias_manager:
-                            inferred_ledger = 'C' if txn.action in ('sales_receipt', 'sales_refund') else 'S'
-                            importer.alias_manager.save_alias(
-                                bank_name=txn.name,
-                                ledger_type=txn.manual_ledger_type or inferred_ledger,
-                                account_code=txn.manual_account,
-                                match_score=1.0,
-                                created_by='MANUAL_IMPORT'
-                            )
-                    else:
-                        error_msg = '; '.join(result.errors) if result.errors else 'Import failed'
-                        errors.append({"row": txn.row_number, "error": error_msg})
-                except Exception as e:
-                    errors.append({"row": txn.row_number, "error": str(e)})
+                        else:
+                            error_msg = '; '.join(result.errors) if result.errors else 'Import failed'
+                            errors.append({"row": txn.row_number, "error": error_msg})
+                    except Exception as e:
+                        errors.append({"row": txn.row_number, "error": str(e)})
 
         # Calculate totals by action type
         receipts_imported = sum(1 for t in imported if t['action'] == 'sales_receipt')
@@ -4851,21 +5052,39 @@ async def scan_folder_for_bank_statements(
 
         # Scan folder for PDFs
         from sql_rag.statement_reconcile import PDFExtractionCache
+        from sql_rag.statement_scan_index import StatementScanIndex
         scan_cache = PDFExtractionCache()
 
         statements = []
-        total_pdfs = 0
-
-        for file_path in sorted(folder_path.iterdir()):
-            if not file_path.is_file() or file_path.suffix.lower() != '.pdf':
-                continue
-
-            total_pdfs += 1
+        pdf_files = [
+            p for p in sorted(folder_path.iterdir())
+            if p.is_file() and p.suffix.lower() == '.pdf'
+        ]
+        total_pdfs = len(pdf_files)
+        # Skip already reconciled
+        pdf_files = [p for p in pdf_files if p.name not in reconciled_filenames]
+
+        # Hash + header info per file, only needed to validate balances: unchanged
+        # files come straight from the scan index (stat only); new files get the
+        # header-only probe, run concurrently. Otherwise files are only stat()ed.
+        probe = None
+        if validate_balances:
+            try:
+                from sql_rag.statement_reconcile import StatementReconciler
+                reconciler = StatementReconciler(
+                    sql_connector,
+                    gemini_api_key=_load_company_settings().get('gemini_api_key') or (config.get('gemini', 'api_key', fallback='') if config and config.has_section('gemini') else '')
+                )
+                probe = reconciler.extract_statement_info_only
+            except Exception as ex:
+                logger.warning(f"Scan folder: header probe unavailable: {ex}")
+        probe_workers = config.getint('extraction', 'max_workers', fallback=4) if config and config.has_section('extraction') else 4
+        scan_entries = StatementScanIndex(scan_cache).scan(pdf_files, probe=probe, max_workers=probe_workers,
+                                                           with_info=validate_balances)
+
+        for file_path in pdf_files:
             filename = file_path.name
-
-            # Skip already reconciled
-            if filename in reconciled_filenames:
-                continue
+            scan_entry = scan_entries[str(file_path)]
 
             is_imported = filename in imported_filenames
             stmt_entry = {
@@ -4875,44 +5094,18 @@ async def scan_folder_for_bank_statements(
                 'already_processed': False,
                 'is_imported': is_imported,
                 'status': 'imported' if is_imported else 'pending',
-                'file_size': file_path.stat().st_size,
-                'file_modified': datetime.fromtimestamp(file_path.stat().st_mtime).isoformat(),
+                'file_size': scan_entry.file_size,
+                'file_modified': datetime.fromtimestamp(scan_entry.mtime).isoformat(),
             }
 
-            # Try cache lookup for balance validation and bank matching
+            # Header info for balance validation and bank matching
             if validate_balances:
                 try:
-                    with open(str(file_path), 'rb') as f:
-                        content_bytes = f.read()
-                    pdf_hash = scan_cache.hash_pdf(content_bytes)
-                    cached = scan_cache.get(pdf_hash)
-
-                    info_data = None
-                    if cached:
-                        info_data, _ = cached
-                        logger.info(f"Scan cache HIT for {filename}")
+                    info_data = scan_entry.info
+                    if info_data:
+                        logger.info(f"Scan {'index' if scan_entry.from_index else 'probe'} HIT for {filename}")
                     else:
-                        # Cache miss — run lightweight extraction to get balances/bank info
-                        # This uses Gemini but only asks for header info, not transactions
-                        logger.info(f"Scan cache MISS for {filename} — running full extraction")
-                        try:
-                            from sql_rag.statement_reconcile import StatementReconciler
-                            reconciler = StatementReconciler(
-                                sql_connector,
-                                gemini_api_key=_load_company_settings().get('gemini_api_key') or (config.get('gemini', 'api_key', fallback='') if config and config.has_section('gemini') else '')
-                            )
-                            stmt_info_result, _ = reconciler.extract_transactions_from_pdf(str(file_path))
-                            info_data = {
-                                'opening_balance': stmt_info_result.opening_balance,
-                                'closing_balance': stmt_info_result.closing_balance,
-                                'period_start': stmt_info_result.period_start.strftime('%Y-%m-%d') if stmt_info_result.period_start else None,
-                                'period_end': stmt_info_result.period_end.strftime('%Y-%m-%d') if stmt_info_result.period_end else None,
-                                'bank_name': stmt_info_result.bank_name,
-                                'account_number': stmt_info_result.account_number,
-                                'sort_code': stmt_info_result.sort_code,
-                            }
-                        except Exception as ex:
-                            logger.warning(f"Full extraction failed for {filename}: {ex}")
+                        logger.warning(f"No statement header info for {filename}")
 
                     if info_data:
                         stmt_entry['opening_balance'] = float(info_data.get('opening_balance')) if info_data.get('opening_balance') is not None else None
@@ -6515,6 +6708,9 @@ async def scan_all_banks_for_statements(
                 if child.is_dir() and child.name != 'archive':
                     scan_folders.append(child)
 
+        from sql_rag.statement_scan_index import StatementScanIndex
+        scan_index = StatementScanIndex(scan_cache)
+
         for folder in scan_folders:
             folder_name = folder.name
             if not folder.exists():
@@ -6558,23 +6754,17 @@ async def scan_all_banks_for_statements(
                     'statement_date': statement_date
                 }
 
-                # Try cache lookup for bank matching
+                # Try cache lookup for bank matching (scan index: stat only for unchanged files)
                 matched_bank_code = None
                 if validate_balances:
                     try:
-                        with open(str(file_path), 'rb') as f:
-                            content_bytes = f.read()
-                        pdf_hash = scan_cache.hash_pdf(content_bytes)
-                        cached = scan_cache.get(pdf_hash)
-
-                        if cached:
-                            info_data, _ = cached
+                        scan_entry = scan_index.scan([file_path])[str(file_path)]
+                        info_data = scan_entry.info
+                        if info_data and info_data.get('opening_balance') is None and info_data.get('closing_balance') is None:
                             # Skip stale cache entries that have no balances — force re-extraction
-                            if info_data.get('opening_balance') is None and info_data.get('closing_balance') is None:
-                                scan_cache.delete(pdf_hash)
-                                cached = None
-                        if cached:
-                            info_data, _ = cached
+                            scan_cache.delete(scan_entry.pdf_hash)
+                            info_data = None
+                        if info_data:
                             stmt_entry['opening_balance'] = float(info_data.get('opening_balance')) if info_data.get('opening_balance') is not None else None
                             stmt_entry['closing_balance'] = float(info_data.get('closing_balance')) if info_data.get('closing_balance') is not None else None
                             stmt_entry['period_start'] = info_data.get('period_start')
@@ -8717,185 +8907,186 @@ async def import_bank_statement_from_email(
         skipped_duplicates = 0
         skipped_already_posted = 0
 
-        for txn in transactions:
-            if selected_rows is not None and txn.row_number not in selected_rows:
-                skipped_not_selected += 1
-                continue
-
-            # Skip already-posted lines (partial recovery resume)
-            if txn.row_number in already_posted_email:
-                skipped_already_posted += 1
-                imported.append({
-                    "row": txn.row_number,
-                    "date": txn.date.isoformat(),
-                    "amount": txn.amount,
-                    "account": txn.manual_account or txn.matched_account or '',
-                    "account_name": txn.matched_name or '',
-                    "action": txn.action,
-                    "entry_number": already_posted_email[txn.row_number],
-                    "name": txn.name or '',
-                    "already_posted": True
-                })
-                continue
+        with importer.reference_data(transactions):
+            for txn in transactions:
+                if selected_rows is not None and txn.row_number not in selected_rows:
+                    skipped_not_selected += 1
+                    continue
 
-            # Log transaction details for selected rows
-            logger.info(f"Processing row {txn.row_number}: action={txn.action}, "
-                       f"account={txn.manual_account or txn.matched_account}, "
-                       f"is_duplicate={txn.is_duplicate}, amount={txn.amount}")
-
-            # Handle bank transfers separately (paired entries in two banks)
-            if txn.action == 'bank_transfer' and not txn.is_duplicate:
-                bt_details = getattr(txn, 'bank_transfer_details', {}) or {}
-                dest_bank = bt_details.get('dest_bank') or txn.manual_account
-                if not dest_bank:
-                    errors.append({"row": txn.row_number, "error": "Bank transfer missing destination bank"})
+                # Skip already-posted lines (partial recovery resume)
+                if txn.row_number in already_posted_email:
+                    skipped_already_posted += 1
+                    imported.append({
+                        "row": txn.row_number,
+                        "date": txn.date.isoformat(),
+                        "amount": txn.amount,
+                        "account": txn.manual_account or txn.matched_account or '',
+                        "account_name": txn.matched_name or '',
+                        "action": txn.action,
+                        "entry_number": already_posted_email[txn.row_number],
+                        "name": txn.name or '',
+                        "already_posted": True
+                    })
                     continue
 
-                amount = abs(txn.amount)
-                # Direction: negative = paying out (current bank is source), positive = receiving in
-                if txn.amount < 0:
-                    source, dest = bank_code, dest_bank
-                else:
-                    source, dest = dest_bank, bank_code
+                # Log transaction details for selected rows
+                logger.info(f"Processing row {txn.row_number}: action={txn.action}, "
+                           f"account={txn.manual_account or txn.matched_account}, "
+                           f"is_duplicate={txn.is_duplicate}, amount={txn.amount}")
+
+                # Handle bank transfers separately (paired entries in two banks)
+                if txn.action == 'bank_transfer' and not txn.is_duplicate:
+                    bt_details = getattr(txn, 'bank_transfer_details', {}) or {}
+                    dest_bank = bt_details.get('dest_bank') or txn.manual_account
+                    if not dest_bank:
+                        errors.append({"row": txn.row_number, "error": "Bank transfer missing destination bank"})
+                        continue
 
-                try:
-                    from sql_rag.opera_sql_import import OperaSQLImport
-                    opera_import = OperaSQLImport(sql_connector)
-                    bt_result = opera_import.import_bank_transfer(
-                        source_bank=source,
-                        dest_bank=dest,
-                        amount_pounds=amount,
-                        reference=(bt_details.get('reference') or txn.reference or '')[:20],
-                        post_date=txn.date,
-                        comment=(bt_details.get('comment') or txn.memo or '')[:50],
-                        input_by='SQLRAG'
-                    )
-                    if bt_result.get('success'):
-                        imported.append({
-                            "row": txn.row_number,
-                            "date": txn.date.isoformat() if txn.date else None,
-                            "amount": txn.amount,
-                            "account": dest_bank if txn.amount < 0 else source,
-                            "account_name": f"Transfer {'to' if txn.amount < 0 else 'from'} {dest_bank if txn.amount < 0 else source}",
-                            "action": 'bank_transfer',
-                            "entry_number": bt_result.get('source_entry') or bt_result.get('dest_entry'),
-                            "name": txn.name or '',
-                            "memo": txn.memo or '',
-                            "reference": txn.reference or '',
-                            "allocated": False,
-                            "allocation_result": None
-                        })
+                    amount = abs(txn.amount)
+                    # Direction: negative = paying out (current bank is source), positive = receiving in
+                    if txn.amount < 0:
+                        source, dest = bank_code, dest_bank
                     else:
-                        errors.append({"row": txn.row_number, "error": bt_result.get('error', 'Bank transfer failed')})
-                except Exception as e:
-                    errors.append({"row": txn.row_number, "error": f"Bank transfer error: {str(e)}"})
-                continue
+                        source, dest = dest_bank, bank_code
 
-            if txn.action in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt') and not txn.is_duplicate:
-                account = txn.manual_account or txn.matched_account
-                if not account:
-                    skipped_incomplete += 1
-                    errors.append({"row": txn.row_number, "error": "Missing account"})
+                    try:
+                        from sql_rag.opera_sql_import import OperaSQLImport
+                        opera_import = OperaSQLImport(sql_connector)
+                        bt_result = opera_import.import_bank_transfer(
+                            source_bank=source,
+                            dest_bank=dest,
+                            amount_pounds=amount,
+                            reference=(bt_details.get('reference') or txn.reference or '')[:20],
+                            post_date=txn.date,
+                            comment=(bt_details.get('comment') or txn.memo or '')[:50],
+                            input_by='SQLRAG'
+                        )
+                        if bt_result.get('success'):
+                            imported.append({
+                                "row": txn.row_number,
+                                "date": txn.date.isoformat() if txn.date else None,
+                                "amount": txn.amount,
+                                "account": dest_bank if txn.amount < 0 else source,
+                                "account_name": f"Transfer {'to' if txn.amount < 0 else 'from'} {dest_bank if txn.amount < 0 else source}",
+                                "action": 'bank_transfer',
+                                "entry_number": bt_result.get('source_entry') or bt_result.get('dest_entry'),
+                                "name": txn.name or '',
+                                "memo": txn.memo or '',
+                                "reference": txn.reference or '',
+                                "allocated": False,
+                                "allocation_result": None
+                            })
+                        else:
+                            errors.append({"row": txn.row_number, "error": bt_result.get('error', 'Bank transfer failed')})
+                    except Exception as e:
+                        errors.append({"row": txn.row_number, "error": f"Bank transfer error: {str(e)}"})
                     continue
 
-                if not txn.action or txn.action not in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt'):
-                    skipped_incomplete += 1
-                    errors.append({"row": txn.row_number, "error": "Missing transaction type"})
-                    continue
+                if txn.action in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt') and not txn.is_duplicate:
+                    account = txn.manual_account or txn.matched_account
+                    if not account:
+                        skipped_incomplete += 1
+                        errors.append({"row": txn.row_number, "error": "Missing account"})
+                        continue
 
-                # Just-in-time duplicate check - catches entries that appeared since statement was processed
-                try:
-                    from sql_rag.opera_sql_import import OperaSQLImport as _OI
-                    _oi = _OI(sql_connector)
-                    acct_type = ('customer' if txn.action == 'sales_receipt'
-                                else 'customer_refund' if txn.action == 'sales_refund'
-                                else 'supplier' if txn.action == 'purchase_payment'
-                                else 'supplier_refund' if txn.action == 'purchase_refund'
-                                else 'transfer' if txn.action == 'bank_transfer'
-                                else 'nominal')
-                    dup_check = _oi.check_duplicate_before_posting(
-                        bank_account=bank_code,
-                        transaction_date=txn.date,
-                        amount_pounds=abs(txn.amount),
-                        account_code=account,
-                        account_type=acct_type,
-                        description=txn.name or ''
-                    )
-                    if dup_check['is_duplicate']:
-                        skipped_duplicates += 1
-                        errors.append({"row": txn.row_number, "error": f"Skipped - {dup_check['details']}"})
-                        logger.warning(f"Row {txn.row_number}: Pre-posting duplicate detected - {dup_check['details']}")
+                    if not txn.action or txn.action not in ('sales_receipt', 'purchase_payment', 'sales_refund', 'purchase_refund', 'nominal_payment', 'nominal_receipt'):
+                        skipped_incomplete += 1
+                        errors.append({"row": txn.row_number, "error": "Missing transaction type"})
                         continue
-                except Exception as dup_err:
-                    logger.warning(f"Row {txn.row_number}: Pre-posting duplicate check failed: {dup_err}")
 
-                try:
-                    result = importer.import_transaction(txn, validate_only=False)
-                    if result.success:
-                        import_record = {
-                            "row": txn.row_number,
-                            "date": txn.date.isoformat(),
-                            "amount": txn.amount,
-                            "account": txn.manual_account or txn.matched_account,
-                            "account_name": txn.matched_name or '',
-                            "action": txn.action,
-                            "batch_ref": getattr(result, 'batch_ref', None) or getattr(result, 'batch_number', None),
-                            "entry_number": getattr(result, 'entry_number', None),  # For reconciliation
-                            "name": txn.name or '',
-                            "memo": txn.memo or '',
-                            "reference": txn.reference or '',
-                            "allocated": False,
-                            "allocation_result": None
-                        }
+                    # Just-in-time duplicate check - catches entries that appeared since statement was processed
+                    try:
+                        from sql_rag.opera_sql_import import OperaSQLImport as _OI
+                        _oi = _OI(sql_connector)
+                        acct_type = ('customer' if txn.action == 'sales_receipt'
+                                    else 'customer_refund' if txn.action == 'sales_refund'
+                                    else 'supplier' if txn.action == 'purchase_payment'
+                                    else 'supplier_refund' if txn.action == 'purchase_refund'
+                                    else 'transfer' if txn.action == 'bank_transfer'
+                                    else 'nominal')
+                        dup_check = _oi.check_duplicate_before_posting(
+                            bank_account=bank_code,
+                            transaction_date=txn.date,
+                            amount_pounds=abs(txn.amount),
+                            account_code=account,
+                            account_type=acct_type,
+                            description=txn.name or ''
+                        )
+                        if dup_check['is_duplicate']:
+                            skipped_duplicates += 1
+                            errors.append({"row": txn.row_number, "error": f"Skipped - {dup_check['details']}"})
+                            logger.warning(f"Row {txn.row_number}: Pre-posting duplicate detected - {dup_check['details']}")
+                            continue
+                    except Exception as dup_err:
+                        logger.warning(f"Row {txn.row_number}: Pre-posting duplicate check failed: {dup_err}")
 
-                        # Auto-allocate if enabled
-                        if auto_allocate and txn.action in ('sales_receipt', 'purchase_payment'):
-                            from sql_rag.opera_sql_import import OperaSQLImport
-                            opera_import = OperaSQLImport(sql_connector)
-                            account_code = txn.manual_account or txn.matched_account
-                            # Get the reference from the import result
-                            txn_ref = getattr(result, 'transaction_ref', None) or txn.reference or txn.name[:20]
-
-                            if txn.action == 'sales_receipt':
-                                alloc_result = opera_import.auto_allocate_receipt(
-                                    customer_account=account_code,
-                                    receipt_ref=txn_ref,
-                                    receipt_amount=abs(txn.amount),
-                                    allocation_date=txn.date,
-                                    bank_account=bank_code,
-                                    description=txn.memo or txn.name
-                                )
-                                import_record["allocated"] = alloc_result.get("success", False)
-                                import_record["allocation_result"] = alloc_result
-                            elif txn.action == 'purchase_payment':
-                                alloc_result = opera_import.auto_allocate_payment(
-                                    supplier_account=account_code,
-                                    payment_ref=txn_ref,
-                                    payment_amount=abs(txn.amount),
-                                    allocation_date=txn.date,
-                                    bank_account=bank_code,
-                                    description=txn.memo or txn.name
+                    try:
+                        result = importer.import_transaction(txn, validate_only=False)
+                        if result.success:
+                            import_record = {
+                                "row": txn.row_number,
+                                "date": txn.date.isoformat(),
+                                "amount": txn.amount,
+                                "account": txn.manual_account or txn.matched_account,
+                                "account_name": txn.matched_name or '',
+                                "action": txn.action,
+                                "batch_ref": getattr(result, 'batch_ref', None) or getattr(result, 'batch_number', None),
+                                "entry_number": getattr(result, 'entry_number', None),  # For reconciliation
+                                "name": txn.name or '',
+                                "memo": txn.memo or '',
+                                "reference": txn.reference or '',
+                                "allocated": False,
+                                "allocation_result": None
+                            }
+
+                            # Auto-allocate if enabled
+                            if auto_allocate and txn.action in ('sales_receipt', 'purchase_payment'):
+                                from sql_rag.opera_sql_import import OperaSQLImport
+                                opera_import = OperaSQLImport(sql_connector)
+                                account_code = txn.manual_account or txn.matched_account
+                                # Get the reference from the import result
+                                txn_ref = getattr(result, 'transaction_ref', None) or txn.reference or txn.name[:20]
+
+                                if txn.action == 'sales_receipt':
+                                    alloc_result = opera_import.auto_allocate_receipt(
+                                        customer_account=account_code,
+                                        receipt_ref=txn_ref,
+                                        receipt_amount=abs(txn.amount),
+                                        allocation_date=txn.date,
+                                        bank_account=bank_code,
+                                        description=txn.memo or txn.name
+                                    )
+                                    import_record["allocated"] = alloc_result.get("success", False)
+                                    import_record["allocation_result"] = alloc_result
+                                elif txn.action == 'purchase_payment':
+                                    alloc_result = opera_import.auto_allocate_payment(
+                                        supplier_account=account_code,
+                                        payment_ref=txn_ref,
+                                        payment_amount=abs(txn.amount),
+                                        allocation_date=txn.date,
+                                        bank_account=bank_code,
+                                        description=txn.memo or txn.name
+                                    )
+                                    import_record["allocated"] = alloc_result.get("success", False)
+                                    import_record["allocation_result"] = alloc_result
+
+                            imported.append(import_record)
+
+                            # Save alias for manual overrides
+                            if txn.manual_account and importer.alias_manager:
+                                inferred_ledger = 'C' if txn.action in ('sales_receipt', 'sales_refund') else 'S'
+                                importer.alias_manager.save_alias(
+                                    bank_name=txn.name,
+                                    ledger_type=txn.manual_ledger_type or inferred_ledger,
+                                    account_code=txn.manual_account,
+                                    match_score=1.0,
+                                    created_by='MANUAL_IMPORT'
                                 )
-                                import_record["allocated"] = alloc_result.get("success", False)
-                                import_record["allocation_result"] = alloc_result
-
-                        imported.append(import_record)
-
-                        # Save alias for manual overrides
-                        if txn.manual_account and importer.alias_manager:
-                            inferred_ledger = 'C' if txn.action in ('sales_receipt', 'sales_refund') else 'S'
-                            importer.alias_manager.save_alias(
-                                bank_name=txn.name,
-                                ledger_type=txn.manual_ledger_type or inferred_ledger,
-                                account_code=txn.manual_account,
-                                match_score=1.0,
-                                created_by='MANUAL_IMPORT'
-                            )
-                    else:
-                        error_msg = '; '.join(result.errors) if result.errors else 'Import failed'
-                        errors.append({"row": txn.row_number, "error": error_msg})
-                except Exception as e:
-                    errors.append({"row": txn.row_number, "error": str(e)})
+                        else:
+                            error_msg = '; '.join(result.errors) if result.errors else 'Import failed'
+                            errors.append({"row": txn.row_number, "error": error_msg})
+                    except Exception as e:
+                        errors.append({"row": txn.row_number, "error": str(e)})
 
         # Calculate totals by action type
         receipts_imported = sum(1 for t in imported if t['action'] == 'sales_receipt')
@@ -8,6 +8,7 @@ scan-emails, import-from-email, api-payouts, due-invoices, etc.
 Covers both Opera SQL SE (/api/gocardless/*) and Opera 3 (/api/opera3/gocardless/*).
 """
 
+import asyncio
 import os
 import json
 import logging
@@ -237,9 +238,10 @@ def _match_gocardless_payments_helper(payments: List[Dict[str, Any]], connector)
     """
     Helper function to match GoCardless payments to Opera customers.
 
-    Matching uses mandate lookup only — if a payment's mandate_id or
-    gocardless_customer_id is linked in the mandates table, use that
-    Opera account. Otherwise leave blank for manual assignment.
+    Matching uses the company's cached CustomerIndex (mandate links, Opera
+    customer names and outstanding invoice refs); see
+    sql_rag.gocardless_matching for the priority order. Payments that do
+    not match are left blank for manual assignment.
 
     Args:
         payments: List of payment dicts with customer_name, description, amount,
@@ -249,199 +251,17 @@ def _match_gocardless_payments_helper(payments: List[Dict[str, Any]], connector)
     Returns:
         Dict with success, payments (matched), unmatched_count
     """
-    from sql_rag.gocardless_payments import get_payments_db
+    from sql_rag.gocardless_matching import get_customer_index
 
-    # Build mandate lookups from the company-specific mandates table
     payments_db = get_payments_db()
-    logger.info(f"GC match helper: using mandates DB at {payments_db.db_path}")
-    all_mandates = payments_db.list_mandates()
-    logger.info(f"GC match helper: found {len(all_mandates)} total mandates")
-
-    # Lookup by mandate_id and by gocardless_customer_id
-    mandate_by_id = {}
-    mandate_by_customer = {}
-    for m in all_mandates:
-        if m.get('opera_account') and m['opera_account'] != '__UNLINKED__':
-            mid = m.get('mandate_id', '').strip()
-            if mid:
-                mandate_by_id[mid] = m
-            cid = m.get('gocardless_customer_id', '').strip() if m.get('gocardless_customer_id') else ''
-            if cid:
-                mandate_by_customer[cid] = m
-
-    logger.info(f"GC match helper: {len(mandate_by_id)} mandates by ID, {len(mandate_by_customer)} by customer_id")
-
-    # Build name-based lookup from mandates (normalised for matching)
-    import re as _re
-    def _normalize_company_name(name: str) -> str:
-        """Normalise company name for matching: lowercase, strip common suffixes."""
-        n = name.lower().strip()
-        # Remove content in parentheses for matching
-        n = _re.sub(r'\s*\([^)]*\)', '', n).strip()
-        # Normalise "&" and "and"
-        n = n.replace(' and ', ' & ')
-        # Remove spaces between single letters (I C -> IC, P J -> PJ)
-        n = _re.sub(r'\b([a-z])\s+([a-z])\b', r'\1\2', n)
-        # Remove common company suffixes
-        for suffix in [' limited', ' ltd', ' ltd.', ' plc', ' inc', ' llp', ' lp',
-                       ' company', ' co', ' group', ' uk', ' holdings']:
-            if n.endswith(suffix):
-                n = n[:-len(suffix)].strip()
-        # Remove trailing punctuation
-        n = n.rstrip('.,')
-        return n
-
-    mandate_by_name = {}  # normalised_name -> mandate
-    for m in all_mandates:
-        if m.get('opera_account') and m['opera_account'] != '__UNLINKED__':
-            # Index by opera_name (normalised)
-            name = m.get('opera_name', '').strip()
-            if name:
-                mandate_by_name[_normalize_company_name(name)] = m
-            # Also index by gocardless_name if available
-            gc_name = m.get('gocardless_name', '').strip() if m.get('gocardless_name') else ''
-            if gc_name:
-                mandate_by_name[_normalize_company_name(gc_name)] = m
-
-    logger.info(f"GC match helper: {len(mandate_by_name)} mandates by name")
-
-    # Also build a customer name lookup from Opera for displaying matched names
-    customers = {}
-    try:
-        customers_df = connector.execute_query("""
-            SELECT sn_account, sn_name FROM sname WITH (NOLOCK)
-            WHERE sn_stop = 0 OR sn_stop IS NULL
-        """)
-        if customers_df is not None:
-            customers = {
-                row['sn_account'].strip(): row['sn_name'].strip()
-                for _, row in customers_df.iterrows()
-            }
-    except Exception:
-        pass
-
-    matched_payments = []
-    unmatched_count = 0
-    backfill_updates = []  # Track mandates that need gocardless_customer_id backfilled
-
-    for payment in payments:
-        customer_name = payment.get('customer_name', '')
-        amount = payment.get('amount', 0)
-        description = payment.get('description', '')
-        mandate_id = payment.get('mandate_id', '')
-        customer_id = payment.get('customer_id', '')
-        metadata = payment.get('metadata', {})
-
-        best_match = None
-        best_name = None
-        match_method = None
-        metadata_invoice_refs = []
-
-        # Priority 0: Metadata from GoCardless (set when payment was created via this app)
-        # Contains opera_account and invoice refs — gives an exact match
-        meta_account = (metadata.get('opera_account') or '').strip()
-        meta_invoices = (metadata.get('invoices') or '').strip()
-        if meta_account and meta_account in customers:
-            best_match = meta_account
-            best_name = customers.get(meta_account, '')
-            match_method = f"metadata:opera_account={meta_account}"
-            if meta_invoices:
-                metadata_invoice_refs = [r.strip() for r in meta_invoices.split(',') if r.strip()]
-
-        # Priority 1: Mandate lookup by mandate_id
-        if not best_match and mandate_id and mandate_id in mandate_by_id:
-            m = mandate_by_id[mandate_id]
-            best_match = m['opera_account']
-            best_name = customers.get(best_match, m.get('opera_name', ''))
-            match_method = f"mandate:{mandate_id}"
-
-        # Priority 2: Mandate lookup by gocardless_customer_id
-        if not best_match and customer_id and customer_id in mandate_by_customer:
-            m = mandate_by_customer[customer_id]
-            best_match = m['opera_account']
-            best_name = customers.get(best_match, m.get('opera_name', ''))
-            match_method = f"customer:{customer_id}"
-
-        # Priority 3: Name-based matching against mandate opera_name/gocardless_name
-        if not best_match and customer_name and customer_name.lower() not in ('unknown', '', 'not provided'):
-            norm_name = _normalize_company_name(customer_name)
-            # Try exact normalised match first
-            if norm_name in mandate_by_name:
-                m = mandate_by_name[norm_name]
-                best_match = m['opera_account']
-                best_name = customers.get(best_match, m.get('opera_name', ''))
-                match_method = f"name_exact:{norm_name}"
-            else:
-                # Try contains match (either direction)
-                for stored_name, m in mandate_by_name.items():
-                    if norm_name in stored_name or stored_name in norm_name:
-                        best_match = m['opera_account']
-                        best_name = customers.get(best_match, m.get('opera_name', ''))
-                        match_method = f"name_contains:{stored_name}"
-                        break
-
-        # Priority 4: Name-based matching against Opera customer names (sname)
-        # For customers not in mandates table at all
-        if not best_match and customer_name and customer_name.lower() not in ('unknown', '', 'not provided'):
-            norm_name = _normalize_company_name(customer_name)
-            for acct, opera_name in customers.items():
-                norm_opera = _normalize_company_name(opera_name)
-                if norm_name == norm_opera:
-                    best_match = acct
-                    best_name = opera_name
-                    match_method = f"opera_exact:{norm_name}"
-                    break
-                if norm_name in norm_opera or norm_opera in norm_name:
-                    best_match = acct
-                    best_name = opera_name
-                    match_method = f"opera_contains:{norm_opera}"
-                    break
-
-        # Backfill gocardless_customer_id if we matched by name and have a customer_id
-        if best_match and customer_id and match_method and 'name' in match_method:
-            backfill_updates.append((best_match, customer_id, mandate_id))
-
-        logger.info(f"GC match: '{customer_name}' mandate={mandate_id} -> {best_match} ({best_name}) via {match_method}")
-
-        # Use invoice refs from metadata if available (exact match from payment request)
-        invoice_refs = payment.get('invoice_refs', [])
-        if not invoice_refs and metadata_invoice_refs:
-            invoice_refs = metadata_invoice_refs
-
-        matched_payment = {
-            "customer_name": customer_name,
-            "description": description,
-            "amount": amount,
-            "invoice_refs": invoice_refs,
-            "matched_account": best_match,
-            "matched_name": best_name,
-            "match_score": 1.0 if best_match else 0,
-            "match_method": match_method,
-            "match_status": "matched" if best_match else "unmatched",
-            "possible_duplicate": False,
-            "duplicate_warning": None,
-            "gc_payment_id": payment.get('gc_payment_id', '')
-        }
-        matched_payments.append(matched_payment)
-
-        if not best_match:
-            unmatched_count += 1
+    index = get_customer_index(payments_db, "sql", lambda: _opera_sql_customer_data(connector))
+    matched_payments, backfill_updates = index.match(payments)
+    unmatched_count = sum(1 for p in matched_payments if not p["matched_account"])
 
     # Backfill gocardless_customer_id on mandates matched by name
     if backfill_updates:
         try:
-            import sqlite3
-            conn = sqlite3.connect(str(payments_db.db_path))
-            for opera_account, gc_customer_id, gc_mandate_id in backfill_updates:
-                conn.execute("""
-                    UPDATE gocardless_mandates
-                    SET gocardless_customer_id = ?,
-                        updated_at = datetime('now')
-                    WHERE opera_account = ?
-                      AND (gocardless_customer_id IS NULL OR gocardless_customer_id = '')
-                """, (gc_customer_id, opera_account))
-            conn.commit()
-            conn.close()
+            payments_db.backfill_mandate_customer_ids(backfill_updates)
             logger.info(f"GC match: backfilled {len(backfill_updates)} mandate customer IDs")
         except Exception as e:
             logger.warning(f"GC match: backfill failed: {e}")
@@ -454,6 +274,41 @@ def _match_gocardless_payments_helper(payments: List[Dict[str, Any]], connector)
     }
 
 
+def _opera_sql_customer_data(connector):
+    """Active customer names and outstanding invoice refs from Opera SQL SE, for the customer index."""
+    from sql_rag.sql_statements import statement
+
+    customers = {}
+    try:
+        customers_df = statement("gocardless.match.customers", """
+            SELECT sn_account, sn_name FROM sname WITH (NOLOCK)
+            WHERE sn_stop = 0 OR sn_stop IS NULL
+        """).query(connector)
+        if customers_df is not None:
+            customers = {
+                (account or "").strip(): (name or "").strip()
+                for account, name in zip(customers_df["sn_account"], customers_df["sn_name"])
+            }
+    except Exception as e:
+        logger.warning(f"GC match: could not read customers: {e}")
+
+    invoices = []
+    try:
+        invoices_df = statement("gocardless.match.outstanding_invoices", """
+            SELECT st_account, st_trref FROM stran WITH (NOLOCK)
+            WHERE st_trtype = 'I' AND st_trbal > 0
+        """).query(connector)
+        if invoices_df is not None:
+            invoices = [
+                ((account or "").strip(), (ref or "").strip())
+                for account, ref in zip(invoices_df["st_account"], invoices_df["st_trref"])
+            ]
+    except Exception as e:
+        logger.warning(f"GC match: could not read outstanding invoices: {e}")
+
+    return customers, invoices
+
+
 @router.post("/api/gocardless/match-customers")
 async def match_gocardless_customers(
     payments: List[Dict[str, Any]] = Body(..., description="List of payments from parse endpoint")
@@ -462,9 +317,9 @@ async def match_gocardless_customers(
     Match GoCardless payment customer names to Opera customer accounts.
 
     Matching priority:
-    1. Invoice reference lookup - extract INV number from description and find in stran
-    2. Amount + invoice pattern - match amount against outstanding invoices
-    3. Fuzzy name matching - fall back to customer name comparison
+    1. Payment metadata, mandate ID or GoCardless customer ID linked to an account
+    2. Invoice references that belong to one customer's outstanding invoices
+    3. Name matching - mandate names, then Opera customer names
     """
     if not sql_connector:
         raise HTTPException(status_code=503, detail="No database connection")
@@ -1878,17 +1733,46 @@ async def test_gocardless_api():
         return {"success": False, "error": str(e)}
 
 
+@router.get("/api/gocardless/mirror/status")
+async def get_gocardless_mirror_status():
+    """Contents and sync state of the local GoCardless API mirror."""
+    from sql_rag.gocardless_mirror import get_gocardless_mirror
+    mirror = get_gocardless_mirror(_load_gocardless_settings())
+    if not mirror:
+        return {"success": False, "error": "No API access token configured"}
+    return {"success": True, **mirror.status()}
+
+
+@router.post("/api/gocardless/mirror/sync")
+async def sync_gocardless_mirror(background: bool = Query(True, description="Run the sync in the background")):
+    """Sync the local GoCardless API mirror (new payouts and changed objects)."""
+    from sql_rag.gocardless_mirror import get_gocardless_mirror
+    mirror = get_gocardless_mirror(_load_gocardless_settings())
+    if not mirror:
+        return {"success": False, "error": "No API access token configured"}
+    try:
+        if background:
+            return {"success": True, "started": mirror.sync_in_background()}
+        return {"success": True, "stats": mirror.sync()}
+    except Exception as e:
+        logger.error(f"GoCardless mirror sync failed: {e}")
+        return {"success": False, "error": str(e)}
+
+
 @router.get("/api/gocardless/api-payouts")
 async def get_gocardless_api_payouts(
     status: str = Query("paid", description="Payout status filter"),
     limit: int = Query(20, description="Number of payouts to fetch"),
-    days_back: Optional[int] = Query(None, description="Fetch payouts from last N days (default from settings)")
+    days_back: Optional[int] = Query(None, description="Fetch payouts from last N days (default from settings)"),
+    refresh: bool = Query(False, description="Sync the local GoCardless mirror before reading")
 ):
     """
-    Fetch payouts directly from GoCardless API.
+    Fetch payouts from the GoCardless API (via the local mirror).
 
     Returns payouts with full payment details, ready for matching and import.
     Uses payout_lookback_days from settings if days_back not specified.
+    Payouts and their payments are read from the local mirror; a stale
+    mirror is refreshed in the background, or synchronously with refresh=true.
     """
     settings = _load_gocardless_settings()
     access_token = settings.get("api_access_token")
@@ -1901,17 +1785,21 @@ async def get_gocardless_api_payouts(
         return {"success": False, "error": "No API access token configured. Go to Settings to add your GoCardless API credentials."}
 
     try:
-        from sql_rag.gocardless_api import GoCardlessClient
+        from sql_rag.gocardless_mirror import get_gocardless_mirror
         from datetime import datetime, timedelta
 
         sandbox = settings.get("api_sandbox", False)
-        client = GoCardlessClient(access_token=access_token, sandbox=sandbox)
+        mirror = get_gocardless_mirror(settings)
+        if refresh:
+            mirror.sync()
+        else:
+            mirror.sync_if_stale()
 
         # Calculate date range
         created_at_gte = (datetime.now() - timedelta(days=days_back)).date()
 
         # Fetch payouts
-        payouts, _ = client.get_payouts(
+        payouts, _ = mirror.get_payouts(
             status=status,
             limit=limit,
             created_at_gte=created_at_gte
@@ -1975,10 +1863,11 @@ async def get_gocardless_api_payouts(
 
         # === PARALLEL PAYOUT FETCHING ===
         # Fetch full payment details for remaining payouts in parallel
+        # (the mirror only calls the API for payouts not yet mirrored)
         from concurrent.futures import ThreadPoolExecutor, as_completed
         full_payouts_map = {}
         with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(client.get_payout_with_payments, p.id): p for p in payouts_to_fetch}
+            futures = {executor.submit(mirror.get_payout_with_payments, p.id): p for p in payouts_to_fetch}
             for future in as_completed(futures):
                 p = futures[future]
                 try:
@@ -4109,155 +3998,20 @@ async def opera3_match_gocardless_customers(
     data_path: str = Query(..., description="Path to Opera 3 company data folder"),
     payments: List[Dict[str, Any]] = Body(..., description="List of payments from parse endpoint")
 ):
-    """Match GoCardless payment customer names to Opera 3 customer accounts using mandate lookup."""
+    """Match GoCardless payment customer names to Opera 3 customer accounts using the customer index."""
     try:
-        import re as _re
-        from sql_rag.opera3_foxpro import Opera3Reader
-        from sql_rag.gocardless_payments import get_payments_db
-
-        def _normalize_company_name(name: str) -> str:
-            n = name.lower().strip()
-            n = _re.sub(r'\s*\([^)]*\)', '', n).strip()
-            n = n.replace(' and ', ' & ')
-            n = _re.sub(r'\b([a-z])\s+([a-z])\b', r'\1\2', n)
-            for suffix in [' limited', ' ltd', ' ltd.', ' plc', ' inc', ' llp', ' lp',
-                           ' company', ' co', ' group', ' uk', ' holdings']:
-                if n.endswith(suffix):
-                    n = n[:-len(suffix)].strip()
-            n = n.rstrip('.,')
-            return n
+        from sql_rag.gocardless_matching import get_customer_index
 
-        # Build mandate lookups from the company-specific mandates table
         payments_db = get_payments_db()
-        all_mandates = payments_db.list_mandates()
-
-        mandate_by_id = {}
-        mandate_by_customer = {}
-        mandate_by_name = {}
-        for m in all_mandates:
-            if m.get('opera_account') and m['opera_account'] != '__UNLINKED__':
-                mid = m.get('mandate_id', '').strip()
-                if mid:
-                    mandate_by_id[mid] = m
-                cid = m.get('gocardless_customer_id', '').strip() if m.get('gocardless_customer_id') else ''
-                if cid:
-                    mandate_by_customer[cid] = m
-                name = m.get('opera_name', '').strip()
-                if name:
-                    mandate_by_name[_normalize_company_name(name)] = m
-                gc_name = m.get('gocardless_name', '').strip() if m.get('gocardless_name') else ''
-                if gc_name:
-                    mandate_by_name[_normalize_company_name(gc_name)] = m
-
-        # Build Opera customer name lookup
-        reader = Opera3Reader(data_path)
-        sname_records = reader.read_table("sname")
-        customers = {}
-        for r in sname_records:
-            stop = _o3_get_int(r, 'sn_stop')
-            if stop:
-                continue
-            account = _o3_get_str(r, 'sn_account')
-            name = _o3_get_str(r, 'sn_name')
-            if account:
-                customers[account] = name
-
-        matched_payments = []
-        unmatched_count = 0
-        backfill_updates = []
-
-        for payment in payments:
-            customer_name = payment.get('customer_name', '')
-            amount = payment.get('amount', 0)
-            description = payment.get('description', '')
-            mandate_id = payment.get('mandate_id', '')
-            customer_id = payment.get('customer_id', '')
-
-            best_match = None
-            best_name = None
-            match_method = None
-
-            # Priority 1: Mandate lookup by mandate_id
-            if mandate_id and mandate_id in mandate_by_id:
-                m = mandate_by_id[mandate_id]
-                best_match = m['opera_account']
-                best_name = customers.get(best_match, m.get('opera_name', ''))
-                match_method = f"mandate:{mandate_id}"
-
-            # Priority 2: Mandate lookup by gocardless_customer_id
-            if not best_match and customer_id and customer_id in mandate_by_customer:
-                m = mandate_by_customer[customer_id]
-                best_match = m['opera_account']
-                best_name = customers.get(best_match, m.get('opera_name', ''))
-                match_method = f"customer:{customer_id}"
-
-            # Priority 3: Name-based matching against mandates
-            if not best_match and customer_name and customer_name.lower() not in ('unknown', '', 'not provided'):
-                norm_name = _normalize_company_name(customer_name)
-                if norm_name in mandate_by_name:
-                    m = mandate_by_name[norm_name]
-                    best_match = m['opera_account']
-                    best_name = customers.get(best_match, m.get('opera_name', ''))
-                    match_method = f"name_exact:{norm_name}"
-                else:
-                    for stored_name, m in mandate_by_name.items():
-                        if norm_name in stored_name or stored_name in norm_name:
-                            best_match = m['opera_account']
-                            best_name = customers.get(best_match, m.get('opera_name', ''))
-                            match_method = f"name_contains:{stored_name}"
-                            break
-
-            # Priority 4: Name-based matching against Opera customer names
-            if not best_match and customer_name and customer_name.lower() not in ('unknown', '', 'not provided'):
-                norm_name = _normalize_company_name(customer_name)
-                for acct, opera_name in customers.items():
-                    norm_opera = _normalize_company_name(opera_name)
-                    if norm_name == norm_opera:
-                        best_match = acct
-                        best_name = opera_name
-                        match_method = f"opera_exact:{norm_name}"
-                        break
-                    if norm_name in norm_opera or norm_opera in norm_name:
-                        best_match = acct
-                        best_name = opera_name
-                        match_method = f"opera_contains:{norm_opera}"
-                        break
-
-            if best_match and customer_id and match_method and 'name' in match_method:
-                backfill_updates.append((best_match, customer_id, mandate_id))
-
-            matched_payments.append({
-                "customer_name": customer_name,
-                "description": description,
-                "amount": amount,
-                "invoice_refs": payment.get('invoice_refs', []),
-                "matched_account": best_match,
-                "matched_name": best_name,
-                "match_score": 1.0 if best_match else 0,
-                "match_method": match_method,
-                "match_status": "matched" if best_match else "unmatched",
-                "possible_duplicate": False,
-                "duplicate_warning": None
-            })
-
-            if not best_match:
-                unmatched_count += 1
+        index = get_customer_index(payments_db, f"opera3:{data_path}",
+                                   lambda: _opera3_customer_data(data_path))
+        matched_payments, backfill_updates = index.match(payments)
+        unmatched_count = sum(1 for p in matched_payments if not p["matched_account"])
 
         # Backfill gocardless_customer_id on mandates matched by name
         if backfill_updates:
             try:
-                import sqlite3
-                conn = sqlite3.connect(str(payments_db.db_path))
-                for opera_account, gc_customer_id, gc_mandate_id in backfill_updates:
-                    conn.execute("""
-                        UPDATE gocardless_mandates
-                        SET gocardless_customer_id = ?,
-                            updated_at = datetime('now')
-                        WHERE opera_account = ?
-                          AND (gocardless_customer_id IS NULL OR gocardless_customer_id = '')
-                    """, (gc_customer_id, opera_account))
-                conn.commit()
-                conn.close()
+                payments_db.backfill_mandate_customer_ids(backfill_updates)
             except Exception as e:
                 logger.warning(f"GC match O3: backfill failed: {e}")
 
@@ -4272,6 +4026,30 @@ async def opera3_match_gocardless_customers(
         return {"success": False, "error": str(e)}
 
 
+def _opera3_customer_data(data_path: str):
+    """Active customer names and outstanding invoice refs from Opera 3, for the customer index."""
+    from sql_rag.opera3_foxpro import Opera3Reader
+
+    reader = Opera3Reader(data_path)
+    customers = {}
+    for r in reader.iter_table("sname"):
+        if _o3_get_int(r, 'sn_stop'):
+            continue
+        account = _o3_get_str(r, 'sn_account')
+        if account:
+            customers[account] = _o3_get_str(r, 'sn_name')
+
+    invoices = []
+    try:
+        for r in reader.iter_table("stran"):
+            if _o3_get_str(r, 'st_trtype') == 'I' and _o3_get_num(r, 'st_trbal') > 0:
+                invoices.append((_o3_get_str(r, 'st_account'), _o3_get_str(r, 'st_trref')))
+    except Exception as e:
+        logger.warning(f"GC match O3: could not read outstanding invoices: {e}")
+
+    return customers, invoices
+
+
 @router.get("/api/opera3/gocardless/eligible-customers")
 async def opera3_get_eligible_customers(
     data_path: str = Query(..., description="Path to Opera 3 company data folder")
@@ -4408,17 +4186,18 @@ async def opera3_sync_gocardless_mandates(
             return {"success": False, "error": "No API access token configured"}
 
         from sql_rag.gocardless_api import GoCardlessClient
+        from sql_rag.gocardless_mirror import get_gocardless_mirror
         from sql_rag.opera3_foxpro import Opera3Reader
 
         sandbox = settings.get("api_sandbox", False)
         client = GoCardlessClient(access_token=access_token, sandbox=sandbox)
+        mirror = get_gocardless_mirror(settings)  # customers read from the local mirror
 
         payments_db = get_payments_db()
         synced_count = 0
         new_count = 0
         updated_count = 0
         auto_linked_count = 0
-        cursor = None
 
         existing_mandates = payments_db.list_mandates(opera_account=None)
         existing_by_mandate_id = {}
@@ -4468,54 +4247,35 @@ async def opera3_sync_gocardless_mandates(
                     return data
             return None
 
-        while True:
-            mandates, next_cursor = client.list_mandates(status="active", cursor=cursor)
-
-            for mandate in mandates:
-                mandate_id = mandate.get("id")
-                customer_id = mandate.get("links", {}).get("customer")
-                scheme = mandate.get("scheme", "bacs")
-                status = mandate.get("status", "active")
-
-                gc_customer_name = None
-                gc_customer_email = None
-                if customer_id:
-                    customer = client.get_customer(customer_id)
-                    gc_customer_name = customer.get("company_name") or \
-                                   f"{customer.get('given_name', '')} {customer.get('family_name', '')}".strip()
-                    gc_customer_email = customer.get("email")
-
-                existing = existing_by_mandate_id.get(mandate_id)
+        for mandate in client.paginate(client.list_mandates, status="active"):
+            mandate_id = mandate.get("id")
+            customer_id = mandate.get("links", {}).get("customer")
+            scheme = mandate.get("scheme", "bacs")
+            status = mandate.get("status", "active")
 
-                if existing:
-                    if existing['opera_account'] != '__UNLINKED__':
-                        payments_db.link_mandate(
-                            opera_account=existing['opera_account'],
-                            mandate_id=mandate_id,
-                            opera_name=existing.get('opera_name'),
-                            gocardless_name=gc_customer_name,
-                            gocardless_customer_id=customer_id,
-                            mandate_status=status,
-                            scheme=scheme,
-                            email=gc_customer_email
-                        )
-                        updated_count += 1
-                    else:
-                        opera_match = find_opera_match(gc_customer_name)
-                        if opera_match:
-                            payments_db.link_mandate(
-                                opera_account=opera_match['account'],
-                                mandate_id=mandate_id,
-                                opera_name=opera_match['name'],
-                                gocardless_name=gc_customer_name,
-                                gocardless_customer_id=customer_id,
-                                mandate_status=status,
-                                scheme=scheme,
-                                email=gc_customer_email or opera_match.get('email')
-                            )
-                            auto_linked_count += 1
-                        else:
-                            updated_count += 1
+            gc_customer_name = None
+            gc_customer_email = None
+            if customer_id:
+                customer = mirror.get_customer(customer_id)
+                gc_customer_name = customer.get("company_name") or \
+                               f"{customer.get('given_name', '')} {customer.get('family_name', '')}".strip()
+                gc_customer_email = customer.get("email")
+
+            existing = existing_by_mandate_id.get(mandate_id)
+
+            if existing:
+                if existing['opera_account'] != '__UNLINKED__':
+                    payments_db.link_mandate(
+                        opera_account=existing['opera_account'],
+                        mandate_id=mandate_id,
+                        opera_name=existing.get('opera_name'),
+                        gocardless_name=gc_customer_name,
+                        gocardless_customer_id=customer_id,
+                        mandate_status=status,
+                        scheme=scheme,
+                        email=gc_customer_email
+                    )
+                    updated_count += 1
                 else:
                     opera_match = find_opera_match(gc_customer_name)
                     if opera_match:
@@ -4530,25 +4290,37 @@ async def opera3_sync_gocardless_mandates(
                             email=gc_customer_email or opera_match.get('email')
                         )
                         auto_linked_count += 1
-                        new_count += 1
                     else:
-                        payments_db.link_mandate(
-                            opera_account='__UNLINKED__',
-                            mandate_id=mandate_id,
-                            opera_name=gc_customer_name,
-                            gocardless_name=gc_customer_name,
-                            gocardless_customer_id=customer_id,
-                            mandate_status=status,
-                            scheme=scheme,
-                            email=gc_customer_email
-                        )
-                        new_count += 1
-
-                synced_count += 1
+                        updated_count += 1
+            else:
+                opera_match = find_opera_match(gc_customer_name)
+                if opera_match:
+                    payments_db.link_mandate(
+                        opera_account=opera_match['account'],
+                        mandate_id=mandate_id,
+                        opera_name=opera_match['name'],
+                        gocardless_name=gc_customer_name,
+                        gocardless_customer_id=customer_id,
+                        mandate_status=status,
+                        scheme=scheme,
+                        email=gc_customer_email or opera_match.get('email')
+                    )
+                    auto_linked_count += 1
+                    new_count += 1
+                else:
+                    payments_db.link_mandate(
+                        opera_account='__UNLINKED__',
+                        mandate_id=mandate_id,
+                        opera_name=gc_customer_name,
+                        gocardless_name=gc_customer_name,
+                        gocardless_customer_id=customer_id,
+                        mandate_status=status,
+                        scheme=scheme,
+                        email=gc_customer_email
+                    )
+                    new_count += 1
 
-            if not next_cursor:
-                break
-            cursor = next_cursor
+            synced_count += 1
 
         # Clean up duplicate unlinked entries
         all_mandates = payments_db.list_mandates(opera_account=None)
@@ -5126,18 +4898,9 @@ async def opera3_request_gocardless_payment(
         settings = _load_gocardless_settings()
 
         # Build description — kept short for bank statement visibility (~18 chars on BACS)
-        stmt_ref = (settings.get("request_statement_reference") or "").strip()[:10]
-        if not description:
-            if len(invoices) == 1:
-                inv_part = invoices[0]
-            else:
-                inv_part = f"{invoices[0]} +{len(invoices) - 1}"
-            if stmt_ref:
-                description = f"{stmt_ref} {inv_part}"
-            else:
-                description = inv_part
-        elif stmt_ref and not description.startswith(stmt_ref):
-            description = f"{stmt_ref} {description}"
+        from sql_rag.gocardless_collections import build_bacs_reference, build_description
+        stmt_ref = settings.get("request_statement_reference") or ""
+        description = build_description(invoices, description, stmt_ref)
 
         access_token = settings.get("api_access_token")
         if not access_token:
@@ -5148,27 +4911,8 @@ async def opera3_request_gocardless_payment(
         client = GoCardlessClient(access_token=access_token, sandbox=sandbox)
 
         # Build BACS reference from template (max 10 chars — what appears on customer's bank statement)
-        # Supports length params: {company4} = first 4 chars of company, {inv_num5} = 5 digit inv number
-        import re as _bacs_re
-        bacs_ref_template = (settings.get("bacs_reference_template") or "{company}").strip()
-
-        field_values = {
-            'company': stmt_ref or '',
-            'inv': invoices[0] if invoices else '',
-            'inv_num': ''.join(c for c in (invoices[0] if invoices else '') if c.isdigit()),
-            'customer': opera_account or '',
-        }
-
-        def _replace_field(match):
-            field = match.group(1)
-            length = match.group(2)
-            value = field_values.get(field, '')
-            if length:
-                return value[:int(length)]
-            return value
-
-        bacs_reference = _bacs_re.sub(r'\{(\w+?)(\d+)?\}', _replace_field, bacs_ref_template)
-        bacs_reference = bacs_reference.strip()[:10]  # BACS max 10 chars
+        bacs_reference = build_bacs_reference(settings.get("bacs_reference_template"), stmt_ref,
+                                              invoices, opera_account)
 
         try:
             logger.info(f"GoCardless create_payment: account={opera_account}, invoices={invoices}, amount={amount}p, mandate={mandate['mandate_id']}, bacs_ref={bacs_reference}")
@@ -5225,38 +4969,38 @@ async def opera3_request_bulk_payments(
     request: Request,
     data_path: str = Query(..., description="Path to Opera 3 company data folder"),
 ):
-    """Request multiple payments at once (Opera 3 data source)."""
+    """Request multiple payments at once (Opera 3 data source) as one bulk collection."""
     body = await request.json()
     payment_requests = body.get("requests", body) if isinstance(body, dict) else body
 
-    results = []
-    success_count = 0
-    fail_count = 0
+    try:
+        from sql_rag.gocardless_api import create_client_from_settings
+        from sql_rag.gocardless_collections import BulkCollection
 
-    for req in payment_requests:
-        try:
-            result = await opera3_request_gocardless_payment(
-                data_path=data_path,
-                opera_account=req.get("opera_account"),
-                invoices=req.get("invoices", []),
-                amount=req.get("amount"),
-                charge_date=req.get("charge_date"),
-                description=req.get("description")
-            )
-            results.append({"opera_account": req.get("opera_account"), **result})
-            if result.get("success"):
-                success_count += 1
-            else:
-                fail_count += 1
-        except Exception as e:
-            results.append({"opera_account": req.get("opera_account"), "success": False, "error": str(e)})
-            fail_count += 1
+        settings = _load_gocardless_settings()
+        client = create_client_from_settings(settings)
+        if not client:
+            return {"success": False, "error": "GoCardless API not configured"}
 
-    return {
-        "success": fail_count == 0,
-        "results": results,
-        "summary": {"total": len(payment_requests), "succeeded": success_count, "failed": fail_count}
-    }
+        # Invoice values from one read of stran
+        invoice_balances: Dict[str, Dict[str, float]] = {}
+        if any(r.get("amount") is None for r in payment_requests):
+            from sql_rag.opera3_foxpro import Opera3Reader
+            accounts = {(r.get("opera_account") or "").strip() for r in payment_requests}
+            for r in Opera3Reader(data_path).read_table("stran"):
+                acct = _o3_get_str(r, 'st_account')
+                if acct not in accounts:
+                    continue
+                ref = _o3_get_str(r, 'st_trref')
+                ovalue = _o3_get_num(r, 'st_ovalue') if ('ST_OVALUE' in r or 'st_ovalue' in r) else _o3_get_num(r, 'st_trbal')
+                refs = invoice_balances.setdefault(acct, {})
+                refs[ref] = refs.get(ref, 0) + ovalue
+
+        collection = BulkCollection(get_payments_db(), client, settings, use_bacs_reference=True)
+        return await asyncio.to_thread(collection.run, payment_requests, invoice_balances)
+    except Exception as e:
+        logger.error(f"Error requesting Opera 3 bulk payments: {e}")
+        return {"success": False, "error": str(e)}
 
 
 @router.get("/api/opera3/gocardless/repeat-documents")
@@ -6269,15 +6013,16 @@ async def sync_gocardless_mandates():
             return {"success": False, "error": "No API access token configured"}
 
         from sql_rag.gocardless_api import GoCardlessClient
+        from sql_rag.gocardless_mirror import get_gocardless_mirror
         sandbox = settings.get("api_sandbox", False)
         client = GoCardlessClient(access_token=access_token, sandbox=sandbox)
+        mirror = get_gocardless_mirror(settings)  # customers read from the local mirror
 
         payments_db = get_payments_db()
         synced_count = 0
         new_count = 0
         updated_count = 0
         auto_linked_count = 0
-        cursor = None
 
         # Get all existing mandates to check for matches
         # If a mandate_id has both a linked and unlinked entry, prefer the linked one
@@ -6338,61 +6083,40 @@ async def sync_gocardless_mandates():
                     return data
             return None
 
-        while True:
-            mandates, next_cursor = client.list_mandates(status="active", cursor=cursor)
-
-            for mandate in mandates:
-                mandate_id = mandate.get("id")
-                customer_id = mandate.get("links", {}).get("customer")
-                scheme = mandate.get("scheme", "bacs")
-                status = mandate.get("status", "active")
-
-                # Get customer details from GoCardless
-                gc_customer_name = None
-                gc_customer_email = None
-                if customer_id:
-                    customer = client.get_customer(customer_id)
-                    gc_customer_name = customer.get("company_name") or \
-                                   f"{customer.get('given_name', '')} {customer.get('family_name', '')}".strip()
-                    gc_customer_email = customer.get("email")
-
-                existing = existing_by_mandate_id.get(mandate_id)
+        for mandate in client.paginate(client.list_mandates, status="active"):
+            mandate_id = mandate.get("id")
+            customer_id = mandate.get("links", {}).get("customer")
+            scheme = mandate.get("scheme", "bacs")
+            status = mandate.get("status", "active")
 
-                if existing:
-                    # Update existing mandate with latest details from GoCardless
-                    if existing['opera_account'] != '__UNLINKED__':
-                        # Already linked - just update status/scheme
-                        payments_db.link_mandate(
-                            opera_account=existing['opera_account'],
-                            mandate_id=mandate_id,
-                            opera_name=existing.get('opera_name'),
-                            gocardless_name=gc_customer_name,
-                            gocardless_customer_id=customer_id,
-                            mandate_status=status,
-                            scheme=scheme,
-                            email=gc_customer_email
-                        )
-                        updated_count += 1
-                    else:
-                        # Existing but unlinked - try to auto-match now
-                        opera_match = find_opera_match(gc_customer_name)
-                        if opera_match:
-                            payments_db.link_mandate(
-                                opera_account=opera_match['account'],
-                                mandate_id=mandate_id,
-                                opera_name=opera_match['name'],
-                                gocardless_name=gc_customer_name,
-                                gocardless_customer_id=customer_id,
-                                mandate_status=status,
-                                scheme=scheme,
-                                email=gc_customer_email or opera_match.get('email')
-                            )
-                            auto_linked_count += 1
-                            logger.info(f"Auto-linked mandate {mandate_id} to Opera customer {opera_match['account']} ({opera_match['name']})")
-                        else:
-                            updated_count += 1
+            # Get customer details from GoCardless
+            gc_customer_name = None
+            gc_customer_email = None
+            if customer_id:
+                customer = mirror.get_customer(customer_id)
+                gc_customer_name = customer.get("company_name") or \
+                               f"{customer.get('given_name', '')} {customer.get('family_name', '')}".strip()
+                gc_customer_email = customer.get("email")
+
+            existing = existing_by_mandate_id.get(mandate_id)
+
+            if existing:
+                # Update existing mandate with latest details from GoCardless
+                if existing['opera_account'] != '__UNLINKED__':
+                    # Already linked - just update status/scheme
+                    payments_db.link_mandate(
+                        opera_account=existing['opera_account'],
+                        mandate_id=mandate_id,
+                        opera_name=existing.get('opera_name'),
+                        gocardless_name=gc_customer_name,
+                        gocardless_customer_id=customer_id,
+                        mandate_status=status,
+                        scheme=scheme,
+                        email=gc_customer_email
+                    )
+                    updated_count += 1
                 else:
-                    # New mandate - try to auto-match to Opera GC customer
+                    # Existing but unlinked - try to auto-match now
                     opera_match = find_opera_match(gc_customer_name)
                     if opera_match:
                         payments_db.link_mandate(
@@ -6406,28 +6130,42 @@ async def sync_gocardless_mandates():
                             email=gc_customer_email or opera_match.get('email')
                         )
                         auto_linked_count += 1
-                        new_count += 1
-                        logger.info(f"Auto-linked new mandate {mandate_id} to Opera customer {opera_match['account']} ({opera_match['name']})")
+                        logger.info(f"Auto-linked mandate {mandate_id} to Opera customer {opera_match['account']} ({opera_match['name']})")
                     else:
-                        # Store with placeholder for manual linking
-                        payments_db.link_mandate(
-                            opera_account='__UNLINKED__',
-                            mandate_id=mandate_id,
-                            opera_name=gc_customer_name,  # Store GC customer name for reference
-                            gocardless_name=gc_customer_name,
-                            gocardless_customer_id=customer_id,
-                            mandate_status=status,
-                            scheme=scheme,
-                            email=gc_customer_email
-                        )
-                        new_count += 1
-                        logger.info(f"Stored unlinked mandate {mandate_id} for customer {gc_customer_name}")
+                        updated_count += 1
+            else:
+                # New mandate - try to auto-match to Opera GC customer
+                opera_match = find_opera_match(gc_customer_name)
+                if opera_match:
+                    payments_db.link_mandate(
+                        opera_account=opera_match['account'],
+                        mandate_id=mandate_id,
+                        opera_name=opera_match['name'],
+                        gocardless_name=gc_customer_name,
+                        gocardless_customer_id=customer_id,
+                        mandate_status=status,
+                        scheme=scheme,
+                        email=gc_customer_email or opera_match.get('email')
+                    )
+                    auto_linked_count += 1
+                    new_count += 1
+                    logger.info(f"Auto-linked new mandate {mandate_id} to Opera customer {opera_match['account']} ({opera_match['name']})")
+                else:
+                    # Store with placeholder for manual linking
+                    payments_db.link_mandate(
+                        opera_account='__UNLINKED__',
+                        mandate_id=mandate_id,
+                        opera_name=gc_customer_name,  # Store GC customer name for reference
+                        gocardless_name=gc_customer_name,
+                        gocardless_customer_id=customer_id,
+                        mandate_status=status,
+                        scheme=scheme,
+                        email=gc_customer_email
+                    )
+                    new_count += 1
+                    logger.info(f"Stored unlinked mandate {mandate_id} for customer {gc_customer_name}")
 
-                synced_count += 1
-
-            if not next_cursor:
-                break
-            cursor = next_cursor
+            synced_count += 1
 
         # Clean up: remove __UNLINKED__ duplicates where a linked entry exists for the same mandate
         all_mandates = payments_db.list_mandates(opera_account=None)
@@ -7350,10 +7088,11 @@ async def opera3_skip_payout(
 async def opera3_get_api_payouts(
     status: str = Query("paid"),
     limit: int = Query(20),
-    days_back: Optional[int] = Query(None)
+    days_back: Optional[int] = Query(None),
+    refresh: bool = Query(False)
 ):
     """Fetch payouts from GoCardless API — same logic as SE, uses payout_lookback_days from settings."""
-    return await get_gocardless_api_payouts(status=status, limit=limit, days_back=days_back)
+    return await get_gocardless_api_payouts(status=status, limit=limit, days_back=days_back, refresh=refresh)
 
 
 @router.get("/api/gocardless/eligible-customers")
@@ -8151,18 +7890,8 @@ async def request_gocardless_payment(
 
         # Build description — kept short for bank statement visibility (~18 chars on BACS).
         # Full invoice list is always in metadata.invoices regardless.
-        stmt_ref = (settings.get("request_statement_reference") or "").strip()[:10]
-        if not description:
-            if len(invoices) == 1:
-                inv_part = invoices[0]
-            else:
-                inv_part = f"{invoices[0]} +{len(invoices) - 1}"
-            if stmt_ref:
-                description = f"{stmt_ref} {inv_part}"
-            else:
-                description = inv_part
-        elif stmt_ref and not description.startswith(stmt_ref):
-            description = f"{stmt_ref} {description}"
+        from sql_rag.gocardless_collections import build_description, usable_charge_date
+        description = build_description(invoices, description, settings.get("request_statement_reference") or "")
         access_token = settings.get("api_access_token")
 
         if not access_token:
@@ -8173,15 +7902,9 @@ async def request_gocardless_payment(
         client = GoCardlessClient(access_token=access_token, sandbox=sandbox)
 
         # If charge_date is in the past, drop it — GoCardless will use earliest possible date
-        from datetime import date as date_type
-        if charge_date:
-            try:
-                cd = datetime.strptime(charge_date, '%Y-%m-%d').date() if isinstance(charge_date, str) else charge_date
-                if cd < date_type.today():
-                    logger.info(f"Charge date {charge_date} is in the past — letting GoCardless use earliest possible date")
-                    charge_date = None
-            except (ValueError, TypeError):
-                pass
+        if charge_date and usable_charge_date(charge_date) is None:
+            logger.info(f"Charge date {charge_date} is in the past — letting GoCardless use earliest possible date")
+            charge_date = None
 
         # Create payment in GoCardless
         try:
@@ -8248,50 +7971,64 @@ async def request_bulk_payments(request: Request):
     """
     Request multiple payments at once.
     Each request should have: opera_account, invoices, amount (optional)
+
+    Runs as one bulk collection: all requests are validated together, the
+    payment request rows are written in one transaction and the GoCardless
+    calls run concurrently with idempotency keys. Returns a result per request.
     """
     body = await request.json()
     # Accept both {"requests": [...]} and bare [...]
     payment_requests = body.get("requests", body) if isinstance(body, dict) else body
 
-    results = []
-    success_count = 0
-    fail_count = 0
+    try:
+        from sql_rag.gocardless_api import create_client_from_settings
+        from sql_rag.gocardless_collections import BulkCollection
 
-    for req in payment_requests:
-        try:
-            # Call single payment endpoint logic
-            result = await request_gocardless_payment(
-                opera_account=req.get("opera_account"),
-                invoices=req.get("invoices", []),
-                amount=req.get("amount"),
-                charge_date=req.get("charge_date"),
-                description=req.get("description")
-            )
-            results.append({
-                "opera_account": req.get("opera_account"),
-                **result
-            })
-            if result.get("success"):
-                success_count += 1
-            else:
-                fail_count += 1
-        except Exception as e:
-            results.append({
-                "opera_account": req.get("opera_account"),
-                "success": False,
-                "error": str(e)
-            })
-            fail_count += 1
+        settings = _load_gocardless_settings()
+        client = create_client_from_settings(settings)
+        if not client:
+            return {"success": False, "error": "GoCardless API not configured"}
 
-    return {
-        "success": fail_count == 0,
-        "results": results,
-        "summary": {
-            "total": len(payment_requests),
-            "succeeded": success_count,
-            "failed": fail_count
-        }
-    }
+        accounts = [(r.get("opera_account") or "").strip() for r in payment_requests if r.get("opera_account")]
+        invoice_balances, account_credits = {}, {}
+        if sql_connector:
+            invoice_balances, account_credits = _opera_customer_balances(accounts)
+        elif any(r.get("amount") is None for r in payment_requests):
+            return {"success": False, "error": "Database not connected - cannot calculate invoice total"}
+
+        collection = BulkCollection(get_payments_db(), client, settings)
+        return await asyncio.to_thread(collection.run, payment_requests, invoice_balances, account_credits)
+    except Exception as e:
+        logger.error(f"Error requesting bulk payments: {e}")
+        return {"success": False, "error": str(e)}
+
+
+def _opera_customer_balances(accounts: List[str]):
+    """
+    Outstanding stran balances for the customers, in one query per chunk of
+    accounts. Returns ({account: {invoice ref: balance}}, {account: unallocated credit}).
+    """
+    from sql_rag.sql_statements import in_params, statement
+
+    invoice_balances: Dict[str, Dict[str, float]] = {}
+    account_credits: Dict[str, float] = {}
+    for placeholders, params in in_params("acct", sorted(set(accounts))):
+        stmt = statement(f"gocardless.bulk.customer_balances.{len(params)}", f"""
+            SELECT st_account, st_trref, st_trbal FROM stran WITH (NOLOCK)
+            WHERE st_account IN ({placeholders}) AND st_trbal <> 0
+        """)
+        df = stmt.query(sql_connector, params)
+        if df is None:
+            continue
+        for account, ref, balance in df[["st_account", "st_trref", "st_trbal"]].itertuples(index=False):
+            account = (account or "").strip()
+            balance = float(balance or 0)
+            refs = invoice_balances.setdefault(account, {})
+            ref = (ref or "").strip()
+            refs[ref] = refs.get(ref, 0) + balance
+            if balance < 0:
+                account_credits[account] = account_credits.get(account, 0) + balance
+    return invoice_balances, account_credits
 
 
 @router.get("/api/gocardless/payment-requests/{request_id}")
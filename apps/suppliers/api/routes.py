@@ -3907,6 +3907,52 @@ async def process_supplier_statement(statement_id: int):
 # Supplier Statement Extraction API Endpoints
 # ============================================================
 
+class SupplierExtractionJobRequest(BaseModel):
+    file_paths: List[str]
+
+
+@router.post("/api/supplier-statements/extraction-jobs")
+async def create_supplier_extraction_job(body: SupplierExtractionJobRequest):
+    """
+    Queue supplier statement PDFs for background extraction.
+
+    Results are stored in the supplier extraction cache. Poll
+    GET /api/supplier-statements/extraction-jobs/{job_id} for progress.
+    """
+    from api.main import config, current_company
+    from sql_rag.supplier_statement_extract import SupplierStatementExtractor
+    from sql_rag.extraction_queue import get_extraction_queue
+
+    api_key = config.get('gemini', 'api_key', fallback='') if config else ''
+    if not api_key:
+        raise HTTPException(status_code=503, detail="Gemini API key not configured")
+
+    files = [p for p in body.file_paths if Path(p).is_file()]
+    if not files:
+        return {"success": False, "error": "No PDF files found to extract"}
+
+    try:
+        gemini_model = config.get('gemini', 'model', fallback='gemini-2.0-flash')
+        extractor = SupplierStatementExtractor(api_key=api_key, model=gemini_model)
+        company = current_company.get('id') if current_company else None
+        job = get_extraction_queue(config).submit_supplier_job(extractor, files, company=company)
+        return {"success": True, "job": job.to_dict(include_items=False)}
+    except Exception as e:
+        logger.error(f"Error creating supplier extraction job: {e}")
+        return {"success": False, "error": str(e)}
+
+
+@router.get("/api/supplier-statements/extraction-jobs/{job_id}")
+async def get_supplier_extraction_job(job_id: str):
+    """Progress of a background supplier extraction job, with per-file status."""
+    from api.main import config
+    from sql_rag.extraction_queue import get_extraction_queue
+    job = get_extraction_queue(config).get_job(job_id)
+    if not job or job.kind != 'supplier':
+        raise HTTPException(status_code=404, detail="Extraction job not found")
+    return {"success": True, "job": job.to_dict()}
+
+
 @router.post("/api/supplier-statements/extract-from-email/{email_id}")
 async def extract_supplier_statement_from_email(email_id: int, attachment_id: Optional[str] = None):
     """
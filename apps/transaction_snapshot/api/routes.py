@@ -15,12 +15,15 @@ import os
 import json
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException, Query, Body, Request
 
+from sql_rag import snapshot_diff, snapshot_store
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -39,6 +42,9 @@ LIBRARY_DIR = _CENTRAL_LIBRARY if os.path.exists(os.path.dirname(_CENTRAL_LIBRAR
 SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
                             'data', '_transaction_snapshots')
 
+# Pending before snapshot (compact binary format — see sql_rag/snapshot_store.py)
+BEFORE_SNAPSHOT_FILE = 'current_before' + snapshot_store.SNAPSHOT_EXT
+
 # Module categories for organising transaction types
 MODULES = {
     # Transactions
@@ -106,6 +112,145 @@ def _get_snapshot_path():
 # Snapshot Engine — Scans ALL tables
 # ============================================================================
 
+def _list_se_tables(sql_connector, db_name: str):
+    """All user tables in a database with row counts (from sys.partitions — instant)."""
+    return sql_connector.execute_query(f"""
+        SELECT t.TABLE_NAME,
+               p.rows as row_count
+        FROM [{db_name}].INFORMATION_SCHEMA.TABLES t WITH (NOLOCK)
+        LEFT JOIN [{db_name}].sys.partitions p ON p.object_id = OBJECT_ID('{db_name}.dbo.' + t.TABLE_NAME)
+            AND p.index_id IN (0, 1)
+        WHERE t.TABLE_TYPE = 'BASE TABLE'
+        ORDER BY t.TABLE_NAME
+    """)
+
+
+# CHECKSUM(*) raises on these; they are hashed through a cast instead
+_NONCOMPARABLE_CASTS = {
+    'text': 'VARCHAR(MAX)',
+    'ntext': 'NVARCHAR(MAX)',
+    'xml': 'NVARCHAR(MAX)',
+    'image': 'VARBINARY(MAX)',
+}
+ROW_CHECKSUM = 'CHECKSUM(*)'
+
+
+def _checksum_exprs(sql_connector, db_name: str) -> Dict[str, str]:
+    """
+    Row checksum expression for each table with a text/ntext/image/xml column.
+
+    CHECKSUM(*) fails on those types, so such tables list their columns
+    explicitly with HASHBYTES over a cast of each noncomparable one. Tables
+    not in the result use ROW_CHECKSUM.
+    """
+    df = sql_connector.execute_query(f"""
+        SELECT c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE
+        FROM [{db_name}].INFORMATION_SCHEMA.COLUMNS c
+        WHERE c.TABLE_NAME IN (
+            SELECT TABLE_NAME FROM [{db_name}].INFORMATION_SCHEMA.COLUMNS
+            WHERE DATA_TYPE IN ({', '.join(f"'{t}'" for t in _NONCOMPARABLE_CASTS)})
+        )
+        ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+    """)
+    columns: Dict[str, List[str]] = {}
+    if df is not None and not df.empty:
+        for table_name, column, data_type in df.itertuples(index=False, name=None):
+            cast = _NONCOMPARABLE_CASTS.get(str(data_type).lower())
+            columns.setdefault(table_name, []).append(
+                f"HASHBYTES('SHA2_256', CAST([{column}] AS {cast}))" if cast else f"[{column}]"
+            )
+    return {table_name: f"CHECKSUM({', '.join(cols)})" for table_name, cols in columns.items()}
+
+
+def _table_checksum(sql_connector, db_name: str, table_name: str, expr: str = ROW_CHECKSUM,
+                    raise_errors: bool = False) -> Optional[int]:
+    """CHECKSUM_AGG over a whole table (fast — SQL Server computes internally)."""
+    try:
+        checksum_df = sql_connector.execute_query(f"""
+            SELECT CHECKSUM_AGG({expr}) as chk
+            FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)
+        """)
+        return int(checksum_df.iloc[0]['chk']) if checksum_df is not None and checksum_df.iloc[0]['chk'] is not None else 0
+    except Exception:
+        if raise_errors:
+            raise
+        return 0
+
+
+def _rows_from_result(columns: List[str], rows: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Convert a query result to JSON-safe row dicts (dates as ISO, numbers as float, text stripped).
+
+    Values are first given the types a DataFrame row had, so rows come out
+    exactly as in snapshots taken through execute_query() and diff cleanly
+    against them.
+    """
+    rows_data = []
+    for data_row in snapshot_store.dataframe_rows(columns, rows):
+        row_dict = {}
+        for col, val in zip(columns, data_row):
+            if val is None:
+                row_dict[col] = None
+            elif hasattr(val, 'isoformat'):
+                row_dict[col] = val.isoformat()
+            elif isinstance(val, (bytes, bytearray)):
+                row_dict[col] = val.hex()[:100]
+            else:
+                try:
+                    row_dict[col] = float(val) if isinstance(val, (int, float)) else str(val).strip()
+                except (ValueError, TypeError):
+                    row_dict[col] = str(val)[:200]
+        rows_data.append(row_dict)
+    return rows_data
+
+
+def _snapshot_se_database(sql_connector, db_name: str, max_rows_for_full_data: int) -> Dict[str, Any]:
+    """Full snapshot of one database: row count, checksum and (up to the limit) every row of every table."""
+    db_snapshot = {}
+    tables_df = _list_se_tables(sql_connector, db_name)
+    if tables_df is None or tables_df.empty:
+        return db_snapshot
+    checksum_exprs = _checksum_exprs(sql_connector, db_name)
+
+    for _, row in tables_df.iterrows():
+        table_name = row['TABLE_NAME']
+        row_count = int(row['row_count']) if row['row_count'] is not None else 0
+
+        try:
+            checksum = _table_checksum(sql_connector, db_name, table_name,
+                                       checksum_exprs.get(table_name, ROW_CHECKSUM))
+
+            # Read full data for small tables (Opera transaction tables are typically < 5000 rows)
+            # Large tables (reports, audit, system config) get checksum-only
+            rows_data = None
+            if row_count > 0 and row_count <= max_rows_for_full_data:
+                try:
+                    columns, rows = sql_connector.execute_query_rows(f"""
+                        SELECT * FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)
+                    """)
+                    if rows:
+                        rows_data = _rows_from_result(columns, rows)
+                except Exception as e:
+                    logger.debug(f"Could not read {db_name}.{table_name}: {e}")
+
+            db_snapshot[table_name] = {
+                'row_count': row_count,
+                'checksum': checksum,
+                'rows': rows_data,
+            }
+        except Exception as e:
+            logger.debug(f"Could not snapshot {db_name}.{table_name}: {e}")
+
+    return db_snapshot
+
+
+def _get_se_databases(sql_connector) -> List[str]:
+    """Company database plus the Opera SE system database."""
+    db_result = sql_connector.execute_query("SELECT DB_NAME() as db_name")
+    company_db = db_result.iloc[0]['db_name'] if db_result is not None else 'unknown'
+    return [company_db, 'Opera3SESystem']
+
+
 def take_snapshot_se(sql_connector, max_rows_for_full_data: int = 500000) -> Dict[str, Any]:
     """
     Take a snapshot of ALL tables in both the company and system databases.
@@ -122,88 +267,303 @@ def take_snapshot_se(sql_connector, max_rows_for_full_data: int = 500000) -> Dic
         'databases': {},
     }
 
-    db_result = sql_connector.execute_query("SELECT DB_NAME() as db_name")
-    company_db = db_result.iloc[0]['db_name'] if db_result is not None else 'unknown'
-    system_db = 'Opera3SESystem'
-
-    for db_name in [company_db, system_db]:
+    for db_name in _get_se_databases(sql_connector):
         db_snapshot = {}
         try:
-            # Get ALL user tables with row counts in a single query (FAST)
-            tables_df = sql_connector.execute_query(f"""
-                SELECT t.TABLE_NAME,
-                       p.rows as row_count
-                FROM [{db_name}].INFORMATION_SCHEMA.TABLES t WITH (NOLOCK)
-                LEFT JOIN [{db_name}].sys.partitions p ON p.object_id = OBJECT_ID('{db_name}.dbo.' + t.TABLE_NAME)
-                    AND p.index_id IN (0, 1)
-                WHERE t.TABLE_TYPE = 'BASE TABLE'
-                ORDER BY t.TABLE_NAME
-            """)
-            if tables_df is None or tables_df.empty:
-                continue
+            db_snapshot = _snapshot_se_database(sql_connector, db_name, max_rows_for_full_data)
+        except Exception as e:
+            logger.warning(f"Could not access database {db_name}: {e}")
 
-            for _, row in tables_df.iterrows():
-                table_name = row['TABLE_NAME']
-                row_count = int(row['row_count']) if row['row_count'] is not None else 0
+        snapshot['databases'][db_name] = db_snapshot
+        logger.info(f"Snapshot: {db_name} — {len(db_snapshot)} tables captured")
 
-                try:
-                    # Get checksum (fast — SQL Server computes internally)
-                    checksum = 0
-                    try:
-                        checksum_df = sql_connector.execute_query(f"""
-                            SELECT CHECKSUM_AGG(CHECKSUM(*)) as chk
-                            FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)
-                        """)
-                        checksum = int(checksum_df.iloc[0]['chk']) if checksum_df is not None and checksum_df.iloc[0]['chk'] is not None else 0
-                    except Exception:
-                        checksum = 0
-
-                    # Read full data for small tables (Opera transaction tables are typically < 5000 rows)
-                    # Large tables (reports, audit, system config) get checksum-only
-                    rows_data = None
-                    if row_count > 0 and row_count <= max_rows_for_full_data:
-                            try:
-                                data_df = sql_connector.execute_query(f"""
-                                    SELECT * FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)
-                                """)
-                                if data_df is not None and not data_df.empty:
-                                    rows_data = []
-                                    for _, data_row in data_df.iterrows():
-                                        row_dict = {}
-                                        for col in data_df.columns:
-                                            val = data_row[col]
-                                            if val is None:
-                                                row_dict[col] = None
-                                            elif hasattr(val, 'isoformat'):
-                                                row_dict[col] = val.isoformat()
-                                            elif isinstance(val, (bytes, bytearray)):
-                                                row_dict[col] = val.hex()[:100]
-                                            else:
-                                                try:
-                                                    row_dict[col] = float(val) if isinstance(val, (int, float)) else str(val).strip()
-                                                except (ValueError, TypeError):
-                                                    row_dict[col] = str(val)[:200]
-                                        rows_data.append(row_dict)
-                            except Exception as e:
-                                logger.debug(f"Could not read {db_name}.{table_name}: {e}")
-
-                    db_snapshot[table_name] = {
-                        'row_count': row_count,
-                        'checksum': checksum,
-                        'rows': rows_data,
-                    }
-                except Exception as e:
-                    logger.debug(f"Could not snapshot {db_name}.{table_name}: {e}")
+    return snapshot
+
+
+# ----------------------------------------------------------------------------
+# Two-phase (checksum-first) snapshots for Opera SE
+#
+# Before: a SQL Server database snapshot (copy-on-write, so creating it is
+# instant) is taken of each database and kept until the after phase. Only
+# checksums are read from it: per table, and for tables keyed on an integer
+# `id`, per block of CHECKSUM_RANGE_SIZE ids.
+#
+# After: checksums are recomputed on the live database. Only tables whose
+# checksum moved are read, and only the id blocks that changed — after-rows
+# from the live database, before-rows from the retained snapshot. The result
+# is a pair of snapshots in the take_snapshot_se format, so diff_snapshots is
+# unchanged.
+#
+# If a database snapshot can't be created (permissions, edition) that database
+# falls back to a full snapshot in the before phase.
+# ----------------------------------------------------------------------------
+
+CHECKSUM_RANGE_SIZE = 1000
+RETAINED_COPY_SUFFIX = '_txsnap'
+
+
+def _create_retained_copy(sql_connector, db_name: str) -> Optional[str]:
+    """Create a SQL Server database snapshot of db_name. Returns its name, or None if not possible."""
+    from sqlalchemy import text
+
+    copy_name = f"{db_name}{RETAINED_COPY_SUFFIX}"
+    try:
+        files_df = sql_connector.execute_query(f"""
+            SELECT name, physical_name FROM [{db_name}].sys.database_files WHERE type = 0
+        """)
+        if files_df is None or files_df.empty:
+            return None
+
+        file_specs = []
+        for _, f in files_df.iterrows():
+            physical = f['physical_name']
+            sep = '\\' if '\\' in physical else '/'
+            folder = physical.rsplit(sep, 1)[0]
+            file_specs.append(f"(NAME = [{f['name']}], FILENAME = '{folder}{sep}{copy_name}_{f['name']}.ss')")
+
+        with sql_connector.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # Left behind by a cancelled or failed run
+            conn.execute(text(f"IF DB_ID('{copy_name}') IS NOT NULL DROP DATABASE [{copy_name}]"))
+            conn.execute(text(
+                f"CREATE DATABASE [{copy_name}] ON {', '.join(file_specs)} AS SNAPSHOT OF [{db_name}]"
+            ))
+        logger.info(f"Snapshot: retained copy {copy_name} created for {db_name}")
+        return copy_name
+    except Exception as e:
+        logger.warning(f"Snapshot: could not create database snapshot of {db_name} ({e}) — using full snapshot")
+        return None
+
+
+def drop_retained_copies(sql_connector, snapshot: Dict[str, Any]):
+    """Drop the database snapshots kept by a checksum-mode before snapshot."""
+    from sqlalchemy import text
+
+    for db_name, copy_name in (snapshot.get('retained') or {}).items():
+        if not copy_name or not copy_name.endswith(RETAINED_COPY_SUFFIX):
+            continue
+        try:
+            with sql_connector.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f"IF DB_ID('{copy_name}') IS NOT NULL DROP DATABASE [{copy_name}]"))
+            logger.info(f"Snapshot: dropped retained copy {copy_name}")
+        except Exception as e:
+            logger.warning(f"Snapshot: could not drop retained copy {copy_name}: {e}")
+
+
+def _id_keyed_tables(sql_connector, db_name: str) -> set:
+    """Tables with an integer `id` column (every Opera SE transaction/master table)."""
+    df = sql_connector.execute_query(f"""
+        SELECT TABLE_NAME FROM [{db_name}].INFORMATION_SCHEMA.COLUMNS
+        WHERE COLUMN_NAME = 'id' AND DATA_TYPE IN ('int', 'bigint', 'smallint')
+    """)
+    return set(df['TABLE_NAME']) if df is not None and not df.empty else set()
+
+
+def _range_checksums(sql_connector, db_name: str, table_name: str, expr: str = ROW_CHECKSUM) -> Dict[str, Any]:
+    """Checksum per block of CHECKSUM_RANGE_SIZE ids, computed server-side in one pass."""
+    df = sql_connector.execute_query(f"""
+        SELECT [id] / {CHECKSUM_RANGE_SIZE} as bucket,
+               CHECKSUM_AGG({expr}) as chk,
+               MAX([id]) as max_id
+        FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)
+        GROUP BY [id] / {CHECKSUM_RANGE_SIZE}
+    """)
+    ranges = {}
+    max_id = None
+    if df is not None and not df.empty:
+        for bucket, chk, bucket_max in df.itertuples(index=False, name=None):
+            ranges[str(int(bucket))] = int(chk) if chk is not None else 0
+            max_id = int(bucket_max) if max_id is None else max(max_id, int(bucket_max))
+    return {'ranges': ranges, 'max_id': max_id}
+
+
+def _rows_checksum(rows: List[Dict[str, Any]]) -> int:
+    """Checksum of rows read back (order-independent), for tables SQL Server could not checksum."""
+    encoded = sorted(json.dumps(row, sort_keys=True, default=str) for row in rows)
+    digest = hashlib.md5('\n'.join(encoded).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+def _ranges_checksum(ranges: Dict[str, int]) -> int:
+    """Single table checksum from the range checksums (changes when any range changes)."""
+    digest = hashlib.md5(json.dumps(sorted(ranges.items())).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+def _checksum_table(sql_connector, db_name: str, table_name: str, row_count: int, keyed: bool,
+                    expr: str = ROW_CHECKSUM) -> Dict[str, Any]:
+    """
+    Checksum-only snapshot entry for one table.
+
+    If the checksum can't be computed the entry has checksum None, and the
+    after phase reads the whole table from both sides instead.
+    """
+    entry = {'row_count': row_count, 'key': 'id' if keyed else None, 'rows': None}
+    try:
+        if keyed:
+            ranges = _range_checksums(sql_connector, db_name, table_name, expr)
+            entry.update(ranges)
+            entry['checksum'] = _ranges_checksum(ranges['ranges'])
+        else:
+            entry['checksum'] = _table_checksum(sql_connector, db_name, table_name, expr, raise_errors=True)
+    except Exception as e:
+        logger.info(f"Could not checksum {db_name}.{table_name} ({e}) — rows will be compared instead")
+        entry.update(key=None, checksum=None)
+    return entry
 
+
+def take_checksum_snapshot_se(sql_connector, max_rows_for_full_data: int = 500000) -> Dict[str, Any]:
+    """
+    Before phase of a two-phase snapshot: checksums only, plus a retained copy
+    of each database for reading before-rows later. Pass the result to
+    complete_checksum_snapshot_se() after the transaction has been entered.
+    """
+    snapshot = {
+        'timestamp': datetime.now().isoformat(),
+        'source': 'opera_se',
+        'mode': 'checksum',
+        'databases': {},
+        'retained': {},
+    }
+
+    for db_name in _get_se_databases(sql_connector):
+        db_snapshot = {}
+        try:
+            copy_name = _create_retained_copy(sql_connector, db_name)
+            if not copy_name:
+                db_snapshot = _snapshot_se_database(sql_connector, db_name, max_rows_for_full_data)
+            else:
+                snapshot['retained'][db_name] = copy_name
+                # Checksum the copy so checksums and retained rows are the same point in time
+                keyed_tables = _id_keyed_tables(sql_connector, copy_name)
+                checksum_exprs = _checksum_exprs(sql_connector, copy_name)
+                tables_df = _list_se_tables(sql_connector, copy_name)
+                for table_name, row_count in tables_df.itertuples(index=False, name=None):
+                    try:
+                        row_count = int(row_count) if row_count is not None else 0
+                        db_snapshot[table_name] = _checksum_table(
+                            sql_connector, copy_name, table_name, row_count, table_name in keyed_tables,
+                            checksum_exprs.get(table_name, ROW_CHECKSUM))
+                    except Exception as e:
+                        logger.debug(f"Could not checksum {db_name}.{table_name}: {e}")
         except Exception as e:
             logger.warning(f"Could not access database {db_name}: {e}")
 
         snapshot['databases'][db_name] = db_snapshot
-        logger.info(f"Snapshot: {db_name} — {len(db_snapshot)} tables captured")
+        logger.info(f"Snapshot (checksum): {db_name} — {len(db_snapshot)} tables captured")
 
     return snapshot
 
 
+def _read_rows(sql_connector, db_name: str, table_name: str, buckets: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Read a table's rows, optionally only those in the given id blocks."""
+    if buckets is None:
+        columns, rows = sql_connector.execute_query_rows(f"SELECT * FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)")
+        return _rows_from_result(columns, rows)
+
+    rows = []
+    for i in range(0, len(buckets), 500):
+        chunk = ', '.join(str(int(b)) for b in buckets[i:i + 500])
+        columns, chunk_rows = sql_connector.execute_query_rows(f"""
+            SELECT * FROM [{db_name}].dbo.[{table_name}] WITH (NOLOCK)
+            WHERE [id] / {CHECKSUM_RANGE_SIZE} IN ({chunk})
+        """)
+        rows.extend(_rows_from_result(columns, chunk_rows))
+    return rows
+
+
+def complete_checksum_snapshot_se(sql_connector, before: Dict[str, Any],
+                                  max_rows_for_full_data: int = 500000) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    After phase of a two-phase snapshot.
+
+    Recomputes checksums on the live databases and reads rows only for the
+    tables and id blocks that changed, from both the live database and the
+    retained copy. Returns (before, after) snapshots in the take_snapshot_se
+    format for diff_snapshots(). Does not drop the retained copies.
+    """
+    timestamp = datetime.now().isoformat()
+    before_full = {'timestamp': before['timestamp'], 'source': 'opera_se', 'databases': {}}
+    after_full = {'timestamp': timestamp, 'source': 'opera_se', 'databases': {}}
+    retained = before.get('retained') or {}
+    tables_read = 0
+
+    for db_name, before_db in before.get('databases', {}).items():
+        copy_name = retained.get(db_name)
+        if not copy_name:
+            # Before phase fell back to a full snapshot for this database
+            before_full['databases'][db_name] = before_db
+            try:
+                after_full['databases'][db_name] = _snapshot_se_database(sql_connector, db_name, max_rows_for_full_data)
+            except Exception as e:
+                logger.warning(f"Could not access database {db_name}: {e}")
+                after_full['databases'][db_name] = {}
+            continue
+
+        before_out, after_out = {}, {}
+        try:
+            keyed_tables = _id_keyed_tables(sql_connector, db_name)
+            checksum_exprs = _checksum_exprs(sql_connector, db_name)
+            tables_df = _list_se_tables(sql_connector, db_name)
+            live_counts = {
+                name: int(count) if count is not None else 0
+                for name, count in tables_df.itertuples(index=False, name=None)
+            }
+        except Exception as e:
+            logger.warning(f"Could not access database {db_name}: {e}")
+            before_full['databases'][db_name] = {}
+            after_full['databases'][db_name] = {}
+            continue
+
+        for table_name in sorted(set(before_db) | set(live_counts)):
+            b_entry = before_db.get(table_name, {'row_count': 0, 'checksum': 0, 'ranges': {}})
+            try:
+                a_entry = _checksum_table(sql_connector, db_name, table_name,
+                                          live_counts.get(table_name, 0), table_name in keyed_tables,
+                                          checksum_exprs.get(table_name, ROW_CHECKSUM))
+            except Exception as e:
+                logger.debug(f"Could not checksum {db_name}.{table_name}: {e}")
+                continue
+
+            # A table that could not be checksummed on either side is always compared row by row
+            comparable = b_entry.get('checksum', 0) is not None and a_entry['checksum'] is not None
+            before_out[table_name] = {'row_count': b_entry.get('row_count', 0), 'checksum': b_entry.get('checksum') or 0, 'rows': None}
+            after_out[table_name] = {'row_count': a_entry['row_count'], 'checksum': a_entry['checksum'] or 0, 'rows': None}
+            if (comparable and before_out[table_name]['row_count'] == a_entry['row_count']
+                    and before_out[table_name]['checksum'] == a_entry['checksum']):
+                continue
+
+            try:
+                if comparable and a_entry.get('key') and b_entry.get('key', 'id'):
+                    b_ranges = b_entry.get('ranges') or {}
+                    a_ranges = a_entry.get('ranges') or {}
+                    buckets = sorted(
+                        (k for k in set(b_ranges) | set(a_ranges) if b_ranges.get(k) != a_ranges.get(k)),
+                        key=int,
+                    )
+                    after_out[table_name]['rows'] = _read_rows(sql_connector, db_name, table_name, buckets)
+                    before_out[table_name]['rows'] = (
+                        _read_rows(sql_connector, copy_name, table_name, buckets) if table_name in before_db else []
+                    )
+                elif max(a_entry['row_count'], b_entry.get('row_count', 0)) <= max_rows_for_full_data:
+                    after_out[table_name]['rows'] = _read_rows(sql_connector, db_name, table_name)
+                    before_out[table_name]['rows'] = (
+                        _read_rows(sql_connector, copy_name, table_name) if table_name in before_db else []
+                    )
+                    if not comparable:
+                        for out in (before_out, after_out):
+                            out[table_name]['checksum'] = _rows_checksum(out[table_name]['rows'])
+                tables_read += 1
+            except Exception as e:
+                logger.debug(f"Could not read changed rows of {db_name}.{table_name}: {e}")
+
+        before_full['databases'][db_name] = before_out
+        after_full['databases'][db_name] = after_out
+        logger.info(f"Snapshot (checksum): {db_name} — {len(after_out)} tables checked")
+
+    logger.info(f"Snapshot (checksum): read rows from {tables_read} changed table(s)")
+    return before_full, after_full
+
+
 def take_snapshot_opera3(data_path: str) -> Dict[str, Any]:
     """
     Take a complete snapshot of ALL Opera 3 FoxPro DBF tables.
@@ -337,12 +697,81 @@ def get_table_field_metadata(sql_connector, db_name: str, table_name: str) -> Di
         return {}
 
 
-def diff_snapshots(before: Dict, after: Dict, sql_connector=None) -> Dict[str, Any]:
+def _primary_key_column(rows: List[Dict]) -> Optional[str]:
+    """PK column for row-level diffs: 'id', else the first *_id column, else the first column."""
+    if not rows or 'id' in rows[0]:
+        return 'id'
+    for candidate in rows[0].keys():
+        if candidate.lower() == 'id' or candidate.lower().endswith('_id'):
+            return candidate
+    return list(rows[0].keys())[0] if rows[0] else None
+
+
+def _diff_table(db_name: str, table_name: str, before_table: Dict, after_table: Dict,
+                sql_connector=None) -> Optional[Dict[str, Any]]:
+    """Diff one table's before/after entries. Returns None if the table is unchanged."""
+    before_count = before_table.get('row_count', 0)
+    after_count = after_table.get('row_count', 0)
+    before_check = before_table.get('checksum', 0)
+    after_check = after_table.get('checksum', 0)
+
+    # Skip unchanged tables
+    if before_count == after_count and before_check == after_check:
+        return None
+
+    table_change = {
+        'database': db_name,
+        'table': table_name,
+        'before_rows': before_count,
+        'after_rows': after_count,
+        'rows_added': max(0, after_count - before_count),
+        'rows_deleted': max(0, before_count - after_count),
+        'checksum_changed': before_check != after_check,
+        'added_rows': [],
+        'deleted_rows': [],
+        'modified_rows': [],
+        'modified_fields': [],
+        'field_metadata': {},
+    }
+
+    # Get field metadata (mandatory/type/default) for changed tables
+    if sql_connector:
+        table_change['field_metadata'] = get_table_field_metadata(sql_connector, db_name, table_name)
+
+    # Detailed row-level diff if we have full row data
+    before_rows = before_table.get('rows')
+    after_rows = after_table.get('rows')
+
+    if before_rows is not None and after_rows is not None:
+        pk_col = _primary_key_column(before_rows)
+        if pk_col:
+            table_diff = snapshot_diff.diff_rows(before_rows, after_rows, pk_col)
+            table_change['added_rows'] = table_diff.added
+            table_change['deleted_rows'] = table_diff.deleted
+            table_change['modified_rows'] = [
+                {
+                    'pk': pk,
+                    'pk_column': pk_col,
+                    'changes': {field: {'before': bval, 'after': aval}
+                                for field, (bval, aval) in field_changes.items()},
+                }
+                for pk, field_changes, _ in table_diff.modified
+            ]
+            table_change['modified_fields'] = sorted(table_diff.modified_fields)
+
+    return table_change
+
+
+def diff_snapshots(before: Dict, after: Dict, sql_connector=None,
+                   max_workers: int = snapshot_diff.DEFAULT_DIFF_WORKERS) -> Dict[str, Any]:
     """
     Compare before and after snapshots. Returns detailed diff showing:
     - Tables with row count changes (added/deleted rows)
     - Tables with checksum changes (modified rows)
     - For each changed table: exact field-level changes
+
+    Changed tables are diffed concurrently (max_workers); results keep
+    database/table order.
     """
     changes = {
         'timestamp': datetime.now().isoformat(),
@@ -352,6 +781,8 @@ def diff_snapshots(before: Dict, after: Dict, sql_connector=None) -> Dict[str, A
     }
 
     # Compare each database
+    work = []
+    missing = {'row_count': 0, 'checksum': 0, 'rows': None}
     for db_name in set(list(before.get('databases', {}).keys()) + list(after.get('databases', {}).keys())):
         before_db = before.get('databases', {}).get(db_name, {})
         after_db = after.get('databases', {}).get(db_name, {})
@@ -360,92 +791,21 @@ def diff_snapshots(before: Dict, after: Dict, sql_connector=None) -> Dict[str, A
         changes['tables_checked'] += len(all_tables)
 
         for table_name in sorted(all_tables):
-            before_table = before_db.get(table_name, {'row_count': 0, 'checksum': 0, 'rows': None})
-            after_table = after_db.get(table_name, {'row_count': 0, 'checksum': 0, 'rows': None})
-
-            before_count = before_table.get('row_count', 0)
-            after_count = after_table.get('row_count', 0)
-            before_check = before_table.get('checksum', 0)
-            after_check = after_table.get('checksum', 0)
+            work.append((db_name, table_name,
+                         before_db.get(table_name, missing), after_db.get(table_name, missing)))
 
-            # Skip unchanged tables
-            if before_count == after_count and before_check == after_check:
-                continue
+    def run(item):
+        return _diff_table(*item, sql_connector=sql_connector)
 
-            changes['tables_changed'] += 1
-
-            table_change = {
-                'database': db_name,
-                'table': table_name,
-                'before_rows': before_count,
-                'after_rows': after_count,
-                'rows_added': max(0, after_count - before_count),
-                'rows_deleted': max(0, before_count - after_count),
-                'checksum_changed': before_check != after_check,
-                'added_rows': [],
-                'deleted_rows': [],
-                'modified_rows': [],
-                'modified_fields': set(),
-                'field_metadata': {},
-            }
-
-            # Get field metadata (mandatory/type/default) for changed tables
-            if sql_connector:
-                table_change['field_metadata'] = get_table_field_metadata(sql_connector, db_name, table_name)
-
-            # Detailed row-level diff if we have full row data
-            before_rows = before_table.get('rows')
-            after_rows = after_table.get('rows')
-
-            if before_rows is not None and after_rows is not None:
-                # Find primary key column (id, or first column)
-                pk_col = 'id'
-                if before_rows and pk_col not in before_rows[0]:
-                    # Try common PK patterns
-                    for candidate in before_rows[0].keys():
-                        if candidate.lower() == 'id' or candidate.lower().endswith('_id'):
-                            pk_col = candidate
-                            break
-                    else:
-                        pk_col = list(before_rows[0].keys())[0] if before_rows[0] else None
-
-                if pk_col:
-                    before_by_pk = {str(r.get(pk_col, '')): r for r in before_rows}
-                    after_by_pk = {str(r.get(pk_col, '')): r for r in after_rows}
-
-                    # Added rows
-                    for pk, row in after_by_pk.items():
-                        if pk not in before_by_pk:
-                            table_change['added_rows'].append(row)
-
-                    # Deleted rows
-                    for pk, row in before_by_pk.items():
-                        if pk not in after_by_pk:
-                            table_change['deleted_rows'].append(row)
-
-                    # Modified rows
-                    for pk in before_by_pk:
-                        if pk in after_by_pk:
-                            before_row = before_by_pk[pk]
-                            after_row = after_by_pk[pk]
-                            field_changes = {}
-                            for field in set(list(before_row.keys()) + list(after_row.keys())):
-                                bval = before_row.get(field)
-                                aval = after_row.get(field)
-                                if str(bval) != str(aval):
-                                    field_changes[field] = {'before': bval, 'after': aval}
-                                    table_change['modified_fields'].add(field)
-                            if field_changes:
-                                table_change['modified_rows'].append({
-                                    'pk': pk,
-                                    'pk_column': pk_col,
-                                    'changes': field_changes,
-                                })
-
-            # Convert set to list for JSON serialisation
-            table_change['modified_fields'] = sorted(list(table_change['modified_fields']))
-            changes['changes'].append(table_change)
+    workers = max(1, min(max_workers, len(work)))
+    if workers == 1:
+        results = [run(item) for item in work]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='snapshot-diff') as pool:
+            results = list(pool.map(run, work))
 
+    changes['changes'] = [table_change for table_change in results if table_change is not None]
+    changes['tables_changed'] = len(changes['changes'])
     return changes
 
 
@@ -832,12 +1192,18 @@ async def take_before_snapshot(
     module: str = Query(..., description="Module category (cashbook, sales_ledger, etc.)"),
     name: str = Query(..., description="Transaction type name (e.g., 'Sales Receipt — BACS')"),
     description: str = Query("", description="Detailed description of the transaction being entered"),
+    mode: str = Query("full", description="Opera SE only: 'full' or 'checksum' (two-phase — checksums now, changed rows read at /after; creates a SQL Server database snapshot of each Opera database until /after or /cancel)"),
 ):
     """
     Take a BEFORE snapshot of all Opera tables.
     Call this, then enter the transaction in Opera, then call /after.
     Automatically detects Opera SE (SQL) vs Opera 3 (FoxPro/SMB).
+
+    mode='checksum' is opt-in: it keeps a database snapshot on the live
+    server (copy-on-write) until /after or /cancel drops it.
     """
+    sql = None
+    snapshot = None
     # Detect Opera version and take appropriate snapshot
     opera_version = 'opera_se'
     try:
@@ -880,15 +1246,17 @@ async def take_before_snapshot(
                 logger.info(f"Taking BEFORE snapshot (Opera SE) for: {module}/{name} — database: {db_check.iloc[0]['db']}")
             except Exception:
                 logger.info(f"Taking BEFORE snapshot (Opera SE) for: {module}/{name}")
-            snapshot = take_snapshot_se(sql)
+            if mode == 'checksum':
+                snapshot = take_checksum_snapshot_se(sql)
+            else:
+                snapshot = take_snapshot_se(sql)
 
         # Save snapshot to temp file
         snap_path = _get_snapshot_path()
-        snap_file = os.path.join(snap_path, 'current_before.json')
+        snap_file = os.path.join(snap_path, BEFORE_SNAPSHOT_FILE)
         meta_file = os.path.join(snap_path, 'current_meta.json')
 
-        with open(snap_file, 'w') as f:
-            json.dump(snapshot, f)
+        snapshot_store.save_snapshot(snap_file, snapshot)
 
         meta = {
             'module': module,
@@ -896,6 +1264,7 @@ async def take_before_snapshot(
             'description': description,
             'before_timestamp': snapshot['timestamp'],
             'source': snapshot.get('source', 'opera_se'),
+            'mode': snapshot.get('mode', 'full'),
         }
         with open(meta_file, 'w') as f:
             json.dump(meta, f)
@@ -911,6 +1280,8 @@ async def take_before_snapshot(
         }
     except Exception as e:
         logger.error(f"Snapshot failed: {e}")
+        if snapshot and snapshot.get('retained'):
+            drop_retained_copies(sql, snapshot)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -920,18 +1291,24 @@ async def take_after_snapshot(request: Request):
     Take an AFTER snapshot and generate the diff.
     Must be called after /before and after the transaction is entered in Opera.
     Saves the result to the transaction library.
+
+    The database snapshots kept by a checksum-mode /before are dropped
+    whether or not this succeeds; if it fails, the pending snapshot is
+    discarded and /before must be taken again.
     """
     snap_path = _get_snapshot_path()
-    snap_file = os.path.join(snap_path, 'current_before.json')
+    snap_file = os.path.join(snap_path, BEFORE_SNAPSHOT_FILE)
     meta_file = os.path.join(snap_path, 'current_meta.json')
 
     if not os.path.exists(snap_file) or not os.path.exists(meta_file):
         raise HTTPException(status_code=400, detail="No before snapshot found. Take a before snapshot first.")
 
+    checksum_before = None
+    sql = None
+    completed = False
     try:
-        # Load before snapshot and metadata
-        with open(snap_file) as f:
-            before = json.load(f)
+        # Load before snapshot (table rows are only decompressed if the diff needs them) and metadata
+        before = snapshot_store.load_snapshot(snap_file)
         with open(meta_file) as f:
             meta = json.load(f)
 
@@ -959,7 +1336,11 @@ async def take_after_snapshot(request: Request):
             sql = _get_request_sql_connector(request)
             if not sql:
                 raise HTTPException(status_code=503, detail="No database connection")
-            after = take_snapshot_se(sql)
+            if before.get('mode') == 'checksum':
+                checksum_before = before
+                before, after = complete_checksum_snapshot_se(sql, checksum_before)
+            else:
+                after = take_snapshot_se(sql)
 
         # Generate diff
         diff = diff_snapshots(before, after, sql_connector=_get_sql_connector() if source != 'opera3' else None)
@@ -993,9 +1374,10 @@ async def take_after_snapshot(request: Request):
         with open(entry_file, 'w') as f:
             json.dump(entry, f, indent=2, default=str)
 
-        # Clean up temp files
+        # Clean up temp files (the database snapshots are dropped below)
         os.remove(snap_file)
         os.remove(meta_file)
+        completed = True
 
         logger.info(f"Transaction library entry saved: {entry_id} — {diff['tables_changed']} tables changed")
 
@@ -1035,7 +1417,18 @@ async def take_after_snapshot(request: Request):
         }
     except Exception as e:
         logger.error(f"After snapshot failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        detail = str(e)
+        if checksum_before:
+            detail += " — the before snapshot has been discarded; take a new one"
+        raise HTTPException(status_code=500, detail=detail)
+    finally:
+        # Never leave a database snapshot growing on the live server
+        if checksum_before:
+            drop_retained_copies(sql, checksum_before)
+            if not completed:
+                for path in (snap_file, meta_file):
+                    if os.path.exists(path):
+                        os.remove(path)
 
 
 @router.delete("/api/transaction-snapshot/library/{entry_id}")
@@ -1055,7 +1448,17 @@ async def delete_library_entry(entry_id: str):
 async def cancel_snapshot():
     """Cancel a pending snapshot (clean up before snapshot without taking after)."""
     snap_path = _get_snapshot_path()
-    for f in ['current_before.json', 'current_meta.json']:
+    snap_file = os.path.join(snap_path, BEFORE_SNAPSHOT_FILE)
+    if os.path.exists(snap_file):
+        try:
+            before = snapshot_store.load_snapshot(snap_file)
+            if before.get('retained'):
+                sql = _get_sql_connector()
+                if sql:
+                    drop_retained_copies(sql, before)
+        except Exception as e:
+            logger.warning(f"Could not drop retained snapshot copies: {e}")
+    for f in [BEFORE_SNAPSHOT_FILE, 'current_before.json', 'current_meta.json']:
         path = os.path.join(snap_path, f)
         if os.path.exists(path):
             os.remove(path)
@@ -17,15 +17,24 @@ Usage:
         name = db.get_field("PNAME", "PN_NAME")
     db.close("PNAME")
     db.shutdown()
+
+Batched access:
+    The per-field calls above cross the ctypes boundary once per field.
+    read_records moves many records as one packed buffer per call (see
+    PackedRecords):
+        rows = db.read_records("NTRAN", [5001, 5002], ["NT_JRNL", "NT_VALUE"])
+        total = sum(row["NT_VALUE"] for row in rows)
+        arr = rows.array()   # NumPy structured array, if numpy is installed
 """
 
 import ctypes
+import struct
 import sys
 import os
 import threading
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterable, Sequence, Tuple
 from datetime import date, datetime
 from contextlib import contextmanager
 
@@ -37,6 +46,136 @@ class HarbourDBFError(Exception):
     pass
 
 
+# DBF field type -> packed type code used by hb_dbf_read_records
+_PACKED_TYPES = {"C": "C", "N": "N", "F": "N", "I": "N", "Y": "N", "B": "N", "D": "D", "L": "L"}
+_PACKED_HEADER = "<iB"  # record number, deleted flag
+
+
+class RecordLayout:
+    """Packed row layout for a set of fields of one table.
+
+    Each row is: int32 recno, uint8 deleted, then each field as
+    C = width bytes (space padded), N = float64, D = 8 bytes YYYYMMDD,
+    L = 1 byte. All little-endian with no padding, matching dbfbridge.prg.
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, str, int, int]]):
+        """fields: (name, packed type C/N/D/L, width in bytes, field position)."""
+        self.fields = list(fields)
+        self.names = [name for name, _, _, _ in self.fields]
+        fmt = _PACKED_HEADER
+        for name, ftype, width, _ in self.fields:
+            fmt += {"C": f"{width}s", "N": "d", "D": "8s", "L": "?"}[ftype]
+        self._struct = struct.Struct(fmt)
+        self.row_size = self._struct.size
+
+    def c_args(self):
+        """(positions, type codes, widths, field count) for the C batch calls."""
+        n = len(self.fields)
+        positions = (ctypes.c_int * n)(*(pos for _, _, _, pos in self.fields))
+        widths = (ctypes.c_int * n)(*(width for _, _, width, _ in self.fields))
+        types = "".join(ftype for _, ftype, _, _ in self.fields).encode("ascii")
+        return positions, types, widths, n
+
+    def pack(self, rows: Iterable[Dict[str, Any]], recnos: Sequence[int] = None) -> bytearray:
+        """Pack dict rows into a buffer, as hb_dbf_read_records fills it. Missing fields are blank."""
+        rows = list(rows)
+        buf = bytearray(self.row_size * len(rows))
+        for i, row in enumerate(rows):
+            values = [recnos[i] if recnos is not None else 0, 0]
+            for name, ftype, width, _ in self.fields:
+                values.append(_pack_value(row.get(name), ftype, width, name))
+            self._struct.pack_into(buf, i * self.row_size, *values)
+        return buf
+
+    def unpack_row(self, buf, index: int, strip: bool = True) -> Tuple[int, bool, Dict[str, Any]]:
+        """(recno, deleted, {field: value}) for row `index` of a packed buffer."""
+        values = self._struct.unpack_from(buf, index * self.row_size)
+        row = {}
+        for (name, ftype, _, _), raw in zip(self.fields, values[2:]):
+            if ftype == "C":
+                raw = raw.decode("latin-1")
+                row[name] = raw.rstrip() if strip else raw
+            elif ftype == "D":
+                raw = raw.decode("ascii", errors="replace").strip()
+                row[name] = datetime.strptime(raw, "%Y%m%d").date() if raw else None
+            else:
+                row[name] = raw
+        return values[0], bool(values[1]), row
+
+    def dtype(self):
+        """NumPy structured dtype for the packed rows (requires numpy)."""
+        import numpy as np
+        spec = [("_recno", "<i4"), ("_deleted", "?")]
+        for name, ftype, width, _ in self.fields:
+            spec.append((name, {"C": f"S{width}", "N": "<f8", "D": "S8", "L": "?"}[ftype]))
+        return np.dtype(spec)
+
+
+def _pack_value(value: Any, ftype: str, width: int, name: str) -> Any:
+    """Convert a Python value to its packed form for one field."""
+    if ftype == "C":
+        if value is None:
+            value = ""
+        return str(value).encode("latin-1", errors="replace")[:width].ljust(width, b" ")
+    if ftype == "N":
+        return float(value or 0)
+    if ftype == "L":
+        return bool(value)
+    if value is None or value == "":
+        return b" " * 8
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y%m%d").encode("ascii")
+    if isinstance(value, str) and len(value) == 8 and value.isdigit():
+        return value.encode("ascii")
+    raise TypeError(f"Unsupported date value {value!r} for field '{name}'")
+
+
+class PackedRecords:
+    """Records read in one batch: a packed buffer plus its layout.
+
+    Iterating yields one dict per record (C fields stripped, D fields as
+    date or None). view() exposes the raw buffer without copying and
+    array() wraps it as a NumPy structured array.
+    """
+
+    def __init__(self, layout: RecordLayout, buf: bytearray):
+        self.layout = layout
+        self.buffer = buf
+
+    def __len__(self) -> int:
+        return len(self.buffer) // self.layout.row_size
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.layout.unpack_row(self.buffer, i)[2]
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return self.layout.unpack_row(self.buffer, index % len(self))[2]
+
+    @property
+    def recnos(self) -> List[int]:
+        """Record number of each row (0 where the requested record does not exist)."""
+        return [struct.unpack_from("<i", self.buffer, i * self.layout.row_size)[0]
+                for i in range(len(self))]
+
+    @property
+    def deleted(self) -> List[bool]:
+        """Deleted flag of each row."""
+        return [bool(self.buffer[i * self.layout.row_size + 4]) for i in range(len(self))]
+
+    def view(self) -> memoryview:
+        """The packed rows as a memoryview (no copy)."""
+        return memoryview(self.buffer)
+
+    def array(self):
+        """The packed rows as a NumPy structured array sharing this buffer."""
+        import numpy as np
+        return np.frombuffer(self.buffer, dtype=self.layout.dtype())
+
+
 class HarbourDBF:
     """Python interface to Harbour DBFCDX operations via shared library.
 
@@ -51,6 +190,7 @@ class HarbourDBF:
                       Auto-detects platform extension if not specified.
         """
         self._lock = threading.Lock()
+        self._layouts: Dict[str, Dict[str, Tuple[str, str, int, int]]] = {}
         self._lib = self._load_library(lib_path)
         self._setup_prototypes()
         self._initialized = False
@@ -197,6 +337,23 @@ class HarbourDBF:
         L.hb_dbf_is_open.restype = ctypes.c_int
         L.hb_dbf_is_open.argtypes = [ctypes.c_char_p]
 
+        # Deleted flag of the current record (absent from libraries built before it was added)
+        self.has_deleted = hasattr(L, "hb_dbf_deleted")
+        if self.has_deleted:
+            L.hb_dbf_deleted.restype = ctypes.c_int
+            L.hb_dbf_deleted.argtypes = [ctypes.c_char_p]
+
+        # Batched record access (absent from libraries built before it was added)
+        self.has_batch = hasattr(L, "hb_dbf_read_records")
+        if self.has_batch:
+            L.hb_dbf_field_info.restype = ctypes.c_char_p
+            L.hb_dbf_field_info.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+            int_p = ctypes.POINTER(ctypes.c_int)
+            L.hb_dbf_read_records.restype = ctypes.c_int
+            L.hb_dbf_read_records.argtypes = [
+                ctypes.c_char_p, int_p, ctypes.c_char_p, int_p, ctypes.c_int,
+                int_p, ctypes.c_int, ctypes.POINTER(ctypes.c_char)]
+
     # ================================================================
     # Encoding helpers
     # ================================================================
@@ -224,6 +381,7 @@ class HarbourDBF:
     def open(self, filepath: str, alias: str = "WORK") -> None:
         """Open a DBF table in shared mode. CDX auto-opens if present."""
         with self._lock:
+            self._layouts.pop(alias.upper(), None)
             rc = self._lib.hb_dbf_open(self._e(filepath), self._e(alias))
             if rc != 0:
                 raise HarbourDBFError(f"Failed to open '{filepath}' as '{alias}' — file may be locked or missing")
@@ -231,6 +389,7 @@ class HarbourDBF:
     def open_exclusive(self, filepath: str, alias: str = "WORK") -> None:
         """Open a DBF table in exclusive mode (for PACK/REINDEX)."""
         with self._lock:
+            self._layouts.pop(alias.upper(), None)
             rc = self._lib.hb_dbf_open_exclusive(self._e(filepath), self._e(alias))
             if rc != 0:
                 raise HarbourDBFError(f"Failed to open '{filepath}' exclusively — file may be in use")
@@ -238,11 +397,13 @@ class HarbourDBF:
     def close(self, alias: str = "WORK") -> None:
         """Close a workarea."""
         with self._lock:
+            self._layouts.pop(alias.upper(), None)
             self._lib.hb_dbf_close(self._e(alias))
 
     def close_all(self) -> None:
         """Close all open workareas."""
         with self._lock:
+            self._layouts.clear()
             self._lib.hb_dbf_close_all()
 
     def is_open(self, alias: str) -> bool:
@@ -392,6 +553,13 @@ class HarbourDBF:
         with self._lock:
             return self._lib.hb_dbf_reccount(self._e(alias))
 
+    def deleted(self, alias: str = "WORK") -> bool:
+        """Check if the current record is marked deleted."""
+        if not self.has_deleted:
+            raise HarbourDBFError("Harbour library has no hb_dbf_deleted - rebuild it with build.sh")
+        with self._lock:
+            return self._lib.hb_dbf_deleted(self._e(alias)) == 1
+
     # ================================================================
     # Index operations
     # ================================================================
@@ -502,6 +670,51 @@ class HarbourDBF:
         with self._lock:
             return self._d(self._lib.hb_dbf_ftype(self._e(alias), self._e(field.upper())))
 
+    # ================================================================
+    # Batched record access
+    # ================================================================
+
+    def _layout(self, alias: str, fields: Sequence[str]) -> RecordLayout:
+        """Packed layout for these fields of an open table (caller holds lock)."""
+        if not self.has_batch:
+            raise HarbourDBFError("Harbour library has no batch functions — rebuild it with ./build.sh")
+        known = self._layouts.setdefault(alias.upper(), {})
+        specs = []
+        for field in fields:
+            name = field.upper()
+            if name not in known:
+                info = self._d(self._lib.hb_dbf_field_info(self._e(alias), self._e(name)))
+                if not info:
+                    raise HarbourDBFError(f"No field '{name}' in '{alias}'")
+                pos, ftype, length, _ = info.split(",")
+                packed = _PACKED_TYPES.get(ftype)
+                if packed is None:
+                    raise HarbourDBFError(
+                        f"Field '{name}' in '{alias}' has type {ftype}, which cannot be batched")
+                width = {"C": int(length), "N": 8, "D": 8, "L": 1}[packed]
+                known[name] = (name, packed, width, int(pos))
+            specs.append(known[name])
+        return RecordLayout(specs)
+
+    def read_records(self, alias: str, recnos: Sequence[int], fields: Sequence[str]) -> PackedRecords:
+        """Read the given fields of many records (by number) in one call.
+
+        Rows come back in the order of `recnos`; a record number past the end
+        of the table gives a row with recno 0 and blank values.
+        """
+        with self._lock:
+            layout = self._layout(alias, fields)
+            buf = bytearray(layout.row_size * len(recnos))
+            if recnos:
+                positions, types, widths, n = layout.c_args()
+                rc = self._lib.hb_dbf_read_records(
+                    self._e(alias), positions, types, widths, n,
+                    (ctypes.c_int * len(recnos))(*recnos), len(recnos),
+                    (ctypes.c_char * len(buf)).from_buffer(buf))
+                if rc != len(recnos):
+                    raise HarbourDBFError(f"Failed to read records from '{alias}' (rc={rc})")
+            return PackedRecords(layout, buf)
+
     # ================================================================
     # Context managers
     # ================================================================
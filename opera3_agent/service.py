@@ -23,6 +23,7 @@ from __future__ import annotations
 
 import os
 import sys
+import json
 import time
 import logging
 import platform
@@ -33,8 +34,9 @@ from dataclasses import dataclass, field, asdict
 
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from contextlib import asynccontextmanager
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from contextlib import ExitStack, asynccontextmanager
 
 from opera3_agent.write_ahead_log import WriteAheadLog, OperationStatus
 from opera3_agent.transaction_safety import TransactionSafety
@@ -50,7 +52,7 @@ OPERA3_BASE_PATH = os.environ.get("OPERA3_BASE_PATH", os.environ.get("OPERA3_DAT
 # Legacy: single company path (still supported for backward compat)
 OPERA3_DATA_PATH = os.environ.get("OPERA3_DATA_PATH", "")
 OPERA3_AGENT_KEY = os.environ.get("OPERA3_AGENT_KEY", "")
-AGENT_VERSION = "1.2.0"
+AGENT_VERSION = "1.3.0"
 START_TIME = time.time()
 
 # Company data paths discovered from seqco.dbf
@@ -424,7 +426,7 @@ def get_importer():
             )
 
 
-def safe_import(operation_type: str, params: dict, import_fn) -> dict:
+def safe_import(operation_type: str, params: dict, import_fn, importer=None) -> dict:
     """Execute an import operation wrapped with WAL + verification + compensation.
 
     This is the core safety wrapper. Every import endpoint calls this instead
@@ -443,6 +445,9 @@ def safe_import(operation_type: str, params: dict, import_fn) -> dict:
         operation_type: e.g. "purchase_payment"
         params: request parameters (for WAL and compensation)
         import_fn: callable that executes the actual import, returns result
+        importer: the Opera3FoxProImport import_fn posts with; the record
+            numbers it wrote are added to the result as written_records, so
+            verification (and compensation) read only those records
 
     Returns:
         dict suitable for JSON response
@@ -457,10 +462,16 @@ def safe_import(operation_type: str, params: dict, import_fn) -> dict:
 
     try:
         wal.mark_in_progress(op_id)
+        if importer is not None:
+            importer.take_written_records()  # drop anything from earlier calls
 
         # Execute the actual write operation
         result = import_fn()
         result_dict = result_to_dict(result)
+        if importer is not None:
+            written = importer.take_written_records()
+            if written:
+                result_dict["written_records"] = written
 
         # If the import itself reported failure, no verification needed
         if not result_dict.get("success", False):
@@ -564,7 +575,7 @@ async def lifespan(app: FastAPI):
     # Initialise safety layer with first available data path
     first_path = next(iter(_company_paths.values()), OPERA3_DATA_PATH)
     if first_path and os.path.isdir(first_path):
-        safety = TransactionSafety(first_path)
+        safety = TransactionSafety(first_path, harbour=_open_harbour())
         logger.info("Transaction safety layer initialised")
 
         # Crash recovery — check for incomplete operations
@@ -581,6 +592,17 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("Opera 3 Write Agent shutting down")
+    wal.close()
+
+
+def _open_harbour():
+    """HarbourDBF for post-write verification reads, or None to use the dbf package."""
+    try:
+        from opera3_agent.harbour_dbf import HarbourDBF
+        return HarbourDBF()
+    except Exception as e:
+        logger.info(f"Harbour bridge not available - verification reads use the dbf package: {e}")
+        return None
 
 
 def _run_crash_recovery(wal: WriteAheadLog, safety: TransactionSafety):
@@ -700,6 +722,175 @@ async def detailed_status():
     }
 
 
+# ============================================================
+# Transaction Postings
+# ============================================================
+# One function per operation, shared by the single-operation endpoints and
+# /bulk. Each takes the importer and the validated request.
+
+def _post_purchase_payment(importer, req: PurchasePaymentRequest):
+    return importer.import_purchase_payment(
+        bank_account=req.bank_account,
+        supplier_account=req.supplier_account,
+        amount_pounds=req.amount_pounds,
+        reference=req.reference,
+        post_date=parse_date(req.post_date),
+        input_by=req.input_by,
+        creditors_control=req.creditors_control,
+        payment_type=req.payment_type,
+        cbtype=req.cbtype,
+        validate_only=req.validate_only,
+    )
+
+
+def _post_sales_receipt(importer, req: SalesReceiptRequest):
+    return importer.import_sales_receipt(
+        bank_account=req.bank_account,
+        customer_account=req.customer_account,
+        amount_pounds=req.amount_pounds,
+        reference=req.reference,
+        post_date=parse_date(req.post_date),
+        input_by=req.input_by,
+        debtors_control=req.debtors_control,
+        receipt_type=req.receipt_type,
+        cbtype=req.cbtype,
+        validate_only=req.validate_only,
+    )
+
+
+def _post_sales_refund(importer, req: SalesRefundRequest):
+    return importer.import_sales_refund(
+        bank_account=req.bank_account,
+        customer_account=req.customer_account,
+        amount_pounds=req.amount_pounds,
+        reference=req.reference,
+        post_date=parse_date(req.post_date),
+        input_by=req.input_by,
+        debtors_control=req.debtors_control,
+        payment_method=req.payment_method,
+        cbtype=req.cbtype,
+        validate_only=req.validate_only,
+        comment=req.comment,
+    )
+
+
+def _post_purchase_refund(importer, req: PurchaseRefundRequest):
+    return importer.import_purchase_refund(
+        bank_account=req.bank_account,
+        supplier_account=req.supplier_account,
+        amount_pounds=req.amount_pounds,
+        reference=req.reference,
+        post_date=parse_date(req.post_date),
+        input_by=req.input_by,
+        creditors_control=req.creditors_control,
+        payment_type=req.payment_type,
+        cbtype=req.cbtype,
+        validate_only=req.validate_only,
+        comment=req.comment,
+    )
+
+
+def _post_bank_transfer(importer, req: BankTransferRequest):
+    return importer.import_bank_transfer(
+        source_bank=req.source_bank,
+        dest_bank=req.dest_bank,
+        amount_pounds=req.amount_pounds,
+        reference=req.reference,
+        post_date=parse_date(req.post_date),
+        comment=req.comment,
+        input_by=req.input_by,
+        post_to_nominal=req.post_to_nominal,
+        cbtype=req.cbtype,
+    )
+
+
+def _post_nominal_entry(importer, req: NominalEntryRequest):
+    return importer.import_nominal_entry(
+        bank_account=req.bank_account,
+        nominal_account=req.nominal_account,
+        amount_pounds=req.amount_pounds,
+        reference=req.reference,
+        post_date=parse_date(req.post_date),
+        description=req.description,
+        input_by=req.input_by,
+        is_receipt=req.is_receipt,
+        cbtype=req.cbtype,
+        validate_only=req.validate_only,
+        project_code=req.project_code,
+        department_code=req.department_code,
+        vat_code=req.vat_code,
+    )
+
+
+def _post_gocardless_batch(importer, req: GoCardlessBatchRequest):
+    return importer.import_gocardless_batch(
+        bank_account=req.bank_account,
+        payments=req.payments,
+        post_date=parse_date(req.post_date),
+        reference=req.reference,
+        gocardless_fees=req.gocardless_fees,
+        vat_on_fees=req.vat_on_fees,
+        fees_nominal_account=req.fees_nominal_account,
+        fees_vat_code=req.fees_vat_code,
+        fees_payment_type=req.fees_payment_type,
+        complete_batch=req.complete_batch,
+        input_by=req.input_by,
+        cbtype=req.cbtype,
+        validate_only=req.validate_only,
+        auto_allocate=req.auto_allocate,
+        currency=req.currency,
+        destination_bank=req.destination_bank,
+        transfer_cbtype=req.transfer_cbtype,
+    )
+
+
+def _post_recurring_entry(importer, req: RecurringEntryRequest):
+    return importer.post_recurring_entry(
+        bank_account=req.bank_account,
+        entry_ref=req.entry_ref,
+        override_date=parse_date(req.override_date),
+        input_by=req.input_by,
+    )
+
+
+def _allocate_receipt(importer, req: AutoAllocateReceiptRequest):
+    return importer.auto_allocate_receipt(
+        customer_account=req.customer_account,
+        receipt_ref=req.receipt_ref,
+        receipt_amount=req.receipt_amount,
+        allocation_date=parse_date(req.allocation_date),
+        bank_account=req.bank_account,
+        description=req.description,
+    )
+
+
+def _allocate_payment(importer, req: AutoAllocatePaymentRequest):
+    return importer.auto_allocate_payment(
+        supplier_account=req.supplier_account,
+        payment_ref=req.payment_ref,
+        payment_amount=req.payment_amount,
+        allocation_date=parse_date(req.allocation_date),
+        bank_account=req.bank_account,
+        description=req.description,
+    )
+
+
+# Operation type -> (request model, posting function, runs through safe_import).
+# Allocations are not WAL-protected, as on their own endpoints.
+BULK_OPERATIONS = {
+    "purchase_payment": (PurchasePaymentRequest, _post_purchase_payment, True),
+    "sales_receipt": (SalesReceiptRequest, _post_sales_receipt, True),
+    "sales_refund": (SalesRefundRequest, _post_sales_refund, True),
+    "purchase_refund": (PurchaseRefundRequest, _post_purchase_refund, True),
+    "bank_transfer": (BankTransferRequest, _post_bank_transfer, True),
+    "nominal_entry": (NominalEntryRequest, _post_nominal_entry, True),
+    "gocardless_batch": (GoCardlessBatchRequest, _post_gocardless_batch, True),
+    "recurring_entry": (RecurringEntryRequest, _post_recurring_entry, True),
+    "allocate_receipt": (AutoAllocateReceiptRequest, _allocate_receipt, False),
+    "allocate_payment": (AutoAllocatePaymentRequest, _allocate_payment, False),
+}
+
+
 # ============================================================
 # Transaction Import Endpoints
 # ============================================================
@@ -708,188 +899,71 @@ async def detailed_status():
 async def import_purchase_payment(req: PurchasePaymentRequest):
     """Import a purchase payment (money out to supplier)."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "purchase_payment",
-        req.model_dump(),
-        lambda: importer.import_purchase_payment(
-            bank_account=req.bank_account,
-            supplier_account=req.supplier_account,
-            amount_pounds=req.amount_pounds,
-            reference=req.reference,
-            post_date=post_date,
-            input_by=req.input_by,
-            creditors_control=req.creditors_control,
-            payment_type=req.payment_type,
-            cbtype=req.cbtype,
-            validate_only=req.validate_only,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("purchase_payment", req.model_dump(),
+                       lambda: _post_purchase_payment(importer, req), importer)
 
 
 @app.post("/import/sales-receipt", dependencies=[Depends(verify_agent_key)])
 async def import_sales_receipt(req: SalesReceiptRequest):
     """Import a sales receipt (money in from customer)."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "sales_receipt",
-        req.model_dump(),
-        lambda: importer.import_sales_receipt(
-            bank_account=req.bank_account,
-            customer_account=req.customer_account,
-            amount_pounds=req.amount_pounds,
-            reference=req.reference,
-            post_date=post_date,
-            input_by=req.input_by,
-            debtors_control=req.debtors_control,
-            receipt_type=req.receipt_type,
-            cbtype=req.cbtype,
-            validate_only=req.validate_only,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("sales_receipt", req.model_dump(),
+                       lambda: _post_sales_receipt(importer, req), importer)
 
 
 @app.post("/import/sales-refund", dependencies=[Depends(verify_agent_key)])
 async def import_sales_refund(req: SalesRefundRequest):
     """Import a sales refund (money out to customer)."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "sales_refund",
-        req.model_dump(),
-        lambda: importer.import_sales_refund(
-            bank_account=req.bank_account,
-            customer_account=req.customer_account,
-            amount_pounds=req.amount_pounds,
-            reference=req.reference,
-            post_date=post_date,
-            input_by=req.input_by,
-            debtors_control=req.debtors_control,
-            payment_method=req.payment_method,
-            cbtype=req.cbtype,
-            validate_only=req.validate_only,
-            comment=req.comment,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("sales_refund", req.model_dump(),
+                       lambda: _post_sales_refund(importer, req), importer)
 
 
 @app.post("/import/purchase-refund", dependencies=[Depends(verify_agent_key)])
 async def import_purchase_refund(req: PurchaseRefundRequest):
     """Import a purchase refund (money in from supplier)."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "purchase_refund",
-        req.model_dump(),
-        lambda: importer.import_purchase_refund(
-            bank_account=req.bank_account,
-            supplier_account=req.supplier_account,
-            amount_pounds=req.amount_pounds,
-            reference=req.reference,
-            post_date=post_date,
-            input_by=req.input_by,
-            creditors_control=req.creditors_control,
-            payment_type=req.payment_type,
-            cbtype=req.cbtype,
-            validate_only=req.validate_only,
-            comment=req.comment,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("purchase_refund", req.model_dump(),
+                       lambda: _post_purchase_refund(importer, req), importer)
 
 
 @app.post("/import/bank-transfer", dependencies=[Depends(verify_agent_key)])
 async def import_bank_transfer(req: BankTransferRequest):
     """Import a bank transfer between two bank accounts."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "bank_transfer",
-        req.model_dump(),
-        lambda: importer.import_bank_transfer(
-            source_bank=req.source_bank,
-            dest_bank=req.dest_bank,
-            amount_pounds=req.amount_pounds,
-            reference=req.reference,
-            post_date=post_date,
-            comment=req.comment,
-            input_by=req.input_by,
-            post_to_nominal=req.post_to_nominal,
-            cbtype=req.cbtype,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("bank_transfer", req.model_dump(),
+                       lambda: _post_bank_transfer(importer, req), importer)
 
 
 @app.post("/import/nominal-entry", dependencies=[Depends(verify_agent_key)])
 async def import_nominal_entry(req: NominalEntryRequest):
     """Import a nominal entry (direct to nominal account)."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "nominal_entry",
-        req.model_dump(),
-        lambda: importer.import_nominal_entry(
-            bank_account=req.bank_account,
-            nominal_account=req.nominal_account,
-            amount_pounds=req.amount_pounds,
-            reference=req.reference,
-            post_date=post_date,
-            description=req.description,
-            input_by=req.input_by,
-            is_receipt=req.is_receipt,
-            cbtype=req.cbtype,
-            validate_only=req.validate_only,
-            project_code=req.project_code,
-            department_code=req.department_code,
-            vat_code=req.vat_code,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("nominal_entry", req.model_dump(),
+                       lambda: _post_nominal_entry(importer, req), importer)
 
 
 @app.post("/import/gocardless-batch", dependencies=[Depends(verify_agent_key)])
 async def import_gocardless_batch(req: GoCardlessBatchRequest):
     """Import a GoCardless batch of customer payments."""
     importer = get_importer()
-    post_date = parse_date(req.post_date)
-    return safe_import(
-        "gocardless_batch",
-        req.model_dump(),
-        lambda: importer.import_gocardless_batch(
-            bank_account=req.bank_account,
-            payments=req.payments,
-            post_date=parse_date(req.post_date),
-            reference=req.reference,
-            gocardless_fees=req.gocardless_fees,
-            vat_on_fees=req.vat_on_fees,
-            fees_nominal_account=req.fees_nominal_account,
-            fees_vat_code=req.fees_vat_code,
-            fees_payment_type=req.fees_payment_type,
-            complete_batch=req.complete_batch,
-            input_by=req.input_by,
-            cbtype=req.cbtype,
-            validate_only=req.validate_only,
-            auto_allocate=req.auto_allocate,
-            currency=req.currency,
-            destination_bank=req.destination_bank,
-            transfer_cbtype=req.transfer_cbtype,
-        ),
-    )
+    parse_date(req.post_date)  # reject a bad date before it reaches the WAL
+    return safe_import("gocardless_batch", req.model_dump(),
+                       lambda: _post_gocardless_batch(importer, req), importer)
 
 
 @app.post("/import/recurring-entry", dependencies=[Depends(verify_agent_key)])
 async def post_recurring_entry(req: RecurringEntryRequest):
     """Post a recurring entry from arhead/arline."""
     importer = get_importer()
-    return safe_import(
-        "recurring_entry",
-        req.model_dump(),
-        lambda: importer.post_recurring_entry(
-            bank_account=req.bank_account,
-            entry_ref=req.entry_ref,
-            override_date=parse_date(req.override_date),
-            input_by=req.input_by,
-        ),
-    )
+    return safe_import("recurring_entry", req.model_dump(),
+                       lambda: _post_recurring_entry(importer, req), importer)
 
 
 # ============================================================
@@ -901,15 +975,7 @@ async def auto_allocate_receipt(req: AutoAllocateReceiptRequest):
     """Auto-allocate a customer receipt to invoices."""
     importer = get_importer()
     try:
-        result = importer.auto_allocate_receipt(
-            customer_account=req.customer_account,
-            receipt_ref=req.receipt_ref,
-            receipt_amount=req.receipt_amount,
-            allocation_date=parse_date(req.allocation_date),
-            bank_account=req.bank_account,
-            description=req.description,
-        )
-        return result_to_dict(result)
+        return result_to_dict(_allocate_receipt(importer, req))
     except Exception as e:
         logger.error(f"auto_allocate_receipt failed: {e}", exc_info=True)
         return {"success": False, "errors": [str(e)]}
@@ -920,20 +986,115 @@ async def auto_allocate_payment(req: AutoAllocatePaymentRequest):
     """Auto-allocate a supplier payment to invoices."""
     importer = get_importer()
     try:
-        result = importer.auto_allocate_payment(
-            supplier_account=req.supplier_account,
-            payment_ref=req.payment_ref,
-            payment_amount=req.payment_amount,
-            allocation_date=parse_date(req.allocation_date),
-            bank_account=req.bank_account,
-            description=req.description,
-        )
-        return result_to_dict(result)
+        return result_to_dict(_allocate_payment(importer, req))
     except Exception as e:
         logger.error(f"auto_allocate_payment failed: {e}", exc_info=True)
         return {"success": False, "errors": [str(e)]}
 
 
+# ============================================================
+# Bulk Endpoint
+# ============================================================
+
+class BulkOperation(BaseModel):
+    type: str  # key of BULK_OPERATIONS, e.g. "sales_receipt"
+    params: Dict[str, Any]
+
+
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation]
+    stop_on_error: bool = False  # skip the rest after the first failure
+
+
+def _run_bulk_operation(importer, op_type: str, req: BaseModel) -> dict:
+    """Run one bulk operation the way its own endpoint would.
+
+    Any error is reported as this operation's result, so it never reaches
+    the rest of the batch.
+    """
+    _, post_fn, protected = BULK_OPERATIONS[op_type]
+    try:
+        if protected:
+            return safe_import(op_type, req.model_dump(), lambda: post_fn(importer, req), importer)
+        return result_to_dict(post_fn(importer, req))
+    except HTTPException as e:
+        return {"success": False, "errors": [str(e.detail)]}
+    except Exception as e:
+        logger.error(f"bulk {op_type} failed: {e}", exc_info=True)
+        return {"success": False, "errors": [str(e)]}
+
+
+def _bulk_results(importer, requests: List[tuple], stop_on_error: bool):
+    """Run the operations under one set of table locks, yielding NDJSON lines."""
+    def line(index, op_type, result):
+        return json.dumps({"index": index, "type": op_type, **result}, default=str) + "\n"
+
+    with ExitStack() as stack:
+        try:
+            stack.enter_context(importer.hold_locks())
+        except Exception as e:
+            logger.error(f"bulk: could not lock tables: {e}")
+            for index, (op_type, _) in enumerate(requests):
+                yield line(index, op_type, {"success": False, "errors": [f"Could not lock tables: {e}"]})
+            return
+
+        stopped = None
+        for index, (op_type, req) in enumerate(requests):
+            if stopped is None and safety is not None and safety.writes_blocked:
+                stopped = f"Writes are BLOCKED: {safety.block_reason}"
+            if stopped is not None:
+                result = {"success": False, "skipped": True, "errors": [stopped]}
+            else:
+                result = _run_bulk_operation(importer, op_type, req)
+                if stop_on_error and not result.get("success", False):
+                    stopped = f"Skipped after operation {index} failed"
+            yield line(index, op_type, result)
+
+
+# Date fields parsed by the posting functions, checked before anything reaches the WAL
+BULK_DATE_FIELDS = ("post_date", "allocation_date", "override_date")
+
+
+@app.post("/bulk", dependencies=[Depends(verify_agent_key)])
+async def bulk(req: BulkRequest):
+    """Run several postings in one request.
+
+    The posting tables are locked once for the whole batch, each operation
+    still gets its own WAL record, verification and compensation, and one
+    JSON result per operation is streamed back (NDJSON) as it completes.
+    Every operation, dates included, is validated before anything is posted.
+    """
+    requests = []
+    problems = []
+    for index, op in enumerate(req.operations):
+        spec = BULK_OPERATIONS.get(op.type)
+        if spec is None:
+            problems.append(f"{index}: unknown operation type '{op.type}'")
+            continue
+        try:
+            op_req = spec[0].model_validate(op.params)
+        except ValidationError as e:
+            problems.append(f"{index}: {op.type}: {e.error_count()} invalid field(s): "
+                            + "; ".join(f"{'.'.join(map(str, err['loc']))} {err['msg']}" for err in e.errors()))
+            continue
+        bad_dates = []
+        for name in BULK_DATE_FIELDS:
+            try:
+                parse_date(getattr(op_req, name, None))
+            except HTTPException as e:
+                bad_dates.append(f"{name} {e.detail}")
+        if bad_dates:
+            problems.append(f"{index}: {op.type}: " + "; ".join(bad_dates))
+            continue
+        requests.append((op.type, op_req))
+    if problems:
+        raise HTTPException(status_code=400, detail=problems)
+
+    importer = get_importer()
+    return StreamingResponse(_bulk_results(importer, requests, req.stop_on_error),
+                             media_type="application/x-ndjson")
+
+
 # ============================================================
 # Reconciliation Endpoints
 # ============================================================
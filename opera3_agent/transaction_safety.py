@@ -14,7 +14,12 @@ Provides three critical safety mechanisms for multi-table FoxPro writes:
 3. CRASH RECOVERY — On agent startup, scan the WAL for incomplete operations.
    Verify their state and compensate if needed.
 
-This module uses the `dbf` package (read-only) for verification reads.
+Verification reads only the records the posting wrote: the importer reports
+their record numbers (result["written_records"]), and each is read directly
+by number, through the Harbour bridge when one is supplied, else the `dbf`
+package (read-only). The cost is the same however large atran/stran/ntran
+grow. Results without record numbers (e.g. WAL entries from older agents)
+fall back to scanning the tail of each table.
 It does NOT modify CDX indexes — compensation uses FoxPro soft-delete which
 is safe even without CDX maintenance (Opera respects SET DELETED ON).
 
@@ -186,8 +191,18 @@ class TransactionSafety:
             compensation = safety.compensate("purchase_payment", params, result)
     """
 
-    def __init__(self, data_path: str):
+    def __init__(self, data_path: str, harbour: Any = None):
+        """
+        Args:
+            data_path: Opera 3 company data folder
+            harbour: Optional HarbourDBF instance for verification reads
+        """
         self.data_path = Path(data_path)
+        if harbour is not None and not _HarbourRecordReader.supported(harbour):
+            logger.warning("Harbour library cannot report deleted records - "
+                           "verification reads use the dbf package")
+            harbour = None
+        self.harbour = harbour
         # Writes blocked if True (set by failed compensation)
         self.writes_blocked = False
         self.block_reason = ""
@@ -199,8 +214,10 @@ class TransactionSafety:
     def verify(self, operation_type: str, result: dict) -> VerificationResult:
         """Verify all expected records were written.
 
-        Scans DBF tables from the end (recently appended records) to confirm
-        every record expected by the operation type exists.
+        Reads the records the posting reported writing (written_records) and
+        counts those carrying the entry/journal number, then checks that the
+        posting's ntran rows balance. Without written_records, scans the end
+        of each table instead.
 
         Args:
             operation_type: e.g. "purchase_payment", "sales_receipt"
@@ -209,7 +226,8 @@ class TransactionSafety:
         Returns:
             VerificationResult with passed=True if all records found
         """
-        if not DBF_AVAILABLE:
+        written = {t.lower(): recnos for t, recnos in (result.get("written_records") or {}).items()}
+        if not DBF_AVAILABLE and self.harbour is None:
             return VerificationResult(
                 passed=True,
                 details="Verification skipped — dbf package not available",
@@ -233,7 +251,32 @@ class TransactionSafety:
 
         checks = []
         missing = []
+        reader = self._record_reader() if written else None
+
+        try:
+            self._run_checks(profile, entry_number, journal_number, written, reader, checks, missing)
+            if reader is not None and written.get("ntran") and any(
+                    spec["table"] == "ntran" for spec in profile):
+                self._check_ntran_balance(written["ntran"], reader, checks, missing)
+        finally:
+            if reader is not None:
+                reader.close()
+
+        passed = len(missing) == 0
+        if passed:
+            details = f"All {len(checks)} checks passed"
+        else:
+            details = f"FAILED: Missing records in: {'; '.join(missing)}"
 
+        return VerificationResult(
+            passed=passed,
+            checks=checks,
+            missing_records=missing,
+            details=details,
+        )
+
+    def _run_checks(self, profile, entry_number, journal_number, written, reader, checks, missing):
+        """Count the expected records for each profile entry."""
         for spec in profile:
             table_name = spec["table"]
             key_field = spec["key_field"]
@@ -254,9 +297,14 @@ class TransactionSafety:
                 continue
 
             try:
-                found_count = self._count_records(
-                    table_name, key_field, search_value
-                )
+                if reader is not None:
+                    values = reader.read_many(table_name, written.get(table_name, []), key_field,
+                                              numeric=isinstance(search_value, (int, float)))
+                    found_count = sum(1 for value in values if _key_matches(value, search_value))
+                else:
+                    found_count = self._count_records(
+                        table_name, key_field, search_value
+                    )
                 if count_min:
                     ok = found_count >= expected_count
                 else:
@@ -291,18 +339,25 @@ class TransactionSafety:
                 if not is_optional:
                     missing.append(f"{table_name} (error: {e})")
 
-        passed = len(missing) == 0
-        if passed:
-            details = f"All {len(checks)} checks passed"
-        else:
-            details = f"FAILED: Missing records in: {'; '.join(missing)}"
-
-        return VerificationResult(
-            passed=passed,
-            checks=checks,
-            missing_records=missing,
-            details=details,
-        )
+    def _check_ntran_balance(self, recnos, reader, checks, missing):
+        """The nominal postings written by one operation must net to zero."""
+        try:
+            total = round(sum(value or 0 for value in
+                              reader.read_many("ntran", recnos, "nt_value", numeric=True)), 2)
+        except Exception as e:
+            checks.append({"table": "ntran", "field": "nt_value", "error": str(e), "passed": False})
+            missing.append(f"ntran balance (error: {e})")
+            return
+        ok = abs(total) < 0.005
+        checks.append({
+            "table": "ntran",
+            "field": "nt_value",
+            "expected": 0,
+            "found": total,
+            "passed": ok,
+        })
+        if not ok:
+            missing.append(f"ntran (postings do not balance: net {total:.2f})")
 
     # ------------------------------------------------------------------
     # Compensation (undo)
@@ -313,7 +368,9 @@ class TransactionSafety:
     ) -> CompensationResult:
         """Attempt to undo a failed/partial write operation.
 
-        Soft-deletes inserted records by scanning from the end of each table.
+        Soft-deletes inserted records: those the posting reported writing
+        when the result has written_records, else by scanning from the end of
+        each table.
         Balance adjustments are LOGGED but NOT applied (manual fix required
         until Harbour bridge enables safe automated writes).
 
@@ -343,6 +400,7 @@ class TransactionSafety:
 
         entry_number = result.get("entry_number", "")
         journal_number = result.get("journal_number", 0)
+        written = {t.lower(): recnos for t, recnos in (result.get("written_records") or {}).items()}
 
         steps: List[str] = []
         errors: List[str] = []
@@ -365,7 +423,8 @@ class TransactionSafety:
 
             try:
                 deleted_count = self._delete_records(
-                    table_name, key_field, search_value
+                    table_name, key_field, search_value,
+                    recnos=written.get(table_name, []) if written else None,
                 )
                 if deleted_count > 0:
                     steps.append(
@@ -508,6 +567,12 @@ class TransactionSafety:
                 return f
         raise FileNotFoundError(f"DBF file not found for table: {table_name}")
 
+    def _record_reader(self):
+        """Reader for verifying records by number (Harbour when available)."""
+        if self.harbour is not None:
+            return _HarbourRecordReader(self.harbour, self._resolve_dbf_path)
+        return _DbfRecordReader(self._resolve_dbf_path)
+
     def _count_records(
         self, table_name: str, key_field: str, search_value: Any,
         max_scan: int = 1000,
@@ -515,8 +580,20 @@ class TransactionSafety:
         """Count records matching key_field=search_value, scanning from end.
 
         Scans the last `max_scan` records (most recent appends are at the end).
-        This avoids full table scans on large tables.
+        This avoids full table scans on large tables. With the Harbour bridge
+        they are read in one read_records call.
         """
+        if self.harbour is not None:
+            reader = _HarbourRecordReader(self.harbour, self._resolve_dbf_path)
+            try:
+                total = reader.reccount(table_name)
+                recnos = list(range(max(total - max_scan, 0) + 1, total + 1))
+                values = reader.read_many(table_name, recnos, key_field,
+                                          numeric=isinstance(search_value, (int, float)))
+                return sum(1 for value in values if _key_matches(value, search_value))
+            finally:
+                reader.close()
+
         dbf_path = str(self._resolve_dbf_path(table_name))
         table = dbf.Table(dbf_path)
         table.open(dbf.READ_ONLY)
@@ -529,25 +606,8 @@ class TransactionSafety:
                 record = table[i]
                 if dbf.is_deleted(record):
                     continue
-
-                raw = getattr(record, key_field, None)
-                if raw is None:
-                    continue
-
-                # Compare: string fields need strip(), numeric fields direct
-                if isinstance(raw, str):
-                    if raw.strip() == str(search_value).strip():
-                        count += 1
-                elif isinstance(raw, (int, float)):
-                    if isinstance(search_value, (int, float)):
-                        if raw == search_value:
-                            count += 1
-                    else:
-                        try:
-                            if raw == int(search_value):
-                                count += 1
-                        except (ValueError, TypeError):
-                            pass
+                if _key_matches(getattr(record, key_field, None), search_value):
+                    count += 1
 
             return count
         finally:
@@ -555,13 +615,16 @@ class TransactionSafety:
 
     def _delete_records(
         self, table_name: str, key_field: str, search_value: Any,
-        max_scan: int = 1000,
+        max_scan: int = 1000, recnos: Optional[List[int]] = None,
     ) -> int:
         """Soft-delete records matching key_field=search_value.
 
         Uses FoxPro soft-delete (marks deletion flag). Opera respects
         SET DELETED ON and will skip these records.
 
+        Only the given record numbers (1-based) are considered when recnos
+        is passed; otherwise the last `max_scan` records are scanned.
+
         Returns count of records deleted.
         """
         dbf_path = str(self._resolve_dbf_path(table_name))
@@ -570,30 +633,17 @@ class TransactionSafety:
         try:
             deleted = 0
             total = len(table)
-            start = max(total - max_scan, 0)
+            if recnos is not None:
+                positions = [r - 1 for r in recnos if 0 < r <= total]
+            else:
+                positions = range(total - 1, max(total - max_scan, 0) - 1, -1)
 
-            for i in range(total - 1, start - 1, -1):
+            for i in positions:
                 record = table[i]
                 if dbf.is_deleted(record):
                     continue
 
-                raw = getattr(record, key_field, None)
-                if raw is None:
-                    continue
-
-                match = False
-                if isinstance(raw, str):
-                    match = raw.strip() == str(search_value).strip()
-                elif isinstance(raw, (int, float)):
-                    try:
-                        match = raw == (
-                            search_value if isinstance(search_value, (int, float))
-                            else int(search_value)
-                        )
-                    except (ValueError, TypeError):
-                        pass
-
-                if match:
+                if _key_matches(getattr(record, key_field, None), search_value):
                     dbf.delete(record)
                     deleted += 1
                     logger.info(
@@ -698,3 +748,117 @@ class TransactionSafety:
             )
 
         return adjustments
+
+
+# ============================================================
+# Record access by number
+# ============================================================
+
+def _key_matches(raw: Any, search_value: Any) -> bool:
+    """Compare a DBF field value with an entry/journal number."""
+    if raw is None:
+        return False
+    # Compare: string fields need strip(), numeric fields direct
+    if isinstance(raw, str):
+        return raw.strip() == str(search_value).strip()
+    if isinstance(raw, (int, float)):
+        try:
+            return raw == (
+                search_value if isinstance(search_value, (int, float))
+                else int(search_value)
+            )
+        except (ValueError, TypeError):
+            return False
+    return False
+
+
+class _DbfRecordReader:
+    """Reads single records by number with the dbf package (tables kept open)."""
+
+    def __init__(self, resolve_path: Callable[[str], Path]):
+        self._resolve_path = resolve_path
+        self._tables: Dict[str, Any] = {}
+
+    def read(self, table_name: str, recno: int, field_name: str, numeric: bool = False) -> Any:
+        """Field value of record `recno` (1-based), or None if absent or deleted."""
+        table = self._tables.get(table_name)
+        if table is None:
+            table = dbf.Table(str(self._resolve_path(table_name)))
+            table.open(dbf.READ_ONLY)
+            self._tables[table_name] = table
+        if not 0 < recno <= len(table):
+            return None
+        record = table[recno - 1]
+        if dbf.is_deleted(record):
+            return None
+        return getattr(record, field_name, None)
+
+    def read_many(self, table_name: str, recnos: List[int], field_name: str,
+                  numeric: bool = False) -> List[Any]:
+        """read() for each of `recnos`, in order."""
+        return [self.read(table_name, recno, field_name, numeric) for recno in recnos]
+
+    def close(self):
+        for table in self._tables.values():
+            table.close()
+        self._tables.clear()
+
+
+class _HarbourRecordReader:
+    """Reads records by number through the Harbour bridge.
+
+    read_many() fetches all the records for a table in one read_records
+    call when the library has the batch functions, else GOTOs each one.
+    Deleted records read as None, like _DbfRecordReader.
+    """
+
+    @staticmethod
+    def supported(harbour: Any) -> bool:
+        """True if the library reports deleted flags (batch reads or hb_dbf_deleted)."""
+        return bool(getattr(harbour, "has_batch", False) or getattr(harbour, "has_deleted", False))
+
+    def __init__(self, harbour: Any, resolve_path: Callable[[str], Path]):
+        self._db = harbour
+        self._resolve_path = resolve_path
+        self._aliases: Dict[str, str] = {}
+
+    def _alias(self, table_name: str) -> str:
+        alias = self._aliases.get(table_name)
+        if alias is None:
+            alias = f"VFY_{table_name.upper()}"
+            self._db.open(str(self._resolve_path(table_name)), alias)
+            self._aliases[table_name] = alias
+        return alias
+
+    def reccount(self, table_name: str) -> int:
+        """Number of records in the table, deleted ones included."""
+        return self._db.reccount(self._alias(table_name))
+
+    def read_many(self, table_name: str, recnos: List[int], field_name: str,
+                  numeric: bool = False) -> List[Any]:
+        """Field value of each of `recnos`, in order (None past the end or deleted)."""
+        if not getattr(self._db, "has_batch", False):
+            return [self.read(table_name, recno, field_name, numeric) for recno in recnos]
+        rows = self._db.read_records(self._alias(table_name), recnos, [field_name])
+        name = field_name.upper()
+        return [row[name] if recno and not deleted else None
+                for recno, deleted, row in zip(rows.recnos, rows.deleted, rows)]
+
+    def read(self, table_name: str, recno: int, field_name: str, numeric: bool = False) -> Any:
+        """Field value of record `recno` (1-based), or None if absent or deleted."""
+        if getattr(self._db, "has_batch", False):
+            return self.read_many(table_name, [recno], field_name, numeric)[0]
+        alias = self._alias(table_name)
+        if not 0 < recno <= self._db.reccount(alias):
+            return None
+        self._db.goto_record(alias, recno)
+        if self._db.deleted(alias):
+            return None
+        if numeric:
+            return self._db.get_field_n(alias, field_name)
+        return self._db.get_field(alias, field_name)
+
+    def close(self):
+        for alias in self._aliases.values():
+            self._db.close(alias)
+        self._aliases.clear()
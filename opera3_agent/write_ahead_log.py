@@ -8,6 +8,12 @@ Records every write operation BEFORE execution, enabling:
 - Monitoring: recent operation history for diagnostics
 
 Storage: SQLite database alongside the agent (NOT in Opera data).
+
+The log keeps one connection open in SQLite WAL mode (synchronous=FULL, so
+a record is on disk once its write returns). Writes from concurrent
+operations are group-committed: the first writer to find no commit running
+commits everything queued so far in one transaction, and writers queued
+behind it wait for that commit rather than paying for their own fsync.
 """
 
 from __future__ import annotations
@@ -16,6 +22,7 @@ import json
 import logging
 import os
 import sqlite3
+import threading
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
 from enum import Enum
@@ -64,13 +71,25 @@ class WriteAheadLog:
 
     def __init__(self, db_path: str):
         self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._db_lock = threading.Lock()  # one user of the connection at a time
+        self._queue_lock = threading.Condition()
+        self._queue: List[_PendingWrite] = []
+        self._committing = False
         self._init_db()
 
+    def close(self):
+        """Close the connection (pending writes have all been committed)."""
+        with self._db_lock:
+            self._conn.close()
+
     def _init_db(self):
         """Create WAL tables if they don't exist."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.executescript("""
+        with self._db_lock:
+            self._conn.executescript("""
                 CREATE TABLE IF NOT EXISTS operations (
                     id TEXT PRIMARY KEY,
                     operation_type TEXT NOT NULL,
@@ -91,9 +110,6 @@ class WriteAheadLog:
                 CREATE INDEX IF NOT EXISTS idx_op_started
                     ON operations(started_at);
             """)
-            conn.commit()
-        finally:
-            conn.close()
 
     # ------------------------------------------------------------------
     # Lifecycle methods
@@ -107,18 +123,13 @@ class WriteAheadLog:
         op_id = str(uuid4())
         now = _now_iso()
 
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.execute(
-                """INSERT INTO operations
-                   (id, operation_type, status, params_json, started_at, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (op_id, operation_type, OperationStatus.PENDING.value,
-                 json.dumps(params, default=str), now, now),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        self._write(
+            """INSERT INTO operations
+               (id, operation_type, status, params_json, started_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (op_id, operation_type, OperationStatus.PENDING.value,
+             json.dumps(params, default=str), now, now),
+        )
 
         logger.info(f"WAL: BEGIN {operation_type} [{op_id[:8]}]")
         return op_id
@@ -134,19 +145,14 @@ class WriteAheadLog:
     def mark_completed(self, op_id: str, result: dict | None = None):
         """Mark operation as successfully completed and verified."""
         now = _now_iso()
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.execute(
-                """UPDATE operations
-                   SET status = ?, result_json = ?, completed_at = ?, updated_at = ?
-                   WHERE id = ?""",
-                (OperationStatus.COMPLETED.value,
-                 json.dumps(result, default=str) if result else None,
-                 now, now, op_id),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        self._write(
+            """UPDATE operations
+               SET status = ?, result_json = ?, completed_at = ?, updated_at = ?
+               WHERE id = ?""",
+            (OperationStatus.COMPLETED.value,
+             json.dumps(result, default=str) if result else None,
+             now, now, op_id),
+        )
         logger.info(f"WAL: COMPLETED [{op_id[:8]}]")
 
     def mark_failed(self, op_id: str, error: str):
@@ -161,19 +167,14 @@ class WriteAheadLog:
     def mark_compensated(self, op_id: str, compensation_log: list):
         """Mark operation as successfully compensated (undone)."""
         now = _now_iso()
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.execute(
-                """UPDATE operations
-                   SET status = ?, compensation_log_json = ?,
-                       completed_at = ?, updated_at = ?
-                   WHERE id = ?""",
-                (OperationStatus.COMPENSATED.value,
-                 json.dumps(compensation_log), now, now, op_id),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        self._write(
+            """UPDATE operations
+               SET status = ?, compensation_log_json = ?,
+                   completed_at = ?, updated_at = ?
+               WHERE id = ?""",
+            (OperationStatus.COMPENSATED.value,
+             json.dumps(compensation_log), now, now, op_id),
+        )
         logger.warning(
             f"WAL: COMPENSATED [{op_id[:8]}] ({len(compensation_log)} steps)"
         )
@@ -187,15 +188,10 @@ class WriteAheadLog:
 
     def set_verification_details(self, op_id: str, details: str):
         """Store verification result details."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.execute(
-                "UPDATE operations SET verification_details = ?, updated_at = ? WHERE id = ?",
-                (details, _now_iso(), op_id),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        self._write(
+            "UPDATE operations SET verification_details = ?, updated_at = ? WHERE id = ?",
+            (details, _now_iso(), op_id),
+        )
 
     # ------------------------------------------------------------------
     # Query methods
@@ -203,15 +199,11 @@ class WriteAheadLog:
 
     def get_operation(self, op_id: str) -> WALOperation | None:
         """Get a specific operation by ID."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.row_factory = sqlite3.Row
-            row = conn.execute(
+        with self._db_lock:
+            row = self._conn.execute(
                 "SELECT * FROM operations WHERE id = ?", (op_id,)
             ).fetchone()
-            return self._row_to_op(row) if row else None
-        finally:
-            conn.close()
+        return self._row_to_op(row) if row else None
 
     def get_incomplete_operations(self) -> List[WALOperation]:
         """Find operations that didn't complete (for crash recovery)."""
@@ -224,35 +216,27 @@ class WriteAheadLog:
         )
         placeholders = ",".join("?" * len(incomplete))
 
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(
+        with self._db_lock:
+            rows = self._conn.execute(
                 f"SELECT * FROM operations WHERE status IN ({placeholders}) "
                 "ORDER BY started_at",
                 incomplete,
             ).fetchall()
-            return [self._row_to_op(r) for r in rows]
-        finally:
-            conn.close()
+        return [self._row_to_op(r) for r in rows]
 
     def get_recent_operations(self, limit: int = 50) -> List[WALOperation]:
         """Get recent operations for monitoring/audit."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(
+        with self._db_lock:
+            rows = self._conn.execute(
                 "SELECT * FROM operations ORDER BY started_at DESC LIMIT ?",
                 (limit,),
             ).fetchall()
-            return [self._row_to_op(r) for r in rows]
-        finally:
-            conn.close()
+        return [self._row_to_op(r) for r in rows]
 
     def get_stats(self) -> Dict[str, Any]:
         """Get summary statistics for monitoring."""
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._db_lock:
+            conn = self._conn
             total = conn.execute("SELECT COUNT(*) FROM operations").fetchone()[0]
             by_status = {}
             for row in conn.execute(
@@ -275,8 +259,6 @@ class WriteAheadLog:
                 "by_status": by_status,
                 "last_operation": last_op,
             }
-        finally:
-            conn.close()
 
     # ------------------------------------------------------------------
     # Maintenance
@@ -284,21 +266,16 @@ class WriteAheadLog:
 
     def cleanup_old(self, days: int = 90):
         """Remove completed/compensated operations older than N days."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            result = conn.execute(
-                """DELETE FROM operations
-                   WHERE status IN (?, ?)
-                     AND started_at < datetime('now', ?)""",
-                (OperationStatus.COMPLETED.value,
-                 OperationStatus.COMPENSATED.value,
-                 f"-{days} days"),
-            )
-            conn.commit()
-            if result.rowcount > 0:
-                logger.info(f"WAL: Cleaned up {result.rowcount} old operations")
-        finally:
-            conn.close()
+        rowcount = self._write(
+            """DELETE FROM operations
+               WHERE status IN (?, ?)
+                 AND started_at < datetime('now', ?)""",
+            (OperationStatus.COMPLETED.value,
+             OperationStatus.COMPENSATED.value,
+             f"-{days} days"),
+        )
+        if rowcount > 0:
+            logger.info(f"WAL: Cleaned up {rowcount} old operations")
 
     # ------------------------------------------------------------------
     # Internal helpers
@@ -308,28 +285,83 @@ class WriteAheadLog:
                 snapshot: dict | None = None, result: dict | None = None,
                 error: str | None = None):
         """Generic status update."""
-        conn = sqlite3.connect(self.db_path)
+        parts = ["status = ?", "updated_at = ?"]
+        vals: list = [status.value, _now_iso()]
+
+        if snapshot is not None:
+            parts.append("snapshot_json = ?")
+            vals.append(json.dumps(snapshot, default=str))
+        if result is not None:
+            parts.append("result_json = ?")
+            vals.append(json.dumps(result, default=str))
+        if error is not None:
+            parts.append("error_message = ?")
+            vals.append(error)
+
+        vals.append(op_id)
+        self._write(f"UPDATE operations SET {', '.join(parts)} WHERE id = ?", vals)
+
+    def _write(self, sql: str, params) -> int:
+        """Execute one write and return once it is committed (group commit).
+
+        Returns the statement's rowcount.
+        """
+        write = _PendingWrite(sql, params)
+        with self._queue_lock:
+            self._queue.append(write)
+            while not write.done:
+                if self._committing:
+                    self._queue_lock.wait()
+                    continue
+                # No commit running: commit everything queued, ours included
+                self._committing = True
+                batch, self._queue = self._queue, []
+                self._queue_lock.release()
+                try:
+                    self._commit(batch)
+                finally:
+                    self._queue_lock.acquire()
+                    self._committing = False
+                    self._queue_lock.notify_all()
+        if write.error is not None:
+            raise write.error
+        return write.rowcount
+
+    def _commit(self, batch: List["_PendingWrite"]):
+        """Run a batch of writes in one transaction.
+
+        If the batch fails, each write is retried in its own transaction so
+        an error is only reported to the write that caused it.
+        """
+        with self._db_lock:
+            try:
+                self._transaction(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0].error = e
+                else:
+                    for write in batch:
+                        try:
+                            self._transaction([write])
+                        except Exception as write_error:
+                            write.error = write_error
+            finally:
+                for write in batch:
+                    if write.rowcount is None and write.error is None:
+                        write.error = RuntimeError("WAL commit was interrupted")
+                    write.done = True
+
+    def _transaction(self, writes: List["_PendingWrite"]):
+        self._conn.execute("BEGIN IMMEDIATE")
         try:
-            parts = ["status = ?", "updated_at = ?"]
-            vals: list = [status.value, _now_iso()]
-
-            if snapshot is not None:
-                parts.append("snapshot_json = ?")
-                vals.append(json.dumps(snapshot, default=str))
-            if result is not None:
-                parts.append("result_json = ?")
-                vals.append(json.dumps(result, default=str))
-            if error is not None:
-                parts.append("error_message = ?")
-                vals.append(error)
-
-            vals.append(op_id)
-            conn.execute(
-                f"UPDATE operations SET {', '.join(parts)} WHERE id = ?", vals
-            )
-            conn.commit()
-        finally:
-            conn.close()
+            counts = [self._conn.execute(w.sql, w.params).rowcount for w in writes]
+            self._conn.execute("COMMIT")
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+            raise
+        for write, count in zip(writes, counts):
+            write.rowcount = count
 
     def _row_to_op(self, row) -> WALOperation:
         """Convert a database row to WALOperation."""
@@ -351,5 +383,17 @@ class WriteAheadLog:
         )
 
 
+class _PendingWrite:
+    """A write waiting in the group-commit queue."""
+    __slots__ = ("sql", "params", "done", "error", "rowcount")
+
+    def __init__(self, sql: str, params):
+        self.sql = sql
+        self.params = params
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.rowcount: Optional[int] = None  # set once committed
+
+
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Opera 3 agent's WriteAheadLog.
+
+Runs the WAL writes of a successful safe_import (begin, in progress,
+verifying, verification details, completed) for a number of operations,
+from one thread and from several concurrent threads, and prints operations
+per second.
+
+Usage:
+    python scripts/benchmark_wal.py [--operations 500] [--threads 1 8]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from opera3_agent.write_ahead_log import WriteAheadLog  # noqa: E402
+
+PARAMS = {
+    'bank_account': 'BC010', 'customer_account': 'A001', 'amount_pounds': 125.50,
+    'reference': 'INV12345', 'post_date': '2026-03-01', 'input_by': 'IMPORT',
+}
+RESULT = {'success': True, 'records_imported': 1, 'entry_number': 'R200001234', 'journal_number': 0}
+
+
+def run_operation(wal):
+    op_id = wal.begin_operation('sales_receipt', PARAMS)
+    wal.mark_in_progress(op_id)
+    wal.mark_verifying(op_id, RESULT)
+    wal.set_verification_details(op_id, 'aentry: 1 row, atran: 1 row, stran: 1 row')
+    wal.mark_completed(op_id, RESULT)
+
+
+def benchmark(operations, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        wal = WriteAheadLog(os.path.join(tmp, 'wal.db'))
+        per_thread = operations // threads
+
+        def worker():
+            for _ in range(per_thread):
+                run_operation(wal)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if hasattr(wal, 'close'):
+            wal.close()
+        return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--operations', type=int, default=500)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    args = parser.parse_args()
+
+    for threads in args.threads:
+        rate = benchmark(args.operations, threads)
+        print(f"{threads:>2} thread(s): {rate:8.1f} operations/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,499 @@
+"""
+Receipt and Payment Allocation Engine
+
+Decides which outstanding invoices a receipt (sales ledger) or payment
+(purchase ledger) should be allocated to, for auto_allocate_receipt and
+auto_allocate_payment in both the Opera SQL SE and Opera 3 importers.
+
+The importers used to read and scan the account's outstanding stran/ptran
+items for every receipt, so a GoCardless batch with several lines for a
+customer with hundreds of open items read them all again per line.
+AllocationEngine loads the open items of all accounts in a batch with one
+read, keeps them indexed by reference and amount in pence, and updates the
+balances in memory as receipts are allocated.
+
+Allocation rules (in priority order):
+  0. payment_request     - receipts only: the invoices a GoCardless payment
+                           request was raised for (remainder stays on account)
+  1. invoice_reference   - invoice refs in the description whose balances
+                           total the amount exactly
+  2. clears_account /    - the amount equals the account's total outstanding
+     single_invoice_match
+  3. amount_match        - exactly one combination of open invoices totals
+                           the amount (no refs in the description). Only when
+                           the caller opts in with allow_amount_match; by
+                           default the combination is suggested, not
+                           allocated. Found by subset search in pence with a
+                           step budget, so the same ledger always gives the
+                           same answer; an ambiguous or unfinished search
+                           never allocates, but the closest combination is
+                           reported.
+"""
+
+import logging
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_STEPS = 2_000_000  # partial sums extended by one subset search
+DEFAULT_MAX_STATES = 200_000  # distinct partial sums kept by the search
+MEET_IN_MIDDLE_MAX_ITEMS = 24  # up to this many candidates, search two halves
+
+RECEIPT_REF_PATTERN = re.compile(r'INV\d+')
+PAYMENT_REF_PATTERN = re.compile(r'(?:PI|INV|PINV|P/INV)[\s-]?\d+')
+_REF_NOISE = re.compile(r'[\s-]')
+
+# Ledger -> (allocation key for the customer/supplier ref, key for the row id)
+_LEDGER_KEYS = {
+    'sales': ('custref', 'stran_id'),
+    'purchase': ('suppref', 'ptran_id'),
+}
+
+# salloc/palloc al_ref2 audit marker per allocation method
+_ALLOCATION_REF2 = {
+    'payment_request': 'AUTO:GC_REQ',
+    'invoice_reference': 'AUTO:INV_REF',
+    'amount_match': 'AUTO:AMT_MATCH',
+}
+
+
+def to_pence(amount: float) -> int:
+    return int(round(float(amount) * 100))
+
+
+def _clean_ref(ref: str) -> str:
+    return _REF_NOISE.sub('', (ref or '').upper())
+
+
+def allocation_ref2(method: str) -> str:
+    """al_ref2 audit marker for an allocation method."""
+    return _ALLOCATION_REF2.get(method, 'AUTO:CLR_ACCT')
+
+
+def allocation_message(method: str, amount: float, count: int) -> str:
+    """Result message for a successful allocation."""
+    if method == 'payment_request':
+        return f"Allocated £{amount:.2f} to {count} invoice(s) from payment request"
+    if method == 'invoice_reference':
+        return f"Allocated £{amount:.2f} to {count} invoice(s) by reference"
+    if method == 'amount_match':
+        return f"Allocated £{amount:.2f} to {count} invoice(s) matching the amount"
+    return f"Allocated £{amount:.2f} to {count} invoice(s) - clears account"
+
+
+# =========================================================================
+# SUBSET SEARCH
+# =========================================================================
+
+@dataclass
+class SubsetResult:
+    """Best combination found by find_subset()."""
+    indices: Tuple[int, ...] = ()
+    total: int = 0
+    exact: bool = False
+    unique: bool = False  # exact, and no other combination has the same total
+    complete: bool = True  # False if the step or state budget cut the search short
+
+
+def _subset_key(indices: Tuple[int, ...]):
+    # Fewest items, then the earliest (oldest) items
+    return (len(indices), indices)
+
+
+def _subset_sums(amounts: List[int], indices: List[int], limit: int, max_steps: int,
+                 max_states: int) -> Tuple[Dict[int, Tuple[int, Tuple[int, ...]]], bool, int]:
+    """
+    Reachable totals <= limit over subsets of ``indices``.
+
+    Each item extends every partial sum so far; that count is the step cost.
+    Returns ({total: (ways capped at 2, best subset)}, complete, steps used).
+    """
+    sums: Dict[int, Tuple[int, Tuple[int, ...]]] = {0: (1, ())}
+    steps = 0
+    for i in indices:
+        if steps + len(sums) > max_steps or len(sums) > max_states:
+            return sums, False, steps
+        steps += len(sums)
+        amount = amounts[i]
+        for total, (ways, best) in list(sums.items()):
+            new_total = total + amount
+            if new_total > limit:
+                continue
+            candidate = best + (i,)
+            current = sums.get(new_total)
+            if current is None:
+                sums[new_total] = (ways, candidate)
+            else:
+                sums[new_total] = (min(2, current[0] + ways), min(current[1], candidate, key=_subset_key))
+    return sums, True, steps
+
+
+def find_subset(amounts: List[int], target: int, max_steps: int = DEFAULT_MAX_STEPS,
+                max_states: int = DEFAULT_MAX_STATES) -> SubsetResult:
+    """
+    Find the combination of amounts (pence) that totals target, or failing
+    that comes closest without exceeding it.
+
+    Ties go to the combination with the fewest items, then the earliest
+    items, so the answer does not depend on dict order. Up to
+    MEET_IN_MIDDLE_MAX_ITEMS candidates are searched as two halves that are
+    then joined; longer lists use one pass over sparse partial sums, bounded
+    by max_steps and max_states. The budgets count work, not time, so the
+    result does not depend on how busy the server is.
+    """
+    candidates = [i for i, amount in enumerate(amounts) if 0 < amount <= target]
+    if target <= 0 or not candidates:
+        return SubsetResult()
+
+    if len(candidates) > MEET_IN_MIDDLE_MAX_ITEMS:
+        sums, complete, _ = _subset_sums(amounts, candidates, target, max_steps, max_states)
+        if target in sums:
+            ways, best = sums[target]
+            return SubsetResult(best, target, True, ways == 1, complete)
+        total = max(sums)
+        return SubsetResult(sums[total][1], total, False, False, complete)
+
+    half = len(candidates) // 2
+    left, left_complete, steps = _subset_sums(amounts, candidates[:half], target, max_steps, max_states)
+    right, right_complete, _ = _subset_sums(amounts, candidates[half:], target, max_steps - steps, max_states)
+    complete = left_complete and right_complete
+
+    # Exact: totals that meet in the middle
+    ways = 0
+    best = None
+    for total, (left_ways, left_best) in left.items():
+        match = right.get(target - total)
+        if match is None:
+            continue
+        ways += left_ways * match[0]
+        candidate = left_best + match[1]
+        if best is None or _subset_key(candidate) < _subset_key(best):
+            best = candidate
+    if best is not None:
+        return SubsetResult(best, target, True, ways == 1, complete)
+
+    # Closest: for each left total, the largest right total that still fits
+    right_totals = sorted(right)
+    best_total = -1
+    for total, (_, left_best) in left.items():
+        j = bisect_right(right_totals, target - total) - 1
+        if j < 0:
+            continue
+        combined = total + right_totals[j]
+        candidate = left_best + right[right_totals[j]][1]
+        if combined > best_total or (combined == best_total and _subset_key(candidate) < _subset_key(best)):
+            best_total, best = combined, candidate
+    return SubsetResult(best or (), max(best_total, 0), False, False, complete)
+
+
+# =========================================================================
+# OPEN ITEMS
+# =========================================================================
+
+@dataclass
+class OpenItem:
+    """An outstanding invoice (st_trtype/pt_trtype 'I' with a positive balance)."""
+    ref: str
+    balance: float
+    alt_ref: str = ''  # st_custref / pt_suppref
+    date: Any = None
+    unique: str = ''
+    row_id: Optional[int] = None  # stran/ptran id (SQL SE only)
+
+    @property
+    def pence(self) -> int:
+        return to_pence(self.balance)
+
+
+def sort_open_items(items: List[OpenItem]) -> List[OpenItem]:
+    """Oldest first, then by reference (the order allocations are tried in)."""
+    return sorted(items, key=lambda i: (i.date is None, i.date or date.min, i.ref))
+
+
+class AccountItems:
+    """One account's open items, indexed by reference and amount in pence."""
+
+    def __init__(self, ledger: str, items: List[OpenItem]):
+        self.ledger = ledger
+        self.items = items
+        self._reindex()
+
+    def _reindex(self):
+        self._by_ref: Dict[str, int] = {}
+        self._by_token: Dict[str, int] = {}
+        self._by_pence: Dict[int, List[int]] = {}
+        for i, item in enumerate(self.items):
+            self._by_ref.setdefault(item.ref.upper(), i)
+            for token in {_clean_ref(item.ref), _clean_ref(item.alt_ref), item.alt_ref.upper()}:
+                if token:
+                    self._by_token.setdefault(token, i)
+            self._by_pence.setdefault(item.pence, []).append(i)
+        self.total_pence = sum(item.pence for item in self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def find(self, ref: str) -> Optional[OpenItem]:
+        """The first item whose ref equals ``ref`` (case-insensitive)."""
+        i = self._by_ref.get((ref or '').strip().upper())
+        return None if i is None else self.items[i]
+
+    def find_token(self, token: str) -> Optional[OpenItem]:
+        """
+        The first item whose ref or alt ref matches ``token``, ignoring spaces
+        and hyphens (supplier invoice numbers are written many ways).
+        """
+        hits = [self._by_token[key] for key in (_clean_ref(token), (token or '').upper())
+                if key in self._by_token]
+        return self.items[min(hits)] if hits else None
+
+    def with_amount(self, pence: int) -> List[OpenItem]:
+        return [self.items[i] for i in self._by_pence.get(pence, [])]
+
+    def alt_refs_in(self, text: str) -> List[str]:
+        """Alt refs of open items that appear in ``text``, in item order."""
+        text = (text or '').upper()
+        return [item.alt_ref for item in self.items if item.alt_ref and item.alt_ref.upper() in text]
+
+    def allocation(self, item: OpenItem, amount: Optional[float] = None) -> Dict[str, Any]:
+        """The allocation dict the importers' posting code expects."""
+        alt_key, id_key = _LEDGER_KEYS[self.ledger]
+        amount = item.balance if amount is None else amount
+        alloc = {
+            'ref': item.ref,
+            alt_key: item.alt_ref,
+            'amount': amount,
+            'full_allocation': amount >= item.balance - 0.005,
+            'unique': item.unique,
+        }
+        if item.row_id is not None:
+            alloc[id_key] = item.row_id
+        return alloc
+
+    def consume(self, allocations: List[Dict[str, Any]]):
+        """Reduce balances after allocations are posted; paid items drop out."""
+        for alloc in allocations:
+            for item in self.items:
+                if item.ref == alloc['ref'] and item.unique == alloc.get('unique', item.unique):
+                    item.balance = round(item.balance - alloc['amount'], 2)
+                    break
+        self.items = [item for item in self.items if item.balance > 0.005]
+        self._reindex()
+
+
+class AllocationEngine:
+    """
+    Open items per account for a batch of allocations.
+
+    Args:
+        ledger: 'sales' (stran) or 'purchase' (ptran)
+        load: Called with a list of account codes; returns
+            {ACCOUNT (stripped, upper case): [OpenItem, ...]}
+    """
+
+    def __init__(self, ledger: str, load: Callable[[List[str]], Dict[str, List[OpenItem]]]):
+        if ledger not in _LEDGER_KEYS:
+            raise ValueError(f"Unknown ledger: {ledger}")
+        self.ledger = ledger
+        self._load = load
+        self._accounts: Dict[str, AccountItems] = {}
+
+    def prefetch(self, accounts: Iterable[str]):
+        """Load the open items of all these accounts in one read."""
+        missing = sorted({a.strip().upper() for a in accounts if a and a.strip()} - set(self._accounts))
+        if not missing:
+            return
+        loaded = self._load(missing)
+        for account in missing:
+            self._accounts[account] = AccountItems(self.ledger, sort_open_items(loaded.get(account, [])))
+
+    def items(self, account: str) -> AccountItems:
+        key = account.strip().upper()
+        if key not in self._accounts:
+            self.prefetch([key])
+        return self._accounts[key]
+
+    def consume(self, account: str, allocations: List[Dict[str, Any]]):
+        items = self._accounts.get(account.strip().upper())
+        if items is not None:
+            items.consume(allocations)
+
+
+# =========================================================================
+# ALLOCATION RULES
+# =========================================================================
+
+@dataclass
+class AllocationPlan:
+    """Outcome of the allocation rules. method is None when nothing should be allocated."""
+    method: Optional[str] = None
+    allocations: List[Dict[str, Any]] = field(default_factory=list)
+    total_to_allocate: float = 0.0
+    fully_allocated: bool = True
+    message: str = ''
+    suggestion: List[str] = field(default_factory=list)
+
+
+def payment_request_invoice_refs(gc_payment_id: str) -> Optional[List[str]]:
+    """Invoice refs stored on the GoCardless payment request for a payment, if any."""
+    try:
+        from sql_rag.gocardless_payments import get_payments_db
+        payment_request = get_payments_db().get_payment_request_by_payment_id(gc_payment_id)
+    except Exception as e:
+        logger.warning(f"Auto-allocate: payment request lookup failed for {gc_payment_id}: {e}")
+        return None
+    if payment_request and payment_request.get('invoice_refs'):
+        logger.info(f"Auto-allocate: payment request {gc_payment_id} has invoice_refs: {payment_request['invoice_refs']}")
+        return payment_request['invoice_refs']
+    return None
+
+
+def _payment_request_plan(items: AccountItems, amount: float, request_refs: List[str]) -> Optional[AllocationPlan]:
+    """
+    Rule 0: allocate to the still-outstanding invoices of the payment request,
+    skipping any already paid in Opera.
+    """
+    found = []
+    skipped = []
+    for ref in request_refs:
+        item = items.find(ref)
+        if item is None:
+            skipped.append(f"{ref} (not found/outstanding)")
+        elif item.balance > 0.005:
+            found.append(item)
+        else:
+            skipped.append(f"{ref} (already paid)")
+    if not found:
+        if skipped:
+            # Fall through to the other rules
+            logger.info(f"Auto-allocate: all payment request invoices already paid: {skipped}")
+        return None
+
+    amount_rounded = round(amount, 2)
+    total = round(sum(item.balance for item in found), 2)
+    if amount_rounded >= total:
+        # Covers all outstanding invoices from the request; any excess stays on account
+        if skipped:
+            logger.info(f"Auto-allocate: skipped invoices (already paid in Opera): {skipped}")
+        allocations = [items.allocation(item) for item in found]
+        if amount_rounded > total:
+            return AllocationPlan('payment_request', allocations, total, False)
+        return AllocationPlan('payment_request', allocations, amount, True)
+
+    # Less than outstanding: allocate in request order up to the amount
+    allocations = []
+    remaining = amount_rounded
+    for item in found:
+        if remaining <= 0.005:
+            break
+        alloc_amount = min(item.balance, remaining)
+        allocations.append(items.allocation(item, alloc_amount))
+        remaining -= alloc_amount
+    return AllocationPlan('payment_request', [a for a in allocations if a['amount'] > 0.005], amount, True)
+
+
+def plan_allocation(items: AccountItems, amount: float, refs: List[str],
+                    request_refs: Optional[List[str]] = None, noun: str = 'receipt',
+                    fuzzy_refs: bool = False, allow_amount_match: bool = False,
+                    max_steps: int = DEFAULT_MAX_STEPS) -> AllocationPlan:
+    """
+    Apply the allocation rules to one receipt/payment.
+
+    Args:
+        items: The account's open items
+        amount: Receipt/payment amount in pounds (positive)
+        refs: Invoice references found in the description
+        request_refs: Invoice refs of the GoCardless payment request (rule 0)
+        noun: 'receipt' or 'payment', for messages
+        fuzzy_refs: Match refs against ref and alt ref ignoring spaces/hyphens
+            (purchase ledger) rather than the ref exactly
+        allow_amount_match: Allocate when exactly one combination of open
+            invoices totals the amount (rule 3). Off by default: the
+            combination is only returned as a suggestion.
+        max_steps: Step budget for the amount_match subset search
+    """
+    if request_refs:
+        plan = _payment_request_plan(items, amount, request_refs)
+        if plan is not None:
+            return plan
+
+    amount_rounded = round(amount, 2)
+    amount_pence = to_pence(amount)
+
+    # RULE 1: invoice references in the description
+    if refs:
+        matched = []
+        seen = set()
+        for ref in refs:
+            item = items.find_token(ref) if fuzzy_refs else items.find(ref)
+            if item is not None and id(item) not in seen:
+                seen.add(id(item))
+                matched.append(item)
+        if matched:
+            total = round(sum(item.balance for item in matched), 2)
+            if amount_rounded == total:
+                return AllocationPlan('invoice_reference', [items.allocation(i) for i in matched], amount, True)
+            details = [f"{item.ref} (£{item.balance:.2f})" for item in matched]
+            return AllocationPlan(message=(
+                f"Invoice reference(s) found but amounts do not match: "
+                f"{noun} £{amount_rounded:.2f} vs invoice total £{total:.2f}. Found: {details}"
+            ))
+
+    # RULE 2: the amount clears the whole account
+    if len(items) and amount_pence == items.total_pence:
+        method = 'clears_account' if len(items) >= 2 else 'single_invoice_match'
+        return AllocationPlan(method, [items.allocation(i) for i in items.items], amount, True)
+
+    if refs:
+        return AllocationPlan(message=f"Invoice reference(s) {refs} not found in outstanding invoices")
+
+    # RULE 3: exactly one combination of open invoices totals the amount
+    same_amount = items.with_amount(amount_pence)
+    if len(same_amount) > 1:
+        # Several invoices of exactly this amount: ambiguous without searching
+        result = SubsetResult((items.items.index(same_amount[0]),), amount_pence, True, False)
+    else:
+        result = find_subset([item.pence for item in items.items], amount_pence, max_steps)
+    if result.exact and result.unique and result.complete and allow_amount_match:
+        matched = [items.items[i] for i in result.indices]
+        return AllocationPlan('amount_match', [items.allocation(item) for item in matched], amount, True)
+
+    plan = AllocationPlan(message=(
+        f"Cannot auto-allocate: no invoice reference in description and "
+        f"{noun} £{amount_rounded:.2f} does not clear account total £{items.total_pence / 100:.2f}"
+    ))
+    plan.suggestion = [items.items[i].ref for i in result.indices]
+    if result.exact and not result.unique:
+        plan.message += f"; more than one combination of invoices totals £{amount_rounded:.2f}"
+    elif result.exact and result.complete:
+        plan.message += f"; {' + '.join(plan.suggestion)} matches the amount (not allocated on amount alone)"
+    elif result.exact:
+        plan.message += f"; search stopped before {' + '.join(plan.suggestion)} could be confirmed as the only match"
+    elif plan.suggestion:
+        plan.message += f"; closest: {' + '.join(plan.suggestion)} = £{result.total / 100:.2f}"
+    return plan
+
+
+def plan_receipt(items: AccountItems, amount: float, description: Optional[str] = None,
+                 request_refs: Optional[List[str]] = None, allow_amount_match: bool = False) -> AllocationPlan:
+    """Allocation rules for a sales receipt (refs like INV12345 in the description)."""
+    refs = RECEIPT_REF_PATTERN.findall(description.upper()) if description else []
+    return plan_allocation(items, amount, refs, request_refs, noun='receipt',
+                           allow_amount_match=allow_amount_match)
+
+
+def plan_payment(items: AccountItems, amount: float, description: Optional[str] = None,
+                 allow_amount_match: bool = False) -> AllocationPlan:
+    """
+    Allocation rules for a purchase payment: PI/INV/PINV refs in the
+    description, or failing that supplier refs of open invoices it mentions.
+    """
+    refs = []
+    if description:
+        refs = PAYMENT_REF_PATTERN.findall(description.upper()) or items.alt_refs_in(description)
+    return plan_allocation(items, amount, refs, noun='payment', fuzzy_refs=True,
+                           allow_amount_match=allow_amount_match)
@@ -25,6 +25,7 @@ import logging
 from sql_rag.sql_connector import SQLConnector
 from sql_rag.opera_sql_import import OperaSQLImport, ImportResult
 from sql_rag.bank_matching import BankMatcher, MatchCandidate, MatchResult
+from sql_rag.sql_statements import statement
 
 # Import new modules for enhanced functionality
 try:
@@ -57,6 +58,61 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Search terms compared against repeat entry descriptions (unused slots bind NULL)
+REPEAT_ENTRY_SEARCH_TERMS = 5
+
+# Per-transaction lookups, registered with bound parameters so each has one
+# cached plan (see sql_rag.sql_statements)
+_REPEAT_ENTRY_BY_REF = statement('bank_import.repeat_entry.by_ref', """
+    SELECT h.ae_entry, h.ae_desc, h.ae_nxtpost, h.ae_freq, h.ae_every,
+           h.ae_posted, h.ae_topost
+    FROM arhead h WITH (NOLOCK)
+    WHERE h.ae_entry = :entry_ref
+      AND RTRIM(h.ae_acnt) = :bank_code
+      AND (h.ae_topost = 0 OR h.ae_posted < h.ae_topost)
+""")
+
+_REPEAT_ENTRY_REF_MATCH = ' OR '.join(
+    f"UPPER(h.ae_desc) LIKE :term{i} OR UPPER(l.at_comment) LIKE :term{i}"
+    for i in range(REPEAT_ENTRY_SEARCH_TERMS)
+)
+_REPEAT_ENTRY_MATCH = statement('bank_import.repeat_entry.match', f"""
+    SELECT h.ae_entry, h.ae_desc, h.ae_nxtpost, h.ae_freq, h.ae_every,
+           h.ae_posted, h.ae_topost, h.ae_type,
+           l.at_value, l.at_account, l.at_cbtype, l.at_comment,
+           CASE WHEN ABS(ABS(l.at_value) - :amount_pence) < 10 THEN 1 ELSE 0 END as amount_match,
+           CASE WHEN {_REPEAT_ENTRY_REF_MATCH} THEN 1 ELSE 0 END as ref_match
+    FROM arhead h WITH (NOLOCK)
+    JOIN arline l WITH (NOLOCK) ON h.ae_entry = l.at_entry AND h.ae_acnt = l.at_acnt
+    WHERE RTRIM(h.ae_acnt) = :bank_code
+      AND (h.ae_topost = 0 OR h.ae_posted < h.ae_topost)  -- Only unposted entries
+      AND (
+          ABS(ABS(l.at_value) - :amount_pence) < 10  -- Amount matches (10p tolerance)
+          OR {_REPEAT_ENTRY_REF_MATCH}  -- OR reference/name matches description
+      )
+    ORDER BY
+        CASE WHEN ABS(ABS(l.at_value) - :amount_pence) < 10 THEN 0 ELSE 1 END,  -- Prefer amount matches
+        ABS(DATEDIFF(day, h.ae_nxtpost, :txn_date)) ASC
+""")
+
+_CUSTOMER_REFUND_CREDITS = statement('bank_import.customer_refund.credits', """
+    SELECT TOP 5 st_unique, st_trtype, st_trvalue, st_trbal, st_trdate, st_trref
+    FROM stran WITH (NOLOCK)
+    WHERE RTRIM(st_account) = :account
+      AND st_trtype IN ('C', 'R')
+      AND st_trbal < 0
+    ORDER BY ABS(ABS(st_trbal) - :amount) ASC
+""")
+
+_SUPPLIER_REFUND_CREDITS = statement('bank_import.supplier_refund.credits', """
+    SELECT TOP 5 pt_unique, pt_trtype, pt_trvalue, pt_trbal, pt_trdate, pt_trref
+    FROM ptran WITH (NOLOCK)
+    WHERE RTRIM(pt_account) = :account
+      AND pt_trtype IN ('C', 'P')
+      AND pt_trbal > 0
+    ORDER BY ABS(pt_trbal - :amount) ASC
+""")
+
 
 def extract_payee_name(description: str) -> str:
     """
@@ -791,9 +847,7 @@ class BankStatementImport:
         else:
             customer_query = "SELECT sn_account, RTRIM(sn_name) as name FROM sname WITH (NOLOCK) WHERE sn_dormant = 0"
 
-        df = self.sql_connector.execute_query(customer_query)
-
-        for _, row in df.iterrows():
+        for row in self.sql_connector.execute_query_dicts(customer_query):
             account = row['sn_account'].strip()
             name = row['name'].strip()
 
@@ -842,9 +896,7 @@ class BankStatementImport:
         else:
             supplier_query = "SELECT pn_account, RTRIM(pn_name) as name FROM pname WITH (NOLOCK) WHERE pn_dormant = 0"
 
-        df = self.sql_connector.execute_query(supplier_query)
-
-        for _, row in df.iterrows():
+        for row in self.sql_connector.execute_query_dicts(supplier_query):
             account = row['pn_account'].strip()
             name = row['name'].strip()
 
@@ -945,15 +997,9 @@ class BankStatementImport:
                     use_count = alias_match.get('use_count', 1)
 
                     # Validate the entry still exists and is active in Opera
-                    validate_query = f"""
-                        SELECT h.ae_entry, h.ae_desc, h.ae_nxtpost, h.ae_freq, h.ae_every,
-                               h.ae_posted, h.ae_topost
-                        FROM arhead h WITH (NOLOCK)
-                        WHERE h.ae_entry = '{entry_ref}'
-                          AND RTRIM(h.ae_acnt) = '{self.bank_code}'
-                          AND (h.ae_topost = 0 OR h.ae_posted < h.ae_topost)
-                    """
-                    df = self.sql_connector.execute_query(validate_query)
+                    df = _REPEAT_ENTRY_BY_REF.query(
+                        self.sql_connector, {'entry_ref': entry_ref, 'bank_code': self.bank_code}
+                    )
 
                     if df is not None and len(df) > 0:
                         # Alias is valid - use it directly
@@ -1006,44 +1052,25 @@ class BankStatementImport:
             search_terms = []
             for text in [txn.name, txn.reference, txn.memo]:
                 if text and len(text.strip()) >= 3:
-                    # Clean and escape for SQL
-                    clean = text.strip().replace("'", "''").upper()
+                    clean = text.strip().upper()
                     # Extract key words (at least 3 chars)
                     words = [w for w in clean.split() if len(w) >= 3]
                     search_terms.extend(words[:3])  # Limit to first 3 words
-
-            # Build reference match conditions
-            ref_conditions = []
-            for term in search_terms[:5]:  # Limit to 5 terms
-                ref_conditions.append(f"UPPER(h.ae_desc) LIKE '%{term}%'")
-                ref_conditions.append(f"UPPER(l.at_comment) LIKE '%{term}%'")
-
-            ref_match_sql = f"OR ({' OR '.join(ref_conditions)})" if ref_conditions else ""
+            search_terms = search_terms[:REPEAT_ENTRY_SEARCH_TERMS]
 
             # Query arhead + arline for matching UNPOSTED repeat entries
             # Match by: amount (within 10p) OR reference/name matches description
             # Only match where ae_posted < ae_topost (or ae_topost = 0 for unlimited)
-            query = f"""
-                SELECT h.ae_entry, h.ae_desc, h.ae_nxtpost, h.ae_freq, h.ae_every,
-                       h.ae_posted, h.ae_topost, h.ae_type,
-                       l.at_value, l.at_account, l.at_cbtype, l.at_comment,
-                       CASE WHEN ABS(ABS(l.at_value) - {amount_pence_abs}) < 10 THEN 1 ELSE 0 END as amount_match,
-                       CASE WHEN {' OR '.join(ref_conditions) if ref_conditions else '1=0'} THEN 1 ELSE 0 END as ref_match
-                FROM arhead h WITH (NOLOCK)
-                JOIN arline l WITH (NOLOCK) ON h.ae_entry = l.at_entry AND h.ae_acnt = l.at_acnt
-                WHERE RTRIM(h.ae_acnt) = '{self.bank_code}'
-                  AND (h.ae_topost = 0 OR h.ae_posted < h.ae_topost)  -- Only unposted entries
-                  AND (
-                      ABS(ABS(l.at_value) - {amount_pence_abs}) < 10  -- Amount matches (10p tolerance)
-                      {ref_match_sql}  -- OR reference/name matches description
-                  )
-                ORDER BY
-                    CASE WHEN ABS(ABS(l.at_value) - {amount_pence_abs}) < 10 THEN 0 ELSE 1 END,  -- Prefer amount matches
-                    ABS(DATEDIFF(day, h.ae_nxtpost, '{txn.date.isoformat()}')) ASC
-            """
+            params = {
+                'amount_pence': amount_pence_abs,
+                'bank_code': self.bank_code,
+                'txn_date': txn.date.isoformat(),
+            }
+            for i in range(REPEAT_ENTRY_SEARCH_TERMS):
+                params[f'term{i}'] = f'%{search_terms[i]}%' if i < len(search_terms) else None
 
             logger.debug(f"Checking repeat entries for {txn.name}: amount={amount_pence_abs}p, date={txn.date}, bank={self.bank_code}, search_terms={search_terms}")
-            df = self.sql_connector.execute_query(query)
+            df = _REPEAT_ENTRY_MATCH.query(self.sql_connector, params)
 
             if df is None or len(df) == 0:
                 logger.debug(f"No repeat entry match found for amount={amount_pence_abs}p or refs={search_terms} on bank {self.bank_code}")
@@ -1109,16 +1136,8 @@ class BankStatementImport:
         - Credit notes (st_trtype='C') with negative balance (unallocated credit)
         - Overpayments (st_trtype='R') with negative balance (customer overpaid)
         """
-        query = f"""
-            SELECT TOP 5 st_unique, st_trtype, st_trvalue, st_trbal, st_trdate, st_trref
-            FROM stran WITH (NOLOCK)
-            WHERE RTRIM(st_account) = '{customer_code}'
-              AND st_trtype IN ('C', 'R')
-              AND st_trbal < 0
-            ORDER BY ABS(ABS(st_trbal) - {amount}) ASC
-        """
         try:
-            df = self.sql_connector.execute_query(query)
+            df = _CUSTOMER_REFUND_CREDITS.query(self.sql_connector, {'account': customer_code, 'amount': amount})
             if df is not None and len(df) > 0:
                 best = df.iloc[0]
                 txn.action = 'sales_refund'
@@ -1140,16 +1159,8 @@ class BankStatementImport:
         - Credit notes (pt_trtype='C') with positive balance (unallocated credit)
         - Overpayments (pt_trtype='P') with positive balance (we overpaid supplier)
         """
-        query = f"""
-            SELECT TOP 5 pt_unique, pt_trtype, pt_trvalue, pt_trbal, pt_trdate, pt_trref
-            FROM ptran WITH (NOLOCK)
-            WHERE RTRIM(pt_account) = '{supplier_code}'
-              AND pt_trtype IN ('C', 'P')
-              AND pt_trbal > 0
-            ORDER BY ABS(pt_trbal - {amount}) ASC
-        """
         try:
-            df = self.sql_connector.execute_query(query)
+            df = _SUPPLIER_REFUND_CREDITS.query(self.sql_connector, {'account': supplier_code, 'amount': amount})
             if df is not None and len(df) > 0:
                 best = df.iloc[0]
                 txn.action = 'purchase_refund'
@@ -1679,25 +1690,9 @@ class BankStatementImport:
             logger.info(f"Parsed {len(parsed_txns)} transactions from {detected_format} file")
 
             # Convert ParsedTransaction to BankTransaction
-            transactions = []
-            for i, ptxn in enumerate(parsed_txns, start=1):
-                txn = BankTransaction(
-                    row_number=i,
-                    date=ptxn.date,
-                    amount=ptxn.amount,
-                    subcategory=ptxn.subcategory,
-                    memo=ptxn.memo,
-                    name=ptxn.name,
-                    reference=ptxn.reference,
-                    fit_id=ptxn.fit_id,
-                    check_number=ptxn.check_number
-                )
-
-                # Generate fingerprint for duplicate detection
-                if self.use_fingerprinting and DUPLICATES_AVAILABLE:
-                    txn.fingerprint = generate_import_fingerprint(ptxn.name, ptxn.amount, ptxn.date)
-
-                transactions.append(txn)
+            transactions = [
+                self._to_bank_transaction(ptxn, i) for i, ptxn in enumerate(parsed_txns, start=1)
+            ]
 
             return transactions, detected_format
 
@@ -1705,6 +1700,26 @@ class BankStatementImport:
             logger.warning(f"Multi-format parsing failed, falling back to CSV: {e}")
             return self.parse_csv(filepath), "CSV"
 
+    def _to_bank_transaction(self, ptxn: 'ParsedTransaction', row_number: int) -> BankTransaction:
+        """Convert a ParsedTransaction from bank_parsers into a BankTransaction"""
+        txn = BankTransaction(
+            row_number=row_number,
+            date=ptxn.date,
+            amount=ptxn.amount,
+            subcategory=ptxn.subcategory,
+            memo=ptxn.memo,
+            name=ptxn.name,
+            reference=ptxn.reference,
+            fit_id=ptxn.fit_id,
+            check_number=ptxn.check_number
+        )
+
+        # Generate fingerprint for duplicate detection
+        if self.use_fingerprinting and DUPLICATES_AVAILABLE:
+            txn.fingerprint = generate_import_fingerprint(ptxn.name, ptxn.amount, ptxn.date)
+
+        return txn
+
     def parse_content(self, content: str, filename: str, format_override: Optional[str] = None) -> Tuple[List[BankTransaction], str]:
         """
         Parse bank statement from content string (for email attachments).
@@ -1742,25 +1757,9 @@ class BankStatementImport:
             logger.info(f"Parsed {len(parsed_txns)} transactions from content as {detected_format}")
 
             # Convert ParsedTransaction to BankTransaction
-            transactions = []
-            for i, ptxn in enumerate(parsed_txns, start=1):
-                txn = BankTransaction(
-                    row_number=i,
-                    date=ptxn.date,
-                    amount=ptxn.amount,
-                    subcategory=ptxn.subcategory,
-                    memo=ptxn.memo,
-                    name=ptxn.name,
-                    reference=ptxn.reference,
-                    fit_id=ptxn.fit_id,
-                    check_number=ptxn.check_number
-                )
-
-                # Generate fingerprint for duplicate detection
-                if self.use_fingerprinting and DUPLICATES_AVAILABLE:
-                    txn.fingerprint = generate_import_fingerprint(ptxn.name, ptxn.amount, ptxn.date)
-
-                transactions.append(txn)
+            transactions = [
+                self._to_bank_transaction(ptxn, i) for i, ptxn in enumerate(parsed_txns, start=1)
+            ]
 
             return transactions, detected_format
 
@@ -1883,6 +1882,26 @@ class BankStatementImport:
                         txn.action = 'skip'
                         txn.skip_reason = f'Already posted: {posted_reason}'
 
+    def reference_data(self, transactions: List[BankTransaction]):
+        """
+        Reference-data snapshot for posting a statement's transactions.
+
+        Wrap the import_transaction() loop in this so every line reads type
+        codes, nominal accounts, VAT codes, periods and the customers and
+        suppliers being posted to from one snapshot instead of querying them
+        per line (see OperaSQLImport.reference_data()).
+        """
+        customers, suppliers = set(), set()
+        for txn in transactions:
+            account = txn.manual_account or txn.matched_account
+            if not account:
+                continue
+            if txn.action in ('sales_receipt', 'sales_refund'):
+                customers.add(account)
+            elif txn.action in ('purchase_payment', 'purchase_refund'):
+                suppliers.add(account)
+        return self.opera_import.reference_data(customers=customers, suppliers=suppliers)
+
     def import_transaction(self, txn: BankTransaction, validate_only: bool = False) -> ImportResult:
         """
         Import a single transaction to Opera
@@ -2121,18 +2140,19 @@ class BankStatementImport:
                 result.already_posted += 1
 
         # Import matched transactions
-        for txn in transactions:
-            if txn.action in ('sales_receipt', 'purchase_payment'):
-                try:
-                    import_result = self.import_transaction(txn, validate_only)
-                    if import_result.success:
-                        result.imported_transactions += 1
-                    else:
-                        result.errors.append(
-                            f"Row {txn.row_number}: {import_result.message}"
-                        )
-                except Exception as e:
-                    result.errors.append(f"Row {txn.row_number}: {str(e)}")
+        with self.reference_data(transactions):
+            for txn in transactions:
+                if txn.action in ('sales_receipt', 'purchase_payment'):
+                    try:
+                        import_result = self.import_transaction(txn, validate_only)
+                        if import_result.success:
+                            result.imported_transactions += 1
+                        else:
+                            result.errors.append(
+                                f"Row {txn.row_number}: {import_result.message}"
+                            )
+                    except Exception as e:
+                        result.errors.append(f"Row {txn.row_number}: {str(e)}")
 
         result.skipped_transactions = (
             result.total_transactions -
@@ -2549,19 +2569,20 @@ class BankStatementImport:
             Updated BankImportResult with import results
         """
         # Import only the matched transactions
-        for txn in result.transactions:
-            if txn.action in ('sales_receipt', 'purchase_payment'):
-                try:
-                    import_result = self.import_transaction(txn, validate_only)
-                    if import_result.success:
-                        result.imported_transactions += 1
-                        txn.imported = True
-                    else:
-                        result.errors.append(
-                            f"Row {txn.row_number}: {import_result.message}"
-                        )
-                except Exception as e:
-                    result.errors.append(f"Row {txn.row_number}: {str(e)}")
+        with self.reference_data(result.transactions):
+            for txn in result.transactions:
+                if txn.action in ('sales_receipt', 'purchase_payment'):
+                    try:
+                        import_result = self.import_transaction(txn, validate_only)
+                        if import_result.success:
+                            result.imported_transactions += 1
+                            txn.imported = True
+                        else:
+                            result.errors.append(
+                                f"Row {txn.row_number}: {import_result.message}"
+                            )
+                    except Exception as e:
+                        result.errors.append(f"Row {txn.row_number}: {str(e)}")
 
         return result
 
@@ -8,21 +8,26 @@ Supports parsing bank statements in multiple formats:
 - MT940 (SWIFT format)
 
 All parsers produce a unified ParsedTransaction structure.
+
+Files are read line by line: CSV and QIF are parsed as the lines are read,
+OFX and MT940 need the whole document and are parsed in one go.
 """
 
+import codecs
 import csv
+import io
 import re
 import hashlib
 import logging
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from datetime import date, datetime
-from typing import List, Optional, Tuple, Dict, Any
+from itertools import chain
+from typing import List, Optional, Tuple, Dict, Any, Iterable, Iterator
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
-
 @dataclass
 class ParsedTransaction:
     """
@@ -106,6 +111,22 @@ class BankFileParser(ABC):
         """
         pass
 
+    def iter_parse(self, lines: Iterable[str], filename: str = "") -> Iterator[ParsedTransaction]:
+        """
+        Parse transactions lazily from an iterable of lines (e.g. an open file).
+
+        The default joins the lines and calls parse(), for formats that need the
+        whole document. Line-based formats override this to stream.
+
+        Args:
+            lines: Lines of the file, including line endings
+            filename: Optional filename for context
+
+        Yields:
+            ParsedTransaction objects
+        """
+        yield from self.parse(''.join(lines), filename)
+
     @property
     @abstractmethod
     def format_name(self) -> str:
@@ -252,16 +273,48 @@ class CSVParser(BankFileParser):
         logger.info("Using generic CSV format")
         return 'generic', {}
 
-    def _find_column(self, row: Dict[str, str], candidates: List[str]) -> Optional[str]:
-        """Find first matching column from candidates (case-insensitive)"""
-        row_lower = {k.lower().strip(): v for k, v in row.items()}
+    @staticmethod
+    def _match_header(headers: List[str], candidates: List[str]) -> Optional[str]:
+        """Find the header for the first matching candidate (case-insensitive substring)"""
         for candidate in candidates:
             candidate_lower = candidate.lower()
-            for key in row_lower:
-                if candidate_lower in key:
-                    return row_lower[key]
+            for header in headers:
+                if candidate_lower in header.lower().strip():
+                    return header
         return None
 
+    def _resolve_columns(self, headers: List[str], config: Dict) -> Dict[str, Any]:
+        """
+        Resolve which header holds each field, once per file.
+
+        Returns:
+            Dict of field -> header name (or None), plus 'amount_mode' and, for
+            generic files, 'amount_like' (every amount/value/sum header in order)
+        """
+        headers = [h for h in headers if h is not None]
+        match = lambda candidates: self._match_header(headers, candidates)
+        columns: Dict[str, Any] = {
+            'date': match(config.get('date', ['date', 'transaction date', 'posting date'])),
+            'name': match(config.get('name', ['description', 'name', 'payee', 'merchant', 'counter party', 'transaction description'])),
+            'reference': match(config.get('reference', ['reference', 'ref', 'transaction reference'])),
+            'type': match(config.get('type', ['type', 'transaction type', 'category', 'subcategory'])),
+            'memo': match(['memo', 'description', 'notes']),
+            'memo_raw': match(['memo']),
+        }
+        if 'amount' in config:
+            columns['amount_mode'] = 'single'
+            columns['amount'] = match(config['amount'])
+        elif 'credit' in config or 'debit' in config:
+            columns['amount_mode'] = 'split'
+            columns['credit'] = match(config.get('credit', ['credit', 'paid in', 'money in']))
+            columns['debit'] = match(config.get('debit', ['debit', 'paid out', 'money out']))
+        else:
+            columns['amount_mode'] = 'generic'
+            columns['amount_like'] = [
+                h for h in headers if any(x in h.lower() for x in ['amount', 'value', 'sum'])
+            ]
+        return columns
+
     def _parse_date(self, date_str: str) -> Optional[date]:
         """Parse date from various formats"""
         if not date_str:
@@ -333,53 +386,49 @@ class CSVParser(BankFileParser):
 
     def parse(self, content: str, filename: str = "") -> List[ParsedTransaction]:
         """Parse CSV content with auto-detection of bank format"""
-        transactions = []
-
-        lines = content.strip().split('\n')
-        if not lines:
-            return transactions
-
-        # Parse as CSV
-        reader = csv.DictReader(lines)
+        return list(self.iter_parse(io.StringIO(content.strip()), filename))
+
+    def iter_parse(self, lines: Iterable[str], filename: str = "") -> Iterator[ParsedTransaction]:
+        """Parse CSV rows lazily; the bank format and column mapping are resolved from the header once"""
+        # Skip blank lines before the header row
+        lines = iter(lines)
+        first = next((line for line in lines if line.strip()), None)
+        if first is None:
+            return
+        reader = csv.DictReader(chain([first], lines))
         headers = reader.fieldnames or []
 
         # Detect bank format
         bank_name, config = self._detect_bank_format(headers)
+        columns = self._resolve_columns(headers, config)
 
         for row in reader:
             try:
-                txn = self._parse_row(row, config, bank_name)
+                txn = self._parse_row(row, config, columns)
                 if txn:
-                    transactions.append(txn)
+                    yield txn
             except Exception as e:
                 logger.warning(f"Error parsing CSV row: {e}")
                 continue
 
-        return transactions
-
-    def _parse_row(self, row: Dict[str, str], config: Dict, bank_name: str) -> Optional[ParsedTransaction]:
-        """Parse a single row using the detected format config"""
+    def _parse_row(self, row: Dict[str, str], config: Dict, columns: Dict[str, Any]) -> Optional[ParsedTransaction]:
+        """Parse a single row using the resolved column mapping"""
+        get = lambda field_name: row.get(columns[field_name]) if columns.get(field_name) else None
 
         # Parse date
-        date_cols = config.get('date', ['date', 'transaction date', 'posting date'])
-        date_str = self._find_column(row, date_cols)
-        txn_date = self._parse_date(date_str)
+        txn_date = self._parse_date(get('date'))
         if not txn_date:
             return None
 
         # Parse amount - either single column or credit/debit columns
         amount = None
 
-        if 'amount' in config:
-            amount_str = self._find_column(row, config['amount'])
-            amount = self._parse_amount(amount_str)
-        elif 'credit' in config or 'debit' in config:
+        if columns['amount_mode'] == 'single':
+            amount = self._parse_amount(get('amount'))
+        elif columns['amount_mode'] == 'split':
             # Separate credit/debit columns
-            credit_str = self._find_column(row, config.get('credit', ['credit', 'paid in', 'money in']))
-            debit_str = self._find_column(row, config.get('debit', ['debit', 'paid out', 'money out']))
-
-            credit = self._parse_amount(credit_str) or 0
-            debit = self._parse_amount(debit_str) or 0
+            credit = self._parse_amount(get('credit')) or 0
+            debit = self._parse_amount(get('debit')) or 0
 
             # Credit is positive, debit is negative
             if credit:
@@ -387,25 +436,22 @@ class CSVParser(BankFileParser):
             elif debit:
                 amount = -abs(debit)
         else:
-            # Generic fallback - look for any amount-like column
-            for key, value in row.items():
-                key_lower = key.lower()
-                if any(x in key_lower for x in ['amount', 'value', 'sum']):
-                    amount = self._parse_amount(value)
-                    if amount is not None:
-                        break
+            # Generic fallback - first amount-like column with a value
+            for key in columns['amount_like']:
+                amount = self._parse_amount(row.get(key))
+                if amount is not None:
+                    break
 
         if amount is None:
             return None
 
         # Parse name/description
-        name_cols = config.get('name', ['description', 'name', 'payee', 'merchant', 'counter party', 'transaction description'])
-        name = self._find_column(row, name_cols) or ''
+        name = get('name') or ''
 
         # Handle Barclays memo format (NAME\tREFERENCE)
         reference = ''
         if config.get('memo_format') == 'tab_split':
-            memo = self._find_column(row, ['memo']) or ''
+            memo = get('memo_raw') or ''
             if '\t' in memo:
                 parts = memo.split('\t')
                 name = parts[0].strip()
@@ -413,15 +459,13 @@ class CSVParser(BankFileParser):
             elif name == '':
                 name = memo
         else:
-            ref_cols = config.get('reference', ['reference', 'ref', 'transaction reference'])
-            reference = self._find_column(row, ref_cols) or ''
+            reference = get('reference') or ''
 
         # Parse type/category
-        type_cols = config.get('type', ['type', 'transaction type', 'category', 'subcategory'])
-        txn_type = self._find_column(row, type_cols) or ''
+        txn_type = get('type') or ''
 
         # Build memo from available fields
-        memo = self._find_column(row, ['memo', 'description', 'notes']) or ''
+        memo = get('memo') or ''
         if not memo:
             memo = name
 
@@ -635,90 +679,101 @@ class QIFParser(BankFileParser):
 
     def parse(self, content: str, filename: str = "") -> List[ParsedTransaction]:
         """Parse QIF content"""
-        transactions = []
-
-        # Split into transaction blocks (separated by ^)
-        blocks = content.split('^')
-
-        for block in blocks:
-            lines = block.strip().split('\n')
-            if not lines:
-                continue
-
-            # Skip header lines
-            if lines[0].strip().upper().startswith('!TYPE:'):
-                lines = lines[1:]
-
-            if not lines:
-                continue
-
-            try:
-                txn_data: Dict[str, str] = {}
-
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
+        return list(self.iter_parse(io.StringIO(content), filename))
+
+    def iter_parse(self, lines: Iterable[str], filename: str = "") -> Iterator[ParsedTransaction]:
+        """Parse QIF lazily, one ^-terminated block at a time"""
+        block: List[str] = []
+        for line in lines:
+            pieces = line.split('^')
+            block.append(pieces[0])
+            for piece in pieces[1:]:
+                txn = self._parse_block(''.join(block))
+                if txn:
+                    yield txn
+                block = [piece]
+        txn = self._parse_block(''.join(block))
+        if txn:
+            yield txn
+
+    def _parse_block(self, block: str) -> Optional[ParsedTransaction]:
+        """Parse one QIF transaction block"""
+        lines = block.strip().split('\n')
+        if not lines:
+            return None
 
-                    code = line[0].upper()
-                    value = line[1:].strip()
-
-                    if code == 'D':  # Date
-                        txn_data['date'] = value
-                    elif code == 'T':  # Amount
-                        txn_data['amount'] = value
-                    elif code == 'P':  # Payee
-                        txn_data['payee'] = value
-                    elif code == 'M':  # Memo
-                        txn_data['memo'] = value
-                    elif code == 'N':  # Check number
-                        txn_data['check_number'] = value
-                    elif code == 'L':  # Category
-                        txn_data['category'] = value
-
-                if 'date' not in txn_data or 'amount' not in txn_data:
-                    continue
+        # Skip header lines
+        if lines[0].strip().upper().startswith('!TYPE:'):
+            lines = lines[1:]
 
-                # Parse date (various formats: MM/DD/YYYY, M/D/YY, etc.)
-                date_str = txn_data['date']
-                txn_date = None
+        if not lines:
+            return None
 
-                for fmt in ['%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%d/%m/%y',
-                           '%m-%d-%Y', '%d-%m-%Y', '%Y-%m-%d']:
-                    try:
-                        txn_date = datetime.strptime(date_str, fmt).date()
-                        break
-                    except ValueError:
-                        continue
+        try:
+            txn_data: Dict[str, str] = {}
 
-                if not txn_date:
-                    logger.warning(f"Could not parse QIF date: {date_str}")
+            for line in lines:
+                line = line.strip()
+                if not line:
                     continue
 
-                # Parse amount
-                amount_str = txn_data['amount'].replace(',', '')
+                code = line[0].upper()
+                value = line[1:].strip()
+
+                if code == 'D':  # Date
+                    txn_data['date'] = value
+                elif code == 'T':  # Amount
+                    txn_data['amount'] = value
+                elif code == 'P':  # Payee
+                    txn_data['payee'] = value
+                elif code == 'M':  # Memo
+                    txn_data['memo'] = value
+                elif code == 'N':  # Check number
+                    txn_data['check_number'] = value
+                elif code == 'L':  # Category
+                    txn_data['category'] = value
+
+            if 'date' not in txn_data or 'amount' not in txn_data:
+                return None
+
+            # Parse date (various formats: MM/DD/YYYY, M/D/YY, etc.)
+            date_str = txn_data['date']
+            txn_date = None
+
+            for fmt in ['%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%d/%m/%y',
+                       '%m-%d-%Y', '%d-%m-%Y', '%Y-%m-%d']:
                 try:
-                    amount = float(amount_str)
+                    txn_date = datetime.strptime(date_str, fmt).date()
+                    break
                 except ValueError:
-                    logger.warning(f"Could not parse QIF amount: {amount_str}")
                     continue
 
-                transactions.append(ParsedTransaction(
-                    date=txn_date,
-                    amount=amount,
-                    name=txn_data.get('payee', ''),
-                    reference=txn_data.get('check_number', ''),
-                    memo=txn_data.get('memo', ''),
-                    check_number=txn_data.get('check_number', ''),
-                    subcategory=txn_data.get('category', ''),
-                    raw_data=txn_data
-                ))
+            if not txn_date:
+                logger.warning(f"Could not parse QIF date: {date_str}")
+                return None
 
-            except Exception as e:
-                logger.warning(f"Error parsing QIF block: {e}")
-                continue
+            # Parse amount
+            amount_str = txn_data['amount'].replace(',', '')
+            try:
+                amount = float(amount_str)
+            except ValueError:
+                logger.warning(f"Could not parse QIF amount: {amount_str}")
+                return None
+
+            return ParsedTransaction(
+                date=txn_date,
+                amount=amount,
+                name=txn_data.get('payee', ''),
+                reference=txn_data.get('check_number', ''),
+                memo=txn_data.get('memo', ''),
+                check_number=txn_data.get('check_number', ''),
+                subcategory=txn_data.get('category', ''),
+                raw_data=txn_data
+            )
 
-        return transactions
+        except Exception as e:
+            logger.warning(f"Error parsing QIF block: {e}")
+            return None
 
 
 class MT940Parser(BankFileParser):
@@ -920,42 +975,68 @@ def get_parser(format_name: str) -> Optional[BankFileParser]:
     return None
 
 
-def detect_and_parse(filepath: str) -> Tuple[List[ParsedTransaction], str]:
-    """
-    Auto-detect format and parse bank statement file.
+def _detect_encoding(path: Path) -> str:
+    """UTF-8 if the whole file decodes as UTF-8, else latin-1 (checked in blocks, not loaded whole)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                decoder.decode(block)
+        decoder.decode(b'', final=True)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
 
-    Args:
-        filepath: Path to bank statement file
 
-    Returns:
-        Tuple of (transactions, format_name)
+def _parse_path(filepath: str, format_name: Optional[str] = None) -> Tuple[List[ParsedTransaction], str]:
+    """
+    Parse a bank statement file, detecting its format from the first 4 KB
+    unless format_name is given.
 
     Raises:
         FileNotFoundError: If file doesn't exist
-        ValueError: If format cannot be detected
+        ValueError: If the format is unknown or cannot be detected
     """
     path = Path(filepath)
 
     if not path.exists():
         raise FileNotFoundError(f"File not found: {filepath}")
 
-    # Read file content
-    # Try UTF-8 first, fall back to latin-1
-    try:
-        content = path.read_text(encoding='utf-8')
-    except UnicodeDecodeError:
-        content = path.read_text(encoding='latin-1')
+    encoding = _detect_encoding(path)
 
-    filename = path.name
+    if format_name:
+        parser = get_parser(format_name)
+        if not parser:
+            raise ValueError(f"Unknown format: {format_name}")
+    else:
+        with open(path, 'r', encoding=encoding) as f:
+            head = f.read(4096)
+        parser = next((p for p in PARSERS if p.can_parse(head, path.name)), None)
+        if not parser:
+            raise ValueError(f"Could not detect format for file: {filepath}")
+        logger.info(f"Detected format: {parser.format_name}")
 
-    # Find appropriate parser
-    for parser in PARSERS:
-        if parser.can_parse(content, filename):
-            logger.info(f"Detected format: {parser.format_name}")
-            transactions = parser.parse(content, filename)
-            return transactions, parser.format_name
+    # newline='' lets the csv module handle quoted line breaks
+    newline = '' if isinstance(parser, CSVParser) else None
+    with open(path, 'r', encoding=encoding, newline=newline) as f:
+        return list(parser.iter_parse(f, path.name)), parser.format_name
 
-    raise ValueError(f"Could not detect format for file: {filepath}")
+
+def detect_and_parse(filepath: str) -> Tuple[List[ParsedTransaction], str]:
+    """
+    Auto-detect format and parse bank statement file.
+
+    Args:
+        filepath: Path to bank statement file
+
+    Returns:
+        Tuple of (transactions, format_name)
+
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        ValueError: If format cannot be detected
+    """
+    return _parse_path(filepath)
 
 
 def parse_file(filepath: str, format_name: Optional[str] = None) -> List[ParsedTransaction]:
@@ -968,19 +1049,10 @@ def parse_file(filepath: str, format_name: Optional[str] = None) -> List[ParsedT
 
     Returns:
         List of ParsedTransaction objects
-    """
-    if format_name:
-        parser = get_parser(format_name)
-        if not parser:
-            raise ValueError(f"Unknown format: {format_name}")
 
-        path = Path(filepath)
-        try:
-            content = path.read_text(encoding='utf-8')
-        except UnicodeDecodeError:
-            content = path.read_text(encoding='latin-1')
-
-        return parser.parse(content, path.name)
-    else:
-        transactions, _ = detect_and_parse(filepath)
-        return transactions
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        ValueError: If the format is unknown or cannot be detected
+    """
+    transactions, _ = _parse_path(filepath, format_name)
+    return transactions
@@ -0,0 +1,262 @@
+"""
+Per-Company Connection Pool Registry
+
+Holds one SQLConnector (and so one SQLAlchemy pool) per system/company key,
+replacing the plain dict api.main used to keep them in. It is a
+MutableMapping, so existing ``key in pools`` / ``pools[key]`` /
+``pools.get(key)`` callers are unchanged.
+
+On top of the dict it adds:
+  - Warmup: a newly registered pool opens a few connections in the
+    background, so the first request after a company switch does not pay
+    for the ODBC logins. warm_recent() re-warms the most recently used
+    companies (e.g. at startup or from the admin endpoint).
+  - A global connection budget: each company pool can grow to
+    pool_size + max_overflow on its own, so with many companies the total
+    can exceed what the SQL Server login allows. Whenever a pool opens a
+    new physical connection, and the open connections across all pools
+    exceed the budget, idle connections of the least recently used pools
+    are closed.
+  - status(): get_pool_status() for every pool plus totals, for the admin
+    endpoint.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECTION_BUDGET = 50
+DEFAULT_WARM_CONNECTIONS = 2
+DEFAULT_WARM_RECENT = 3
+
+
+def _open_connections(status: Dict[str, Any]) -> int:
+    """Physical connections a pool currently holds (idle + checked out)."""
+    return status.get('checkedin', 0) + status.get('checked_out_connections', 0)
+
+
+class ConnectionPoolRegistry(MutableMapping):
+    """
+    SQLConnectors by company key, most recently used last.
+
+    Args:
+        max_connections: Budget for open connections across all pools
+        warm_connections: Connections opened in the background for a new pool
+            (0 disables warmup)
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_CONNECTION_BUDGET,
+                 warm_connections: int = DEFAULT_WARM_CONNECTIONS):
+        self.max_connections = max_connections
+        self.warm_connections = warm_connections
+        self._connectors: 'OrderedDict[str, Any]' = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._listeners: Dict[str, tuple] = {}
+        self._warming: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+        self._warm_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pool-warm')
+
+    def configure(self, config=None):
+        """Read ``pool_budget`` and ``pool_warm_connections`` from [database]."""
+        if config is not None and config.has_section('database'):
+            self.max_connections = config.getint('database', 'pool_budget',
+                                                 fallback=self.max_connections)
+            self.warm_connections = config.getint('database', 'pool_warm_connections',
+                                                  fallback=self.warm_connections)
+
+    # MutableMapping interface
+
+    def __getitem__(self, key: str):
+        with self._lock:
+            connector = self._connectors[key]
+            self._touch(key)
+        return connector
+
+    def __setitem__(self, key: str, connector):
+        with self._lock:
+            previous = self._connectors.get(key)
+            self._connectors[key] = connector
+            self._touch(key)
+        if previous is not connector:
+            self._unwatch(key)
+            self._watch(key, connector)
+            if previous is not None:
+                self._dispose(key, previous)
+        self.warm(key)
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            connector = self._connectors.pop(key)
+            self._last_used.pop(key, None)
+            self._warming.pop(key, None)
+        self._unwatch(key)
+        self._dispose(key, connector)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._connectors))
+
+    def __len__(self) -> int:
+        return len(self._connectors)
+
+    def __contains__(self, key) -> bool:
+        return key in self._connectors
+
+    def _touch(self, key: str):
+        """Mark a pool as most recently used. Caller holds the lock."""
+        self._connectors.move_to_end(key)
+        self._last_used[key] = time.time()
+
+    # Warmup
+
+    def warm(self, key: str, connections: Optional[int] = None):
+        """
+        Open connections for a pool in the background.
+
+        Connections are checked out together and then returned, so the pool
+        keeps them idle for the next requests. Failures are logged only.
+        While a warmup for the pool is pending its future is returned instead
+        of starting another, which would open more connections than asked.
+        """
+        count = self.warm_connections if connections is None else connections
+        if count <= 0:
+            return None
+        with self._lock:
+            pending = self._warming.get(key)
+            if pending is not None and not pending.done():
+                return pending
+            future = self._warm_executor.submit(self._warm, key, count)
+            self._warming[key] = future
+        return future
+
+    def _warm(self, key: str, count: int) -> int:
+        with self._lock:
+            connector = self._connectors.get(key)
+        engine = getattr(connector, 'engine', None)
+        if engine is None:
+            return 0
+        self.enforce_budget(reserve=count, exclude=key)
+        opened = []
+        try:
+            for _ in range(count):
+                opened.append(engine.connect())
+        except Exception as e:
+            logger.warning(f"Connection pool warmup for {key} stopped after {len(opened)}: {e}")
+        finally:
+            for conn in opened:
+                conn.close()
+        logger.info(f"Warmed connection pool for {key} ({len(opened)} connections)")
+        return len(opened)
+
+    def warm_recent(self, limit: int = DEFAULT_WARM_RECENT) -> List[str]:
+        """Warm the most recently used pools. Returns their keys."""
+        keys = self.recent(limit)
+        for key in keys:
+            self.warm(key)
+        return keys
+
+    def recent(self, limit: Optional[int] = None) -> List[str]:
+        """Pool keys, most recently used first."""
+        with self._lock:
+            keys = list(reversed(self._connectors))
+        return keys[:limit] if limit else keys
+
+    # Budget
+
+    def _watch(self, key: str, connector):
+        """Enforce the budget whenever this pool opens a new physical connection."""
+        engine = getattr(connector, 'engine', None)
+        if engine is None:
+            return
+
+        def _on_connect(dbapi_conn, connection_record):
+            try:
+                self.enforce_budget(exclude=key)
+            except Exception as e:
+                logger.warning(f"Connection budget check for {key} failed: {e}")
+
+        event.listen(engine, 'connect', _on_connect)
+        self._listeners[key] = (engine, _on_connect)
+
+    def _unwatch(self, key: str):
+        engine, listener = self._listeners.pop(key, (None, None))
+        if engine is not None and event.contains(engine, 'connect', listener):
+            event.remove(engine, 'connect', listener)
+
+    def enforce_budget(self, reserve: int = 0, exclude: Optional[str] = None) -> List[str]:
+        """
+        Close idle connections of least recently used pools until the open
+        total (plus ``reserve`` about to be opened) fits the budget.
+
+        Pools with connections checked out are left alone. Returns the keys
+        of the pools that were trimmed.
+        """
+        if not self.max_connections:
+            return []
+        with self._lock:
+            items = list(self._connectors.items())  # least recently used first
+        statuses = {key: self._pool_status(connector) for key, connector in items}
+        total = sum(_open_connections(s) for s in statuses.values()) + reserve
+        trimmed = []
+        for key, connector in items:
+            if total <= self.max_connections:
+                break
+            status = statuses[key]
+            if key == exclude or status.get('checked_out_connections', 0) or not status.get('checkedin'):
+                continue
+            try:
+                connector.engine.dispose()
+            except Exception as e:
+                logger.warning(f"Could not release idle connections for {key}: {e}")
+                continue
+            total -= status['checkedin']
+            trimmed.append(key)
+        if trimmed:
+            logger.info(f"Connection budget {self.max_connections}: released idle connections for {trimmed}")
+        return trimmed
+
+    # Status
+
+    @staticmethod
+    def _pool_status(connector) -> Dict[str, Any]:
+        try:
+            return connector.get_pool_status()
+        except Exception as e:
+            return {'error': str(e)}
+
+    def status(self) -> Dict[str, Any]:
+        """get_pool_status() for every pool (most recent first) with totals against the budget."""
+        with self._lock:
+            items = [(key, self._connectors[key], self._last_used.get(key))
+                     for key in reversed(self._connectors)]
+        pools = []
+        for key, connector, last_used in items:
+            status = self._pool_status(connector)
+            pools.append({
+                'key': key,
+                'last_used': last_used,
+                'open_connections': _open_connections(status),
+                **status,
+            })
+        return {
+            'max_connections': self.max_connections,
+            'warm_connections': self.warm_connections,
+            'open_connections': sum(p['open_connections'] for p in pools),
+            'checked_out_connections': sum(p.get('checked_out_connections', 0) for p in pools),
+            'pools': pools,
+        }
+
+    @staticmethod
+    def _dispose(key: str, connector):
+        try:
+            connector.close_all_connections()
+        except Exception as e:
+            logger.warning(f"Error closing connection pool for {key}: {e}")
@@ -0,0 +1,181 @@
+"""
+DBF Header Reader and Schema Cache
+
+Reads a DBF table's structure from its header alone - the 32-byte file
+header plus the 32-byte field descriptors - without touching the records.
+Used by Opera3Reader.list_tables/_get_table_info, which are called across
+hundreds of tables by the Opera 3 config screens and snapshot scans.
+
+DbfHeaderCache keeps parsed headers keyed by path and revalidates them
+against the file's (mtime, size), so an unchanged table is never reparsed.
+get_header_cache() returns one cache per data folder, shared by every
+reader for that company. scan() parses many tables in parallel.
+
+Note: record_count is the header's record count, which includes records
+flagged as deleted (dbfread's len() scans the file to exclude them).
+
+USAGE:
+    from sql_rag.dbf_header import get_header_cache
+
+    cache = get_header_cache(data_path)
+    header = cache.get(Path(data_path) / "stran.dbf")
+    headers = cache.scan(Path(data_path).glob("*.dbf"))
+"""
+
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCAN_WORKERS = 8
+
+# version, yy, mm, dd, record count, header length, record length
+_FILE_HEADER = struct.Struct("<BBBBIHH")
+_FIELD_DESCRIPTOR_SIZE = 32
+_HEADER_TERMINATOR = 0x0D
+
+
+@dataclass
+class DbfHeader:
+    """Structure of a DBF table, as read from its header"""
+    path: str
+    record_count: int
+    header_length: int
+    record_length: int
+    fields: List[Dict[str, Any]]
+    mtime: float
+    size: int
+
+
+def read_dbf_header(path: Union[str, Path], encoding: str = 'cp1252') -> DbfHeader:
+    """
+    Read a DBF table's record count and field list from its header.
+
+    Args:
+        path: Path to the .dbf file
+        encoding: Encoding of the field names
+
+    Returns:
+        DbfHeader for the file
+
+    Raises:
+        ValueError: If the file is too short or its header is malformed
+    """
+    path = Path(path)
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        head = f.read(32)
+        if len(head) < 32:
+            raise ValueError(f"{path.name}: file too short for a DBF header")
+        _, _, _, _, record_count, header_length, record_length = _FILE_HEADER.unpack_from(head)
+        if header_length < 33:
+            raise ValueError(f"{path.name}: invalid header length {header_length}")
+        descriptors = f.read(header_length - 32)
+
+    fields = []
+    for offset in range(0, len(descriptors), _FIELD_DESCRIPTOR_SIZE):
+        descriptor = descriptors[offset:offset + _FIELD_DESCRIPTOR_SIZE]
+        if descriptor[0] == _HEADER_TERMINATOR or len(descriptor) < _FIELD_DESCRIPTOR_SIZE:
+            break
+        fields.append({
+            "name": descriptor[:11].split(b'\0')[0].decode(encoding),
+            "type": chr(descriptor[11]),
+            "length": descriptor[16],
+            "decimal_count": descriptor[17],
+        })
+
+    return DbfHeader(
+        path=str(path),
+        record_count=record_count,
+        header_length=header_length,
+        record_length=record_length,
+        fields=fields,
+        mtime=stat.st_mtime,
+        size=stat.st_size,
+    )
+
+
+class DbfHeaderCache:
+    """
+    Parsed DBF headers by path, revalidated against (mtime, size).
+
+    Thread-safe; scan() parses uncached or changed headers in parallel.
+    """
+
+    def __init__(self, encoding: str = 'cp1252', max_workers: int = DEFAULT_SCAN_WORKERS):
+        self.encoding = encoding
+        self.max_workers = max_workers
+        self._headers: Dict[str, Tuple[int, int, DbfHeader]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Union[str, Path]) -> DbfHeader:
+        """Header for a DBF file, parsed only if new or changed since last read."""
+        key = str(path)
+        stat = os.stat(key)
+        with self._lock:
+            cached = self._headers.get(key)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+
+        header = read_dbf_header(key, self.encoding)
+        with self._lock:
+            self._headers[key] = (stat.st_mtime_ns, stat.st_size, header)
+        return header
+
+    def scan(self, paths: Iterable[Union[str, Path]]) -> Dict[str, Union[DbfHeader, Exception]]:
+        """
+        Headers for many DBF files, read in parallel.
+
+        Returns:
+            Dict of path -> DbfHeader, or the exception raised reading that file
+        """
+        paths = [str(p) for p in paths]
+
+        def _get(path):
+            try:
+                return self.get(path)
+            except Exception as e:
+                return e
+
+        if len(paths) <= 1 or self.max_workers <= 1:
+            return {path: _get(path) for path in paths}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths)),
+                                thread_name_prefix='dbf-header') as executor:
+            return dict(zip(paths, executor.map(_get, paths)))
+
+    def invalidate(self, path: Union[str, Path] = None):
+        """Drop one cached header, or all of them."""
+        with self._lock:
+            if path is None:
+                self._headers.clear()
+            else:
+                self._headers.pop(str(path), None)
+
+    def stats(self) -> Dict[str, int]:
+        """Cached header count and hit/miss counters."""
+        with self._lock:
+            return {"cached": len(self._headers), "hits": self.hits, "misses": self.misses}
+
+
+_caches: Dict[Tuple[str, str], DbfHeaderCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_header_cache(data_path: Union[str, Path], encoding: str = 'cp1252') -> DbfHeaderCache:
+    """The shared header cache for a data folder (one per company)."""
+    key = (os.path.normcase(os.path.abspath(str(data_path))), encoding)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = DbfHeaderCache(encoding)
+        return cache
@@ -0,0 +1,325 @@
+"""
+Background PDF Statement Extraction Queue
+
+Runs bank and supplier statement extraction off the request thread.
+A job holds a list of PDF files; each file is extracted on a shared worker
+pool and the result is written to the normal extraction caches
+(PDFExtractionCache for bank statements, SupplierExtractionCache for supplier
+statements), so the existing preview/import endpoints pick it up as a cache hit.
+
+Calls to the Gemini model are throttled per model name with a token bucket
+so a month-end batch of statements does not trip the API quota. Files that
+are already cached are reported straight away without touching the limiter.
+Each PDF is read and hashed once; the bytes and hash are handed on to the
+extractor.
+
+The UI submits a job, then polls get_job() for per-file progress.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_MINUTE = 30
+MAX_RETAINED_JOBS = 50
+
+JOB_KINDS = ('bank', 'supplier')
+
+
+class ModelRateLimiter:
+    """
+    Token bucket per model name.
+
+    Each model gets ``requests_per_minute`` tokens refilled continuously,
+    with a burst of at most ``burst`` calls. acquire() blocks until a token
+    is available or the job is cancelled.
+    """
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE, burst: Optional[int] = None):
+        self.rate = max(requests_per_minute, 1) / 60.0
+        self.capacity = float(burst or max(1, min(requests_per_minute, 5)))
+        self._buckets: Dict[str, List[float]] = {}  # model -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, model: str, cancelled: Optional[Callable[[], bool]] = None) -> bool:
+        """Wait for a token for ``model``. Returns False if cancelled while waiting."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(model, [self.capacity, now])
+                tokens = min(self.capacity, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[model] = [tokens - 1, now]
+                    return True
+                self._buckets[model] = [tokens, now]
+                wait = (1 - tokens) / self.rate
+            if cancelled and cancelled():
+                return False
+            time.sleep(min(wait, 1.0))
+
+
+@dataclass
+class ExtractionItem:
+    """Progress of one PDF within an extraction job."""
+    file_path: str
+    status: str = 'pending'  # pending, running, cached, done, failed, cancelled
+    transaction_count: int = 0
+    summary: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'file_path': self.file_path,
+            'filename': Path(self.file_path).name,
+            'status': self.status,
+            'transaction_count': self.transaction_count,
+            'summary': self.summary,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+@dataclass
+class ExtractionJob:
+    """A batch of PDFs submitted together."""
+    job_id: str
+    kind: str
+    model_name: str
+    company: Optional[str]
+    items: List[ExtractionItem]
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    finished_at: Optional[str] = None
+    cancelled: bool = False
+
+    @property
+    def status(self) -> str:
+        if self.cancelled:
+            return 'cancelled'
+        states = {item.status for item in self.items}
+        if states & {'pending', 'running'}:
+            return 'running' if states - {'pending'} else 'queued'
+        return 'completed_with_errors' if 'failed' in states else 'completed'
+
+    def to_dict(self, include_items: bool = True) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        finished = sum(counts.get(s, 0) for s in ('cached', 'done', 'failed', 'cancelled'))
+        result = {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'model_name': self.model_name,
+            'company': self.company,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'total': len(self.items),
+            'finished': finished,
+            'counts': counts,
+        }
+        if include_items:
+            result['items'] = [item.to_dict() for item in self.items]
+        return result
+
+
+def _bank_summary(statement_info) -> Dict[str, Any]:
+    return {
+        'bank_name': statement_info.bank_name,
+        'account_number': statement_info.account_number,
+        'sort_code': statement_info.sort_code,
+        'period_start': statement_info.period_start,
+        'period_end': statement_info.period_end,
+        'opening_balance': statement_info.opening_balance,
+        'closing_balance': statement_info.closing_balance,
+    }
+
+
+def _supplier_summary(info) -> Dict[str, Any]:
+    return {
+        'supplier_name': info.supplier_name,
+        'account_reference': info.account_reference,
+        'statement_date': info.statement_date,
+        'opening_balance': info.opening_balance,
+        'closing_balance': info.closing_balance,
+    }
+
+
+class ExtractionQueue:
+    """
+    Worker pool that extracts statement PDFs in the background.
+
+    Args:
+        max_workers: Number of PDFs extracted concurrently
+        requests_per_minute: Gemini calls allowed per model per minute
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE):
+        self.max_workers = max_workers
+        self.limiter = ModelRateLimiter(requests_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdf-extract')
+        self._jobs: Dict[str, ExtractionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit_bank_job(self, reconciler, file_paths: List[str], company: Optional[str] = None) -> ExtractionJob:
+        """
+        Queue bank statement PDFs for extraction.
+
+        Args:
+            reconciler: StatementReconciler used for every file in the job
+            file_paths: PDF paths to extract
+            company: Company the job belongs to (for display only)
+        """
+        from sql_rag.pdf_extraction_cache import get_extraction_cache
+        # Pin the cache now: the singleton is swapped on company switch
+        cache = get_extraction_cache()
+
+        def extract(item: ExtractionItem, job: ExtractionJob):
+            pdf_bytes = Path(item.file_path).read_bytes()
+            pdf_hash = cache.hash_pdf(pdf_bytes)
+            cached = cache.get(pdf_hash)
+            if cached and not cached[0].get('_info_only') and cached[1]:
+                item.status = 'cached'
+            elif not self.limiter.acquire(job.model_name, lambda: job.cancelled):
+                item.status = 'cancelled'
+                return
+            statement_info, transactions = reconciler.extract_transactions_from_pdf(
+                item.file_path, cache=cache, pdf_bytes=pdf_bytes, pdf_hash=pdf_hash)
+            item.transaction_count = len(transactions)
+            item.summary = _bank_summary(statement_info)
+
+        return self._submit('bank', reconciler.model_name, file_paths, company, extract)
+
+    def submit_supplier_job(self, extractor, file_paths: List[str], company: Optional[str] = None) -> ExtractionJob:
+        """
+        Queue supplier statement PDFs for extraction.
+
+        Args:
+            extractor: SupplierStatementExtractor used for every file in the job
+            file_paths: PDF paths to extract
+            company: Company the job belongs to (for display only)
+        """
+        model_name = getattr(extractor.model, 'model_name', 'gemini')
+
+        def extract(item: ExtractionItem, job: ExtractionJob):
+            pdf_bytes = Path(item.file_path).read_bytes()
+            file_hash = extractor.cache.hash_bytes(pdf_bytes)
+            if extractor.cache.get_cached_hash(file_hash) is not None:
+                item.status = 'cached'
+            elif not self.limiter.acquire(job.model_name, lambda: job.cancelled):
+                item.status = 'cancelled'
+                return
+            info, lines = extractor.extract_from_pdf_bytes(pdf_bytes, file_hash=file_hash)
+            item.transaction_count = len(lines)
+            item.summary = _supplier_summary(info)
+
+        return self._submit('supplier', model_name, file_paths, company, extract)
+
+    def _submit(self, kind: str, model_name: str, file_paths: List[str],
+                company: Optional[str], extract: Callable) -> ExtractionJob:
+        job = ExtractionJob(
+            job_id=uuid.uuid4().hex[:12],
+            kind=kind,
+            model_name=model_name,
+            company=company,
+            items=[ExtractionItem(file_path=str(p)) for p in file_paths],
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        for item in job.items:
+            self._executor.submit(self._run_item, job, item, extract)
+        logger.info(f"Extraction job {job.job_id}: queued {len(job.items)} {kind} PDF(s) on {self.max_workers} workers")
+        return job
+
+    def _run_item(self, job: ExtractionJob, item: ExtractionItem, extract: Callable):
+        if job.cancelled:
+            item.status = 'cancelled'
+            self._finish(job)
+            return
+        item.status = 'running'
+        item.started_at = datetime.now().isoformat()
+        try:
+            extract(item, job)
+            if item.status == 'running':
+                item.status = 'done'
+        except Exception as e:
+            logger.warning(f"Extraction job {job.job_id}: {Path(item.file_path).name} failed: {e}")
+            item.status = 'failed'
+            item.error = str(e)
+        finally:
+            item.finished_at = datetime.now().isoformat()
+            self._finish(job)
+
+    def _finish(self, job: ExtractionJob):
+        if job.finished_at is None and all(
+            i.status not in ('pending', 'running') for i in job.items
+        ):
+            job.finished_at = datetime.now().isoformat()
+            logger.info(f"Extraction job {job.job_id} finished: {job.to_dict(include_items=False)['counts']}")
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond MAX_RETAINED_JOBS. Caller holds the lock."""
+        finished = [j for j in self._jobs.values() if j.finished_at]
+        excess = len(self._jobs) - MAX_RETAINED_JOBS
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(excess, 0)]:
+            del self._jobs[job.job_id]
+
+    def get_job(self, job_id: str) -> Optional[ExtractionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, kind: Optional[str] = None) -> List[ExtractionJob]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if kind:
+            jobs = [j for j in jobs if j.kind == kind]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def cancel_job(self, job_id: str) -> bool:
+        """Cancel files not yet started. Files already being extracted run to completion."""
+        job = self.get_job(job_id)
+        if not job:
+            return False
+        job.cancelled = True
+        for item in job.items:
+            if item.status == 'pending':
+                item.status = 'cancelled'
+        self._finish(job)
+        return True
+
+
+# Singleton instance
+_queue_instance: Optional[ExtractionQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_extraction_queue(config=None) -> ExtractionQueue:
+    """
+    Get or create the shared extraction queue.
+
+    Reads ``max_workers`` and ``requests_per_minute`` from the [extraction]
+    section of config.ini on first use.
+    """
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            max_workers = DEFAULT_MAX_WORKERS
+            rpm = DEFAULT_REQUESTS_PER_MINUTE
+            if config is not None and config.has_section('extraction'):
+                max_workers = config.getint('extraction', 'max_workers', fallback=DEFAULT_MAX_WORKERS)
+                rpm = config.getint('extraction', 'requests_per_minute', fallback=DEFAULT_REQUESTS_PER_MINUTE)
+            _queue_instance = ExtractionQueue(max_workers=max_workers, requests_per_minute=rpm)
+        return _queue_instance
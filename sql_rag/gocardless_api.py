@@ -7,14 +7,27 @@ More reliable than email parsing with access to complete payment data.
 API Documentation: https://developer.gocardless.com/api-reference/
 """
 
+import asyncio
+import random
 import requests
 import logging
-from typing import Optional, List, Dict, Any
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Iterator
 from dataclasses import dataclass
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 
 logger = logging.getLogger(__name__)
 
+# GoCardless allows 1000 requests per minute per access token
+DEFAULT_RATE_LIMIT = 1000
+RATE_LIMIT_PERIOD = 60.0
+MAX_RETRIES = 5
+MAX_BACKOFF = 60.0  # seconds
+HTTP_POOL_SIZE = 20  # keep-alive connections per host (parallel payout fetches use 10)
+
 
 @dataclass
 class GoCardlessPayment:
@@ -62,12 +75,179 @@ class GoCardlessPayout:
         return len(self.payments)
 
 
+def summarise_payout_items(items: List[Dict]) -> tuple[List[str], float]:
+    """
+    Split payout items into the paid-out payment IDs and the VAT on fees.
+
+    Returns:
+        Tuple of (payment IDs in payout order, fees VAT in pounds)
+    """
+    fees_vat = 0.0
+    payment_ids = []
+    for item in items:
+        item_type = item.get("type", "")
+        if item_type == "payment_paid_out":
+            pid = item.get("links", {}).get("payment")
+            if pid:
+                payment_ids.append(pid)
+        elif item_type in ("gocardless_fee", "app_fee"):
+            for tax in item.get("taxes", []):
+                fees_vat += abs(float(tax.get("amount", 0))) / 100
+    return payment_ids, fees_vat
+
+
+def customer_display_name(customer: Dict) -> str:
+    """Company name, or given + family name for individuals"""
+    return customer.get("company_name") or \
+        f"{customer.get('given_name', '')} {customer.get('family_name', '')}".strip()
+
+
+def build_payment(payment_data: Dict, mandate: Optional[Dict] = None,
+                  customer: Optional[Dict] = None) -> GoCardlessPayment:
+    """Build a GoCardlessPayment from API payment data and its mandate/customer"""
+    mandate_id = payment_data.get("links", {}).get("mandate")
+    customer_id = (mandate or {}).get("links", {}).get("customer") if mandate_id else None
+    customer_name = customer_display_name(customer or {}) if customer_id else None
+
+    return GoCardlessPayment(
+        id=payment_data.get("id"),
+        amount=int(payment_data.get("amount", 0)) / 100,
+        currency=payment_data.get("currency", "GBP"),
+        status=payment_data.get("status"),
+        charge_date=GoCardlessClient._parse_date(payment_data.get("charge_date")),
+        customer_name=customer_name,
+        customer_id=customer_id,
+        mandate_id=mandate_id,
+        description=payment_data.get("description"),
+        reference=payment_data.get("reference"),
+        metadata=payment_data.get("metadata", {})
+    )
+
+
+def _header_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds from now given by a Retry-After / RateLimit-Reset header, which
+    is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every client using the same access token.
+
+    The bucket refills at limit per period. GoCardless reports its own view
+    in RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset headers, which
+    update() applies: the bucket never holds more than the server says is
+    remaining, and when nothing remains callers wait for the reset.
+    """
+
+    def __init__(self, limit: int = DEFAULT_RATE_LIMIT, period: float = RATE_LIMIT_PERIOD):
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._reset_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self._reset_at is not None and now >= self._reset_at:
+            # Server window has rolled over
+            self.tokens = float(self.limit)
+            self._reset_at = None
+        else:
+            self.tokens = min(float(self.limit), self.tokens + (now - self._updated) * self.limit / self.period)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) * self.period / self.limit
+            time.sleep(wait)
+
+    def update(self, headers):
+        """Apply RateLimit-* headers from a response."""
+        try:
+            limit = int(headers.get("RateLimit-Limit") or 0)
+            remaining = headers.get("RateLimit-Remaining")
+            remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            return
+        reset_in = _header_seconds(headers.get("RateLimit-Reset"))
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit > 0:
+                self.limit = limit
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+            if reset_in is not None:
+                self._reset_at = now + reset_in
+                if remaining == 0:
+                    self._blocked_until = max(self._blocked_until, now + reset_in)
+
+    def pause(self, seconds: float):
+        """Hold all callers for the given time (e.g. after a 429)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+# Shared keep-alive session and per-token rate limiters
+_session: Optional[requests.Session] = None
+_rate_limiters: Dict[str, RateLimiter] = {}
+_shared_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide session so API calls reuse TLS connections."""
+    global _session
+    with _shared_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def get_rate_limiter(access_token: str) -> RateLimiter:
+    """Rate limiter for an access token (GoCardless limits per token)."""
+    with _shared_lock:
+        limiter = _rate_limiters.get(access_token)
+        if limiter is None:
+            limiter = _rate_limiters[access_token] = RateLimiter()
+        return limiter
+
+
 class GoCardlessAPIError(Exception):
     """Exception for GoCardless API errors"""
-    def __init__(self, message: str, status_code: int = None, error_type: str = None):
+    def __init__(self, message: str, status_code: int = None, error_type: str = None,
+                 errors: List[Dict] = None):
         self.message = message
         self.status_code = status_code
         self.error_type = error_type
+        self.errors = errors or []
         super().__init__(message)
 
 
@@ -100,6 +280,8 @@ class GoCardlessClient:
         self._customers_cache: Dict[str, Dict] = {}
         self._mandates_cache: Dict[str, Dict] = {}
         self._bank_accounts_cache: Dict[str, Dict] = {}
+        self._session = get_http_session()
+        self._rate_limiter = get_rate_limiter(access_token)
 
     @property
     def headers(self) -> Dict[str, str]:
@@ -110,19 +292,56 @@ class GoCardlessClient:
             "Accept": "application/json"
         }
 
-    def _request(self, method: str, endpoint: str, params: Dict = None, data: Dict = None) -> Dict:
-        """Make API request"""
+    def _request(self, method: str, endpoint: str, params: Dict = None, data: Dict = None,
+                 headers: Dict[str, str] = None) -> Dict:
+        """
+        Make API request.
+
+        Requests go through the shared keep-alive session and the token's
+        rate limiter. A 429 is retried after Retry-After (or exponential
+        backoff); GETs, and POSTs sent with an Idempotency-Key, are also
+        retried on 5xx and connection errors.
+        """
         url = f"{self.base_url}{endpoint}"
+        request_headers = {**self.headers, **(headers or {})}
+        safe_to_retry = method == "GET" or "Idempotency-Key" in request_headers
 
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                params=params,
-                json=data,
-                timeout=30
-            )
+            attempt = 0
+            while True:
+                attempt += 1
+                self._rate_limiter.acquire()
+                try:
+                    response = self._session.request(
+                        method=method,
+                        url=url,
+                        headers=request_headers,
+                        params=params,
+                        json=data,
+                        timeout=30
+                    )
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                    if not safe_to_retry or attempt >= MAX_RETRIES:
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning(f"GoCardless {method} {endpoint} failed ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+
+                self._rate_limiter.update(response.headers)
+
+                retryable = response.status_code == 429 or (safe_to_retry and response.status_code >= 500)
+                if not retryable or attempt >= MAX_RETRIES:
+                    break
+                delay = _header_seconds(response.headers.get("Retry-After"))
+                if delay is None:
+                    delay = self._backoff(attempt)
+                if response.status_code == 429:
+                    # Everyone sharing this token waits, not just this caller
+                    self._rate_limiter.pause(delay)
+                logger.warning(f"GoCardless {method} {endpoint} returned {response.status_code}, "
+                               f"retrying in {delay:.1f}s (attempt {attempt}/{MAX_RETRIES})")
+                time.sleep(delay)
 
             if response.status_code == 401:
                 raise GoCardlessAPIError("Invalid access token", 401, "authentication_error")
@@ -146,7 +365,8 @@ class GoCardlessClient:
                 raise GoCardlessAPIError(
                     message,
                     response.status_code,
-                    error_data.get("type")
+                    error_data.get("type"),
+                    errors
                 )
 
             return response.json()
@@ -158,6 +378,37 @@ class GoCardlessClient:
         except requests.exceptions.RequestException as e:
             raise GoCardlessAPIError(f"Request failed: {e}", error_type="request_error")
 
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with jitter for retries without Retry-After."""
+        return min(MAX_BACKOFF, 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def paginate(self, list_method: Callable[..., tuple], limit: int = 500, **kwargs) -> Iterator[Dict]:
+        """
+        Iterate over every item of a cursor-paginated list method.
+
+        Usage:
+            for mandate in client.paginate(client.list_mandates, status="active"):
+                ...
+        """
+        cursor = None
+        while True:
+            items, cursor = list_method(limit=limit, cursor=cursor, **kwargs)
+            yield from items
+            if not cursor or not items:
+                return
+
+    async def apaginate(self, list_method: Callable[..., tuple], limit: int = 500,
+                        **kwargs) -> AsyncIterator[Dict]:
+        """Async version of paginate(); each page is fetched in a worker thread."""
+        cursor = None
+        while True:
+            items, cursor = await asyncio.to_thread(list_method, limit=limit, cursor=cursor, **kwargs)
+            for item in items:
+                yield item
+            if not cursor or not items:
+                return
+
     def test_connection(self) -> Dict[str, Any]:
         """
         Test API connection and return account info
@@ -203,8 +454,30 @@ class GoCardlessClient:
         Returns:
             Tuple of (list of payouts, next cursor or None)
         """
-        params = {"status": status, "limit": min(limit, 500)}
+        raw_payouts, next_cursor = self.list_payouts(
+            status=status, limit=limit, created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte, cursor=cursor
+        )
+        payouts = [self._parse_payout(p) for p in raw_payouts]
+        return payouts, next_cursor
 
+    def list_payouts(
+        self,
+        status: Optional[str] = None,
+        limit: int = 500,
+        created_at_gte: Optional[date] = None,
+        created_at_lte: Optional[date] = None,
+        cursor: Optional[str] = None
+    ) -> tuple[List[Dict], Optional[str]]:
+        """
+        List payouts as raw API dicts (status None = all statuses).
+
+        Returns:
+            Tuple of (list of payouts, next cursor or None)
+        """
+        params = {"limit": min(limit, 500)}
+        if status:
+            params["status"] = status
         if created_at_gte:
             params["created_at[gte]"] = created_at_gte.isoformat() + "T00:00:00Z"
         if created_at_lte:
@@ -214,16 +487,47 @@ class GoCardlessClient:
 
         result = self._request("GET", "/payouts", params=params)
 
-        payouts = []
-        for p in result.get("payouts", []):
-            payout = self._parse_payout(p)
-            payouts.append(payout)
-
         # Get pagination cursor
         meta = result.get("meta", {}).get("cursors", {})
         next_cursor = meta.get("after")
 
-        return payouts, next_cursor
+        return result.get("payouts", []), next_cursor
+
+    def list_events(
+        self,
+        created_at_gt: Optional[str] = None,
+        limit: int = 500,
+        cursor: Optional[str] = None
+    ) -> tuple[List[Dict], Optional[str]]:
+        """
+        List events (oldest first) created after a timestamp.
+
+        Args:
+            created_at_gt: ISO timestamp; only events created after it
+            limit: Number of results (max 500)
+            cursor: Pagination cursor
+
+        Returns:
+            Tuple of (list of events, next cursor or None)
+        """
+        params = {"limit": min(limit, 500)}
+        if created_at_gt:
+            params["created_at[gt]"] = created_at_gt
+        if cursor:
+            params["after"] = cursor
+
+        result = self._request("GET", "/events", params=params)
+        events = sorted(result.get("events", []), key=lambda e: e.get("created_at", ""))
+
+        meta = result.get("meta", {}).get("cursors", {})
+        next_cursor = meta.get("after")
+
+        return events, next_cursor
+
+    def get_resource(self, resource: str, object_id: str) -> Dict:
+        """Fetch one object by resource name (e.g. "payments"), bypassing the client caches"""
+        result = self._request("GET", f"/{resource}/{object_id}")
+        return result.get(resource, {})
 
     def get_payout(self, payout_id: str) -> GoCardlessPayout:
         """Get a specific payout by ID"""
@@ -331,11 +635,16 @@ class GoCardlessClient:
         currency: str = "GBP",
         metadata: Optional[Dict[str, str]] = None,
         reference: Optional[str] = None,
-        retry_if_possible: bool = True
+        retry_if_possible: bool = True,
+        idempotency_key: Optional[str] = None
     ) -> Dict:
         """
         Create a payment against a mandate.
 
+        With an idempotency_key the request is safe to repeat: transient
+        failures are retried, and if GoCardless already created a payment
+        for the key that payment is returned instead of a second one.
+
         Args:
             amount_pence: Amount in pence (GBP) or smallest currency unit
             mandate_id: GoCardless mandate ID (MD000XXX)
@@ -345,6 +654,7 @@ class GoCardlessClient:
             metadata: Optional metadata dict
             reference: Optional reference (shown on bank statement)
             retry_if_possible: Whether to retry failed payments
+            idempotency_key: Unique key for this payment request
 
         Returns:
             Created payment dict from GoCardless
@@ -372,8 +682,24 @@ class GoCardlessClient:
         if metadata:
             payment_data["payments"]["metadata"] = metadata
 
-        result = self._request("POST", "/payments", data=payment_data)
-        return result.get("payments", {})
+        if not idempotency_key:
+            result = self._request("POST", "/payments", data=payment_data)
+            return result.get("payments", {})
+
+        try:
+            result = self._request("POST", "/payments", data=payment_data,
+                                   headers={"Idempotency-Key": idempotency_key})
+            return result.get("payments", {})
+        except GoCardlessAPIError as e:
+            conflicting = next(
+                (err.get("links", {}).get("conflicting_resource_id") for err in e.errors
+                 if err.get("reason") == "idempotent_creation_conflict"),
+                None
+            )
+            if e.status_code != 409 or not conflicting:
+                raise
+            logger.info(f"Payment for idempotency key {idempotency_key} already exists: {conflicting}")
+            return self.get_payment(conflicting)
 
     def cancel_payment(self, payment_id: str) -> Dict:
         """
@@ -664,19 +990,7 @@ class GoCardlessClient:
 
         payout = self.get_payout(payout_id)
         items = self.get_payout_items(payout_id)
-
-        fees_vat = 0.0
-        payment_ids = []
-
-        for item in items:
-            item_type = item.get("type", "")
-            if item_type == "payment_paid_out":
-                pid = item.get("links", {}).get("payment")
-                if pid:
-                    payment_ids.append(pid)
-            elif item_type in ("gocardless_fee", "app_fee"):
-                for tax in item.get("taxes", []):
-                    fees_vat += abs(float(tax.get("amount", 0))) / 100
+        payment_ids, fees_vat = summarise_payout_items(items)
 
         # Phase 1: Fetch all payments in parallel
         payment_data_map = {}
@@ -731,30 +1045,9 @@ class GoCardlessClient:
             if not pd:
                 continue
 
-            customer_id = None
-            customer_name = None
-            mandate_id = pd.get("links", {}).get("mandate")
-            if mandate_id:
-                mandate = self._mandates_cache.get(mandate_id, {})
-                customer_id = mandate.get("links", {}).get("customer")
-                if customer_id:
-                    customer = self._customers_cache.get(customer_id, {})
-                    customer_name = customer.get("company_name") or \
-                                  f"{customer.get('given_name', '')} {customer.get('family_name', '')}".strip()
-
-            payments.append(GoCardlessPayment(
-                id=pd.get("id"),
-                amount=int(pd.get("amount", 0)) / 100,
-                currency=pd.get("currency", "GBP"),
-                status=pd.get("status"),
-                charge_date=self._parse_date(pd.get("charge_date")),
-                customer_name=customer_name,
-                customer_id=customer_id,
-                mandate_id=mandate_id,
-                description=pd.get("description"),
-                reference=pd.get("reference"),
-                metadata=pd.get("metadata", {})
-            ))
+            mandate = self._mandates_cache.get(pd.get("links", {}).get("mandate"), {})
+            customer = self._customers_cache.get(mandate.get("links", {}).get("customer"), {})
+            payments.append(build_payment(pd, mandate, customer))
 
         payout.payments = payments
         payout.fees_vat = fees_vat
@@ -763,24 +1056,29 @@ class GoCardlessClient:
 
     def _parse_payout(self, data: Dict) -> GoCardlessPayout:
         """Parse payout data from API response"""
-        # Parse FX data for foreign currency payouts
-        fx_data = data.get("fx", {}) or {}
-        fx_amount_pence = fx_data.get("fx_amount")
-        fx_amount = int(fx_amount_pence) / 100 if fx_amount_pence is not None else None
-        fx_currency = fx_data.get("fx_currency")
-        exchange_rate = fx_data.get("exchange_rate")
-
         # Look up creditor bank account for sort code / account number
-        bank_account_number = None
-        bank_sort_code = None
+        cba = {}
         cba_id = data.get("links", {}).get("creditor_bank_account")
         if cba_id:
             try:
                 cba = self.get_creditor_bank_account(cba_id)
-                bank_account_number = cba.get("account_number_ending") or cba.get("account_number")
-                bank_sort_code = cba.get("bank_code")  # GoCardless uses bank_code for sort code
             except Exception:
                 pass
+        return self.parse_payout(data, cba)
+
+    @classmethod
+    def parse_payout(cls, data: Dict, bank_account: Optional[Dict] = None) -> GoCardlessPayout:
+        """Parse payout data with its (already fetched) creditor bank account"""
+        # Parse FX data for foreign currency payouts
+        fx_data = data.get("fx", {}) or {}
+        fx_amount_pence = fx_data.get("fx_amount")
+        fx_amount = int(fx_amount_pence) / 100 if fx_amount_pence is not None else None
+        fx_currency = fx_data.get("fx_currency")
+        exchange_rate = fx_data.get("exchange_rate")
+
+        bank_account = bank_account or {}
+        bank_account_number = bank_account.get("account_number_ending") or bank_account.get("account_number")
+        bank_sort_code = bank_account.get("bank_code")  # GoCardless uses bank_code for sort code
 
         return GoCardlessPayout(
             id=data.get("id"),
@@ -788,8 +1086,8 @@ class GoCardlessClient:
             currency=data.get("currency", "GBP"),
             status=data.get("status"),
             reference=data.get("reference", ""),
-            arrival_date=self._parse_date(data.get("arrival_date")),
-            created_at=self._parse_datetime(data.get("created_at")),
+            arrival_date=cls._parse_date(data.get("arrival_date")),
+            created_at=cls._parse_datetime(data.get("created_at")),
             deducted_fees=int(data.get("deducted_fees", 0)) / 100,
             payout_type=data.get("payout_type", ""),
             payments=[],
@@ -944,7 +1242,7 @@ class GoCardlessPartnerClient:
         }
 
         try:
-            response = requests.post(url, json=data, timeout=30)
+            response = get_http_session().post(url, json=data, timeout=30)
             if response.status_code != 200:
                 error_msg = response.text
                 try:
@@ -979,7 +1277,7 @@ class GoCardlessPartnerClient:
             "Content-Type": "application/json",
         }
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = get_http_session().get(url, headers=headers, timeout=30)
             if response.status_code != 200:
                 raise GoCardlessAPIError(
                     f"Failed to get organisation info: {response.status_code}",
@@ -0,0 +1,327 @@
+"""
+GoCardless Bulk Collections
+
+Creates GoCardless payment requests for many customers as one job, instead
+of running the single request-payment flow once per customer.
+
+Pipeline:
+  1. Validate every request in one pass against the mandates, the open
+     payment requests (duplicate invoice check) and the Opera balances,
+     all loaded up front with one query each.
+  2. Write the payment request rows in a single transaction, each with its
+     own idempotency key, in status 'submitting'.
+  3. Submit to GoCardless with bounded concurrency. The idempotency key makes
+     retries safe: a repeated create returns the payment already made.
+  4. Record the outcomes in a single transaction and return a per-item report.
+
+A row left in 'submitting' (the job was interrupted, or GoCardless did not
+give a definite answer) is resumed with the same idempotency key the next
+time the same invoices are collected, so it cannot be collected twice.
+"""
+
+import logging
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sql_rag.gocardless_api import GoCardlessAPIError, GoCardlessClient
+from sql_rag.gocardless_payments import GoCardlessPaymentsDB
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+
+def build_description(invoices: List[str], description: Optional[str] = None,
+                      statement_reference: str = '') -> str:
+    """
+    Payment description, kept short for bank statement visibility (~18 chars
+    on BACS). The full invoice list is always in metadata.invoices.
+    """
+    stmt_ref = (statement_reference or '').strip()[:10]
+    if not description:
+        inv_part = invoices[0] if len(invoices) == 1 else f"{invoices[0]} +{len(invoices) - 1}"
+        return f"{stmt_ref} {inv_part}" if stmt_ref else inv_part
+    if stmt_ref and not description.startswith(stmt_ref):
+        return f"{stmt_ref} {description}"
+    return description
+
+
+def build_bacs_reference(template: Optional[str], statement_reference: str,
+                         invoices: List[str], opera_account: str) -> str:
+    """
+    BACS reference from the settings template (max 10 chars — what appears
+    on the customer's bank statement). Fields take an optional length, e.g.
+    {company4} = first 4 chars of company, {inv_num5} = 5 digit inv number.
+    """
+    first_invoice = invoices[0] if invoices else ''
+    field_values = {
+        'company': (statement_reference or '').strip()[:10],
+        'inv': first_invoice,
+        'inv_num': ''.join(c for c in first_invoice if c.isdigit()),
+        'customer': opera_account or '',
+    }
+
+    def replace_field(match):
+        value = field_values.get(match.group(1), '')
+        length = match.group(2)
+        return value[:int(length)] if length else value
+
+    reference = re.sub(r'\{(\w+?)(\d+)?\}', replace_field, (template or '{company}').strip())
+    return reference.strip()[:10]
+
+
+def usable_charge_date(charge_date: Optional[str]) -> Optional[str]:
+    """Drop a charge date in the past — GoCardless then uses the earliest possible date."""
+    if not charge_date:
+        return None
+    try:
+        if datetime.strptime(charge_date, '%Y-%m-%d').date() < date.today():
+            return None
+    except (ValueError, TypeError):
+        pass
+    return charge_date
+
+
+def estimated_arrival(charge_date: Optional[str]) -> Optional[str]:
+    """Rough payout arrival: charge date plus about 3 working days."""
+    if not charge_date:
+        return None
+    return (datetime.strptime(charge_date, '%Y-%m-%d').date() + timedelta(days=5)).isoformat()
+
+
+class BulkCollection:
+    """
+    One bulk collection run.
+
+    Args:
+        payments_db: Payments database for mandates and payment requests
+        client: GoCardless API client
+        settings: GoCardless settings (statement reference, BACS template)
+        use_bacs_reference: Send a BACS reference built from the template
+        max_concurrency: Payment create calls in flight at once
+    """
+
+    def __init__(self, payments_db: GoCardlessPaymentsDB, client: GoCardlessClient,
+                 settings: Dict[str, Any], use_bacs_reference: bool = False,
+                 max_concurrency: int = DEFAULT_CONCURRENCY):
+        self.db = payments_db
+        self.client = client
+        self.settings = settings
+        self.use_bacs_reference = use_bacs_reference
+        self.max_concurrency = max_concurrency
+
+    def run(self, requests: List[Dict[str, Any]],
+            invoice_balances: Optional[Dict[str, Dict[str, float]]] = None,
+            account_credits: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        Collect payments for a list of requests.
+
+        Args:
+            requests: Dicts with opera_account, invoices and optionally
+                amount (pence), charge_date and description
+            invoice_balances: account -> {invoice ref: outstanding pounds},
+                used when a request has no amount
+            account_credits: account -> unallocated credit in pounds; accounts
+                with credit are refused (money may already have been received)
+
+        Returns:
+            Per-item results in request order, with a summary
+        """
+        items = self._validate(requests, invoice_balances or {}, account_credits or {})
+        to_submit = [item for item in items if item['status'] == 'ready']
+
+        # New rows in one transaction; resumed rows already exist
+        new_rows = self.db.create_payment_requests([
+            {
+                'mandate_id': item['mandate_id'],
+                'opera_account': item['opera_account'],
+                'amount_pence': item['amount'],
+                'invoice_refs': item['invoices'],
+                'charge_date': item['charge_date'],
+                'description': item['description'],
+                'idempotency_key': item['idempotency_key'],
+            }
+            for item in to_submit if item.get('request_id') is None
+        ])
+        rows_by_key = {row['idempotency_key']: row['id'] for row in new_rows}
+        for item in to_submit:
+            item.setdefault('request_id', rows_by_key.get(item['idempotency_key']))
+
+        if to_submit:
+            workers = min(self.max_concurrency, len(to_submit))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gc-collect') as executor:
+                list(executor.map(self._submit, to_submit))
+
+        self.db.update_payment_requests([
+            {
+                'id': item['request_id'],
+                'payment_id': item.get('payment_id'),
+                'status': item.get('gc_status') if item['status'] == 'submitted'
+                else 'failed' if item['status'] == 'failed' else None,
+                'charge_date': item.get('charge_date') if item['status'] == 'submitted' else None,
+                'error_message': item.get('error'),
+            }
+            for item in to_submit
+        ])
+
+        results = [self._result(item) for item in items]
+        succeeded = sum(1 for r in results if r['success'])
+        return {
+            'success': succeeded == len(results),
+            'results': results,
+            'summary': {
+                'total': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'invalid': sum(1 for item in items if item['status'] == 'invalid'),
+                'unconfirmed': sum(1 for item in items if item['status'] == 'unconfirmed'),
+                'amount_pence': sum(item['amount'] for item in items if item['status'] == 'submitted'),
+            },
+        }
+
+    def _validate(self, requests, invoice_balances, account_credits) -> List[Dict[str, Any]]:
+        """Check every request against mandates, open requests and balances in one pass."""
+        accounts = [(req.get('opera_account') or '').strip() for req in requests]
+        mandates = self.db.get_active_mandates([a for a in accounts if a])
+        open_requests: Dict[str, List[Dict[str, Any]]] = {}
+        for req in self.db.list_open_payment_requests([a for a in accounts if a]):
+            open_requests.setdefault(req['opera_account'], []).append(req)
+
+        statement_reference = self.settings.get("request_statement_reference") or ""
+        claimed = set()  # (account, invoice) already in this batch
+        items = []
+        for index, (req, account) in enumerate(zip(requests, accounts)):
+            invoices = [str(i).strip() for i in (req.get('invoices') or []) if str(i).strip()]
+            item = {'index': index, 'opera_account': account, 'invoices': invoices,
+                    'amount': req.get('amount'), 'status': 'ready'}
+            items.append(item)
+
+            def invalid(message):
+                item['status'] = 'invalid'
+                item['error'] = message
+
+            if not account or not invoices:
+                invalid("opera_account and invoices are required")
+                continue
+
+            mandate = mandates.get(account)
+            if not mandate:
+                invalid(f"No active mandate found for customer {account}. Please set up a mandate first.")
+                continue
+
+            if item['amount'] is None:
+                balances = invoice_balances.get(account, {})
+                total = sum(balances.get(inv, 0) for inv in invoices)
+                if not total:
+                    invalid("Could not find specified invoices")
+                    continue
+                item['amount'] = int(round(total * 100))
+            if item['amount'] <= 0:
+                invalid("Amount must be greater than zero")
+                continue
+
+            unallocated = abs(account_credits.get(account, 0))
+            if unallocated >= 0.01:
+                invalid(f"Customer {account} has £{unallocated:,.2f} unallocated credit on their account. "
+                        f"This may be a previous GoCardless payment not yet allocated to invoices. "
+                        f"Please allocate existing receipts before requesting a new payment to avoid duplicate collection.")
+                continue
+
+            in_batch = {inv for inv in invoices if (account, inv) in claimed}
+            if in_batch:
+                invalid(f"Invoice(s) {', '.join(sorted(in_batch))} appear more than once in this batch.")
+                continue
+
+            overlapping = [r for r in open_requests.get(account, [])
+                           if set(invoices) & set(r.get('invoice_refs') or [])]
+            # An unfinished row for exactly these invoices is resumed, not duplicated
+            resumable = next((r for r in overlapping
+                              if r['status'] == 'submitting' and r.get('idempotency_key')
+                              and sorted(r['invoice_refs']) == sorted(invoices)
+                              and r['amount_pence'] == item['amount']), None)
+            existing = next((r for r in overlapping if r is not resumable), None)
+            if existing:
+                overlap = set(invoices) & set(existing.get('invoice_refs') or [])
+                invalid(f"Payment already requested for invoice(s): {', '.join(sorted(overlap))}. "
+                        f"Existing request status: {existing.get('status')}. "
+                        f"Cancel the existing request first to avoid duplicate collection.")
+                continue
+
+            claimed.update((account, inv) for inv in invoices)
+            item.update({
+                'mandate_id': mandate['mandate_id'],
+                'customer_name': mandate.get('opera_name', account),
+                'charge_date': usable_charge_date(req.get('charge_date')),
+                'description': build_description(invoices, req.get('description'), statement_reference),
+                'reference': build_bacs_reference(
+                    self.settings.get("bacs_reference_template"), statement_reference, invoices, account
+                ) if self.use_bacs_reference else None,
+            })
+            if resumable:
+                item['request_id'] = resumable['id']
+                item['idempotency_key'] = resumable['idempotency_key']
+            else:
+                item['idempotency_key'] = f"opera-payreq-{uuid.uuid4().hex}"
+        return items
+
+    def _submit(self, item: Dict[str, Any]):
+        """Create one payment. Runs on the worker pool."""
+        try:
+            payment = self.client.create_payment(
+                amount_pence=item['amount'],
+                mandate_id=item['mandate_id'],
+                description=item['description'],
+                charge_date=item['charge_date'],
+                reference=item['reference'] or None,
+                metadata={"opera_account": item['opera_account'], "invoices": ",".join(item['invoices'])},
+                idempotency_key=item['idempotency_key'],
+            )
+        except GoCardlessAPIError as e:
+            # A definite rejection fails the row; anything else (timeouts,
+            # server errors) may have created the payment, so the row stays
+            # 'submitting' and is resumed with the same key next time
+            definite = e.status_code is not None and 400 <= e.status_code < 500 and e.status_code != 429
+            item['status'] = 'failed' if definite else 'unconfirmed'
+            item['error'] = f"GoCardless API error: {e.message}"
+            logger.error(f"GoCardless create_payment FAILED for {item['opera_account']} / {item['invoices']}: {e}")
+            return
+        except Exception as e:
+            item['status'] = 'unconfirmed'
+            item['error'] = f"GoCardless API error: {e}"
+            logger.error(f"GoCardless create_payment FAILED for {item['opera_account']} / {item['invoices']}: {e}")
+            return
+
+        item['status'] = 'submitted'
+        item['payment_id'] = payment.get('id')
+        item['gc_status'] = payment.get('status', 'pending')
+        item['charge_date'] = payment.get('charge_date') or item['charge_date']
+
+    @staticmethod
+    def _result(item: Dict[str, Any]) -> Dict[str, Any]:
+        result = {
+            'index': item['index'],
+            'opera_account': item['opera_account'],
+            'invoices': item['invoices'],
+            'status': item['status'],
+            'success': item['status'] == 'submitted',
+        }
+        if item.get('error'):
+            result['error'] = item['error']
+        if item['status'] == 'submitted':
+            result['message'] = f"Payment of £{item['amount'] / 100:.2f} requested for customer {item['opera_account']}"
+        if item.get('request_id'):
+            result['payment_request'] = {
+                'id': item['request_id'],
+                'payment_id': item.get('payment_id'),
+                'mandate_id': item['mandate_id'],
+                'amount_pence': item['amount'],
+                'charge_date': item.get('charge_date'),
+                'description': item['description'],
+                'status': item.get('gc_status') or ('failed' if item['status'] == 'failed' else 'submitting'),
+                'customer_name': item.get('customer_name'),
+                'estimated_arrival': estimated_arrival(item.get('charge_date')) if item.get('payment_id') else None,
+            }
+        return result
@@ -0,0 +1,303 @@
+"""
+GoCardless Customer Matching
+
+Resolves GoCardless payments (payer name, mandate, customer id, invoice
+references) to Opera customer accounts.
+
+The match-customers endpoints used to rebuild their lookups on every call
+and, for payments not linked by mandate, normalise every Opera customer
+name once per payment. CustomerIndex is built once per company from:
+  - the mandate links in GoCardlessPaymentsDB (by mandate id, GoCardless
+    customer id and normalised name)
+  - the Opera customer names (sname), normalised once
+  - the references of outstanding invoices (stran)
+and cached until the mandates change or it is max_age old, so a payout is
+matched with dictionary lookups and a few substring searches per payment.
+
+Match priority (first hit wins):
+  0. metadata   - opera_account set when the payment was requested from here
+  1. mandate    - mandate_id linked in the mandates table
+  2. customer   - GoCardless customer id linked in the mandates table
+  3. invoice    - invoice refs that all belong to one outstanding account
+  4. name_exact / name_contains   - mandate opera_name / gocardless_name
+  5. opera_exact / opera_contains - Opera customer names
+Contains matches take the first name in the same order as before (mandates
+by account, Opera customers in query order), so results are unchanged.
+"""
+
+import logging
+import re
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sql_rag.gocardless_payments import GoCardlessPaymentsDB
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 300  # seconds before Opera customers/invoices are re-read
+
+_COMPANY_SUFFIXES = (' limited', ' ltd', ' ltd.', ' plc', ' inc', ' llp', ' lp',
+                     ' company', ' co', ' group', ' uk', ' holdings')
+_PARENS_RE = re.compile(r'\s*\([^)]*\)')
+_INITIALS_RE = re.compile(r'\b([a-z])\s+([a-z])\b')
+_NO_NAME = ('unknown', '', 'not provided')
+_SEP = '\x00'
+
+
+def normalize_company_name(name: str) -> str:
+    """Normalise company name for matching: lowercase, strip common suffixes."""
+    n = (name or '').lower().strip()
+    # Remove content in parentheses for matching
+    n = _PARENS_RE.sub('', n).strip()
+    # Normalise "&" and "and"
+    n = n.replace(' and ', ' & ')
+    # Remove spaces between single letters (I C -> IC, P J -> PJ)
+    n = _INITIALS_RE.sub(r'\1\2', n)
+    # Remove common company suffixes
+    for suffix in _COMPANY_SUFFIXES:
+        if n.endswith(suffix):
+            n = n[:-len(suffix)].strip()
+    # Remove trailing punctuation
+    return n.rstrip('.,')
+
+
+class _NameList:
+    """
+    Normalised names in priority order, searchable for the first name that
+    contains, or is contained in, a query name.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]]):
+        entries = list(entries)
+        self.names = [name for name, _ in entries]
+        self.values = [value for _, value in entries]
+        self._first: Dict[str, int] = {}
+        for i, name in enumerate(self.names):
+            self._first.setdefault(name, i)
+        self._lengths = sorted({len(name) for name in self._first})
+        # All names joined, so "query in name" is one str.find over the list
+        self._joined = _SEP.join(self.names)
+        self._offsets = []
+        offset = 0
+        for name in self.names:
+            self._offsets.append(offset)
+            offset += len(name) + 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def first_overlap(self, query: str) -> Optional[int]:
+        """Index of the first name where ``query in name or name in query``."""
+        if not self.names:
+            return None
+        best = None
+        pos = self._joined.find(query)
+        if pos >= 0:
+            best = bisect_right(self._offsets, pos) - 1
+        # "name in query": look up every substring of query with a name length
+        for length in self._lengths:
+            if length > len(query):
+                break
+            for start in range(len(query) - length + 1):
+                i = self._first.get(query[start:start + length])
+                if i is not None and (best is None or i < best):
+                    best = i
+        return best
+
+
+class CustomerIndex:
+    """
+    Lookups for matching GoCardless payments to Opera customers.
+
+    Args:
+        mandates: Rows from GoCardlessPaymentsDB.list_mandates()
+        customers: Opera account -> customer name (active customers)
+        invoices: (account, invoice ref) pairs for outstanding invoices
+    """
+
+    def __init__(self, mandates: List[Dict[str, Any]], customers: Dict[str, str],
+                 invoices: Iterable[Tuple[str, str]] = ()):
+        self.customers = customers
+        self.mandate_by_id: Dict[str, Dict[str, Any]] = {}
+        self.mandate_by_customer: Dict[str, Dict[str, Any]] = {}
+        mandate_by_name: Dict[str, Dict[str, Any]] = {}
+        for m in mandates:
+            if not m.get('opera_account') or m['opera_account'] == '__UNLINKED__':
+                continue
+            mid = (m.get('mandate_id') or '').strip()
+            if mid:
+                self.mandate_by_id[mid] = m
+            cid = (m.get('gocardless_customer_id') or '').strip()
+            if cid:
+                self.mandate_by_customer[cid] = m
+            name = (m.get('opera_name') or '').strip()
+            if name:
+                mandate_by_name[normalize_company_name(name)] = m
+            gc_name = (m.get('gocardless_name') or '').strip()
+            if gc_name:
+                mandate_by_name[normalize_company_name(gc_name)] = m
+        self.mandate_by_name = mandate_by_name
+        self._mandate_names = _NameList(mandate_by_name.items())
+        self._opera_names = _NameList(
+            (normalize_company_name(name), (account, name)) for account, name in customers.items()
+        )
+
+        # Invoice ref -> account, dropping refs that appear on several accounts
+        self.invoice_accounts: Dict[str, str] = {}
+        ambiguous = set()
+        for account, ref in invoices:
+            ref = (ref or '').strip().upper()
+            if not ref or ref in ambiguous:
+                continue
+            existing = self.invoice_accounts.setdefault(ref, account)
+            if existing != account:
+                ambiguous.add(ref)
+                del self.invoice_accounts[ref]
+
+        self.built_at = time.time()
+        logger.info(f"GC customer index: {len(self.mandate_by_id)} mandates by ID, "
+                    f"{len(self.mandate_by_customer)} by customer_id, {len(mandate_by_name)} by name, "
+                    f"{len(customers)} Opera customers, {len(self.invoice_accounts)} invoice refs")
+
+    def _mandate_match(self, m: Dict[str, Any]) -> Tuple[str, str]:
+        account = m['opera_account']
+        return account, self.customers.get(account, m.get('opera_name', ''))
+
+    def resolve(self, payment: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str], List[str]]:
+        """
+        Match one payment.
+
+        Returns (account, name, match_method, invoice refs from metadata).
+        """
+        customer_name = payment.get('customer_name', '') or ''
+        mandate_id = payment.get('mandate_id', '') or ''
+        customer_id = payment.get('customer_id', '') or ''
+        metadata = payment.get('metadata') or {}
+
+        metadata_refs = []
+        meta_invoices = (metadata.get('invoices') or '').strip()
+        if meta_invoices:
+            metadata_refs = [r.strip() for r in meta_invoices.split(',') if r.strip()]
+
+        # Metadata from GoCardless (set when payment was created via this app)
+        meta_account = (metadata.get('opera_account') or '').strip()
+        if meta_account and meta_account in self.customers:
+            return meta_account, self.customers[meta_account], f"metadata:opera_account={meta_account}", metadata_refs
+
+        if mandate_id and mandate_id in self.mandate_by_id:
+            return (*self._mandate_match(self.mandate_by_id[mandate_id]), f"mandate:{mandate_id}", metadata_refs)
+
+        if customer_id and customer_id in self.mandate_by_customer:
+            return (*self._mandate_match(self.mandate_by_customer[customer_id]), f"customer:{customer_id}", metadata_refs)
+
+        refs = payment.get('invoice_refs') or metadata_refs
+        if refs and self.invoice_accounts:
+            accounts = {self.invoice_accounts.get(str(r).strip().upper()) for r in refs}
+            if len(accounts) == 1 and None not in accounts:
+                account = accounts.pop()
+                return account, self.customers.get(account, ''), f"invoice:{','.join(refs)}", metadata_refs
+
+        if customer_name.lower() in _NO_NAME:
+            return None, None, None, metadata_refs
+
+        norm_name = normalize_company_name(customer_name)
+        if norm_name in self.mandate_by_name:
+            return (*self._mandate_match(self.mandate_by_name[norm_name]), f"name_exact:{norm_name}", metadata_refs)
+        i = self._mandate_names.first_overlap(norm_name)
+        if i is not None:
+            stored_name = self._mandate_names.names[i]
+            return (*self._mandate_match(self._mandate_names.values[i]), f"name_contains:{stored_name}", metadata_refs)
+
+        i = self._opera_names.first_overlap(norm_name)
+        if i is not None:
+            norm_opera = self._opera_names.names[i]
+            account, opera_name = self._opera_names.values[i]
+            method = f"opera_exact:{norm_name}" if norm_opera == norm_name else f"opera_contains:{norm_opera}"
+            return account, opera_name, method, metadata_refs
+
+        return None, None, None, metadata_refs
+
+    def match(self, payments: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """
+        Match a batch of payments.
+
+        Returns (matched payment dicts, (opera_account, gocardless customer id)
+        pairs for mandates matched by name that can be backfilled).
+        """
+        matched_payments = []
+        backfill = []
+        cache: Dict[tuple, tuple] = {}
+        for payment in payments:
+            metadata = payment.get('metadata') or {}
+            key = (payment.get('customer_name', ''), payment.get('mandate_id', ''), payment.get('customer_id', ''),
+                   tuple(payment.get('invoice_refs') or ()),
+                   metadata.get('opera_account'), metadata.get('invoices'))
+            if key not in cache:
+                cache[key] = self.resolve(payment)
+            account, name, method, metadata_refs = cache[key]
+
+            customer_id = payment.get('customer_id', '')
+            if account and customer_id and method and method.startswith('name_'):
+                backfill.append((account, customer_id))
+
+            # Use invoice refs from metadata if available (exact match from payment request)
+            invoice_refs = payment.get('invoice_refs', [])
+            if not invoice_refs and metadata_refs:
+                invoice_refs = metadata_refs
+
+            matched_payments.append({
+                "customer_name": payment.get('customer_name', ''),
+                "description": payment.get('description', ''),
+                "amount": payment.get('amount', 0),
+                "invoice_refs": invoice_refs,
+                "matched_account": account,
+                "matched_name": name,
+                "match_score": 1.0 if account else 0,
+                "match_method": method,
+                "match_status": "matched" if account else "unmatched",
+                "possible_duplicate": False,
+                "duplicate_warning": None,
+                "gc_payment_id": payment.get('gc_payment_id', '')
+            })
+        return matched_payments, backfill
+
+
+# Cached indexes by (payments database, Opera source)
+_indexes: Dict[Tuple[str, str], Tuple[tuple, CustomerIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_customer_index(
+    payments_db: GoCardlessPaymentsDB,
+    source: str,
+    load_opera: Callable[[], Tuple[Dict[str, str], Iterable[Tuple[str, str]]]],
+    max_age: int = DEFAULT_MAX_AGE,
+) -> CustomerIndex:
+    """
+    Get the customer index for a company, building it if needed.
+
+    Args:
+        payments_db: The company's payments database (mandate links)
+        source: Identifies the Opera data (e.g. 'sql' or the Opera 3 data path)
+        load_opera: Returns (customers {account: name}, outstanding invoice
+            (account, ref) pairs); called only when the index is rebuilt
+        max_age: Seconds before the Opera data is re-read
+
+    The index is rebuilt when the mandates table changes (linking or
+    backfilling a mandate) or after max_age seconds.
+    """
+    key = (str(payments_db.db_path), source)
+    version = payments_db.mandates_version()
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached and cached[0] == version and time.time() - cached[1].built_at < max_age:
+        return cached[1]
+
+    customers, invoices = load_opera()
+    index = CustomerIndex(payments_db.list_mandates(), customers, invoices)
+    with _indexes_lock:
+        _indexes[key] = (version, index)
+    return index
+
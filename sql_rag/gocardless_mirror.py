@@ -0,0 +1,372 @@
+"""
+GoCardless API Mirror
+
+Keeps a local copy of GoCardless payouts, payout items, payments, mandates,
+customers and creditor bank accounts in GoCardlessPaymentsDB, so the payouts
+screen, customer matching and import read from SQLite instead of re-fetching
+every object from the API on each page view.
+
+Sync is incremental:
+  - New payouts are listed from a created_at watermark (the newest payout
+    already mirrored), with a one-day overlap since the API filter is by date.
+  - Changes to mirrored objects (payout status, payment failures, mandate
+    cancellations, ...) are picked up from the events API, using the newest
+    event seen as the cursor, and only those objects are re-fetched.
+  - Payout details (items and the payments, mandates and customers they
+    reference) are fetched once per payout; mandates and customers shared
+    between payouts are fetched once in total.
+
+Usage:
+    mirror = get_gocardless_mirror(settings)
+    mirror.sync_if_stale()                 # background refresh
+    payouts, _ = mirror.get_payouts(status="paid", created_at_gte=since)
+    payout = mirror.get_payout_with_payments(payouts[0].id)
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional
+
+from sql_rag.gocardless_api import (
+    GoCardlessClient, GoCardlessPayout, build_payment, create_client_from_settings,
+    summarise_payout_items,
+)
+from sql_rag.gocardless_payments import GoCardlessPaymentsDB, get_payments_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_DAYS = 90  # payout history pulled on the first sync
+DEFAULT_MAX_AGE = 300  # seconds before sync_if_stale() refreshes
+DETAIL_FETCH_WORKERS = 10
+
+# Event resource_type -> key in event links
+_EVENT_RESOURCES = {
+    'payouts': 'payout',
+    'payments': 'payment',
+    'mandates': 'mandate',
+    'customers': 'customer',
+}
+
+
+class GoCardlessMirror:
+    """
+    Local GoCardless mirror with incremental sync.
+
+    Mirrored objects and sync watermarks are stored under the client's scope
+    (see mirror_scope), so a mirror only ever reads its own account's data.
+
+    Args:
+        db: Payments database holding the mirror tables
+        client: API client used for new or changed objects
+        initial_days: Days of payouts pulled when the mirror is empty
+        max_age: Seconds after which sync_if_stale() triggers a refresh
+    """
+
+    def __init__(self, db: GoCardlessPaymentsDB, client: GoCardlessClient,
+                 initial_days: int = DEFAULT_INITIAL_DAYS, max_age: int = DEFAULT_MAX_AGE):
+        self.db = db
+        self.client = client
+        self.initial_days = initial_days
+        self.max_age = max_age
+        self._sync_lock = threading.Lock()
+        self._detail_lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+        self._last_sync: Optional[float] = None
+        self.last_sync_stats: Dict[str, Any] = {}
+        self.last_error: Optional[str] = None
+
+    # ---------------------------------------------------------------- sync
+
+    @property
+    def scope(self) -> str:
+        return mirror_scope(self.client)
+
+    @property
+    def has_synced(self) -> bool:
+        return self.db.get_api_sync_state('payouts', scope=self.scope) is not None
+
+    def sync(self) -> Dict[str, Any]:
+        """
+        Bring the mirror up to date. Concurrent calls wait for the running sync.
+
+        Returns:
+            Counts of fetched objects for this sync
+        """
+        with self._sync_lock:
+            started = time.monotonic()
+            stats = {'payouts': 0, 'events': 0, 'refreshed': 0, 'details': 0}
+            try:
+                first_sync = not self.has_synced
+                # Start the event cursor before listing so changes made during
+                # the sync are picked up by the next one
+                event_state = self.db.get_api_sync_state('events', scope=self.scope)
+                if first_sync or event_state is None:
+                    self.db.set_api_sync_state('events', _utc_now_iso(), scope=self.scope)
+                else:
+                    self._apply_events(event_state['watermark'], stats)
+
+                new_ids = self._sync_payouts(stats)
+                stats['details'] = len(self.ensure_payout_details(new_ids))
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"GoCardless mirror sync failed: {e}")
+                raise
+            finally:
+                stats['seconds'] = round(time.monotonic() - started, 2)
+                self.last_sync_stats = stats
+            self._last_sync = time.time()
+            logger.info(f"GoCardless mirror synced: {stats}")
+            return stats
+
+    def sync_in_background(self) -> bool:
+        """Start a sync on a daemon thread unless one is already running."""
+        if self._background is not None and self._background.is_alive():
+            return False
+
+        def run():
+            try:
+                self.sync()
+            except Exception:
+                pass  # logged and kept in last_error by sync()
+
+        self._background = threading.Thread(target=run, name='gocardless-mirror-sync', daemon=True)
+        self._background.start()
+        return True
+
+    def sync_if_stale(self) -> bool:
+        """
+        Sync now if the mirror is empty, otherwise refresh in the background
+        when the last sync is older than max_age. Returns True if a sync ran
+        or was started.
+        """
+        if not self.has_synced:
+            self.sync()
+            return True
+        if self._last_sync is None or time.time() - self._last_sync > self.max_age:
+            return self.sync_in_background()
+        return False
+
+    def _sync_payouts(self, stats: Dict[str, Any]) -> List[str]:
+        """List payouts created since the watermark. Returns the new payout IDs."""
+        state = self.db.get_api_sync_state('payouts', scope=self.scope)
+        watermark = state['watermark'] if state else None
+        if watermark:
+            since = _parse_iso(watermark).date() - timedelta(days=1)
+        else:
+            since = date.today() - timedelta(days=self.initial_days)
+
+        fetched = {payout['id']: payout
+                   for payout in self.client.paginate(self.client.list_payouts, created_at_gte=since)}
+
+        known = self.db.get_api_objects('payouts', list(fetched), scope=self.scope)
+        new_ids = [pid for pid in fetched if pid not in known]
+        self.db.upsert_api_objects('payouts', fetched, scope=self.scope)
+        self._ensure_bank_accounts(fetched.values())
+        stats['payouts'] = len(fetched)
+
+        newest = max([p.get('created_at') or '' for p in fetched.values()] + [watermark or ''])
+        self.db.set_api_sync_state('payouts', newest or None, scope=self.scope)
+        return new_ids
+
+    def _apply_events(self, watermark: Optional[str], stats: Dict[str, Any]):
+        """Re-fetch mirrored objects named in events since the watermark."""
+        changed: Dict[str, set] = {resource: set() for resource in _EVENT_RESOURCES}
+        newest = watermark
+        for event in self.client.paginate(self.client.list_events, created_at_gt=watermark):
+            resource = event.get('resource_type')
+            object_id = event.get('links', {}).get(_EVENT_RESOURCES.get(resource, ''))
+            if object_id:
+                changed[resource].add(object_id)
+            if event.get('created_at') and (newest is None or event['created_at'] > newest):
+                newest = event['created_at']
+            stats['events'] += 1
+
+        for resource, ids in changed.items():
+            if not ids:
+                continue
+            # New payouts are picked up by the listing; other resources are
+            # only refreshed if already mirrored (new ones arrive with a payout)
+            known = self.db.get_api_objects(resource, list(ids), scope=self.scope)
+            refreshed = self._fetch(resource, list(known))
+            self.db.upsert_api_objects(resource, refreshed, scope=self.scope)
+            stats['refreshed'] += len(refreshed)
+
+        if newest:
+            self.db.set_api_sync_state('events', newest, scope=self.scope)
+
+    # ------------------------------------------------------------- details
+
+    def ensure_payout_details(self, payout_ids: List[str]) -> List[str]:
+        """
+        Fetch items, payments, mandates and customers for payouts whose items
+        are not yet mirrored. Returns the payout IDs that were fetched.
+        """
+        with self._detail_lock:
+            have = self.db.get_api_objects('payout_items', payout_ids, scope=self.scope)
+            missing = [pid for pid in dict.fromkeys(payout_ids) if pid and pid not in have]
+            if not missing:
+                return []
+
+            items_by_payout = {pid: self.client.get_payout_items(pid) for pid in missing}
+            payment_ids = [pid for items in items_by_payout.values()
+                           for pid in summarise_payout_items(items)[0]]
+            payments = self._fetch_missing('payments', payment_ids)
+            mandate_ids = [p.get('links', {}).get('mandate') for p in payments.values()]
+            mandates = self._fetch_missing('mandates', mandate_ids)
+            customer_ids = [m.get('links', {}).get('customer') for m in mandates.values()]
+            self._fetch_missing('customers', customer_ids)
+
+            # Items last: their presence marks the payout as complete
+            self.db.upsert_api_objects('payout_items', items_by_payout, scope=self.scope)
+            return missing
+
+    def _ensure_bank_accounts(self, payouts):
+        cba_ids = [p.get('links', {}).get('creditor_bank_account') for p in payouts]
+        self._fetch_missing('creditor_bank_accounts', cba_ids)
+
+    def _fetch_missing(self, resource: str, object_ids: List[Optional[str]]) -> Dict[str, Dict]:
+        """Mirrored objects for the IDs, fetching and storing any not yet mirrored."""
+        ids = [i for i in dict.fromkeys(object_ids) if i]
+        found = self.db.get_api_objects(resource, ids, scope=self.scope)
+        fetched = self._fetch(resource, [i for i in ids if i not in found])
+        self.db.upsert_api_objects(resource, fetched, scope=self.scope)
+        found.update(fetched)
+        return found
+
+    def _fetch(self, resource: str, object_ids: List[str]) -> Dict[str, Dict]:
+        """Fetch objects from the API in parallel. Failures are logged and skipped."""
+        if not object_ids:
+            return {}
+
+        def fetch_one(object_id):
+            try:
+                return object_id, self.client.get_resource(resource, object_id)
+            except Exception as e:
+                logger.warning(f"Failed to fetch GoCardless {resource} {object_id}: {e}")
+                return object_id, None
+
+        with ThreadPoolExecutor(max_workers=min(DETAIL_FETCH_WORKERS, len(object_ids))) as executor:
+            results = executor.map(fetch_one, object_ids)
+            return {object_id: data for object_id, data in results if data}
+
+    # --------------------------------------------------------------- reads
+
+    def get_payouts(
+        self,
+        status: Optional[str] = "paid",
+        limit: int = 50,
+        created_at_gte: Optional[date] = None,
+    ) -> tuple[List[GoCardlessPayout], Optional[str]]:
+        """
+        Payouts from the mirror, newest first (same shape as
+        GoCardlessClient.get_payouts; the cursor is always None).
+        """
+        raw = self.db.list_api_objects(
+            'payouts', status=status,
+            created_at_gte=created_at_gte.isoformat() if created_at_gte else None,
+            limit=limit, scope=self.scope,
+        )
+        accounts = self._fetch_missing(
+            'creditor_bank_accounts', [p.get('links', {}).get('creditor_bank_account') for p in raw])
+        payouts = [GoCardlessClient.parse_payout(p, accounts.get(p.get('links', {}).get('creditor_bank_account')))
+                   for p in raw]
+        return payouts, None
+
+    def get_payout_with_payments(self, payout_id: str) -> GoCardlessPayout:
+        """Payout with its payments, fetching from the API only what is not mirrored."""
+        data = self._fetch_missing('payouts', [payout_id]).get(payout_id)
+        if not data:
+            raise ValueError(f"GoCardless payout {payout_id} not found")
+        self.ensure_payout_details([payout_id])
+
+        items = self.db.get_api_objects('payout_items', [payout_id], scope=self.scope).get(payout_id, [])
+        payment_ids, fees_vat = summarise_payout_items(items)
+        payments = self._fetch_missing('payments', payment_ids)
+        mandates = self._fetch_missing(
+            'mandates', [p.get('links', {}).get('mandate') for p in payments.values()])
+        customers = self._fetch_missing(
+            'customers', [m.get('links', {}).get('customer') for m in mandates.values()])
+
+        cba_id = data.get('links', {}).get('creditor_bank_account')
+        bank_account = self._fetch_missing('creditor_bank_accounts', [cba_id]).get(cba_id)
+        payout = GoCardlessClient.parse_payout(data, bank_account)
+
+        for pid in payment_ids:
+            payment = payments.get(pid)
+            if not payment:
+                continue
+            mandate = mandates.get(payment.get('links', {}).get('mandate'), {})
+            customer = customers.get(mandate.get('links', {}).get('customer'), {})
+            payout.payments.append(build_payment(payment, mandate, customer))
+        payout.fees_vat = fees_vat
+        return payout
+
+    def get_customer(self, customer_id: str) -> Dict:
+        """Customer from the mirror, fetched once if not yet mirrored."""
+        return self._fetch_missing('customers', [customer_id]).get(customer_id, {})
+
+    def status(self) -> Dict[str, Any]:
+        """Mirror contents and sync state for the UI."""
+        return {
+            'objects': self.db.count_api_objects(scope=self.scope),
+            'payouts_watermark': (self.db.get_api_sync_state('payouts', scope=self.scope) or {}).get('watermark'),
+            'events_watermark': (self.db.get_api_sync_state('events', scope=self.scope) or {}).get('watermark'),
+            'last_sync': datetime.fromtimestamp(self._last_sync).isoformat() if self._last_sync else None,
+            'last_sync_stats': self.last_sync_stats,
+            'syncing': self._sync_lock.locked(),
+            'last_error': self.last_error,
+        }
+
+
+def mirror_scope(client: GoCardlessClient) -> str:
+    """
+    Key for the API account a client talks to: the environment (base URL)
+    and the access token, which is issued per creditor organisation. Hashed
+    so the token itself is not stored.
+    """
+    identity = f"{client.base_url}|{client.access_token}".encode()
+    return hashlib.sha256(identity).hexdigest()[:16]
+
+
+def _utc_now_iso() -> str:
+    return datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+
+
+def _parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+# One mirror per payments database (i.e. per company) and API account
+_mirrors: Dict[tuple, GoCardlessMirror] = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_gocardless_mirror(settings: Dict) -> Optional[GoCardlessMirror]:
+    """
+    Get the mirror for the current company's payments database and the
+    configured API account.
+
+    Returns None if no API access token is configured. Changing the token or
+    switching between sandbox and live gives a separate mirror with its own
+    objects and sync watermarks.
+    """
+    client = create_client_from_settings(settings)
+    if client is None:
+        return None
+    db = get_payments_db()
+    key = (str(db.db_path), mirror_scope(client))
+    with _mirrors_lock:
+        mirror = _mirrors.get(key)
+        if mirror is None:
+            mirror = GoCardlessMirror(
+                db, client,
+                initial_days=int(settings.get("payout_lookback_days", DEFAULT_INITIAL_DAYS)),
+                max_age=int(settings.get("mirror_max_age_seconds", DEFAULT_MAX_AGE)),
+            )
+            _mirrors[key] = mirror
+        return mirror
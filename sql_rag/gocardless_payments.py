@@ -158,6 +158,11 @@ class GoCardlessPaymentsDB:
                 ON gocardless_payment_requests(payment_id)
             ''')
 
+            # Migration: idempotency key sent with the GoCardless create call
+            cursor.execute("PRAGMA table_info(gocardless_payment_requests)")
+            if 'idempotency_key' not in {col[1] for col in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE gocardless_payment_requests ADD COLUMN idempotency_key TEXT')
+
             # Subscriptions table - links Opera repeat documents to GoCardless subscriptions
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS gocardless_subscriptions (
@@ -290,6 +295,48 @@ class GoCardlessPaymentsDB:
                 if col not in existing_cols:
                     cursor.execute(f'ALTER TABLE gocardless_partner_signups ADD COLUMN {col} TEXT')
 
+            # Local mirror of GoCardless API objects (payouts, payout items,
+            # payments, mandates, customers, creditor bank accounts) as raw JSON.
+            # scope identifies the API account (environment and access token)
+            # the objects came from, so switching accounts never mixes data.
+            for table in ('gocardless_api_objects', 'gocardless_api_sync_state'):
+                cursor.execute(f"PRAGMA table_info({table})")
+                columns = [col[1] for col in cursor.fetchall()]
+                if columns and 'scope' not in columns:
+                    # Unscoped mirror from an earlier version: it is only a
+                    # cache of API data, so drop it and let the next sync refill it
+                    cursor.execute(f'DROP TABLE {table}')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gocardless_api_objects (
+                    scope TEXT NOT NULL,
+                    resource TEXT NOT NULL,
+                    object_id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    status TEXT,
+                    created_at TEXT,
+                    synced_at TEXT,
+                    PRIMARY KEY (scope, resource, object_id)
+                )
+            ''')
+
+            cursor.execute('DROP INDEX IF EXISTS idx_api_objects_created')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_api_objects_scope_created
+                ON gocardless_api_objects(scope, resource, created_at)
+            ''')
+
+            # Incremental sync watermarks per API account and resource
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gocardless_api_sync_state (
+                    scope TEXT NOT NULL,
+                    resource TEXT NOT NULL,
+                    watermark TEXT,
+                    synced_at TEXT,
+                    PRIMARY KEY (scope, resource)
+                )
+            ''')
+
             conn.commit()
             logger.info(f"GoCardless payments database initialized at {self.db_path}")
         finally:
@@ -547,6 +594,42 @@ class GoCardlessPaymentsDB:
         finally:
             conn.close()
 
+    def get_active_mandates(self, opera_accounts: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Latest active mandate per Opera customer, for many customers in one query."""
+        accounts = list(dict.fromkeys(opera_accounts))
+        mandates = {}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(accounts), 500):
+                chunk = accounts[start:start + 500]
+                cursor.execute(f'''
+                    SELECT id, opera_account, opera_name, gocardless_customer_id,
+                           mandate_id, mandate_status, scheme, email, created_at, updated_at,
+                           gocardless_name
+                    FROM gocardless_mandates
+                    WHERE opera_account IN ({', '.join('?' * len(chunk))}) AND mandate_status = 'active'
+                    ORDER BY created_at
+                ''', chunk)
+                # Ascending order: the latest mandate per account wins
+                for row in cursor.fetchall():
+                    mandates[row[1]] = {
+                        'id': row[0],
+                        'opera_account': row[1],
+                        'opera_name': row[2],
+                        'gocardless_customer_id': row[3],
+                        'mandate_id': row[4],
+                        'mandate_status': row[5],
+                        'scheme': row[6],
+                        'email': row[7],
+                        'created_at': row[8],
+                        'updated_at': row[9],
+                        'gocardless_name': row[10]
+                    }
+            return mandates
+        finally:
+            conn.close()
+
     def list_mandates(
         self,
         status: Optional[str] = None,
@@ -623,6 +706,48 @@ class GoCardlessPaymentsDB:
         finally:
             conn.close()
 
+    def mandates_version(self) -> tuple:
+        """
+        Cheap fingerprint of the mandates table (row count, highest id, latest
+        change), used to tell whether a cached customer index is out of date.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*), MAX(id), MAX(COALESCE(updated_at, created_at))
+                FROM gocardless_mandates
+            ''')
+            return tuple(cursor.fetchone())
+        finally:
+            conn.close()
+
+    def backfill_mandate_customer_ids(self, updates: List[tuple]) -> int:
+        """
+        Set gocardless_customer_id on mandates that do not have one yet.
+
+        Args:
+            updates: (opera_account, gocardless_customer_id) pairs
+
+        Returns the number of mandates updated.
+        """
+        if not updates:
+            return 0
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            now = datetime.utcnow().isoformat()
+            cursor.executemany('''
+                UPDATE gocardless_mandates
+                SET gocardless_customer_id = ?, updated_at = ?
+                WHERE opera_account = ?
+                  AND (gocardless_customer_id IS NULL OR gocardless_customer_id = '')
+            ''', [(customer_id, now, account) for account, customer_id in updates])
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
     # ============ Payment Request Management ============
 
     def create_payment_request(
@@ -660,6 +785,91 @@ class GoCardlessPaymentsDB:
         finally:
             conn.close()
 
+    def create_payment_requests(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create payment request records for a bulk collection in one transaction.
+
+        Each request needs mandate_id, opera_account, amount_pence,
+        invoice_refs and idempotency_key; charge_date, description and
+        currency are optional. Rows start in status 'submitting' until the
+        GoCardless call returns (see update_payment_requests).
+
+        Returns:
+            The requests with their new 'id'
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            created = []
+            for req in requests:
+                cursor.execute('''
+                    INSERT INTO gocardless_payment_requests
+                    (mandate_id, opera_account, amount_pence, currency, charge_date,
+                     description, invoice_refs, status, idempotency_key)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 'submitting', ?)
+                ''', (req['mandate_id'], req['opera_account'], req['amount_pence'],
+                      req.get('currency') or 'GBP', req.get('charge_date'), req.get('description'),
+                      json.dumps(req['invoice_refs']), req['idempotency_key']))
+                created.append({**req, 'id': cursor.lastrowid, 'status': 'submitting'})
+            conn.commit()
+            return created
+        finally:
+            conn.close()
+
+    def update_payment_requests(self, updates: List[Dict[str, Any]]) -> int:
+        """
+        Apply the GoCardless outcome of a bulk collection in one transaction.
+
+        Each update has 'id' plus any of payment_id, status, charge_date and
+        error_message; fields left out (or None) keep their current value.
+        """
+        if not updates:
+            return 0
+        now = datetime.utcnow().isoformat()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany('''
+                UPDATE gocardless_payment_requests
+                SET payment_id = COALESCE(?, payment_id),
+                    status = COALESCE(?, status),
+                    charge_date = COALESCE(?, charge_date),
+                    error_message = COALESCE(?, error_message),
+                    updated_at = ?
+                WHERE id = ?
+            ''', [(u.get('payment_id'), u.get('status'), u.get('charge_date'),
+                   u.get('error_message'), now, u['id']) for u in updates])
+            conn.commit()
+            return len(updates)
+        finally:
+            conn.close()
+
+    def list_open_payment_requests(self, opera_accounts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Payment requests for the accounts that may still collect
+        (not cancelled, failed or charged back), with their idempotency_key.
+        """
+        accounts = list(dict.fromkeys(opera_accounts))
+        requests = []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(accounts), 500):
+                chunk = accounts[start:start + 500]
+                cursor.execute(f'''
+                    SELECT id, payment_id, mandate_id, opera_account, amount_pence,
+                           currency, charge_date, description, invoice_refs, status,
+                           payout_id, opera_receipt_ref, error_message, created_at, updated_at,
+                           idempotency_key
+                    FROM gocardless_payment_requests
+                    WHERE opera_account IN ({', '.join('?' * len(chunk))})
+                      AND status NOT IN ('cancelled', 'failed', 'charged_back')
+                ''', chunk)
+                for row in cursor.fetchall():
+                    requests.append({**self._row_to_payment_request(row), 'idempotency_key': row[15]})
+            return requests
+        finally:
+            conn.close()
+
     def update_payment_request(
         self,
         request_id: int,
@@ -1414,6 +1624,129 @@ class GoCardlessPaymentsDB:
             'updated_at': row[14],
         }
 
+    # ============ GoCardless API Mirror ============
+
+    def upsert_api_objects(self, resource: str, objects: Dict[str, Any], scope: str = '') -> int:
+        """
+        Store API objects for a resource in one transaction.
+
+        Args:
+            resource: API resource name (e.g. 'payouts', 'payments')
+            objects: object_id -> raw API data (payout items are stored as
+                a list under the payout ID)
+            scope: API account the objects belong to
+        """
+        if not objects:
+            return 0
+        now = datetime.utcnow().isoformat()
+        rows = []
+        for object_id, data in objects.items():
+            status = data.get('status') if isinstance(data, dict) else None
+            created_at = data.get('created_at') if isinstance(data, dict) else None
+            rows.append((scope, resource, object_id, json.dumps(data), status, created_at, now))
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany('''
+                INSERT INTO gocardless_api_objects
+                (scope, resource, object_id, data, status, created_at, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(scope, resource, object_id) DO UPDATE SET
+                    data = excluded.data, status = excluded.status,
+                    created_at = excluded.created_at, synced_at = excluded.synced_at
+            ''', rows)
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
+    def get_api_objects(self, resource: str, object_ids: List[str], scope: str = '') -> Dict[str, Any]:
+        """Mirrored objects by ID; IDs not in the mirror are absent from the result."""
+        ids = list(dict.fromkeys(i for i in object_ids if i))
+        found = {}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT object_id, data FROM gocardless_api_objects
+                    WHERE scope = ? AND resource = ? AND object_id IN ({', '.join('?' * len(chunk))})
+                ''', [scope, resource, *chunk])
+                for object_id, data in cursor.fetchall():
+                    found[object_id] = json.loads(data)
+            return found
+        finally:
+            conn.close()
+
+    def list_api_objects(
+        self,
+        resource: str,
+        status: Optional[str] = None,
+        created_at_gte: Optional[str] = None,
+        limit: Optional[int] = None,
+        scope: str = ''
+    ) -> List[Dict[str, Any]]:
+        """Mirrored objects for a resource, newest first."""
+        query = 'SELECT data FROM gocardless_api_objects WHERE scope = ? AND resource = ?'
+        params: List[Any] = [scope, resource]
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        if created_at_gte:
+            query += ' AND created_at >= ?'
+            params.append(created_at_gte)
+        query += ' ORDER BY created_at DESC'
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [json.loads(row[0]) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def count_api_objects(self, scope: str = '') -> Dict[str, int]:
+        """Number of mirrored objects per resource."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT resource, COUNT(*) FROM gocardless_api_objects WHERE scope = ? GROUP BY resource
+            ''', (scope,))
+            return dict(cursor.fetchall())
+        finally:
+            conn.close()
+
+    def get_api_sync_state(self, resource: str, scope: str = '') -> Optional[Dict[str, Any]]:
+        """Sync watermark for a resource, or None if it has never synced."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT watermark, synced_at FROM gocardless_api_sync_state WHERE scope = ? AND resource = ?
+            ''', (scope, resource))
+            row = cursor.fetchone()
+            return {'watermark': row[0], 'synced_at': row[1]} if row else None
+        finally:
+            conn.close()
+
+    def set_api_sync_state(self, resource: str, watermark: Optional[str], scope: str = ''):
+        """Record a sync watermark for a resource."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                INSERT INTO gocardless_api_sync_state (scope, resource, watermark, synced_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(scope, resource) DO UPDATE SET
+                    watermark = excluded.watermark, synced_at = excluded.synced_at
+            ''', (scope, resource, watermark, datetime.utcnow().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
     # ============ Statistics ============
 
     def get_statistics(self) -> Dict[str, Any]:
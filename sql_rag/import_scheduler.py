@@ -0,0 +1,296 @@
+"""
+Multi-Bank Statement Import Scheduler
+
+Runs bank statement imports off the request thread so a month-end batch of
+statements for several bank accounts can be queued in one go.
+
+Jobs are queued per bank code. Each bank has at most one import in flight;
+imports for different banks run concurrently on a shared worker pool. Before
+a job starts, the bank-level import lock (sql_rag.import_lock) is taken so
+interactive imports and other processes are still excluded. If that lock is
+held elsewhere, or the import fails on Opera lock contention (detected with
+is_deadlock_error), the job goes back to the head of its bank's queue and is
+retried after a delay.
+
+The UI submits jobs, then polls get_job() / queue_state() for progress.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 5.0  # seconds before a contended job is tried again
+MAX_RETAINED_JOBS = 100
+
+
+class ImportJobFailed(Exception):
+    """Raised by a job's run callable to fail the job while keeping its result dict."""
+
+    def __init__(self, message: str, result: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.result = result
+
+
+@dataclass
+class ImportJob:
+    """One statement import for one bank account."""
+    job_id: str
+    bank_code: str
+    lock_key: str
+    label: str
+    company: Optional[str]
+    run: Callable[['ImportJob'], Dict[str, Any]] = field(repr=False)
+    status: str = 'queued'  # queued, waiting, running, done, failed, cancelled
+    attempts: int = 0
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    wait_reason: Optional[str] = None
+    retry_at: float = 0.0
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def set_progress(self, done: int, total: int, message: str = ''):
+        """Called by the import while it runs."""
+        self.progress = {'done': done, 'total': total, 'message': message}
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        result = {
+            'job_id': self.job_id,
+            'bank_code': self.bank_code,
+            'label': self.label,
+            'company': self.company,
+            'status': self.status,
+            'attempts': self.attempts,
+            'progress': self.progress,
+            'error': self.error,
+            'wait_reason': self.wait_reason,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if include_result:
+            result['result'] = self.result
+        return result
+
+
+class ImportScheduler:
+    """
+    Worker pool that runs statement imports with one in-flight job per bank.
+
+    Args:
+        max_workers: Number of banks imported concurrently
+        max_attempts: Tries per job when the import hits Opera lock contention
+        retry_delay: Seconds to wait before retrying a contended job
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_delay: float = DEFAULT_RETRY_DELAY):
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bank-import')
+        self._jobs: Dict[str, ImportJob] = {}
+        self._queues: Dict[str, Deque[ImportJob]] = {}  # lock key -> pending jobs in order
+        self._in_flight: Dict[str, ImportJob] = {}  # lock key -> running job
+        self._lock = threading.Lock()
+
+    def submit(self, bank_code: str, run: Callable[[ImportJob], Dict[str, Any]],
+               lock_key: Optional[str] = None, label: str = '',
+               company: Optional[str] = None) -> ImportJob:
+        """
+        Queue an import for a bank account.
+
+        Args:
+            bank_code: Opera bank account code
+            run: Callable(job) that performs the import and returns its result
+                dict. It runs while the bank's import lock is held. Raise
+                ImportJobFailed to fail the job and still report the result.
+            lock_key: Key for the bank-level import lock (defaults to bank_code)
+            label: Description shown in the queue (e.g. the statement filename)
+            company: Company the job belongs to (for display only)
+        """
+        job = ImportJob(
+            job_id=uuid.uuid4().hex[:12],
+            bank_code=bank_code,
+            lock_key=lock_key or bank_code,
+            label=label,
+            company=company,
+            run=run,
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._queues.setdefault(job.lock_key, deque()).append(job)
+            self._prune()
+        logger.info(f"Import job {job.job_id}: queued {label or 'import'} for bank {bank_code}")
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """Start the next job for every bank that is idle and due."""
+        now = time.monotonic()
+        next_retry = None
+        with self._lock:
+            for key, queue in self._queues.items():
+                if key in self._in_flight or not queue:
+                    continue
+                job = queue[0]
+                if job.retry_at > now:
+                    next_retry = min(next_retry or job.retry_at, job.retry_at)
+                    continue
+                queue.popleft()
+                self._in_flight[key] = job
+                self._executor.submit(self._run_job, job)
+        if next_retry is not None:
+            timer = threading.Timer(next_retry - now, self._dispatch)
+            timer.daemon = True
+            timer.start()
+
+    def _run_job(self, job: ImportJob):
+        from sql_rag.import_lock import acquire_import_lock, release_import_lock
+        from sql_rag.opera_sql_import import is_deadlock_error
+
+        # Final status is published together with freeing the bank, so a job
+        # never reads as finished while its bank still shows it in flight
+        outcome = None
+        try:
+            if job.status == 'cancelled':
+                return
+            if not acquire_import_lock(job.lock_key, locked_by='scheduler',
+                                       endpoint='import-scheduler', description=job.label):
+                job.status = 'waiting'
+                job.wait_reason = 'Bank is being imported by another user'
+                return
+
+            job.status = 'running'
+            job.wait_reason = None
+            job.attempts += 1
+            job.started_at = job.started_at or datetime.now().isoformat()
+            try:
+                job.result = job.run(job)
+                outcome = 'done'
+            except Exception as e:
+                if is_deadlock_error(e) and job.attempts < self.max_attempts:
+                    logger.warning(f"Import job {job.job_id}: lock contention on attempt "
+                                   f"{job.attempts}, retrying in {self.retry_delay}s: {e}")
+                    job.status = 'waiting'
+                    job.wait_reason = 'Opera lock contention'
+                else:
+                    logger.error(f"Import job {job.job_id} failed: {e}")
+                    job.error = str(e)
+                    job.result = getattr(e, 'result', None)
+                    outcome = 'failed'
+            finally:
+                release_import_lock(job.lock_key)
+        except Exception as e:
+            logger.error(f"Import job {job.job_id} failed: {e}")
+            job.error = str(e)
+            outcome = 'failed'
+        finally:
+            with self._lock:
+                self._in_flight.pop(job.lock_key, None)
+                if outcome:
+                    job.status = outcome
+                    job.finished_at = datetime.now().isoformat()
+                elif job.status == 'waiting':
+                    job.retry_at = time.monotonic() + self.retry_delay
+                    self._queues.setdefault(job.lock_key, deque()).appendleft(job)
+            if outcome:
+                logger.info(f"Import job {job.job_id} for bank {job.bank_code}: {outcome}")
+            self._dispatch()
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond MAX_RETAINED_JOBS. Caller holds the lock."""
+        finished = [j for j in self._jobs.values() if j.finished]
+        excess = len(self._jobs) - MAX_RETAINED_JOBS
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(excess, 0)]:
+            del self._jobs[job.job_id]
+
+    def get_job(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, bank_code: Optional[str] = None) -> List[ImportJob]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if bank_code:
+            jobs = [j for j in jobs if j.bank_code == bank_code]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def cancel_job(self, job_id: str) -> bool:
+        """Cancel a job that has not started. Returns False if unknown or already running."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.status not in ('queued', 'waiting'):
+                return False
+            queue = self._queues.get(job.lock_key)
+            if queue and job in queue:
+                queue.remove(job)
+            job.status = 'cancelled'
+            job.finished_at = datetime.now().isoformat()
+        return True
+
+    def queue_state(self) -> Dict[str, Any]:
+        """Per-bank view of what is running and what is waiting."""
+        with self._lock:
+            banks = {}
+            for key in set(self._queues) | set(self._in_flight):
+                running = self._in_flight.get(key)
+                queued = list(self._queues.get(key, ()))
+                if not running and not queued:
+                    continue
+                bank_code = (running or queued[0]).bank_code
+                banks[key] = {
+                    'bank_code': bank_code,
+                    'running': running.job_id if running else None,
+                    'queued': [j.job_id for j in queued],
+                }
+        return {
+            'max_workers': self.max_workers,
+            'running': sum(1 for b in banks.values() if b['running']),
+            'queued': sum(len(b['queued']) for b in banks.values()),
+            'banks': sorted(banks.values(), key=lambda b: b['bank_code']),
+        }
+
+
+# Singleton instance
+_scheduler_instance: Optional[ImportScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_import_scheduler(config=None) -> ImportScheduler:
+    """
+    Get or create the shared import scheduler.
+
+    Reads ``max_workers``, ``max_attempts`` and ``retry_delay`` from the
+    [import_scheduler] section of config.ini on first use.
+    """
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            max_workers = DEFAULT_MAX_WORKERS
+            max_attempts = DEFAULT_MAX_ATTEMPTS
+            retry_delay = DEFAULT_RETRY_DELAY
+            if config is not None and config.has_section('import_scheduler'):
+                max_workers = config.getint('import_scheduler', 'max_workers', fallback=DEFAULT_MAX_WORKERS)
+                max_attempts = config.getint('import_scheduler', 'max_attempts', fallback=DEFAULT_MAX_ATTEMPTS)
+                retry_delay = config.getfloat('import_scheduler', 'retry_delay', fallback=DEFAULT_RETRY_DELAY)
+            _scheduler_instance = ImportScheduler(max_workers=max_workers, max_attempts=max_attempts,
+                                                  retry_delay=retry_delay)
+        return _scheduler_instance
@@ -86,21 +86,21 @@ class SQLRagApplication:
     def store_sql_data_in_vector_db(self, query: str, metadata: Dict[str, Any] = None):
         """Execute SQL query and store results in vector database."""
         try:
-            # Execute the SQL query
-            df = self.sql_connector.execute_query(query)
-            if df.empty:
+            # Execute the SQL query (tuples straight from the cursor - no DataFrame needed)
+            columns, rows = self.sql_connector.execute_query_rows(query)
+            if not rows:
                 logger.warning("SQL query returned no results")
                 return
                 
-            logger.info(f"Retrieved {len(df)} rows from SQL database")
+            logger.info(f"Retrieved {len(rows)} rows from SQL database")
             
             # Process rows for storage
             texts = []
             meta_list = []
             
-            for idx, row in df.iterrows():
+            for idx, row in enumerate(rows):
                 # Convert row to string for embedding
-                row_text = " ".join([f"{col}: {val}" for col, val in row.items()])
+                row_text = " ".join([f"{col}: {val}" for col, val in zip(columns, row)])
                 
                 # Prepare metadata for this row
                 row_metadata = {
@@ -119,7 +119,7 @@ class SQLRagApplication:
             result = self.vector_db.store_vectors(texts, meta_list)
             
             if result:
-                logger.info(f"Stored {len(df)} records in vector database")
+                logger.info(f"Stored {len(rows)} records in vector database")
             else:
                 logger.error("Failed to store vectors in database")
             
@@ -13,15 +13,28 @@ Usage:
 
 The client returns the same data structures as Opera3FoxProImport methods,
 making it a drop-in replacement.
+
+Several postings can be sent in one request with bulk(); the agent locks the
+posting tables once for the batch and streams back one result per operation:
+
+    for item in client.bulk([
+        bulk_operation("sales_receipt", bank_account="BC010", ...),
+        bulk_operation("allocate_receipt", customer_account="A001", ...),
+    ]):
+        ...
+
+AsyncOpera3AgentClient offers the same over httpx.AsyncClient, so the API
+server does not hold a thread while a remote posting runs.
 """
 
 from __future__ import annotations
 
+import json
 import logging
 import time
 import threading
 from datetime import date, datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator
 from dataclasses import dataclass, field
 
 import httpx
@@ -67,6 +80,67 @@ def _date_to_str(d: Optional[date]) -> Optional[str]:
     return d.isoformat()
 
 
+# Operation type (as used by the agent's /bulk endpoint) -> single-operation path
+OPERATION_PATHS = {
+    "purchase_payment": "/import/purchase-payment",
+    "sales_receipt": "/import/sales-receipt",
+    "sales_refund": "/import/sales-refund",
+    "purchase_refund": "/import/purchase-refund",
+    "bank_transfer": "/import/bank-transfer",
+    "nominal_entry": "/import/nominal-entry",
+    "gocardless_batch": "/import/gocardless-batch",
+    "recurring_entry": "/import/recurring-entry",
+    "allocate_receipt": "/allocate/receipt",
+    "allocate_payment": "/allocate/payment",
+}
+
+
+def bulk_operation(op_type: str, **params) -> Dict[str, Any]:
+    """Build one entry for bulk(), e.g. bulk_operation("sales_receipt", bank_account=..., ...).
+
+    Parameters are those of the matching client method; dates are converted
+    to ISO strings.
+    """
+    if op_type not in OPERATION_PATHS:
+        raise ValueError(f"Unknown operation type: {op_type}")
+    return {
+        "type": op_type,
+        "params": {k: _date_to_str(v) if isinstance(v, date) else v for k, v in params.items()},
+    }
+
+
+def _check_response(resp: httpx.Response):
+    """Raise for the agent's authentication and availability errors.
+
+    The body must already have been read (streamed responses included).
+    """
+    if resp.status_code == 401:
+        raise Opera3AgentError("Authentication failed — check OPERA3_AGENT_KEY")
+    if resp.status_code == 503:
+        raise Opera3AgentUnavailable(resp.json().get("detail", "Service unavailable"))
+
+
+def _check_bulk_response(resp: httpx.Response):
+    """As _check_response, plus the 400 /bulk returns when an operation is invalid."""
+    _check_response(resp)
+    if resp.status_code != 200:
+        try:
+            detail = resp.json().get("detail")
+        except ValueError:
+            detail = resp.text
+        raise Opera3AgentError(f"Bulk request rejected ({resp.status_code}): {detail}")
+
+
+def _unavailable(base_url: str, timeout: float, error: Exception) -> Opera3AgentUnavailable:
+    """Map an httpx connect/timeout error to Opera3AgentUnavailable."""
+    if isinstance(error, httpx.TimeoutException):
+        return Opera3AgentUnavailable(f"Opera 3 Write Agent at {base_url} timed out after {timeout}s")
+    return Opera3AgentUnavailable(
+        f"Cannot connect to Opera 3 Write Agent at {base_url}. "
+        "Ensure the service is running on the Opera 3 server."
+    )
+
+
 class Opera3AgentClient:
     """HTTP client for the Opera 3 Write Agent service.
 
@@ -190,23 +264,45 @@ class Opera3AgentClient:
             with httpx.Client(timeout=self.timeout) as client:
                 resp = client.post(url, json=data, headers=self._headers())
 
-            if resp.status_code == 401:
-                raise Opera3AgentError("Authentication failed — check OPERA3_AGENT_KEY")
-            if resp.status_code == 503:
-                raise Opera3AgentUnavailable(resp.json().get("detail", "Service unavailable"))
-
+            _check_response(resp)
             result = resp.json()
             return result
 
-        except httpx.ConnectError:
-            raise Opera3AgentUnavailable(
-                f"Cannot connect to Opera 3 Write Agent at {self.base_url}. "
-                "Ensure the service is running on the Opera 3 server."
-            )
-        except httpx.TimeoutException:
-            raise Opera3AgentUnavailable(
-                f"Opera 3 Write Agent at {self.base_url} timed out after {self.timeout}s"
-            )
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            raise _unavailable(self.base_url, self.timeout, e)
+
+    # ================================================================
+    # Bulk submission
+    # ================================================================
+
+    def bulk(self, operations: List[Dict[str, Any]], stop_on_error: bool = False) -> Iterator[Dict[str, Any]]:
+        """Post several operations in one request.
+
+        Args:
+            operations: Entries built with bulk_operation()
+            stop_on_error: Skip the remaining operations after the first failure
+
+        Yields:
+            One result dict per operation, in order, as the agent completes
+            it: the operation's usual response plus "index" and "type".
+
+        Raises:
+            Opera3AgentError: If any operation is invalid (nothing is posted)
+            Opera3AgentUnavailable: If the agent is not responding
+        """
+        payload = {"operations": operations, "stop_on_error": stop_on_error}
+        try:
+            with httpx.Client(timeout=self.timeout) as client:
+                with client.stream("POST", f"{self.base_url}/bulk", json=payload,
+                                   headers=self._headers()) as resp:
+                    if resp.status_code != 200:
+                        resp.read()
+                        _check_bulk_response(resp)
+                    for line in resp.iter_lines():
+                        if line.strip():
+                            yield json.loads(line)
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            raise _unavailable(self.base_url, self.timeout, e)
 
     # ================================================================
     # Transaction import methods (mirror Opera3FoxProImport API)
@@ -523,6 +619,82 @@ class Opera3AgentClient:
         })
 
 
+class AsyncOpera3AgentClient:
+    """Async HTTP client for the Opera 3 Write Agent service.
+
+    For use from the API server's event loop: requests are awaited on one
+    pooled httpx.AsyncClient instead of blocking a worker thread for the
+    length of the remote posting. Close it with aclose() (or use it as an
+    async context manager).
+    """
+
+    def __init__(self, base_url: str, agent_key: str = "", timeout: float = 30.0):
+        """
+        Args:
+            base_url: Agent service URL (e.g., "http://opera3-server:9000")
+            agent_key: Shared secret for authentication (must match agent config)
+            timeout: HTTP request timeout in seconds
+        """
+        self.base_url = base_url.rstrip("/")
+        self.agent_key = agent_key
+        self.timeout = timeout
+        headers = {"Content-Type": "application/json"}
+        if agent_key:
+            headers["X-Agent-Key"] = agent_key
+        self._client = httpx.AsyncClient(base_url=self.base_url, headers=headers, timeout=timeout)
+
+    async def __aenter__(self) -> "AsyncOpera3AgentClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def is_available(self) -> bool:
+        """Live health check against the agent."""
+        try:
+            resp = await self._client.get("/health", timeout=5.0)
+            return resp.status_code == 200 and resp.json().get("status") == "ok"
+        except Exception:
+            return False
+
+    async def _post(self, path: str, data: dict) -> dict:
+        """Make a POST request to the agent (see Opera3AgentClient._post)."""
+        try:
+            resp = await self._client.post(path, json=data)
+            _check_response(resp)
+            return resp.json()
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            raise _unavailable(self.base_url, self.timeout, e)
+
+    async def run(self, op_type: str, **params):
+        """Post one operation, with the parameters of the matching Opera3AgentClient method.
+
+        Returns Opera3ImportResult for imports and the response dict for
+        allocations, as the synchronous client does.
+        """
+        op = bulk_operation(op_type, **params)
+        data = await self._post(OPERATION_PATHS[op_type], op["params"])
+        return data if op_type.startswith("allocate_") else _dict_to_result(data)
+
+    async def bulk(self, operations: List[Dict[str, Any]],
+                   stop_on_error: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Post several operations in one request; see Opera3AgentClient.bulk."""
+        payload = {"operations": operations, "stop_on_error": stop_on_error}
+        try:
+            async with self._client.stream("POST", "/bulk", json=payload) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    _check_bulk_response(resp)
+                async for line in resp.aiter_lines():
+                    if line.strip():
+                        yield json.loads(line)
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            raise _unavailable(self.base_url, self.timeout, e)
+
+
 # ============================================================
 # Exceptions
 # ============================================================
@@ -38,6 +38,8 @@ except ImportError:
     DBF_AVAILABLE = False
     logger.warning("dbfread not installed. Install with: pip install dbfread")
 
+from sql_rag.dbf_header import DbfHeader, get_header_cache
+
 try:
     from sql_rag.smb_access import get_smb_manager
 except ImportError:
@@ -125,7 +127,8 @@ class Opera3Reader:
         """
         self.data_path = Path(data_path)
         self.encoding = encoding
-        self._table_cache: Dict[str, TableInfo] = {}
+        # Parsed headers are shared by every reader for this data folder
+        self._header_cache = get_header_cache(self.data_path, encoding)
 
         if not DBF_AVAILABLE:
             raise ImportError(
@@ -157,73 +160,60 @@ class Opera3Reader:
             logger.error(f"Data path does not exist: {self.data_path}")
             return tables
 
-        # Find all .dbf files
+        # Find all .dbf files and read their headers in parallel
+        dbf_files = {}
         for dbf_file in self.data_path.glob("*.dbf"):
             table_name = dbf_file.stem.lower()
 
             # Skip if not in known tables and include_unknown is False
             if not include_unknown and table_name not in self.KNOWN_TABLES:
                 continue
+            dbf_files[table_name] = dbf_file
 
-            try:
-                info = self._get_table_info(table_name)
-                tables.append({
-                    "name": table_name,
-                    "description": self.KNOWN_TABLES.get(table_name, "Unknown"),
-                    "record_count": info.record_count,
-                    "field_count": len(info.fields),
-                    "path": str(info.path),
-                    "last_modified": info.last_modified.isoformat() if info.last_modified else None
-                })
-            except Exception as e:
-                logger.warning(f"Could not read table {table_name}: {e}")
+        headers = self._header_cache.scan(dbf_files.values())
+
+        for table_name, dbf_file in dbf_files.items():
+            header = headers[str(dbf_file)]
+            if isinstance(header, Exception):
+                logger.warning(f"Could not read table {table_name}: {header}")
                 tables.append({
                     "name": table_name,
                     "description": self.KNOWN_TABLES.get(table_name, "Unknown"),
-                    "error": str(e)
+                    "error": str(header)
                 })
+                continue
+
+            info = self._table_info(table_name, header)
+            tables.append({
+                "name": table_name,
+                "description": self.KNOWN_TABLES.get(table_name, "Unknown"),
+                "record_count": info.record_count,
+                "field_count": len(info.fields),
+                "path": str(info.path),
+                "last_modified": info.last_modified.isoformat() if info.last_modified else None
+            })
 
         return sorted(tables, key=lambda x: x["name"])
 
     def _get_table_info(self, table_name: str) -> TableInfo:
-        """Get information about a table"""
-        if table_name in self._table_cache:
-            return self._table_cache[table_name]
-
+        """Get information about a table (from its header, cached by mtime and size)"""
         dbf_path = self._get_dbf_path(table_name)
+        return self._table_info(table_name, self._header_cache.get(dbf_path))
 
-        # Get file modification time
-        mtime = datetime.fromtimestamp(dbf_path.stat().st_mtime)
+    @staticmethod
+    def _table_info(table_name: str, header: DbfHeader) -> TableInfo:
+        """TableInfo from a parsed DBF header.
 
-        # Open DBF to get structure
-        dbf = DBF(
-            str(dbf_path),
-            encoding=self.encoding,
-            parserclass=Opera3FieldParser,
-            load=False  # Don't load all records
-        )
-
-        fields = [
-            {
-                "name": f.name,
-                "type": f.type,
-                "length": f.length,
-                "decimal_count": getattr(f, 'decimal_count', 0)
-            }
-            for f in dbf.fields
-        ]
-
-        info = TableInfo(
+        record_count is the header count, so it includes deleted records.
+        """
+        return TableInfo(
             name=table_name,
-            path=str(dbf_path),
-            record_count=len(dbf),
-            fields=fields,
-            last_modified=mtime
+            path=header.path,
+            record_count=header.record_count,
+            fields=[dict(f) for f in header.fields],
+            last_modified=datetime.fromtimestamp(header.mtime)
         )
 
-        self._table_cache[table_name] = info
-        return info
-
     def get_table_structure(self, table_name: str) -> Dict[str, Any]:
         """
         Get the structure of a table.
@@ -37,6 +37,11 @@ from datetime import datetime, date, timedelta
 from decimal import Decimal
 from contextlib import contextmanager
 
+from sql_rag.allocation_engine import (
+    AllocationEngine, OpenItem, allocation_message, allocation_ref2,
+    payment_request_invoice_refs, plan_payment, plan_receipt,
+)
+
 try:
     from sql_rag.smb_access import get_smb_manager
 except ImportError:
@@ -49,6 +54,13 @@ logger = logging.getLogger(__name__)
 LOCK_TIMEOUT_SECONDS = 5  # Equivalent to SQL SE's 5000ms LOCK_TIMEOUT
 LOCK_RETRY_INTERVAL = 0.1  # Seconds between retry attempts
 
+# Every table a posting or allocation locks, for holding the locks across a
+# batch of postings (see Opera3FoxProImport.hold_locks)
+POSTING_LOCK_TABLES = [
+    'aentry', 'anoml', 'arhead', 'atran', 'atype', 'nacnt', 'nbank', 'nhist',
+    'nparm', 'ntran', 'palloc', 'pname', 'ptran', 'salloc', 'sname', 'stran',
+]
+
 try:
     import dbf
     DBF_WRITE_AVAILABLE = True
@@ -251,10 +263,18 @@ class Opera3FoxProImport:
         self.encoding = encoding
         self.lock_timeout = lock_timeout
         self._table_cache: Dict[str, Any] = {}  # dbf.Table when available
-        self._lock_files: Dict[str, int] = {}  # file descriptors for locks
+        self._lock_files: Dict[str, int] = {}  # file descriptors for locks held, by table name
         self._nacnt_type_cache: Dict[str, tuple] = {}  # Cache for nacnt type/subtype lookups
         self._financial_year_cache = None  # Cache for nparm financial year
         self._modified_tables: List[str] = []  # table names modified during this session
+        self._lock_depth = 0  # nesting depth of _transaction_lock
+        # Pending nacnt/nhist changes keyed by (account, period, year) -> [debit, credit],
+        # collected while a transaction lock is held and applied once before it is released
+        self._nominal_deltas: Optional[Dict[tuple, list]] = None
+        # Record counts of the tables opened by the posting in progress, and the
+        # record numbers appended since take_written_records() was last called
+        self._posting_lengths: Optional[Dict[str, int]] = None
+        self._written_records: Dict[str, List[int]] = {}
 
         if not self.data_path.exists():
             smb = get_smb_manager()
@@ -320,7 +340,13 @@ class Opera3FoxProImport:
         Acquire locks on multiple tables for a transaction.
 
         Equivalent to SQL SE's transaction with UPDLOCK, ROWLOCK hints.
-        Acquires all locks before proceeding to prevent deadlocks.
+        Acquires all locks before proceeding to prevent deadlocks. Tables
+        already locked by an enclosing _transaction_lock or hold_locks are
+        not locked again.
+
+        Nominal balance changes made while the outermost lock is held are
+        collected per (account, period, year) and written to nacnt/nhist once,
+        just before the locks are released.
 
         Args:
             table_names: List of table names to lock
@@ -328,29 +354,106 @@ class Opera3FoxProImport:
         Yields:
             None (tables are locked for duration of context)
         """
+        outermost = self._lock_depth == 0
+        self._lock_depth += 1
+        acquired_locks = []
+        try:
+            acquired_locks = self._acquire_table_locks(table_names)
+            if not outermost:
+                yield
+                return
+
+            self._nominal_deltas = {}
+            self._posting_lengths = {}
+            try:
+                yield
+            except BaseException:
+                # DBF writes are not rolled back, so ntran rows already written
+                # must still get their balances when the posting fails part way
+                deltas, self._nominal_deltas = self._nominal_deltas, None
+                if deltas:
+                    try:
+                        self._apply_nominal_deltas(deltas)
+                    except Exception as e:
+                        logger.error(f"Failed to apply nominal balances after error: {e}")
+                raise
+            deltas, self._nominal_deltas = self._nominal_deltas, None
+            self._apply_nominal_deltas(deltas)
+
+        finally:
+            self._lock_depth -= 1
+            if outermost:
+                self._record_written()
+            self._release_table_locks(acquired_locks)
+
+    def _record_written(self):
+        """Note the records appended by the posting that just ended."""
+        lengths, self._posting_lengths = self._posting_lengths, None
+        for table_name, start in (lengths or {}).items():
+            table = self._table_cache.get(table_name)
+            end = len(table) if table is not None else start
+            if end > start:
+                self._written_records.setdefault(table_name, []).extend(range(start + 1, end + 1))
+
+    def take_written_records(self) -> Dict[str, List[int]]:
+        """
+        Record numbers appended by postings since the last call, by table.
+
+        Record numbers are 1-based, as in FoxPro (RECNO()). The agent passes
+        them to post-write verification so it reads only these records.
+        """
+        written, self._written_records = self._written_records, {}
+        return written
+
+    @contextmanager
+    def hold_locks(self, table_names: List[str] = POSTING_LOCK_TABLES):
+        """
+        Hold table locks across several postings.
+
+        Postings made inside skip the locks already held, so a batch pays for
+        one lock acquisition instead of one per posting. Each posting is still
+        its own transaction: its nominal balances are written when it ends.
+
+        Args:
+            table_names: Tables to lock (default: every table a posting locks)
+        """
+        acquired_locks = self._acquire_table_locks(table_names)
+        try:
+            yield
+        finally:
+            self._release_table_locks(acquired_locks)
+
+    def _acquire_table_locks(self, table_names: List[str]) -> list:
+        """Lock the tables not already held; returns the locks taken, for _release_table_locks."""
         acquired_locks = []
         try:
             # Sort table names to prevent deadlocks (consistent lock order)
-            for table_name in sorted(table_names):
+            for table_name in sorted(set(table_names)):
+                if table_name in self._lock_files:
+                    continue
                 try:
                     dbf_path = self._get_dbf_path(table_name)
                     lock_ctx = self._acquire_file_lock(dbf_path, exclusive=True)
                     fd = lock_ctx.__enter__()
                     acquired_locks.append((table_name, lock_ctx, fd))
+                    self._lock_files[table_name] = fd
                 except FileNotFoundError:
                     # Table doesn't exist - skip locking (will fail later on write)
                     pass
+        except BaseException:
+            self._release_table_locks(acquired_locks)
+            raise
+        logger.debug(f"Acquired transaction locks on: {[t[0] for t in acquired_locks]}")
+        return acquired_locks
 
-            logger.debug(f"Acquired transaction locks on: {[t[0] for t in acquired_locks]}")
-            yield
-
-        finally:
-            # Release locks in reverse order
-            for table_name, lock_ctx, fd in reversed(acquired_locks):
-                try:
-                    lock_ctx.__exit__(None, None, None)
-                except Exception as e:
-                    logger.warning(f"Error releasing lock on {table_name}: {e}")
+    def _release_table_locks(self, acquired_locks: list):
+        """Release locks taken by _acquire_table_locks, in reverse order."""
+        for table_name, lock_ctx, fd in reversed(acquired_locks):
+            self._lock_files.pop(table_name, None)
+            try:
+                lock_ctx.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error releasing lock on {table_name}: {e}")
 
     def _get_dbf_path(self, table_name: str) -> Path:
         """Get the path to a DBF file"""
@@ -383,18 +486,20 @@ class Opera3FoxProImport:
 
     def _open_table(self, table_name: str) -> Any:
         """Open a DBF table for reading/writing"""
-        if table_name in self._table_cache:
-            return self._table_cache[table_name]
-
-        dbf_path = self._get_dbf_path(table_name)
-        table = dbf.Table(str(dbf_path), codepage=self.encoding)
-        table.open(dbf.READ_WRITE)
-        self._table_cache[table_name] = table
-
-        # Track for SMB upload on close
-        if table_name not in self._modified_tables:
-            self._modified_tables.append(table_name)
-
+        table = self._table_cache.get(table_name)
+        if table is None:
+            dbf_path = self._get_dbf_path(table_name)
+            table = dbf.Table(str(dbf_path), codepage=self.encoding)
+            table.open(dbf.READ_WRITE)
+            self._table_cache[table_name] = table
+
+            # Track for SMB upload on close
+            if table_name not in self._modified_tables:
+                self._modified_tables.append(table_name)
+
+        if self._posting_lengths is not None:
+            # First use in this posting: anything past here is appended by it
+            self._posting_lengths.setdefault(table_name, len(table))
         return table
 
     def _close_all_tables(self):
@@ -522,7 +627,7 @@ class Opera3FoxProImport:
                 break
         return self._financial_year_cache
 
-    def _update_nhist(self, account: str, value: float, period: int, year: int = None):
+    def _update_nhist(self, deltas: Dict[tuple, list]):
         """
         Update nhist (nominal history) after posting to ntran.
 
@@ -535,50 +640,49 @@ class Opera3FoxProImport:
         - Records are updated in-place if they exist, or a new record is appended
 
         Args:
-            account: Nominal account code
-            value: Transaction value in POUNDS (positive=DR, negative=CR)
-            period: Posting period
-            year: Financial year (looked up from nparm if None)
+            deltas: {(account, period, year): [debit, credit]} in POUNDS, where
+                debit is the sum of positive values and credit the sum of
+                negative values (None when the side was not posted)
         """
-        type_info = self._get_nacnt_type(account)
-        if not type_info:
-            logger.warning(f"Cannot update nhist - account {account} not found in nacnt")
-            return
-        na_type, na_subt = type_info
-
-        if year is None:
-            year = self._get_financial_year()
-
         cost_centre = '    '
-        account_key = account.strip().upper()
+        pending = {}
+        for (account, period, year), (debit, credit) in deltas.items():
+            type_info = self._get_nacnt_type(account)
+            if not type_info:
+                logger.warning(f"Cannot update nhist - account {account} not found in nacnt")
+                continue
+            na_type, na_subt = type_info
+            key = (account.strip().upper(), na_type, na_subt, year, period)
+            pending[key] = (account, debit, credit)
+
+        if not pending:
+            return
 
         try:
             table = self._open_table('nhist')
-            found = False
 
+            # One pass over nhist for every account/period in the posting
             for record in table:
-                if (record.nh_nacnt.strip().upper() == account_key
-                        and str(record.nh_ntype) == na_type
-                        and str(record.nh_nsubt) == na_subt
-                        and str(record.nh_ncntr).strip() == cost_centre.strip()
-                        and int(record.nh_year or 0) == year
-                        and int(record.nh_period or 0) == period):
-                    # UPDATE existing record
-                    with record:
-                        bal = float(record.nh_bal or 0)
-                        record.nh_bal = bal + value
-                        if value >= 0:
-                            record.nh_ptddr = float(record.nh_ptddr or 0) + value
-                        else:
-                            record.nh_ptdcr = float(record.nh_ptdcr or 0) + value  # stored as negative
-                    found = True
-                    logger.debug(f"Updated nhist for {account} period {period}/{year}: value={value}")
+                if str(record.nh_ncntr).strip() != cost_centre.strip():
+                    continue
+                key = (record.nh_nacnt.strip().upper(), str(record.nh_ntype), str(record.nh_nsubt),
+                       int(record.nh_year or 0), int(record.nh_period or 0))
+                if key not in pending:
+                    continue
+                account, debit, credit = pending.pop(key)
+                # UPDATE existing record
+                with record:
+                    record.nh_bal = float(record.nh_bal or 0) + (debit or 0) + (credit or 0)
+                    if debit is not None:
+                        record.nh_ptddr = float(record.nh_ptddr or 0) + debit
+                    if credit is not None:
+                        record.nh_ptdcr = float(record.nh_ptdcr or 0) + credit  # stored as negative
+                logger.debug(f"Updated nhist for {account} period {key[4]}/{key[3]}: dr={debit} cr={credit}")
+                if not pending:
                     break
 
-            if not found:
+            for (_, na_type, na_subt, year, period), (account, debit, credit) in pending.items():
                 # INSERT new period row
-                ptddr = value if value >= 0 else 0
-                ptdcr = value if value < 0 else 0  # stored as negative
                 table.append({
                     'nh_rectype': 1,
                     'nh_ntype': na_type,
@@ -589,17 +693,17 @@ class Opera3FoxProImport:
                     'nh_project': '        ',
                     'nh_year': year,
                     'nh_period': period,
-                    'nh_bal': value,
+                    'nh_bal': (debit or 0) + (credit or 0),
                     'nh_budg': 0,
                     'nh_rbudg': 0,
-                    'nh_ptddr': ptddr,
-                    'nh_ptdcr': ptdcr,
+                    'nh_ptddr': debit or 0,
+                    'nh_ptdcr': credit or 0,  # stored as negative
                     'nh_fbal': 0,
                 })
-                logger.debug(f"Inserted nhist for {account} period {period}/{year}: value={value}")
+                logger.debug(f"Inserted nhist for {account} period {period}/{year}: dr={debit} cr={credit}")
 
         except Exception as e:
-            logger.error(f"Failed to update nhist for {account}: {e}")
+            logger.error(f"Failed to update nhist: {e}")
             raise
 
     # =========================================================================
@@ -969,6 +1073,11 @@ class Opera3FoxProImport:
         Opera updates nacnt whenever it posts to ntran. This ensures the
         nominal account balances stay in sync with the transaction totals.
 
+        Inside _transaction_lock the change is added to the pending totals for
+        (account, period, year) and written when the lock is released;
+        otherwise it is written straight away. Either way an account missing
+        from nacnt raises here, at the line that uses it.
+
         Args:
             account: Nominal account code (e.g., 'BC010', 'BB020')
             value: Transaction value in POUNDS (positive=DR, negative=CR)
@@ -983,53 +1092,80 @@ class Opera3FoxProImport:
             logger.warning(f"Invalid period {period} for nacnt update, skipping")
             return
 
+        if self._get_nacnt_type(account) is None:
+            raise ValueError(f"nacnt update: account {account} not found in nacnt table")
+
+        if year is None:
+            year = self._get_financial_year()
+
+        deltas = self._nominal_deltas if self._nominal_deltas is not None else {}
+        totals = deltas.setdefault((account.strip(), period, year), [None, None])
+        side = 0 if value >= 0 else 1
+        totals[side] = (totals[side] or 0) + value
+
+        if self._nominal_deltas is None:
+            self._apply_nominal_deltas(deltas)
+
+    def _apply_nominal_deltas(self, deltas: Dict[tuple, list]):
+        """
+        Write pending nominal balance changes to nacnt and nhist.
+
+        Makes one pass over nacnt for all accounts, then one pass over nhist.
+
+        Args:
+            deltas: {(account, period, year): [debit, credit]} as collected by
+                _update_nacnt_balance
+        """
+        if not deltas:
+            return
+
+        deltas = {
+            key: [round(dr, 2) if dr is not None else None, round(cr, 2) if cr is not None else None]
+            for key, (dr, cr) in deltas.items()
+        }
+        by_account: Dict[str, list] = {}
+        for (account, period, year), (debit, credit) in sorted(deltas.items()):
+            by_account.setdefault(account.upper(), []).append((account, period, debit, credit))
+
         try:
             table = self._open_table('nacnt')
-            found = False
+            remaining = set(by_account)
 
             for record in table:
-                if record.na_acnt.strip().upper() == account.upper():
-                    with record:
-                        # Get current values, defaulting to 0 if None
-                        ptddr = float(record.na_ptddr or 0)
-                        ptdcr = float(record.na_ptdcr or 0)
-                        ytddr = float(record.na_ytddr or 0)
-                        ytdcr = float(record.na_ytdcr or 0)
-
+                account_key = record.na_acnt.strip().upper()
+                if account_key not in remaining:
+                    continue
+                remaining.discard(account_key)
+                with record:
+                    for account, period, debit, credit in by_account[account_key]:
                         # Update period balance field (na_balc01-na_balc24)
                         period_field = f"na_balc{period:02d}"
                         period_bal = float(getattr(record, period_field, 0) or 0)
 
-                        if value >= 0:
-                            # DEBIT entry
-                            record.na_ptddr = ptddr + value
-                            record.na_ytddr = ytddr + value
-                        else:
-                            # CREDIT entry
-                            abs_value = abs(value)
-                            record.na_ptdcr = ptdcr + abs_value
-                            record.na_ytdcr = ytdcr + abs_value
+                        if debit is not None:
+                            # DEBIT entries
+                            record.na_ptddr = float(record.na_ptddr or 0) + debit
+                            record.na_ytddr = float(record.na_ytddr or 0) + debit
+                        if credit is not None:
+                            # CREDIT entries
+                            record.na_ptdcr = float(record.na_ptdcr or 0) + abs(credit)
+                            record.na_ytdcr = float(record.na_ytdcr or 0) + abs(credit)
 
                         # Period balance always gets the signed value
-                        setattr(record, period_field, period_bal + value)
-
-                    found = True
-                    logger.debug(f"Updated nacnt for {account}: value={value}, period={period}")
+                        setattr(record, period_field, period_bal + (debit or 0) + (credit or 0))
+                        logger.debug(f"Updated nacnt for {account}: dr={debit} cr={credit}, period={period}")
+                if not remaining:
                     break
 
-            if not found:
-                raise ValueError(f"nacnt update: account {account} not found in nacnt table")
+            if remaining:
+                raise ValueError(f"nacnt update: account(s) {', '.join(sorted(remaining))} not found in nacnt table")
 
         except Exception as e:
-            logger.error(f"Failed to update nacnt for {account}: {e}")
+            logger.error(f"Failed to update nacnt: {e}")
             raise  # Fail the transaction - nacnt must be updated correctly
 
         # Also update nhist (nominal history) — Opera always updates both together
-        try:
-            self._update_nhist(account, value, period, year)
-        except Exception as e:
-            logger.error(f"Failed to update nhist for {account}: {e}")
-            raise
+        self._update_nhist(deltas)
 
     def _update_nbank_balance(self, bank_account: str, amount_pounds: float):
         """
@@ -4138,6 +4274,10 @@ class Opera3FoxProImport:
             # Auto-allocate receipts to invoices if requested
             allocation_results = []
             if auto_allocate:
+                # Open invoices for every customer in the batch, from one stran scan
+                allocation_engine = self.allocation_engine('sales')
+                allocation_engine.prefetch(
+                    p['customer_account'] for p in payments if p.get('auto_allocate', True))
                 for payment in payments:
                     customer_account = payment['customer_account'].strip()
                     amount = float(payment['amount'])
@@ -4157,7 +4297,8 @@ class Opera3FoxProImport:
                         allocation_date=post_date,
                         bank_account=bank_account,
                         description=pay_description,
-                        gc_payment_id=payment.get('gc_payment_id')
+                        gc_payment_id=payment.get('gc_payment_id'),
+                        allocation_engine=allocation_engine
                     )
 
                     if alloc_result['success']:
@@ -5008,6 +5149,37 @@ class Opera3FoxProImport:
     # AUTO-ALLOCATION (Opera 3 parity with SQL SE)
     # =========================================================================
 
+    def allocation_engine(self, ledger: str = 'sales') -> AllocationEngine:
+        """
+        Open invoices for auto-allocation ('sales' stran or 'purchase' ptran).
+
+        Pass one engine to every auto_allocate_receipt/payment call of a batch
+        (after prefetch() with the batch's accounts) so stran/ptran is scanned
+        once for all of the batch's accounts instead of once per line.
+        """
+        return AllocationEngine(ledger, lambda accounts: self._load_open_invoices(ledger, accounts))
+
+    def _load_open_invoices(self, ledger: str, accounts: List[str]) -> Dict[str, List[OpenItem]]:
+        """Outstanding invoices for the accounts, from one scan of stran/ptran."""
+        table_name, p, alt_ref = ('stran', 'st', 'st_custref') if ledger == 'sales' else ('ptran', 'pt', 'pt_suppref')
+        wanted = set(accounts)
+        items: Dict[str, List[OpenItem]] = {}
+        for record in self._open_table(table_name):
+            account = getattr(record, f'{p}_account').strip().upper()
+            if account not in wanted or getattr(record, f'{p}_trtype').strip() != 'I':
+                continue
+            balance = float(getattr(record, f'{p}_trbal') or 0)
+            if balance <= 0:
+                continue
+            items.setdefault(account, []).append(OpenItem(
+                ref=getattr(record, f'{p}_trref').strip(),
+                balance=balance,
+                alt_ref=(getattr(record, alt_ref, '') or '').strip(),
+                date=getattr(record, f'{p}_trdate'),
+                unique=(getattr(record, f'{p}_unique', '') or '').strip(),
+            ))
+        return items
+
     def auto_allocate_receipt(
         self,
         customer_account: str,
@@ -5016,7 +5188,9 @@ class Opera3FoxProImport:
         allocation_date: date,
         bank_account: str = "",
         description: str = None,
-        gc_payment_id: str = None
+        gc_payment_id: str = None,
+        allocation_engine: Optional[AllocationEngine] = None,
+        allow_amount_match: bool = False
     ) -> Dict[str, Any]:
         """
         Automatically allocate a receipt to matching outstanding invoices.
@@ -5029,6 +5203,9 @@ class Opera3FoxProImport:
            total matches the receipt exactly -> allocate to those specific invoices
         2. If receipt amount equals TOTAL outstanding balance on account AND there are
            1+ invoices -> allocate to ALL invoices (clears whole account, no ambiguity)
+        3. Only with allow_amount_match: if there is no invoice reference and exactly
+           one combination of outstanding invoices totals the receipt -> allocate to
+           those invoices
 
         Args:
             customer_account: Customer code (e.g., 'K009')
@@ -5040,12 +5217,14 @@ class Opera3FoxProImport:
             gc_payment_id: GoCardless payment ID (e.g., 'PM000XXX') for payment request
                           invoice lookup. When provided, uses stored invoice_refs from
                           the original collection request for precise allocation.
+            allocation_engine: Open items shared by a batch of allocations (see
+                          allocation_engine()); loaded for this account if omitted.
+            allow_amount_match: Allow rule 3. Off by default, when a unique
+                          combination is only returned in suggested_invoices.
 
         Returns:
             Dict with allocation results
         """
-        import re
-
         result = {
             "success": False,
             "allocated_amount": 0.0,
@@ -5080,152 +5259,27 @@ class Opera3FoxProImport:
                 result["message"] = "Receipt already fully allocated"
                 return result
 
-            # Get outstanding invoices for customer
-            invoices = []
-            for record in stran_table:
-                if (record.st_account.strip().upper() == customer_account.upper()
-                        and record.st_trtype.strip() == 'I'
-                        and float(record.st_trbal or 0) > 0):
-                    invoices.append({
-                        'ref': record.st_trref.strip(),
-                        'custref': record.st_custref.strip() if hasattr(record, 'st_custref') and record.st_custref else '',
-                        'balance': float(record.st_trbal),
-                        'date': record.st_trdate,
-                        'unique': record.st_unique.strip() if hasattr(record, 'st_unique') and record.st_unique else '',
-                    })
-
-            if not invoices:
+            # Outstanding invoices for customer (shared across a batch when an engine is passed)
+            engine = allocation_engine or self.allocation_engine('sales')
+            open_items = engine.items(customer_account)
+            if not open_items:
                 result["message"] = "No outstanding invoices found for customer"
                 return result
 
-            # Build list of invoices to allocate
-            invoices_to_allocate = []
-            allocation_method = None
-
-            total_outstanding = round(sum(inv['balance'] for inv in invoices), 2)
-            receipt_rounded = round(receipt_amount, 2)
-
-            # RULE 0: Payment request invoice lookup (GoCardless collections)
-            if gc_payment_id and not allocation_method:
-                try:
-                    from sql_rag.gocardless_payments import get_payments_db
-                    payments_db = get_payments_db()
-                    payment_request = payments_db.get_payment_request_by_payment_id(gc_payment_id)
-
-                    if payment_request and payment_request.get('invoice_refs'):
-                        pr_invoice_refs = payment_request['invoice_refs']
-                        logger.info(f"Auto-allocate: payment request {gc_payment_id} has invoice_refs: {pr_invoice_refs}")
-
-                        pr_invoices_to_allocate = []
-                        skipped_invoices = []
-                        for inv_ref in pr_invoice_refs:
-                            found = False
-                            for inv in invoices:
-                                if inv['ref'].upper() == inv_ref.strip().upper():
-                                    if inv['balance'] > 0.005:
-                                        pr_invoices_to_allocate.append({
-                                            'ref': inv['ref'],
-                                            'custref': inv['custref'],
-                                            'amount': inv['balance'],
-                                            'full_allocation': True,
-                                            'unique': inv['unique']
-                                        })
-                                    else:
-                                        skipped_invoices.append(f"{inv_ref} (already paid)")
-                                    found = True
-                                    break
-                            if not found:
-                                skipped_invoices.append(f"{inv_ref} (not found/outstanding)")
-
-                        if pr_invoices_to_allocate:
-                            total_pr_invoice_balance = round(sum(a['amount'] for a in pr_invoices_to_allocate), 2)
-
-                            if receipt_rounded >= total_pr_invoice_balance:
-                                invoices_to_allocate = pr_invoices_to_allocate
-                                allocation_method = "payment_request"
-                                if skipped_invoices:
-                                    logger.info(f"Auto-allocate: skipped invoices (already paid in Opera): {skipped_invoices}")
-                            elif receipt_rounded < total_pr_invoice_balance:
-                                remaining = receipt_rounded
-                                for inv_alloc in pr_invoices_to_allocate:
-                                    if remaining <= 0.005:
-                                        break
-                                    alloc_amt = min(inv_alloc['amount'], remaining)
-                                    inv_alloc['amount'] = alloc_amt
-                                    inv_alloc['full_allocation'] = abs(alloc_amt - float(inv_alloc['amount'])) < 0.01
-                                    remaining -= alloc_amt
-                                invoices_to_allocate = [a for a in pr_invoices_to_allocate if a['amount'] > 0.005]
-                                allocation_method = "payment_request"
-                        elif skipped_invoices:
-                            logger.info(f"Auto-allocate: all payment request invoices already paid: {skipped_invoices}")
-                except Exception as e:
-                    logger.warning(f"Auto-allocate: payment request lookup failed for {gc_payment_id}: {e}")
-
-            # RULE 1: Try to match by invoice reference in description
-            inv_matches = []
-            if description:
-                inv_matches = re.findall(r'INV\d+', description.upper())
-
-            if inv_matches:
-                for inv_ref in inv_matches:
-                    for inv in invoices:
-                        if inv['ref'].upper() == inv_ref:
-                            if inv['balance'] > 0:
-                                invoices_to_allocate.append({
-                                    'ref': inv['ref'],
-                                    'custref': inv['custref'],
-                                    'amount': inv['balance'],
-                                    'full_allocation': True,
-                                    'unique': inv['unique']
-                                })
-                            break
-
-                if invoices_to_allocate:
-                    total_invoice_balance = round(sum(a['amount'] for a in invoices_to_allocate), 2)
-                    if receipt_rounded == total_invoice_balance:
-                        allocation_method = "invoice_reference"
-                    else:
-                        inv_details = [f"{a['ref']} (£{a['amount']:.2f})" for a in invoices_to_allocate]
-                        result["message"] = (
-                            f"Invoice reference(s) found but amounts do not match: "
-                            f"receipt £{receipt_rounded:.2f} vs invoice total £{total_invoice_balance:.2f}. "
-                            f"Found: {inv_details}"
-                        )
-                        return result
-
-            # RULE 2: If no invoice ref match, check if receipt clears whole account
-            if not allocation_method:
-                invoice_count = len(invoices)
-                if receipt_rounded == total_outstanding and invoice_count >= 1:
-                    invoices_to_allocate = []
-                    for inv in invoices:
-                        if inv['balance'] > 0:
-                            invoices_to_allocate.append({
-                                'ref': inv['ref'],
-                                'custref': inv['custref'],
-                                'amount': inv['balance'],
-                                'full_allocation': True,
-                                'unique': inv['unique']
-                            })
-                    allocation_method = "clears_account" if invoice_count >= 2 else "single_invoice_match"
-                else:
-                    if inv_matches:
-                        result["message"] = f"Invoice reference(s) {inv_matches} not found in outstanding invoices"
-                    else:
-                        result["message"] = (
-                            f"Cannot auto-allocate: no invoice reference in description and "
-                            f"receipt £{receipt_rounded:.2f} does not clear account total £{total_outstanding:.2f}"
-                        )
-                    return result
+            request_refs = payment_request_invoice_refs(gc_payment_id) if gc_payment_id else None
+            plan = plan_receipt(open_items, receipt_amount, description, request_refs,
+                                allow_amount_match=allow_amount_match)
+            if not plan.method:
+                result["message"] = plan.message
+                if plan.suggestion:
+                    result["suggested_invoices"] = plan.suggestion
+                return result
 
             # Amounts verified - proceed with allocation
-            total_invoice_amount = round(sum(a['amount'] for a in invoices_to_allocate), 2)
-            if allocation_method == "payment_request" and receipt_rounded > total_invoice_amount:
-                total_to_allocate = total_invoice_amount
-                receipt_fully_allocated = False
-            else:
-                total_to_allocate = receipt_amount
-                receipt_fully_allocated = True
+            invoices_to_allocate = plan.allocations
+            allocation_method = plan.method
+            total_to_allocate = plan.total_to_allocate
+            receipt_fully_allocated = plan.fully_allocated
 
             if isinstance(allocation_date, str):
                 allocation_date = datetime.strptime(allocation_date, '%Y-%m-%d').date()
@@ -5260,12 +5314,7 @@ class Opera3FoxProImport:
 
                 # Insert salloc record for receipt
                 if receipt_fully_allocated:
-                    if allocation_method == "payment_request":
-                        alloc_ref2 = "AUTO:GC_REQ"
-                    elif allocation_method == "invoice_reference":
-                        alloc_ref2 = "AUTO:INV_REF"
-                    else:
-                        alloc_ref2 = "AUTO:CLR_ACCT"
+                    alloc_ref2 = allocation_ref2(allocation_method)
                     salloc_table.append({
                         'al_account': customer_account[:8],
                         'al_date': allocation_date,
@@ -5357,12 +5406,8 @@ class Opera3FoxProImport:
             result["receipt_fully_allocated"] = receipt_fully_allocated
             result["allocation_method"] = allocation_method
 
-            if allocation_method == "payment_request":
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) from payment request"
-            elif allocation_method == "invoice_reference":
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) by reference"
-            else:
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) - clears account"
+            result["message"] = allocation_message(allocation_method, total_to_allocate, len(invoices_to_allocate))
+            engine.consume(customer_account, invoices_to_allocate)
 
             logger.info(f"Auto-allocated receipt {receipt_ref} for {customer_account}: £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoices ({allocation_method})")
             return result
@@ -5379,7 +5424,9 @@ class Opera3FoxProImport:
         payment_amount: float,
         allocation_date: date,
         bank_account: str = "",
-        description: str = None
+        description: str = None,
+        allocation_engine: Optional[AllocationEngine] = None,
+        allow_amount_match: bool = False
     ) -> Dict[str, Any]:
         """
         Automatically allocate a payment to matching outstanding supplier invoices.
@@ -5389,6 +5436,9 @@ class Opera3FoxProImport:
            the payment exactly -> allocate to those specific invoices
         2. If payment amount equals TOTAL outstanding balance on account AND there are
            1+ invoices -> allocate to ALL invoices (clears whole account, no ambiguity)
+        3. Only with allow_amount_match: if there is no invoice reference and exactly
+           one combination of outstanding invoices totals the payment -> allocate to
+           those invoices
 
         Args:
             supplier_account: Supplier code (e.g., 'P001')
@@ -5397,12 +5447,14 @@ class Opera3FoxProImport:
             allocation_date: Date to use for allocation
             bank_account: Bank account code for palloc record
             description: Description to search for invoice references (optional)
+            allocation_engine: Open items shared by a batch of allocations (see
+                          allocation_engine()); loaded for this account if omitted.
+            allow_amount_match: Allow rule 3. Off by default, when a unique
+                          combination is only returned in suggested_invoices.
 
         Returns:
             Dict with allocation results
         """
-        import re
-
         result = {
             "success": False,
             "allocated_amount": 0.0,
@@ -5433,105 +5485,26 @@ class Opera3FoxProImport:
                 result["message"] = "Payment already fully allocated"
                 return result
 
-            # Get outstanding invoices for supplier
-            invoices = []
-            for record in ptran_table:
-                if (record.pt_account.strip().upper() == supplier_account.upper()
-                        and record.pt_trtype.strip() == 'I'
-                        and float(record.pt_trbal or 0) > 0):
-                    invoices.append({
-                        'ref': record.pt_trref.strip(),
-                        'suppref': record.pt_suppref.strip() if hasattr(record, 'pt_suppref') and record.pt_suppref else '',
-                        'balance': float(record.pt_trbal),
-                        'date': record.pt_trdate,
-                        'unique': record.pt_unique.strip() if hasattr(record, 'pt_unique') and record.pt_unique else '',
-                    })
-
-            if not invoices:
+            # Outstanding invoices for supplier (shared across a batch when an engine is passed)
+            engine = allocation_engine or self.allocation_engine('purchase')
+            open_items = engine.items(supplier_account)
+            if not open_items:
                 result["message"] = "No outstanding invoices found for supplier"
                 return result
 
-            # Build list of invoices to allocate
-            invoices_to_allocate = []
-            allocation_method = None
-
-            total_outstanding = round(sum(inv['balance'] for inv in invoices), 2)
-            payment_rounded = round(payment_amount, 2)
-
-            # RULE 1: Try to match by invoice reference in description
-            inv_matches = []
-            if description:
-                inv_matches = re.findall(r'(?:PI|INV|PINV|P/INV)[\s-]?\d+', description.upper())
-                if not inv_matches:
-                    # Look for references in ptran pt_suppref format
-                    for inv in invoices:
-                        suppref = inv['suppref']
-                        if suppref and suppref.upper() in description.upper():
-                            inv_matches.append(suppref)
-
-            if inv_matches:
-                for inv_ref_pattern in inv_matches:
-                    inv_ref_clean = re.sub(r'[\s-]', '', inv_ref_pattern.upper())
-                    for inv in invoices:
-                        inv_trref = inv['ref'].upper()
-                        inv_suppref = inv['suppref'].upper()
-                        inv_trref_clean = re.sub(r'[\s-]', '', inv_trref)
-                        inv_suppref_clean = re.sub(r'[\s-]', '', inv_suppref)
-
-                        if inv_ref_clean == inv_trref_clean or inv_ref_clean == inv_suppref_clean or inv_ref_pattern.upper() == inv_suppref:
-                            if inv['balance'] > 0:
-                                already_added = any(a['ref'] == inv['ref'] for a in invoices_to_allocate)
-                                if not already_added:
-                                    invoices_to_allocate.append({
-                                        'ref': inv['ref'],
-                                        'suppref': inv['suppref'],
-                                        'amount': inv['balance'],
-                                        'full_allocation': True,
-                                        'unique': inv['unique']
-                                    })
-                            break
-
-                if invoices_to_allocate:
-                    total_invoice_balance = round(sum(a['amount'] for a in invoices_to_allocate), 2)
-                    if payment_rounded == total_invoice_balance:
-                        allocation_method = "invoice_reference"
-                    else:
-                        inv_details = [f"{a['ref']} (£{a['amount']:.2f})" for a in invoices_to_allocate]
-                        result["message"] = (
-                            f"Invoice reference(s) found but amounts do not match: "
-                            f"payment £{payment_rounded:.2f} vs invoice total £{total_invoice_balance:.2f}. "
-                            f"Found: {inv_details}"
-                        )
-                        return result
-
-            # RULE 2: If no invoice ref match, check if payment clears whole account
-            if not allocation_method:
-                invoice_count = len(invoices)
-                if payment_rounded == total_outstanding and invoice_count >= 1:
-                    invoices_to_allocate = []
-                    for inv in invoices:
-                        if inv['balance'] > 0:
-                            invoices_to_allocate.append({
-                                'ref': inv['ref'],
-                                'suppref': inv['suppref'],
-                                'amount': inv['balance'],
-                                'full_allocation': True,
-                                'unique': inv['unique']
-                            })
-                    allocation_method = "clears_account" if invoice_count >= 2 else "single_invoice_match"
-                else:
-                    if inv_matches:
-                        result["message"] = f"Invoice reference(s) {inv_matches} not found in outstanding invoices"
-                    else:
-                        result["message"] = (
-                            f"Cannot auto-allocate: no invoice reference in description and "
-                            f"payment £{payment_rounded:.2f} does not clear account total £{total_outstanding:.2f}"
-                        )
-                    return result
+            plan = plan_payment(open_items, payment_amount, description,
+                                allow_amount_match=allow_amount_match)
+            if not plan.method:
+                result["message"] = plan.message
+                if plan.suggestion:
+                    result["suggested_invoices"] = plan.suggestion
+                return result
 
             # Amounts verified - proceed with allocation
-            total_to_allocate = payment_amount
-            payment_fully_allocated = True
+            invoices_to_allocate = plan.allocations
+            allocation_method = plan.method
+            total_to_allocate = plan.total_to_allocate
+            payment_fully_allocated = plan.fully_allocated
 
             if isinstance(allocation_date, str):
                 allocation_date = datetime.strptime(allocation_date, '%Y-%m-%d').date()
@@ -5565,7 +5538,7 @@ class Opera3FoxProImport:
 
                 # Insert palloc record for payment
                 if payment_fully_allocated:
-                    alloc_ref2 = "AUTO:INV_REF" if allocation_method == "invoice_reference" else "AUTO:CLR_ACCT"
+                    alloc_ref2 = allocation_ref2(allocation_method)
                     palloc_table.append({
                         'al_account': supplier_account[:8],
                         'al_date': allocation_date,
@@ -5657,10 +5630,8 @@ class Opera3FoxProImport:
             result["payment_fully_allocated"] = payment_fully_allocated
             result["allocation_method"] = allocation_method
 
-            if allocation_method == "invoice_reference":
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) by reference"
-            else:
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) - clears account"
+            result["message"] = allocation_message(allocation_method, total_to_allocate, len(invoices_to_allocate))
+            engine.consume(supplier_account, invoices_to_allocate)
 
             logger.info(f"Auto-allocated payment {payment_ref} for {supplier_account}: £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoices ({allocation_method})")
             return result
@@ -15,6 +15,7 @@ import json
 import os
 from datetime import datetime
 from typing import Optional, Dict, List
+from sql_rag import snapshot_store
 from sql_rag.opera3_foxpro import get_opera3_reader
 
 SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), '..', 'snapshots', 'opera3')
@@ -122,20 +123,18 @@ def take_snapshot(name: str, limit: int = 500, tables: Optional[List] = None) ->
             snapshot['tables'][table_name] = {'error': str(e)}
 
     # Save snapshot
-    filename = f"snapshot_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    filename = f"snapshot_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{snapshot_store.SNAPSHOT_EXT}"
     filepath = os.path.join(SNAPSHOT_DIR, filename)
 
-    with open(filepath, 'w') as f:
-        json.dump(snapshot, f, indent=2, default=str)
+    snapshot_store.save_snapshot(filepath, snapshot)
 
     print(f"\nSnapshot saved to: {filepath}")
     return filepath
 
 
 def load_snapshot(filepath: str) -> dict:
-    """Load a snapshot from file."""
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    """Load a snapshot from file (binary snapshots load table rows lazily; legacy .json still reads)."""
+    return snapshot_store.load_snapshot(filepath)
 
 
 def find_latest_snapshots() -> tuple:
@@ -190,6 +189,10 @@ def compare_snapshots(before_path: Optional[str] = None, after_path: Optional[st
         if 'error' in after['tables'][table_name]:
             continue
 
+        # Identical stored rows — skip without decompressing either table
+        if snapshot_store.same_rows(before['tables'].get(table_name, {}), after['tables'][table_name]):
+            continue
+
         after_records = after['tables'][table_name].get('records', [])
         before_records = before['tables'].get(table_name, {}).get('records', [])
 
@@ -271,7 +274,7 @@ def list_snapshots():
 
     print("Available Opera 3 snapshots:")
     for f in files:
-        if f.endswith('.json') and 'snapshot_' in f:
+        if f.endswith(('.json', snapshot_store.SNAPSHOT_EXT)) and 'snapshot_' in f:
             filepath = os.path.join(SNAPSHOT_DIR, f)
             size = os.path.getsize(filepath)
             print(f"  {f} ({size:,} bytes)")
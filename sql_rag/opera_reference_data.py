@@ -0,0 +1,349 @@
+"""
+Opera SQL SE Reference Data Snapshot
+
+Immutable in-memory copy of the reference data that posting methods in
+opera_sql_import look up for every line:
+- nparm financial year / current period
+- atype type codes (category, description)
+- nacnt account types (na_type / na_subt) and project/department settings
+- ztax VAT codes
+- nclndd period calendar
+- zxchg home currency
+- control accounts
+- dormant flags, names, analysis codes and profile control accounts of the
+  sname/pname accounts involved
+
+Load it once per batch or request (OperaSQLImport.reference_data()) and the
+lookups are answered from memory instead of one SELECT each per line. The
+snapshot carries a version (checksums of the columns it depends on) which is
+re-read inside each posting transaction just before commit, so a posting
+never commits against reference data changed since the snapshot was taken.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+class StaleReferenceDataError(RuntimeError):
+    """Reference data changed in the database after the snapshot was taken."""
+
+
+def _strip(value) -> str:
+    return value.strip() if isinstance(value, str) else ('' if value is None else str(value))
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    if hasattr(value, 'date'):
+        return value.date()
+    return None
+
+
+def _in_list(accounts: Iterable[str]) -> str:
+    return "','".join(sorted({a.strip().replace("'", "''") for a in accounts}))
+
+
+def _version_tuple(values) -> Tuple[Optional[int], ...]:
+    # NULL checksums (empty tables) arrive as None from SQLAlchemy but NaN from pandas
+    return tuple(None if v is None or v != v else int(v) for v in values)
+
+
+def _version_sql(customers: Tuple[str, ...], suppliers: Tuple[str, ...]) -> str:
+    """Checksums over every column the snapshot depends on (not balances or counters)."""
+    parts = [
+        "(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(np_year, np_perno)) FROM nparm WITH (NOLOCK)) as nparm_v",
+        "(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(ay_cbtype, ay_type, ay_desc)) FROM atype WITH (NOLOCK)) as atype_v",
+        "(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(na_acnt, na_type, na_subt, na_allwprj, na_allwjob, na_project, na_job)) "
+        "FROM nacnt WITH (NOLOCK)) as nacnt_v",
+        "(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM ztax WITH (NOLOCK)) as ztax_v",
+        "(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM nclndd WITH (NOLOCK)) as nclndd_v",
+    ]
+    if customers:
+        parts.append(
+            f"(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(sn_account, sn_name, sn_dormant, sn_cprfl, sn_region, "
+            f"sn_terrtry, sn_custype)) FROM sname WITH (NOLOCK) "
+            f"WHERE RTRIM(sn_account) IN ('{_in_list(customers)}')) as sname_v"
+        )
+    if suppliers:
+        parts.append(
+            f"(SELECT CHECKSUM_AGG(BINARY_CHECKSUM(pn_account, pn_name, pn_dormant, pn_sprfl)) FROM pname WITH (NOLOCK) "
+            f"WHERE RTRIM(pn_account) IN ('{_in_list(suppliers)}')) as pname_v"
+        )
+    return "SELECT " + ",\n       ".join(parts)
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """
+    Read-only reference data for one batch or request.
+
+    A field left as None was not loaded (query failed); callers fall back to
+    querying the database for it.
+    """
+    financial_year: Optional[int] = None
+    current_period: Optional[int] = None
+    home_currency: Optional[Mapping[str, Any]] = None
+    control_accounts: Any = None
+    # code -> {'code', 'description', 'category', 'next_entry'}, in atype order
+    cbtypes: Optional[Mapping[str, Mapping[str, str]]] = None
+    nacnt_types: Optional[Mapping[str, Tuple[str, str]]] = None
+    # account -> {'description', 'allow_project', 'allow_department', 'project', 'department'}
+    nominal_accounts: Optional[Mapping[str, Mapping[str, Any]]] = None
+    vat_codes: Optional[Tuple[Mapping[str, Any], ...]] = None
+    # (start date, end date, period, year)
+    calendar: Optional[Tuple[Tuple[date, date, int, int], ...]] = None
+    # (ledger, account) -> account name if dormant else None; ledger is 'sales' or 'purchase'
+    dormant: Mapping[Tuple[str, str], Optional[str]] = field(default_factory=lambda: MappingProxyType({}))
+    # (ledger, account) -> {'name', 'region', 'terr', 'type', 'control'} for accounts found in sname/pname;
+    # control is the profile control account, '' when the profile has none
+    ledger_accounts: Mapping[Tuple[str, str], Mapping[str, str]] = field(default_factory=lambda: MappingProxyType({}))
+    customers: Tuple[str, ...] = ()
+    suppliers: Tuple[str, ...] = ()
+    version: Optional[Tuple[Any, ...]] = None
+    loaded_at: Optional[datetime] = None
+
+    def period_for_date(self, post_date) -> Optional[Tuple[int, int]]:
+        """(period, year) from the nclndd calendar, or None if not covered."""
+        if self.calendar is None:
+            return None
+        post_date = _as_date(post_date)
+        for start, end, period, year in self.calendar:
+            if start <= post_date <= end:
+                return (period, year)
+        return None
+
+    def available_types(self, category: str = None) -> Optional[List[Dict[str, str]]]:
+        """atype codes ordered as OperaSQLImport.get_available_types() orders them."""
+        if self.cbtypes is None:
+            return None
+        types = [dict(t) for t in self.cbtypes.values()]
+        if category:
+            types = [t for t in types if t['category'] == category]
+            types.sort(key=lambda t: (0 if t['code'][:1] == category else 1, t['code']))
+        else:
+            types.sort(key=lambda t: (t['category'], t['code']))
+        return types
+
+    def vat_row(self, vat_code: str, vat_type: str) -> Optional[Mapping[str, Any]]:
+        """Home-country ztax row for a code, preferring the matching transaction type."""
+        home = [r for r in self.vat_codes if _strip(r['tx_code']) == vat_code and _strip(r['tx_ctrytyp']) == 'H']
+        for row in home:
+            if _strip(row['tx_trantyp']) == vat_type:
+                return row
+        return home[0] if home else None
+
+    def any_vat_nominal(self) -> str:
+        for row in self.vat_codes:
+            if _strip(row['tx_ctrytyp']) == 'H' and _strip(row['tx_nominal']):
+                return _strip(row['tx_nominal'])
+        return ''
+
+    def covers_account(self, account: str, ledger: str) -> bool:
+        return (ledger, account.strip()) in self.dormant
+
+    def ledger_account(self, account: str, ledger: str) -> Optional[Mapping[str, str]]:
+        """sname/pname details for a preloaded account, or None if not loaded or not on file."""
+        return self.ledger_accounts.get((ledger, account.strip()))
+
+    def nominal_account(self, account: str) -> Optional[Mapping[str, Any]]:
+        """nacnt details for an account, or None if not loaded or not on file."""
+        if self.nominal_accounts is None:
+            return None
+        return self.nominal_accounts.get(account.strip())
+
+    def verify_version(self, conn):
+        """
+        Re-read the reference version inside a posting transaction.
+
+        Raises:
+            StaleReferenceDataError: If anything the snapshot holds has changed
+        """
+        if self.version is None:
+            return
+        row = conn.execute(text(_version_sql(self.customers, self.suppliers))).fetchone()
+        current = _version_tuple(row) if row else None
+        if current != self.version:
+            raise StaleReferenceDataError(
+                f"Opera reference data (type codes, nominal accounts, VAT codes, calendar or "
+                f"sales/purchase accounts) changed since {self.loaded_at:%H:%M:%S} - posting rolled back, please retry"
+            )
+
+
+def load_reference_data(
+    sql_connector,
+    customers: Iterable[str] = (),
+    suppliers: Iterable[str] = (),
+) -> ReferenceData:
+    """
+    Load a reference-data snapshot with one query per table.
+
+    Args:
+        sql_connector: SQLConnector for the Opera SQL SE company database
+        customers: sname accounts whose details and dormant flags should be included
+        suppliers: pname accounts whose details and dormant flags should be included
+
+    Returns:
+        ReferenceData (parts that failed to load are None)
+    """
+    customers = tuple(sorted({str(a).strip() for a in customers if a and str(a).strip()}))
+    suppliers = tuple(sorted({str(a).strip() for a in suppliers if a and str(a).strip()}))
+    values: Dict[str, Any] = {'customers': customers, 'suppliers': suppliers, 'loaded_at': datetime.now()}
+
+    # Version first: anything changed between here and the loads below is caught at commit
+    try:
+        df = sql_connector.execute_query(_version_sql(customers, suppliers))
+        values['version'] = _version_tuple(df.iloc[0].tolist()) if not df.empty else None
+    except Exception as e:
+        logger.warning(f"Could not read reference data version: {e}")
+
+    try:
+        df = sql_connector.execute_query("SELECT TOP 1 np_year, np_perno FROM nparm WITH (NOLOCK)")
+        if not df.empty:
+            row = df.iloc[0]
+            values['financial_year'] = int(row['np_year']) if row['np_year'] else None
+            values['current_period'] = int(row['np_perno']) if row['np_perno'] else None
+    except Exception as e:
+        logger.warning(f"Could not load nparm reference data: {e}")
+
+    try:
+        df = sql_connector.execute_query("""
+            SELECT ay_cbtype, ay_desc, ay_type, ay_entry
+            FROM atype WITH (NOLOCK)
+            ORDER BY ay_cbtype
+        """)
+        values['cbtypes'] = MappingProxyType({
+            _strip(r['ay_cbtype']): MappingProxyType({
+                'code': _strip(r['ay_cbtype']),
+                'description': _strip(r['ay_desc']),
+                'category': _strip(r['ay_type']),
+                'next_entry': _strip(r['ay_entry']),
+            })
+            for r in df.to_dict('records')
+        })
+    except Exception as e:
+        logger.warning(f"Could not load atype reference data: {e}")
+
+    try:
+        df = sql_connector.execute_query("""
+            SELECT RTRIM(na_acnt) as na_acnt, na_type, na_subt, na_desc,
+                   ISNULL(na_allwprj, 0) as na_allwprj, ISNULL(na_allwjob, 0) as na_allwjob,
+                   RTRIM(ISNULL(na_project, '')) as na_project, RTRIM(ISNULL(na_job, '')) as na_job
+            FROM nacnt WITH (NOLOCK)
+        """)
+        records = df.to_dict('records')
+        values['nacnt_types'] = MappingProxyType({
+            r['na_acnt']: (r['na_type'], r['na_subt']) for r in records
+        })
+        values['nominal_accounts'] = MappingProxyType({
+            r['na_acnt']: MappingProxyType({
+                'description': _strip(r.get('na_desc')),
+                'allow_project': int(r.get('na_allwprj') or 0),
+                'allow_department': int(r.get('na_allwjob') or 0),
+                'project': _strip(r.get('na_project')),
+                'department': _strip(r.get('na_job')),
+            })
+            for r in records
+        })
+    except Exception as e:
+        logger.warning(f"Could not load nacnt reference data: {e}")
+
+    try:
+        df = sql_connector.execute_query("""
+            SELECT tx_code, tx_desc, tx_rate1, tx_rate2, tx_rate1dy, tx_rate2dy,
+                   tx_nominal, tx_trantyp, tx_ctrytyp
+            FROM ztax WITH (NOLOCK)
+        """)
+        values['vat_codes'] = tuple(MappingProxyType(r) for r in df.to_dict('records'))
+    except Exception as e:
+        logger.warning(f"Could not load ztax reference data: {e}")
+
+    try:
+        df = sql_connector.execute_query("""
+            SELECT ncd_stdate, ncd_endate, ncd_period, ncd_year
+            FROM nclndd WITH (NOLOCK)
+            ORDER BY ncd_stdate
+        """)
+        values['calendar'] = tuple(
+            (_as_date(r['ncd_stdate']), _as_date(r['ncd_endate']), int(r['ncd_period']), int(r['ncd_year']))
+            for r in df.to_dict('records')
+            if r['ncd_stdate'] is not None and r['ncd_endate'] is not None
+        )
+    except Exception as e:
+        logger.warning(f"Could not load nclndd reference data: {e}")
+
+    try:
+        df = sql_connector.execute_query("SELECT xc_curr, xc_desc FROM zxchg WHERE xc_home = 1")
+        if not df.empty:
+            currency = {'code': _strip(df.iloc[0]['xc_curr']), 'description': _strip(df.iloc[0]['xc_desc']), 'found': True}
+        else:
+            currency = {'code': 'GBP', 'description': 'Sterling (default)', 'found': False}
+        values['home_currency'] = MappingProxyType(currency)
+    except Exception as e:
+        logger.warning(f"Could not load home currency reference data: {e}")
+
+    try:
+        from sql_rag.opera_config import get_control_accounts
+        values['control_accounts'] = get_control_accounts(sql_connector)
+    except Exception as e:
+        logger.warning(f"Could not load control accounts reference data: {e}")
+
+    dormant: Dict[Tuple[str, str], Optional[str]] = {}
+    ledger_accounts: Dict[Tuple[str, str], Mapping[str, str]] = {}
+    ledgers = (
+        ('sales', 'sname', """
+            SELECT RTRIM(s.sn_account) as account, RTRIM(s.sn_name) as name, s.sn_dormant as dormant,
+                   RTRIM(ISNULL(s.sn_region, '')) as region, RTRIM(ISNULL(s.sn_terrtry, '')) as terr,
+                   RTRIM(ISNULL(s.sn_custype, '')) as type, RTRIM(ISNULL(sp.sc_dbtctrl, '')) as control_account
+            FROM sname s WITH (NOLOCK)
+            LEFT JOIN sprfls sp WITH (NOLOCK) ON RTRIM(s.sn_cprfl) = RTRIM(sp.sc_code)
+            WHERE RTRIM(s.sn_account) IN ('{accounts}')
+        """, customers),
+        ('purchase', 'pname', """
+            SELECT RTRIM(p.pn_account) as account, RTRIM(p.pn_name) as name, p.pn_dormant as dormant,
+                   RTRIM(ISNULL(pp.pc_crdctrl, '')) as control_account
+            FROM pname p WITH (NOLOCK)
+            LEFT JOIN pprfls pp WITH (NOLOCK) ON RTRIM(p.pn_sprfl) = RTRIM(pp.pc_code)
+            WHERE RTRIM(p.pn_account) IN ('{accounts}')
+        """, suppliers),
+    )
+    for ledger, table, query, accounts in ledgers:
+        if not accounts:
+            continue
+        try:
+            df = sql_connector.execute_query(query.format(accounts=_in_list(accounts)))
+            for account in accounts:
+                dormant[(ledger, account)] = None
+            for r in df.to_dict('records'):
+                if r['dormant']:
+                    dormant[(ledger, r['account'])] = r['name']
+                ledger_accounts[(ledger, r['account'])] = MappingProxyType({
+                    'name': _strip(r['name']),
+                    'region': _strip(r.get('region')) or 'K',
+                    'terr': _strip(r.get('terr')) or '001',
+                    'type': _strip(r.get('type')) or 'DD1',
+                    'control': _strip(r.get('control_account')),
+                })
+        except Exception as e:
+            logger.warning(f"Could not load {table} accounts: {e}")
+    values['dormant'] = MappingProxyType(dormant)
+    values['ledger_accounts'] = MappingProxyType(ledger_accounts)
+
+    logger.debug(
+        f"Loaded Opera reference data: {len(values.get('cbtypes') or {})} type codes, "
+        f"{len(values.get('nacnt_types') or {})} nominal accounts, {len(dormant)} ledger accounts"
+    )
+    return ReferenceData(**values)
@@ -24,8 +24,16 @@ import json
 import time
 import string
 import threading
+from contextlib import contextmanager
 from sqlalchemy import text
 
+from sql_rag.opera_reference_data import ReferenceData, load_reference_data
+from sql_rag.sql_statements import in_params, statement
+from sql_rag.allocation_engine import (
+    AllocationEngine, OpenItem, allocation_message, allocation_ref2,
+    payment_request_invoice_refs, plan_payment, plan_receipt,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -179,6 +187,35 @@ TRANSACTION_TYPE_MAP = {
     },
 }
 
+# Per-kind settings for set-based cashbook batch posting (see _import_cashbook_batch).
+# 'sign' is the direction of the bank side: +1 money in, -1 money out.
+CASHBOOK_BATCH_KINDS = {
+    'sales_receipt': {
+        'label': 'Receipt',
+        'account_key': 'customer_account',
+        'method_key': 'payment_method',
+        'default_method': 'BACS',
+        'sign': 1,
+        'ledger': 'SL',
+        'master': 'sname',
+        'ledger_table': 'stran',
+        'source': 'S',
+        'control_type': ('B ', 'BB'),
+    },
+    'purchase_payment': {
+        'label': 'Payment',
+        'account_key': 'supplier_account',
+        'method_key': 'payment_type',
+        'default_method': 'Direct Cr',
+        'sign': -1,
+        'ledger': 'PL',
+        'master': 'pname',
+        'ledger_table': 'ptran',
+        'source': 'P',
+        'control_type': ('C ', 'CA'),
+    },
+}
+
 
 @dataclass
 class ImportResult:
@@ -222,6 +259,48 @@ def get_lock_timeout_sql() -> str:
     return f"SET LOCK_TIMEOUT {LOCK_TIMEOUT_MS}"
 
 
+# =========================================================================
+# NUMBER ALLOCATION STATEMENTS
+# =========================================================================
+# Run inside every posting transaction, so they are registered once with
+# bound parameters (see sql_rag.sql_statements).
+
+_NEXTID_SELECT = statement('opera.nextid.select', """
+    SELECT nextid FROM nextid WITH (UPDLOCK, ROWLOCK)
+    WHERE RTRIM(tablename) = :tablename
+""")
+_NEXTID_UPDATE = statement('opera.nextid.update', """
+    UPDATE nextid WITH (ROWLOCK)
+    SET nextid = :nextid, datemodified = GETDATE()
+    WHERE RTRIM(tablename) = :tablename
+""")
+_NEXT_JOURNAL_SELECT = statement('opera.nparm.next_journal.select', """
+    SELECT np_nexjrnl FROM nparm WITH (UPDLOCK, ROWLOCK)
+""")
+_NEXT_JOURNAL_UPDATE = statement('opera.nparm.next_journal.update', """
+    UPDATE nparm WITH (ROWLOCK) SET np_nexjrnl = :next_journal
+""")
+
+_ATYPE_ENTRY_RESERVE = statement('opera.atype.entry.reserve', """
+    SELECT ay_entry
+    FROM atype WITH (UPDLOCK, ROWLOCK)
+    WHERE RTRIM(ay_cbtype) = :cbtype
+""")
+
+_AENTRY_USED_RANGE = statement('opera.aentry.used_range', """
+    SELECT RTRIM(ae_entry) FROM aentry WITH (NOLOCK)
+    WHERE RTRIM(ae_cbtype) = :cbtype
+      AND ae_entry >= :first_entry AND ae_entry <= :last_entry
+""")
+
+_ATYPE_ENTRY_UPDATE = statement('opera.atype.entry.update', """
+    UPDATE atype WITH (ROWLOCK)
+    SET ay_entry = :next_entry,
+        datemodified = GETDATE()
+    WHERE RTRIM(ay_cbtype) = :cbtype
+""")
+
+
 # =========================================================================
 # DEADLOCK RETRY UTILITY
 # =========================================================================
@@ -243,10 +322,11 @@ def check_record_locked(engine, table: str, key_column: str, key_value: str) ->
     try:
         with engine.connect() as conn:
             conn.execute(text("SET LOCK_TIMEOUT 500"))  # 0.5 second — quick check
-            conn.execute(text(f"""
+            probe = statement(f'opera.lock_probe.{table}.{key_column}', f"""
                 SELECT 1 FROM {table} WITH (UPDLOCK, ROWLOCK, NOWAIT)
-                WHERE RTRIM({key_column}) = '{key_value}'
-            """))
+                WHERE RTRIM({key_column}) = :key_value
+            """)
+            probe.execute(conn, {'key_value': key_value})
             conn.rollback()  # release the lock immediately
             return False  # Not locked — safe to proceed
     except Exception as e:
@@ -257,6 +337,35 @@ def check_record_locked(engine, table: str, key_column: str, key_value: str) ->
         return False  # Other error — assume not locked
 
 
+def check_records_locked(engine, table: str, key_column: str, key_values: List[str]) -> bool:
+    """
+    Set-based check_record_locked(): True if ANY of the given records is locked.
+
+    Used by batch posting so a batch of N lines costs one brief lock probe
+    rather than N.
+    """
+    if not key_values:
+        return False
+    keys = sorted({str(k).strip() for k in key_values})
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SET LOCK_TIMEOUT 500"))
+            for placeholders, params in in_params('key', keys):
+                probe = statement(f'opera.lock_probe.{table}.{key_column}.in.{len(params)}', f"""
+                    SELECT 1 FROM {table} WITH (UPDLOCK, ROWLOCK, NOWAIT)
+                    WHERE RTRIM({key_column}) IN ({placeholders})
+                """)
+                probe.execute(conn, params)
+            conn.rollback()
+            return False
+    except Exception as e:
+        error_str = str(e).lower()
+        if 'lock' in error_str or '1222' in str(e) or 'timeout' in error_str or 'nowait' in error_str:
+            logger.warning(f"Record locked in {table} for one of {len(key_values)} batch account(s)")
+            return True
+        return False
+
+
 def is_deadlock_error(exc: Exception) -> bool:
     """
     Check if an exception is a SQL Server deadlock (error 1205).
@@ -268,7 +377,7 @@ def is_deadlock_error(exc: Exception) -> bool:
     return '1205' in error_str or '40001' in error_str or 'deadlock' in error_str.lower()
 
 
-def execute_with_deadlock_retry(engine, operation_func, operation_name: str = "import"):
+def execute_with_deadlock_retry(engine, operation_func, operation_name: str = "import", before_commit=None):
     """
     Execute a database operation with automatic deadlock retry.
 
@@ -279,6 +388,8 @@ def execute_with_deadlock_retry(engine, operation_func, operation_name: str = "i
         engine: SQLAlchemy engine instance
         operation_func: Callable(conn) that performs all DB work within a transaction
         operation_name: Human-readable name for logging
+        before_commit: Optional Callable(conn) run after operation_func, inside the
+                       transaction; raising from it rolls the transaction back
 
     Returns:
         The return value of operation_func
@@ -293,7 +404,10 @@ def execute_with_deadlock_retry(engine, operation_func, operation_name: str = "i
         try:
             with engine.begin() as conn:
                 conn.execute(text(get_lock_timeout_sql()))
-                return operation_func(conn)
+                result = operation_func(conn)
+                if before_commit is not None:
+                    before_commit(conn)
+                return result
         except Exception as e:
             if is_deadlock_error(e) and attempt < DEADLOCK_MAX_RETRIES:
                 delay = DEADLOCK_BACKOFF_DELAYS[attempt]
@@ -381,6 +495,71 @@ class OperaSQLImport:
         self._financial_year_cache = None  # Cache for nparm financial year
         self._control_accounts = None  # Loaded on first use
         self._period_cache = {}  # Cache for date-to-period lookups
+        self._reference: Optional[ReferenceData] = None  # Set by reference_data()
+        self._nominal_deltas: Dict[Any, Dict[tuple, list]] = {}  # conn -> pending nominal changes (_run_posting)
+
+    # =========================================================================
+    # REFERENCE DATA SNAPSHOT
+    # =========================================================================
+
+    @contextmanager
+    def reference_data(self, customers=(), suppliers=()):
+        """
+        Answer reference lookups from one in-memory snapshot for the duration of a batch/request.
+
+        While active, get_control_accounts, get_period_for_date, get_vat_rate,
+        _get_nacnt_type, _get_financial_year, get_home_currency,
+        get_available_types/validate_cbtype, the nominal account checks and,
+        for the accounts listed, check_account_dormant and the customer/supplier
+        name and control account lookups do not query the database, and every
+        posting transaction checks the snapshot is still current before it
+        commits. Nested use keeps the outer snapshot.
+
+        Args:
+            customers: Customer accounts whose details and dormant flags to preload
+            suppliers: Supplier accounts whose details and dormant flags to preload
+
+        Yields:
+            The ReferenceData snapshot
+        """
+        if self._reference is not None:
+            yield self._reference
+            return
+        self._reference = load_reference_data(self.sql, customers, suppliers)
+        try:
+            yield self._reference
+        finally:
+            self._reference = None
+
+    def _ledger_account(self, account: str, ledger: str) -> Optional[Dict[str, str]]:
+        """
+        sname/pname details of an account from the active snapshot.
+
+        Returns None when no snapshot is active or the account was not
+        preloaded, and the caller queries the database as before.
+        """
+        if self._reference is None:
+            return None
+        info = self._reference.ledger_account(account, ledger)
+        return dict(info) if info is not None else None
+
+    def _ledger_control_account(self, account: str, ledger: str) -> str:
+        """Debtors/creditors control account for an account: its profile's, else the company default."""
+        info = self._ledger_account(account, ledger)
+        if info is None:
+            from sql_rag.opera_config import get_customer_control_account, get_supplier_control_account
+            if ledger == 'sales':
+                return get_customer_control_account(self.sql, account)
+            return get_supplier_control_account(self.sql, account)
+        if info['control']:
+            return info['control']
+        defaults = self.get_control_accounts()
+        return defaults.debtors_control if ledger == 'sales' else defaults.creditors_control
+
+    def _verify_reference_data(self, conn):
+        """before_commit hook: fail the transaction if the active snapshot is stale."""
+        if self._reference is not None:
+            self._reference.verify_version(conn)
 
     def get_period_for_date(self, post_date):
         """
@@ -403,6 +582,12 @@ class OperaSQLImport:
         if cache_key in self._period_cache:
             return self._period_cache[cache_key]
 
+        if self._reference is not None:
+            result = self._reference.period_for_date(post_date)
+            if result is not None:
+                self._period_cache[cache_key] = result
+                return result
+
         from sql_rag.opera_config import get_period_for_date
         result = get_period_for_date(self.sql, post_date)
         self._period_cache[cache_key] = result
@@ -415,6 +600,9 @@ class OperaSQLImport:
         Returns:
             OperaControlAccounts with debtors and creditors control codes
         """
+        if self._reference is not None and self._reference.control_accounts is not None:
+            return self._reference.control_accounts
+
         if self._control_accounts is None:
             from sql_rag.opera_config import get_control_accounts
             self._control_accounts = get_control_accounts(self.sql)
@@ -433,6 +621,9 @@ class OperaSQLImport:
                 - description: Currency description (e.g., 'Sterling')
                 - found: True if home currency was found
         """
+        if self._reference is not None and self._reference.home_currency is not None:
+            return dict(self._reference.home_currency)
+
         if hasattr(self, '_home_currency_cache') and self._home_currency_cache:
             return self._home_currency_cache
 
@@ -496,34 +687,36 @@ class OperaSQLImport:
             return self._vat_cache[cache_key]
 
         try:
-            df = self.sql.execute_query(f"""
-                SELECT
-                    tx_code, tx_desc, tx_rate1, tx_rate2,
-                    tx_rate1dy, tx_rate2dy, tx_nominal
-                FROM ztax
-                WHERE RTRIM(tx_code) = '{vat_code}'
-                AND tx_trantyp = '{vat_type}'
-                AND tx_ctrytyp = 'H'
-            """)
-
-            if df.empty:
-                # Try without transaction type filter
+            if self._reference is not None and self._reference.vat_codes is not None:
+                row = self._reference.vat_row(vat_code, vat_type)
+            else:
                 df = self.sql.execute_query(f"""
                     SELECT
                         tx_code, tx_desc, tx_rate1, tx_rate2,
                         tx_rate1dy, tx_rate2dy, tx_nominal
                     FROM ztax
                     WHERE RTRIM(tx_code) = '{vat_code}'
+                    AND tx_trantyp = '{vat_type}'
                     AND tx_ctrytyp = 'H'
                 """)
 
-            if df.empty:
+                if df.empty:
+                    # Try without transaction type filter
+                    df = self.sql.execute_query(f"""
+                        SELECT
+                            tx_code, tx_desc, tx_rate1, tx_rate2,
+                            tx_rate1dy, tx_rate2dy, tx_nominal
+                        FROM ztax
+                        WHERE RTRIM(tx_code) = '{vat_code}'
+                        AND tx_ctrytyp = 'H'
+                    """)
+                row = df.iloc[0] if not df.empty else None
+
+            if row is None:
                 # Try to get any VAT nominal from ztax as fallback
                 fallback_nominal = self._get_any_vat_nominal()
                 return {'rate': 0.0, 'nominal': fallback_nominal, 'description': 'Unknown', 'found': False}
 
-            row = df.iloc[0]
-
             # Determine which rate to use based on date
             # tx_rate2 is the updated rate, tx_rate2dy is when it became effective
             # Use tx_rate2 if transaction date >= rate change date, otherwise tx_rate1
@@ -562,6 +755,8 @@ class OperaSQLImport:
     def _get_any_vat_nominal(self) -> str:
         """Get the VAT nominal account from this company's ztax table.
         Reads the first available tx_nominal from ztax as a dynamic fallback."""
+        if self._reference is not None and self._reference.vat_codes is not None:
+            return self._reference.any_vat_nominal()
         try:
             df = self.sql.execute_query("""
                 SELECT TOP 1 RTRIM(tx_nominal) as nominal
@@ -586,6 +781,12 @@ class OperaSQLImport:
         Opera updates both nacnt and nhist whenever it posts to ntran. This ensures the
         nominal account balances and period history stay in sync with the transaction totals.
 
+        Inside a posting run by _run_posting() the change is only recorded here;
+        all changes in the transaction are summed per (account, period, year) and
+        applied just before commit by _apply_nominal_deltas(). Otherwise it is
+        applied immediately. Either way an account missing from nacnt fails the
+        posting here, at the line that uses it.
+
         Args:
             conn: Active database connection (within transaction)
             account: Nominal account code (e.g., 'BC010', 'BB020')
@@ -603,43 +804,68 @@ class OperaSQLImport:
             logger.warning(f"Invalid period {period} for nacnt update, skipping")
             return
 
+        debit, credit = (value, None) if value >= 0 else (None, value)
+
+        pending = self._nominal_deltas.get(conn)
+        if pending is not None:
+            if self._get_nacnt_type(conn, account) is None:
+                raise ValueError(f"nacnt update: account {account} not found in nacnt table")
+            if year is None:
+                year = self._get_financial_year(conn)
+            totals = pending.setdefault((account.strip(), period, year), [None, None])
+            if debit is not None:
+                totals[0] = (totals[0] or 0) + debit
+            else:
+                totals[1] = (totals[1] or 0) + credit
+            return
+
+        self._apply_nominal_delta(conn, account, period, year, debit, credit)
+
+    def _apply_nominal_delta(self, conn, account: str, period: int, year: Optional[int],
+                             debit: Optional[float], credit: Optional[float]):
+        """
+        Apply debit/credit totals for one account and period to nacnt, nhist and nsubt/ntype.
+
+        Args:
+            conn: Active database connection (within transaction)
+            account: Nominal account code
+            period: Posting period
+            year: Financial year (if None, looked up from nparm)
+            debit: Sum of debits (positive), or None if there were none
+            credit: Sum of credits (negative), or None if there were none
+        """
+        net = (debit or 0) + (credit or 0)
+
         # Period balance column: na_balc01 for period 1, na_balc02 for period 2, etc.
         period_col = f"na_balc{period:02d}"
-
-        if value >= 0:
-            # DEBIT entry - update debit columns
-            nacnt_sql = f"""
-                UPDATE nacnt WITH (ROWLOCK)
-                SET na_ptddr = ISNULL(na_ptddr, 0) + {value},
-                    na_ytddr = ISNULL(na_ytddr, 0) + {value},
-                    {period_col} = ISNULL({period_col}, 0) + {value},
-                    datemodified = GETDATE()
-                WHERE RTRIM(na_acnt) = '{account}'
-            """
-        else:
-            # CREDIT entry - update credit columns with absolute value
-            abs_value = abs(value)
-            nacnt_sql = f"""
-                UPDATE nacnt WITH (ROWLOCK)
-                SET na_ptdcr = ISNULL(na_ptdcr, 0) + {abs_value},
-                    na_ytdcr = ISNULL(na_ytdcr, 0) + {abs_value},
-                    {period_col} = ISNULL({period_col}, 0) + {value},
-                    datemodified = GETDATE()
-                WHERE RTRIM(na_acnt) = '{account}'
-            """
+        set_parts = []
+        if debit is not None:
+            set_parts += [f"na_ptddr = ISNULL(na_ptddr, 0) + {debit}",
+                          f"na_ytddr = ISNULL(na_ytddr, 0) + {debit}"]
+        if credit is not None:
+            # Credit columns hold the absolute value
+            set_parts += [f"na_ptdcr = ISNULL(na_ptdcr, 0) + {abs(credit)}",
+                          f"na_ytdcr = ISNULL(na_ytdcr, 0) + {abs(credit)}"]
+        nacnt_sql = f"""
+            UPDATE nacnt WITH (ROWLOCK)
+            SET {', '.join(set_parts)},
+                {period_col} = ISNULL({period_col}, 0) + {net},
+                datemodified = GETDATE()
+            WHERE RTRIM(na_acnt) = '{account}'
+        """
 
         try:
             result = conn.execute(text(nacnt_sql))
             if result.rowcount == 0:
                 raise ValueError(f"nacnt update affected 0 rows for account {account} - account may not exist in nacnt table")
-            logger.debug(f"Updated nacnt for {account}: value={value}, period={period}")
+            logger.debug(f"Updated nacnt for {account}: debit={debit}, credit={credit}, period={period}")
         except Exception as e:
             logger.error(f"Failed to update nacnt for {account}: {e}")
             raise  # Fail the transaction - nacnt must be updated correctly
 
         # Also update nhist (nominal history) — Opera always updates both together
         try:
-            self._update_nhist(conn, account, value, period, year)
+            self._update_nhist(conn, account, debit, credit, period, year)
         except Exception as e:
             logger.error(f"Failed to update nhist for {account}: {e}")
             raise  # Fail the transaction - nhist must be updated correctly
@@ -647,11 +873,60 @@ class OperaSQLImport:
         # Also update nsubt/ntype (nominal sub-type and type balance totals)
         # Opera keeps these aggregate balances in sync with nacnt
         try:
-            self._update_nsubt_ntype(conn, account, value)
+            self._update_nsubt_ntype(conn, account, net)
         except Exception as e:
             logger.error(f"Failed to update nsubt/ntype for {account}: {e}")
             raise  # Fail the transaction - nsubt/ntype must be updated correctly
 
+    def _apply_nominal_deltas(self, conn):
+        """
+        Apply the nominal balance changes recorded during a posting transaction.
+
+        One nacnt update and one nhist update/insert per (account, period, year),
+        in key order so concurrent postings take row locks in the same order.
+        """
+        pending = self._nominal_deltas.get(conn)
+        if not pending:
+            return
+        for (account, period, year), (debit, credit) in sorted(pending.items()):
+            self._apply_nominal_delta(
+                conn, account, period, year,
+                round(debit, 2) if debit is not None else None,
+                round(credit, 2) if credit is not None else None,
+            )
+        logger.debug(f"Applied nominal balance changes for {len(pending)} account/period(s)")
+        pending.clear()
+
+    def _run_posting(self, operation_func, operation_name: str):
+        """
+        Run a posting transaction with deadlock retry.
+
+        Nominal balance changes made through update_nacnt_balance() are summed
+        for the whole transaction and applied once per account and period at
+        the end, and the reference-data snapshot (if any) is verified, before
+        the transaction commits.
+
+        Args:
+            operation_func: Callable(conn) that performs the posting
+            operation_name: Human-readable name for logging
+
+        Returns:
+            The return value of operation_func
+        """
+        def _posting(conn):
+            self._nominal_deltas[conn] = {}
+            try:
+                result = operation_func(conn)
+                self._apply_nominal_deltas(conn)
+            finally:
+                self._nominal_deltas.pop(conn, None)
+            return result
+
+        return execute_with_deadlock_retry(
+            self.sql.engine, _posting, operation_name,
+            before_commit=self._verify_reference_data
+        )
+
     def _update_nsubt_ntype(self, conn, account: str, value: float):
         """
         Update nsubt (nominal sub-type balance) and ntype (nominal type balance)
@@ -749,6 +1024,9 @@ class OperaSQLImport:
         if account_key in self._nacnt_type_cache:
             return self._nacnt_type_cache[account_key]
 
+        if self._reference is not None and self._reference.nacnt_types is not None:
+            return self._reference.nacnt_types.get(account_key)
+
         result = conn.execute(text(f"""
             SELECT na_type, na_subt FROM nacnt WITH (NOLOCK)
             WHERE RTRIM(na_acnt) = '{account_key}'
@@ -761,6 +1039,8 @@ class OperaSQLImport:
 
     def _get_financial_year(self, conn):
         """Look up and cache the current financial year from nparm."""
+        if self._reference is not None and self._reference.financial_year is not None:
+            return self._reference.financial_year
         if self._financial_year_cache is None:
             result = conn.execute(text(
                 "SELECT np_year FROM nparm WITH (NOLOCK)"
@@ -769,7 +1049,8 @@ class OperaSQLImport:
             self._financial_year_cache = int(row[0]) if row else 2026
         return self._financial_year_cache
 
-    def _update_nhist(self, conn, account: str, value: float, period: int, year: int = None):
+    def _update_nhist(self, conn, account: str, debit: Optional[float], credit: Optional[float],
+                      period: int, year: int = None):
         """
         Update nhist (nominal history) after posting to ntran.
 
@@ -788,10 +1069,13 @@ class OperaSQLImport:
         Args:
             conn: Active database connection (within transaction)
             account: Nominal account code
-            value: Transaction value in POUNDS (positive=DR, negative=CR)
+            debit: Debit total in POUNDS (positive), or None
+            credit: Credit total in POUNDS (negative), or None
             period: Posting period
             year: Financial year (looked up from nparm if None)
         """
+        value = (debit or 0) + (credit or 0)
+
         # Look up account type/subtype
         type_info = self._get_nacnt_type(conn, account)
         if not type_info:
@@ -822,30 +1106,22 @@ class OperaSQLImport:
 
         if row_id is not None:
             # Row exists — UPDATE by id (targets exactly one row)
-            if value >= 0:
-                update_sql = f"""
-                    UPDATE nhist WITH (ROWLOCK)
-                    SET nh_bal = ISNULL(nh_bal, 0) + {value},
-                        nh_ptddr = ISNULL(nh_ptddr, 0) + {value},
-                        datemodified = GETDATE()
-                    WHERE id = {row_id}
-                """
-            else:
-                update_sql = f"""
-                    UPDATE nhist WITH (ROWLOCK)
-                    SET nh_bal = ISNULL(nh_bal, 0) + {value},
-                        nh_ptdcr = ISNULL(nh_ptdcr, 0) + {value},
-                        datemodified = GETDATE()
-                    WHERE id = {row_id}
-                """
+            set_parts = [f"nh_bal = ISNULL(nh_bal, 0) + {value}"]
+            if debit is not None:
+                set_parts.append(f"nh_ptddr = ISNULL(nh_ptddr, 0) + {debit}")
+            if credit is not None:
+                set_parts.append(f"nh_ptdcr = ISNULL(nh_ptdcr, 0) + {credit}")  # stored as negative
+            update_sql = f"""
+                UPDATE nhist WITH (ROWLOCK)
+                SET {', '.join(set_parts)},
+                    datemodified = GETDATE()
+                WHERE id = {row_id}
+            """
             conn.execute(text(update_sql))
             logger.debug(f"Updated nhist id={row_id} for {account_stripped} period {period}/{year}: value={value}")
         else:
             # No row exists for this period — INSERT new row
-            if value >= 0:
-                ptddr, ptdcr = value, 0
-            else:
-                ptddr, ptdcr = 0, value  # ptdcr stored as negative
+            ptddr, ptdcr = debit or 0, credit or 0  # ptdcr stored as negative
 
             nhist_id = self._get_next_id(conn, 'nhist')
             insert_sql = f"""
@@ -1024,13 +1300,8 @@ class OperaSQLImport:
         Returns:
             The first allocated journal number.
         """
-        result = conn.execute(text("""
-            SELECT np_nexjrnl FROM nparm WITH (UPDLOCK, ROWLOCK)
-        """))
-        next_journal = int(result.scalar() or 1)
-        conn.execute(text(f"""
-            UPDATE nparm WITH (ROWLOCK) SET np_nexjrnl = {next_journal + count}
-        """))
+        next_journal = int(_NEXT_JOURNAL_SELECT.execute(conn).scalar() or 1)
+        _NEXT_JOURNAL_UPDATE.execute(conn, {'next_journal': next_journal + count})
         logger.debug(f"Allocated journal number(s) {next_journal}..{next_journal + count - 1} from nparm")
         return next_journal
 
@@ -1051,22 +1322,36 @@ class OperaSQLImport:
         Returns:
             The first allocated id.
         """
-        result = conn.execute(text(f"""
-            SELECT nextid FROM nextid WITH (UPDLOCK, ROWLOCK)
-            WHERE RTRIM(tablename) = '{tablename}'
-        """))
-        next_val = result.scalar()
+        next_val = _NEXTID_SELECT.execute(conn, {'tablename': tablename}).scalar()
         if next_val is None:
             raise RuntimeError(f"No nextid row found for table '{tablename}'")
         next_val = int(next_val)
-        conn.execute(text(f"""
-            UPDATE nextid WITH (ROWLOCK)
-            SET nextid = {next_val + count}, datemodified = GETDATE()
-            WHERE RTRIM(tablename) = '{tablename}'
-        """))
+        _NEXTID_UPDATE.execute(conn, {'tablename': tablename, 'nextid': next_val + count})
         logger.debug(f"Allocated id(s) {next_val}..{next_val + count - 1} from nextid for {tablename}")
         return next_val
 
+    def _insert_rows(self, conn, tablename: str, rows: List[Dict[str, Any]]):
+        """
+        Insert many rows into one table with a single parameterised executemany.
+
+        All rows must have the same columns (those of the first row). Values are
+        bound, so strings must not be pre-escaped.
+
+        Args:
+            conn: Active database connection (within transaction)
+            tablename: Opera table name
+            rows: Row dicts (column -> value)
+        """
+        if not rows:
+            return
+        columns = list(rows[0])
+        insert_sql = (
+            f"INSERT INTO {tablename} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + c for c in columns)})"
+        )
+        conn.execute(text(insert_sql), rows)
+        logger.debug(f"Inserted {len(rows)} row(s) into {tablename}")
+
     def update_nbank_balance(self, conn, bank_account: str, amount_pounds: float):
         """
         Update nbank.nk_curbal (bank current balance) after posting cashbook transactions.
@@ -1228,6 +1513,47 @@ class OperaSQLImport:
             # Never break the import workflow for a verification failure
             logger.warning(f"Ledger verification query failed for {table}: {e}")
 
+    def verify_ledger_entries_after_import(self, table: str, cbtype: str, entry_numbers: List[str]):
+        """
+        Batch version of verify_ledger_after_import(): one query checks that every
+        entry number in a posted batch has its stran/ptran record.
+
+        Args:
+            table: 'stran' or 'ptran'
+            cbtype: Cashbook type code (e.g. 'R1', 'P1')
+            entry_numbers: Entry numbers posted for this type code
+        """
+        try:
+            col_map = {
+                'stran': ('st_cbtype', 'st_entry'),
+                'ptran': ('pt_cbtype', 'pt_entry'),
+            }
+            if table not in col_map or not entry_numbers:
+                return
+            type_col, entry_col = col_map[table]
+
+            found = set()
+            for placeholders, params in in_params('entry', entry_numbers):
+                result = statement(f'opera.verify_entries.{table}.{len(params)}', f"""
+                    SELECT RTRIM({entry_col}) as entry FROM {table} WITH (NOLOCK)
+                    WHERE RTRIM({type_col}) = :cbtype
+                      AND RTRIM({entry_col}) IN ({placeholders})
+                """).query(self.sql, {'cbtype': cbtype, **params})
+                if result is not None and not result.empty:
+                    found.update(result['entry'])
+            missing = [e for e in entry_numbers if e not in found]
+
+            if missing:
+                logger.critical(
+                    f"POST-COMMIT VERIFICATION FAILED: {table} missing {len(missing)} of "
+                    f"{len(entry_numbers)} record(s) for cbtype={cbtype}: {', '.join(missing[:10])}. "
+                    f"Data integrity issue — cashbook posted but {table} missing."
+                )
+            else:
+                logger.debug(f"Ledger verification OK: {table} has all {len(entry_numbers)} record(s) for cbtype={cbtype}")
+        except Exception as e:
+            logger.warning(f"Ledger verification query failed for {table}: {e}")
+
     def get_bank_accounts_for_transfer(self) -> List[Dict[str, Any]]:
         """
         Get list of bank accounts valid for transfers.
@@ -1269,6 +1595,8 @@ class OperaSQLImport:
         Returns:
             List of type dictionaries with ay_cbtype, ay_desc, ay_type, ay_entry
         """
+        if self._reference is not None and self._reference.cbtypes is not None:
+            return self._reference.available_types(category)
         try:
             query = """
                 SELECT ay_cbtype, ay_desc, ay_type, ay_entry
@@ -1317,20 +1645,25 @@ class OperaSQLImport:
                 - error: Error message if not valid
         """
         try:
-            df = self.sql.execute_query(f"""
-                SELECT ay_cbtype, ay_desc, ay_type, ay_entry
-                FROM atype WITH (NOLOCK)
-                WHERE RTRIM(ay_cbtype) = '{cbtype}'
-            """)
+            if self._reference is not None and self._reference.cbtypes is not None:
+                cached = self._reference.cbtypes.get(cbtype.strip())
+                row = {'ay_cbtype': cached['code'], 'ay_desc': cached['description'],
+                       'ay_type': cached['category'], 'ay_entry': cached['next_entry']} if cached else None
+            else:
+                df = self.sql.execute_query(f"""
+                    SELECT ay_cbtype, ay_desc, ay_type, ay_entry
+                    FROM atype WITH (NOLOCK)
+                    WHERE RTRIM(ay_cbtype) = '{cbtype}'
+                """)
+                row = df.iloc[0] if not df.empty else None
 
-            if df.empty:
+            if row is None:
                 return {
                     'valid': False,
                     'code': cbtype,
                     'error': f"Type code '{cbtype}' not found in atype table"
                 }
 
-            row = df.iloc[0]
             category = row['ay_type'].strip() if row['ay_type'] else ''
 
             if required_category and category != required_category:
@@ -1466,6 +1799,60 @@ class OperaSQLImport:
 
         return entry_to_use
 
+    def reserve_atype_entries(self, conn, cbtype: str, count: int) -> List[str]:
+        """
+        Reserve `count` consecutive-as-possible entry numbers for a type code in one go.
+
+        Batch version of increment_atype_entry(): one UPDLOCK read of atype, one
+        range query against aentry to skip numbers that are already used, and
+        one atype update.
+
+        Args:
+            conn: Active database connection (within transaction)
+            cbtype: Type code (e.g., 'P1', 'R2')
+            count: Number of entry numbers needed
+
+        Returns:
+            List of entry numbers (none of which exist in aentry)
+        """
+        row = _ATYPE_ENTRY_RESERVE.execute(conn, {'cbtype': cbtype}).fetchone()
+        if not row:
+            raise ValueError(f"Type code '{cbtype}' not found in atype")
+
+        current_entry = row[0].strip() if row[0] else f"{cbtype}{0:08d}"
+        try:
+            first_num = int(current_entry[len(cbtype):])
+        except ValueError:
+            first_num = 0
+
+        # Same 100-entry skip allowance as increment_atype_entry
+        last_num = first_num + count + 100
+        used = _AENTRY_USED_RANGE.execute(conn, {
+            'cbtype': cbtype,
+            'first_entry': f"{cbtype}{first_num:08d}",
+            'last_entry': f"{cbtype}{last_num:08d}",
+        }).fetchall()
+        used = {r[0] for r in used}
+
+        entries = []
+        num = first_num
+        while len(entries) < count:
+            if num > last_num:
+                raise ValueError(f"Unable to find {count} unused entry numbers for cbtype '{cbtype}'")
+            entry = f"{cbtype}{num:08d}"
+            if entry not in used:
+                entries.append(entry)
+            num += 1
+
+        next_entry = f"{cbtype}{num:08d}"
+        _ATYPE_ENTRY_UPDATE.execute(conn, {'next_entry': next_entry, 'cbtype': cbtype})
+
+        skipped = num - first_num - count
+        if skipped:
+            logger.warning(f"Skipped {skipped} existing entries for {cbtype}: atype counter was behind")
+        logger.debug(f"Reserved {count} atype entries for {cbtype}: {entries[0]}..{entries[-1]}, atype -> {next_entry}")
+        return entries
+
     def check_account_dormant(self, account_code: str, ledger: str = 'sales') -> Optional[str]:
         """
         Check if a customer or supplier account is dormant.
@@ -1486,8 +1873,14 @@ class OperaSQLImport:
         dormant_field = f'{prefix}_dormant'
         account_field = f'{prefix}_account'
 
+        if self._reference is not None and self._reference.covers_account(account_code, ledger):
+            name = self._reference.dormant[(ledger, account_code.strip())]
+            if name is not None:
+                return f"Account {account_code} ({name}) is dormant — cannot post transactions to dormant accounts"
+            return None
+
         try:
-            df = self.sql_connector.execute_query(f"""
+            df = self.sql.execute_query(f"""
                 SELECT {dormant_field}, RTRIM({name_field}) as name
                 FROM {table} WITH (NOLOCK)
                 WHERE {account_field} = '{account_code}'
@@ -2124,8 +2517,7 @@ class OperaSQLImport:
 
         # Get control account - check customer profile first, then fall back to default
         if sales_ledger_control is None:
-            from sql_rag.opera_config import get_customer_control_account
-            sales_ledger_control = get_customer_control_account(self.sql, customer_account)
+            sales_ledger_control = self._ledger_control_account(customer_account, 'sales')
             logger.debug(f"Using debtors control for customer {customer_account}: {sales_ledger_control}")
 
         try:
@@ -2157,15 +2549,25 @@ class OperaSQLImport:
 
             # Validate customer exists by checking sname (Sales Ledger Master) first
             # This is the authoritative source for customer names
-            sname_check = self.sql.execute_query(f"""
-                SELECT sn_name, sn_region, sn_terrtry, sn_custype FROM sname WITH (NOLOCK)
-                WHERE RTRIM(sn_account) = '{customer_account}'
-            """)
-            if not sname_check.empty:
-                customer_name = sname_check.iloc[0]['sn_name'].strip()
-                customer_region = sname_check.iloc[0]['sn_region'].strip() if sname_check.iloc[0]['sn_region'] else 'K'
-                customer_terr = sname_check.iloc[0]['sn_terrtry'].strip() if sname_check.iloc[0]['sn_terrtry'] else '001'
-                customer_type = sname_check.iloc[0]['sn_custype'].strip() if sname_check.iloc[0]['sn_custype'] else 'DD1'
+            customer = self._ledger_account(customer_account, 'sales')
+            if customer is None:
+                sname_check = self.sql.execute_query(f"""
+                    SELECT sn_name, sn_region, sn_terrtry, sn_custype FROM sname WITH (NOLOCK)
+                    WHERE RTRIM(sn_account) = '{customer_account}'
+                """)
+                if not sname_check.empty:
+                    row = sname_check.iloc[0]
+                    customer = {
+                        'name': row['sn_name'].strip(),
+                        'region': row['sn_region'].strip() if row['sn_region'] else 'K',
+                        'terr': row['sn_terrtry'].strip() if row['sn_terrtry'] else '001',
+                        'type': row['sn_custype'].strip() if row['sn_custype'] else 'DD1',
+                    }
+            if customer is not None:
+                customer_name = customer['name']
+                customer_region = customer['region']
+                customer_terr = customer['terr']
+                customer_type = customer['type']
             else:
                 # Fall back to atran history if not in sname
                 customer_check = self.sql.execute_query(f"""
@@ -2488,8 +2890,8 @@ class OperaSQLImport:
                 result_data['entry_number'] = entry_number
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_sales_receipt,
+            self._run_posting(
+                _do_sales_receipt,
                 f"sales_receipt({customer_account}, £{amount_pounds:.2f})"
             )
             entry_number = result_data['entry_number']
@@ -2540,13 +2942,561 @@ class OperaSQLImport:
                 errors=[str(e)]
             )
 
+    def _load_batch_accounts(self, kind: str, accounts: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up name, dormant flag, profile control account (and sname analysis
+        codes) for all accounts in a batch with one query, falling back to atran
+        history for accounts missing from the master table.
+
+        Returns:
+            account -> {'name', 'dormant', 'control', 'region', 'terr', 'type'}
+        """
+        if not accounts:
+            return {}
+        if kind == 'sales_receipt':
+            name, sql = 'opera.batch_accounts.sname', """
+                SELECT RTRIM(s.sn_account) as account, RTRIM(s.sn_name) as name,
+                       s.sn_dormant as dormant,
+                       RTRIM(ISNULL(s.sn_region, '')) as region,
+                       RTRIM(ISNULL(s.sn_terrtry, '')) as terr,
+                       RTRIM(ISNULL(s.sn_custype, '')) as type,
+                       RTRIM(ISNULL(sp.sc_dbtctrl, '')) as control_account
+                FROM sname s WITH (NOLOCK)
+                LEFT JOIN sprfls sp WITH (NOLOCK) ON RTRIM(s.sn_cprfl) = RTRIM(sp.sc_code)
+                WHERE RTRIM(s.sn_account) IN ({placeholders})
+            """
+        else:
+            name, sql = 'opera.batch_accounts.pname', """
+                SELECT RTRIM(p.pn_account) as account, RTRIM(p.pn_name) as name,
+                       p.pn_dormant as dormant,
+                       RTRIM(ISNULL(pp.pc_crdctrl, '')) as control_account
+                FROM pname p WITH (NOLOCK)
+                LEFT JOIN pprfls pp WITH (NOLOCK) ON RTRIM(p.pn_sprfl) = RTRIM(pp.pc_code)
+                WHERE RTRIM(p.pn_account) IN ({placeholders})
+            """
+
+        found = {}
+        for placeholders, params in in_params('account', accounts):
+            df = statement(f'{name}.{len(params)}', sql.format(placeholders=placeholders)).query(self.sql, params)
+            for row in df.to_dict('records'):
+                found[row['account']] = {
+                    'name': row['name'] or '',
+                    'dormant': bool(row['dormant']),
+                    'control': row['control_account'] or None,
+                    'region': row.get('region') or 'K',
+                    'terr': row.get('terr') or '001',
+                    'type': row.get('type') or 'DD1',
+                }
+
+        missing = [a for a in accounts if a not in found]
+        if missing:
+            # Fall back to atran history if not in the master table
+            for placeholders, params in in_params('account', missing):
+                history = statement(f'opera.batch_accounts.atran_history.{len(params)}', f"""
+                    SELECT RTRIM(at_account) as account, MAX(RTRIM(at_name)) as name
+                    FROM atran WITH (NOLOCK)
+                    WHERE RTRIM(at_account) IN ({placeholders})
+                    GROUP BY RTRIM(at_account)
+                """).query(self.sql, params)
+                for row in history.to_dict('records'):
+                    found[row['account']] = {
+                        'name': row['name'] or '', 'dormant': False, 'control': None,
+                        'region': 'K', 'terr': '001', 'type': 'DD1',
+                    }
+
+        # Profiles without a control account use the company default
+        if any(info['control'] is None for info in found.values()):
+            from sql_rag.opera_config import get_control_accounts
+            defaults = get_control_accounts(self.sql)
+            default_control = defaults.debtors_control if kind == 'sales_receipt' else defaults.creditors_control
+            for info in found.values():
+                if info['control'] is None:
+                    info['control'] = default_control
+        return found
+
+    def _import_cashbook_batch(
+        self,
+        kind: str,
+        items: List[Dict[str, Any]],
+        validate_only: bool = False
+    ) -> ImportResult:
+        """
+        Set-based posting of many sales receipts or purchase payments.
+
+        Produces exactly the rows import_sales_receipt()/import_purchase_payment()
+        would, line for line, but:
+        - Validation runs once per distinct type code, date and account (one
+          master-table query for all accounts, one lock probe for the batch)
+        - Entry numbers, journal numbers and nextid ranges are reserved once
+          for the whole batch
+        - aentry/atran/ntran/anoml/njmemo/stran|ptran rows are built in memory
+          and inserted with one executemany per table
+        - nacnt/nhist, nbank and sname/pname balances are updated once per
+          account with the batch totals
+
+        Lines that fail validation are reported and skipped. All valid lines are
+        posted in ONE transaction: if it fails, none of them are posted, and
+        each valid line gets a '<label> N: Not posted - batch rolled back' error
+        after the batch-level one.
+
+        Args:
+            kind: 'sales_receipt' or 'purchase_payment' (see CASHBOOK_BATCH_KINDS)
+            items: Line dicts as accepted by import_sales_receipts_batch /
+                   import_purchase_payments_batch
+            validate_only: If True, only validate without inserting
+
+        Returns:
+            ImportResult with per-line errors/details prefixed '<Receipt|Payment> N:'
+        """
+        if self._reference is None:
+            # One reference-data snapshot for the whole batch
+            with self.reference_data():
+                return self._import_cashbook_batch(kind, items, validate_only)
+
+        spec = CASHBOOK_BATCH_KINDS[kind]
+        label = spec['label']
+        sign = spec['sign']
+        errors = []
+        warnings = []
+
+        # =====================
+        # PARSE LINES
+        # =====================
+        lines = []
+        for idx, item in enumerate(items, 1):
+            try:
+                post_date = item['post_date']
+                if isinstance(post_date, str):
+                    post_date = datetime.strptime(post_date, '%Y-%m-%d').date()
+                comment = item.get('comment') or ''
+                lines.append({
+                    'idx': idx,
+                    'bank': str(item['bank_account']).strip(),
+                    'account': str(item[spec['account_key']]).strip(),
+                    'amount': float(item['amount']),
+                    'reference': item.get('reference', '') or '',
+                    'post_date': post_date,
+                    'input_by': item.get('input_by', 'IMPORT') or 'IMPORT',
+                    'method': item.get(spec['method_key'], spec['default_method']) or spec['default_method'],
+                    'cbtype': item.get('cbtype'),
+                    'comment': comment.replace(chr(10), ' ').replace(chr(13), ' '),
+                })
+            except Exception as e:
+                errors.append(f"{label} {idx}: {str(e)}")
+
+        def _fail(line, message):
+            errors.append(f"{label} {line['idx']}: {message}")
+            line['failed'] = True
+
+        try:
+            # =====================
+            # VALIDATE ONCE PER DISTINCT TYPE CODE / DATE / ACCOUNT
+            # =====================
+            default_cbtype = None
+            if any(line['cbtype'] is None for line in lines):
+                default_cbtype = self.get_default_cbtype(kind)
+                logger.debug(f"Using default cbtype for {kind} batch: {default_cbtype}")
+            category = TRANSACTION_TYPE_MAP[kind]['ay_type']
+            cbtype_errors = {}
+            for line in lines:
+                if line['cbtype'] is None:
+                    if default_cbtype is None:
+                        kind_name = 'Receipt' if category == AtypeCategory.RECEIPT else 'Payment'
+                        _fail(line, f"No {kind_name} type codes found in atype table")
+                        continue
+                    line['cbtype'] = default_cbtype
+                if line['cbtype'] not in cbtype_errors:
+                    type_validation = self.validate_cbtype(line['cbtype'], required_category=category)
+                    cbtype_errors[line['cbtype']] = None if type_validation['valid'] else type_validation['error']
+                if cbtype_errors[line['cbtype']]:
+                    _fail(line, cbtype_errors[line['cbtype']])
+
+            from sql_rag.opera_config import get_period_posting_decision
+            decisions = {}
+            for line in lines:
+                if line.get('failed'):
+                    continue
+                if line['post_date'] not in decisions:
+                    decisions[line['post_date']] = get_period_posting_decision(self.sql, line['post_date'], spec['ledger'])
+                decision = decisions[line['post_date']]
+                if not decision.can_post:
+                    _fail(line, decision.error_message)
+                    continue
+                line['decision'] = decision
+                line['period'], line['year'] = self.get_period_for_date(line['post_date'])
+
+            accounts = sorted({line['account'] for line in lines if not line.get('failed')})
+            account_info = self._load_batch_accounts(kind, accounts)
+            ledger_name = 'Customer' if kind == 'sales_receipt' else 'Supplier'
+            for line in lines:
+                if line.get('failed'):
+                    continue
+                info = account_info.get(line['account'])
+                if info is None:
+                    _fail(line, f"{ledger_name} account '{line['account']}' not found")
+                elif info['dormant']:
+                    _fail(line, f"Account {line['account']} ({info['name']}) is dormant — cannot post transactions to dormant accounts")
+                else:
+                    line['info'] = info
+
+            valid = [line for line in lines if not line.get('failed')]
+
+            # Advisory checks: accounts never used before (one query per table)
+            if valid:
+                banks = sorted({line['bank'] for line in valid})
+                used = set()
+                for placeholders, params in in_params('bank', banks):
+                    df = statement(f'opera.atran.used_banks.{len(params)}', f"""
+                        SELECT DISTINCT RTRIM(at_acnt) as acnt FROM atran WITH (NOLOCK)
+                        WHERE RTRIM(at_acnt) IN ({placeholders})
+                    """).query(self.sql, params)
+                    if df is not None and not df.empty:
+                        used.update(df['acnt'])
+                for bank in banks:
+                    if bank not in used:
+                        warnings.append(f"Bank account '{bank}' has not been used before - verify it's correct")
+                for warning in warnings:
+                    logger.warning(warning)
+
+            if not valid:
+                return ImportResult(
+                    success=False,
+                    records_processed=len(items),
+                    records_failed=len(items),
+                    errors=errors
+                )
+
+            if validate_only:
+                for line in valid:
+                    warnings.append(f"{label} {line['idx']}: Validation passed - no records inserted (validate_only=True)")
+                return ImportResult(
+                    success=len(valid) == len(items),
+                    records_processed=len(items),
+                    records_imported=len(valid),
+                    records_failed=len(items) - len(valid),
+                    errors=errors,
+                    warnings=warnings
+                )
+
+            # Pre-check: verify no master record is locked by another user
+            if check_records_locked(self.sql.engine, spec['master'], f"{spec['master'][:2]}_account", accounts):
+                errors.append(
+                    f"One or more {ledger_name.lower()} accounts in this batch are currently being edited "
+                    f"by another user. Please try again in a moment."
+                )
+                return ImportResult(
+                    success=False,
+                    records_processed=len(items),
+                    records_failed=len(items),
+                    errors=errors
+                )
+
+            # Pre-commit balance snapshot for concurrency verification
+            bank_deltas = {}
+            for line in valid:
+                bank_deltas[line['bank']] = bank_deltas.get(line['bank'], 0.0) + sign * line['amount']
+            pre_bank_balances = {bank: self.read_bank_balance_pence(bank) for bank in bank_deltas}
+
+            now = datetime.now()
+            now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+            date_str = now.strftime('%Y-%m-%d')
+            time_str = now.strftime('%H:%M:%S')
+
+            result_data = {}
+
+            def _do_cashbook_batch(conn):
+                n = len(valid)
+                nominal = [line for line in valid if line['decision'].post_to_nominal]
+                transfer = [line for line in valid if line['decision'].post_to_transfer_file]
+
+                # Unique IDs inside retry scope: atran/ledger shared id + 2 ntran pstids per line
+                unique_ids = OperaUniqueIdGenerator.generate_multiple(3 * n)
+
+                # Reserve all counters up front
+                entries = {}
+                for cbtype in sorted({line['cbtype'] for line in valid}):
+                    cb_lines = [line for line in valid if line['cbtype'] == cbtype]
+                    for line, entry in zip(cb_lines, self.reserve_atype_entries(conn, cbtype, len(cb_lines))):
+                        entries[line['idx']] = entry
+                first_journal = self._get_next_journal(conn, n)
+                aentry_id = self._get_next_id(conn, 'aentry', n)
+                atran_id = self._get_next_id(conn, 'atran', n)
+                ledger_id = self._get_next_id(conn, spec['ledger_table'], n)
+                ntran_id = self._get_next_id(conn, 'ntran', 2 * len(nominal)) if nominal else 0
+                anoml_id = self._get_next_id(conn, 'anoml', 2 * len(transfer)) if transfer else 0
+                njmemo_id = self._get_next_id(conn, 'njmemo', len(nominal)) if nominal else 0
+
+                aentry_rows, atran_rows, ledger_rows = [], [], []
+                ntran_rows, anoml_rows, njmemo_rows = [], [], []
+                account_totals = {}
+
+                # na_type/na_subt looked up once per distinct nominal account
+                nacnt_types = {}
+
+                def _nacnt_type(acnt, default):
+                    if acnt not in nacnt_types:
+                        nacnt_types[acnt] = self._get_nacnt_type(conn, acnt)
+                    return nacnt_types[acnt] or default
+
+                for i, line in enumerate(valid):
+                    info = line['info']
+                    decision = line['decision']
+                    bank, account, cbtype = line['bank'], line['account'], line['cbtype']
+                    entry_number = entries[line['idx']]
+                    journal = first_journal + i
+                    amount = line['amount']
+                    amount_pence = int(round(amount * 100))
+                    bank_value = sign * amount
+                    post_date = str(line['post_date'])
+                    reference = line['reference']
+                    comment = line['comment']
+                    input_by = line['input_by']
+                    name = info['name']
+                    control = info['control']
+                    atran_unique = unique_ids[3 * i]
+                    line['entry_number'] = entry_number
+                    line['journal'] = journal
+
+                    # 1. aentry (Cashbook Entry Header)
+                    aentry_rows.append({
+                        'id': aentry_id + i, 'ae_acnt': bank, 'ae_cntr': '    ', 'ae_cbtype': cbtype,
+                        'ae_entry': entry_number, 'ae_reclnum': 0,
+                        'ae_lstdate': post_date, 'ae_frstat': 0, 'ae_tostat': 0, 'ae_statln': 0,
+                        'ae_entref': reference[:20],
+                        'ae_value': sign * amount_pence, 'ae_recbal': 0, 'ae_remove': 0, 'ae_tmpstat': 0,
+                        'ae_complet': 1,
+                        'ae_postgrp': 0, 'sq_crdate': date_str, 'sq_crtime': time_str[:8],
+                        'sq_cruser': input_by[:8], 'ae_comment': comment[:40],
+                        'ae_payid': 0, 'ae_batchid': 0, 'ae_brwptr': '  ',
+                        'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                    })
+
+                    # 2. atran (Cashbook Transaction)
+                    atran_rows.append({
+                        'id': atran_id + i, 'at_acnt': bank, 'at_cntr': '    ', 'at_cbtype': cbtype,
+                        'at_entry': entry_number, 'at_inputby': input_by[:8],
+                        'at_type': TRANSACTION_TYPE_MAP[kind]['at_type'], 'at_pstdate': post_date,
+                        'at_sysdate': post_date, 'at_tperiod': 1, 'at_value': sign * amount_pence,
+                        'at_disc': 0, 'at_fcurr': '   ', 'at_fcexch': 1.0, 'at_fcmult': 0, 'at_fcdec': 2,
+                        'at_account': account, 'at_name': name[:35], 'at_comment': comment[:50],
+                        'at_payee': '        ', 'at_payname': '',
+                        'at_sort': '        ', 'at_number': '         ', 'at_remove': 0, 'at_chqprn': 0,
+                        'at_chqlst': 0,
+                        'at_bacprn': 0, 'at_ccdprn': 0, 'at_ccdno': '', 'at_payslp': 0, 'at_pysprn': 0,
+                        'at_cash': 0, 'at_remit': 0, 'at_unique': atran_unique, 'at_postgrp': 0,
+                        'at_ccauth': '0       ',
+                        'at_refer': reference[:20], 'at_srcco': 'I', 'at_ecb': 0, 'at_ecbtype': ' ',
+                        'at_atpycd': '      ',
+                        'at_bsref': '', 'at_bsname': '', 'at_vattycd': '  ', 'at_project': '        ',
+                        'at_job': '        ',
+                        'at_bic': '', 'at_iban': '', 'at_memo': '',
+                        'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                    })
+
+                    # 3. Nominal postings - CONDITIONAL based on period posting decision
+                    if decision.post_to_nominal:
+                        ntran_comment = f"{(comment or reference)[:50]:<50}"
+                        if kind == 'sales_receipt':
+                            ntran_trnref = f"{name[:30]:<30}BACS       (RT)     "
+                        else:
+                            ntran_trnref = f"{name[:30]:<30}{line['method']:<10}(RT)     "
+                        bank_type = _nacnt_type(bank, ('B ', 'BC'))
+                        control_type = _nacnt_type(control, spec['control_type'])
+                        for acnt, acnt_type, value, pstid in (
+                            (bank, bank_type, bank_value, unique_ids[3 * i + 1]),
+                            (control, control_type, -bank_value, unique_ids[3 * i + 2]),
+                        ):
+                            ntran_rows.append({
+                                'id': ntran_id + len(ntran_rows), 'nt_acnt': acnt, 'nt_cntr': '    ',
+                                'nt_type': acnt_type[0], 'nt_subt': acnt_type[1], 'nt_jrnl': journal,
+                                'nt_ref': '', 'nt_inp': input_by[:10], 'nt_trtype': 'A',
+                                'nt_cmnt': ntran_comment, 'nt_trnref': ntran_trnref,
+                                'nt_entr': post_date, 'nt_value': value, 'nt_year': line['year'],
+                                'nt_period': line['period'], 'nt_rvrse': 0,
+                                'nt_prevyr': 0, 'nt_consol': 0, 'nt_fcurr': '   ', 'nt_fvalue': 0, 'nt_fcrate': 0,
+                                'nt_fcmult': 0, 'nt_fcdec': 0, 'nt_srcco': 'I', 'nt_cdesc': '',
+                                'nt_project': '        ',
+                                'nt_job': '        ', 'nt_posttyp': spec['source'], 'nt_pstgrp': 0,
+                                'nt_pstid': pstid, 'nt_srcnlid': 0,
+                                'nt_recurr': 0, 'nt_perpost': 0, 'nt_rectify': 0, 'nt_recjrnl': 0,
+                                'nt_vatanal': 0,
+                                'nt_distrib': 0, 'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                            })
+                            # Summed per account/period and applied before commit (_run_posting)
+                            self.update_nacnt_balance(conn, acnt, value, line['period'], line['year'])
+
+                        njmemo_rows.append({
+                            'id': njmemo_id + len(njmemo_rows), 'nj_journal': journal,
+                            'nj_memo': f"{chr(255)}<<JOURNAL_DATA_ONLY>>{chr(255)}", 'nj_image': '',
+                            'nj_txtrep': 'Cashbook Ledger Transfer (RT)', 'nj_binrep': 0,
+                            'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                        })
+
+                    # 4. Transfer file (anoml - both bank and control sides)
+                    if decision.post_to_transfer_file:
+                        ax_comment = f"{name[:30]:<30}{line['method']}"[:40]
+                        jrnl_num = journal if decision.post_to_nominal else 0
+                        for acnt, value in ((bank, bank_value), (control, -bank_value)):
+                            anoml_rows.append({
+                                'id': anoml_id + len(anoml_rows), 'ax_nacnt': acnt, 'ax_ncntr': '    ',
+                                'ax_source': spec['source'], 'ax_date': post_date, 'ax_value': value,
+                                'ax_tref': reference[:20],
+                                'ax_comment': ax_comment, 'ax_done': decision.transfer_file_done_flag,
+                                'ax_fcurr': '   ', 'ax_fvalue': 0, 'ax_fcrate': 0, 'ax_fcmult': 0, 'ax_fcdec': 0,
+                                'ax_srcco': 'I', 'ax_unique': atran_unique, 'ax_project': '        ',
+                                'ax_job': '        ', 'ax_jrnl': jrnl_num, 'ax_nlpdate': post_date,
+                                'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                            })
+
+                    # 5. stran / ptran (ledger transaction - negative, reduces the balance)
+                    if kind == 'sales_receipt':
+                        ledger_rows.append({
+                            'id': ledger_id + i, 'st_account': account, 'st_trdate': post_date,
+                            'st_trref': reference[:20], 'st_custref': line['method'][:20], 'st_trtype': 'R',
+                            'st_trvalue': -amount, 'st_vatval': 0, 'st_trbal': -amount, 'st_paid': ' ',
+                            'st_crdate': post_date,
+                            'st_advance': 'N', 'st_memo': f"Payment received - {reference[:50]}"[:200],
+                            'st_payflag': 0, 'st_set1day': 0, 'st_set1': 0,
+                            'st_set2day': 0, 'st_set2': 0, 'st_dueday': post_date, 'st_fcurr': '   ',
+                            'st_fcrate': 0,
+                            'st_fcdec': 0, 'st_fcval': 0, 'st_fcbal': 0, 'st_fcmult': 0, 'st_dispute': 0,
+                            'st_edi': 0, 'st_editx': 0, 'st_edivn': 0, 'st_txtrep': '', 'st_binrep': 0,
+                            'st_advallc': 0, 'st_cbtype': cbtype, 'st_entry': entry_number,
+                            'st_unique': atran_unique, 'st_region': info['region'][:3],
+                            'st_terr': info['terr'][:3], 'st_type': info['type'][:3], 'st_fadval': 0,
+                            'st_delacc': account, 'st_euro': 0,
+                            'st_payadvl': 0, 'st_eurind': ' ', 'st_origcur': '   ', 'st_fullamt': 0,
+                            'st_fullcb': '  ',
+                            'st_fullnar': '          ', 'st_cash': 0, 'st_rcode': '    ',
+                            'st_ruser': '        ', 'st_revchrg': 0,
+                            'st_nlpdate': post_date, 'st_adjsv': 0, 'st_fcvat': 0, 'st_taxpoin': post_date,
+                            'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                        })
+                    else:
+                        ledger_rows.append({
+                            'id': ledger_id + i, 'pt_account': account, 'pt_trdate': post_date,
+                            'pt_trref': reference[:20], 'pt_supref': line['method'][:20], 'pt_trtype': 'P',
+                            'pt_trvalue': -amount, 'pt_vatval': 0, 'pt_trbal': -amount, 'pt_paid': ' ',
+                            'pt_crdate': post_date,
+                            'pt_advance': 'N', 'pt_payflag': 0, 'pt_set1day': 0, 'pt_set1': 0,
+                            'pt_set2day': 0,
+                            'pt_set2': 0, 'pt_held': ' ', 'pt_fcurr': '   ', 'pt_fcrate': 0, 'pt_fcdec': 0,
+                            'pt_fcval': 0, 'pt_fcbal': 0, 'pt_adval': 0, 'pt_fadval': 0, 'pt_fcmult': 0,
+                            'pt_cbtype': cbtype, 'pt_entry': entry_number, 'pt_unique': atran_unique,
+                            'pt_suptype': '   ', 'pt_euro': 0,
+                            'pt_payadvl': 0, 'pt_origcur': '   ', 'pt_eurind': ' ', 'pt_revchrg': 0,
+                            'pt_nlpdate': post_date,
+                            'pt_adjsv': 0, 'pt_vatset1': 0, 'pt_vatset2': 0, 'pt_pyroute': 0, 'pt_fcvat': 0,
+                            'datecreated': now_str, 'datemodified': now_str, 'state': 1,
+                        })
+
+                    totals = account_totals.setdefault(account, [0.0, 0])
+                    totals[0] += amount
+                    totals[1] += 1
+
+                # One executemany per table
+                self._insert_rows(conn, 'aentry', aentry_rows)
+                self._insert_rows(conn, 'atran', atran_rows)
+                self._insert_rows(conn, 'ntran', ntran_rows)
+                self._insert_rows(conn, 'njmemo', njmemo_rows)
+                self._insert_rows(conn, 'anoml', anoml_rows)
+                self._insert_rows(conn, spec['ledger_table'], ledger_rows)
+
+                # Aggregated balance updates, in key order so concurrent batches lock alike
+                for bank in sorted(bank_deltas):
+                    self.update_nbank_balance(conn, bank, round(bank_deltas[bank], 2))
+                prefix = spec['master'][:2]
+                master_update = statement(f"opera.batch.{spec['master']}.balance", f"""
+                    UPDATE {spec['master']} WITH (ROWLOCK)
+                    SET {prefix}_currbal = {prefix}_currbal - :total,
+                        {prefix}_nextpay = {prefix}_nextpay + :count,
+                        datemodified = :now
+                    WHERE RTRIM({prefix}_account) = :account
+                """)
+                for account in sorted(account_totals):
+                    total, count = account_totals[account]
+                    master_update.execute(conn, {
+                        'total': round(total, 2), 'count': count, 'now': now_str, 'account': account,
+                    })
+
+                result_data['posted'] = True
+
+            total_amount = sum(line['amount'] for line in valid)
+            try:
+                self._run_posting(
+                    _do_cashbook_batch,
+                    f"{kind}_batch({len(valid)} lines, £{total_amount:.2f})"
+                )
+            except Exception as e:
+                logger.error(f"Failed to import {kind} batch: {e}")
+                errors.append(f"Batch posting failed - none of the {len(valid)} valid line(s) were posted: {e}")
+                errors.extend(f"{label} {line['idx']}: Not posted - batch rolled back" for line in valid)
+                return ImportResult(
+                    success=False,
+                    records_processed=len(items),
+                    records_failed=len(items),
+                    errors=errors
+                )
+
+            # Post-commit verification (advisory / auto-correcting), once per bank, period and type code
+            for bank, delta in bank_deltas.items():
+                self.verify_balance_after_import(bank, delta, pre_bank_balances[bank])
+            nominal_accounts = {}
+            for line in valid:
+                if line['decision'].post_to_nominal:
+                    nominal_accounts.setdefault((line['period'], line['year']), set()).update(
+                        [line['bank'], line['info']['control']])
+            for (period, year), accts in nominal_accounts.items():
+                self.verify_nominal_balances(sorted(accts), period, year)
+            for cbtype in sorted({line['cbtype'] for line in valid}):
+                self.verify_ledger_entries_after_import(
+                    spec['ledger_table'], cbtype,
+                    [line['entry_number'] for line in valid if line['cbtype'] == cbtype])
+
+            for line in valid:
+                decision = line['decision']
+                tables_updated = ["aentry", "atran", spec['ledger_table'], spec['master']]
+                if decision.post_to_nominal:
+                    tables_updated.insert(2, "ntran (2)")
+                if decision.post_to_transfer_file:
+                    tables_updated.append("anoml (2)")
+                posting_mode = "Current period - posted to nominal" if decision.post_to_nominal else "Different period - transfer file only (pending NL post)"
+                warnings.extend(f"{label} {line['idx']}: {w}" for w in (
+                    f"Entry number: {line['entry_number']}",
+                    f"Journal number: {line['journal']}",
+                    f"Amount: £{line['amount']:.2f}",
+                    f"Posting mode: {posting_mode}",
+                    f"Tables updated: {', '.join(tables_updated)}",
+                ))
+
+            logger.info(f"Successfully imported {len(valid)} {kind} line(s) in one batch for £{total_amount:.2f}")
+
+            return ImportResult(
+                success=len(valid) == len(items),
+                records_processed=len(items),
+                records_imported=len(valid),
+                records_failed=len(items) - len(valid),
+                errors=errors,
+                warnings=warnings
+            )
+
+        except Exception as e:
+            logger.error(f"Failed to validate {kind} batch: {e}")
+            errors.append(str(e))
+            return ImportResult(
+                success=False,
+                records_processed=len(items),
+                records_failed=len(items),
+                errors=errors
+            )
+
     def import_sales_receipts_batch(
         self,
         receipts: List[Dict[str, Any]],
         validate_only: bool = False
     ) -> ImportResult:
         """
-        Import multiple sales receipts.
+        Import multiple sales receipts in one set-based posting.
 
         Each receipt dictionary should contain:
             - bank_account: Bank account code (e.g., 'BC010')
@@ -2556,50 +3506,16 @@ class OperaSQLImport:
             - post_date: Posting date (YYYY-MM-DD string or date object)
             - input_by: (optional) User code, defaults to 'IMPORT'
             - payment_method: (optional) Payment method, defaults to 'BACS'
+            - cbtype: (optional) Receipt type code, defaults to the first Receipt type
+            - comment: (optional) Cashbook comment
+
+        Invalid receipts are reported and skipped; the rest are posted together
+        in a single transaction (see _import_cashbook_batch).
 
         Returns:
             ImportResult with combined details
         """
-        total_processed = 0
-        total_imported = 0
-        total_failed = 0
-        all_errors = []
-        all_warnings = []
-
-        for idx, receipt in enumerate(receipts, 1):
-            try:
-                result = self.import_sales_receipt(
-                    bank_account=receipt['bank_account'],
-                    customer_account=receipt['customer_account'],
-                    amount_pounds=float(receipt['amount']),
-                    reference=receipt.get('reference', ''),
-                    post_date=receipt['post_date'],
-                    input_by=receipt.get('input_by', 'IMPORT'),
-                    payment_method=receipt.get('payment_method', 'BACS'),
-                    validate_only=validate_only
-                )
-
-                total_processed += 1
-                if result.success:
-                    total_imported += 1
-                    all_warnings.extend([f"Receipt {idx}: {w}" for w in result.warnings])
-                else:
-                    total_failed += 1
-                    all_errors.extend([f"Receipt {idx}: {e}" for e in result.errors])
-
-            except Exception as e:
-                total_processed += 1
-                total_failed += 1
-                all_errors.append(f"Receipt {idx}: {str(e)}")
-
-        return ImportResult(
-            success=total_failed == 0,
-            records_processed=total_processed,
-            records_imported=total_imported,
-            records_failed=total_failed,
-            errors=all_errors,
-            warnings=all_warnings
-        )
+        return self._import_cashbook_batch('sales_receipt', receipts, validate_only)
 
 
     # =========================================================================
@@ -2677,8 +3593,7 @@ class OperaSQLImport:
         at_type = CashbookTransactionType.SALES_REFUND  # 3.0
 
         if sales_ledger_control is None:
-            from sql_rag.opera_config import get_customer_control_account
-            sales_ledger_control = get_customer_control_account(self.sql, customer_account)
+            sales_ledger_control = self._ledger_control_account(customer_account, 'sales')
             logger.debug(f"Using debtors control for customer {customer_account}: {sales_ledger_control}")
 
         try:
@@ -2705,15 +3620,25 @@ class OperaSQLImport:
                 warnings.append(f"Bank account '{bank_account}' has not been used before - verify it's correct")
 
             # Validate customer exists
-            sname_check = self.sql.execute_query(f"""
-                SELECT sn_name, sn_region, sn_terrtry, sn_custype FROM sname WITH (NOLOCK)
-                WHERE RTRIM(sn_account) = '{customer_account}'
-            """)
-            if not sname_check.empty:
-                customer_name = sname_check.iloc[0]['sn_name'].strip()
-                customer_region = sname_check.iloc[0]['sn_region'].strip() if sname_check.iloc[0]['sn_region'] else 'K'
-                customer_terr = sname_check.iloc[0]['sn_terrtry'].strip() if sname_check.iloc[0]['sn_terrtry'] else '001'
-                customer_type = sname_check.iloc[0]['sn_custype'].strip() if sname_check.iloc[0]['sn_custype'] else 'DD1'
+            customer = self._ledger_account(customer_account, 'sales')
+            if customer is None:
+                sname_check = self.sql.execute_query(f"""
+                    SELECT sn_name, sn_region, sn_terrtry, sn_custype FROM sname WITH (NOLOCK)
+                    WHERE RTRIM(sn_account) = '{customer_account}'
+                """)
+                if not sname_check.empty:
+                    row = sname_check.iloc[0]
+                    customer = {
+                        'name': row['sn_name'].strip(),
+                        'region': row['sn_region'].strip() if row['sn_region'] else 'K',
+                        'terr': row['sn_terrtry'].strip() if row['sn_terrtry'] else '001',
+                        'type': row['sn_custype'].strip() if row['sn_custype'] else 'DD1',
+                    }
+            if customer is not None:
+                customer_name = customer['name']
+                customer_region = customer['region']
+                customer_terr = customer['terr']
+                customer_type = customer['type']
             else:
                 customer_check = self.sql.execute_query(f"""
                     SELECT TOP 1 at_account, at_name FROM atran WITH (NOLOCK)
@@ -2997,8 +3922,8 @@ class OperaSQLImport:
                 result_data['entry_number'] = entry_number
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_sales_refund,
+            self._run_posting(
+                _do_sales_refund,
                 f"sales_refund({customer_account}, £{amount_pounds:.2f})"
             )
             entry_number = result_data['entry_number']
@@ -3131,8 +4056,7 @@ class OperaSQLImport:
 
         # Get control account - check supplier profile first, then fall back to default
         if creditors_control is None:
-            from sql_rag.opera_config import get_supplier_control_account
-            creditors_control = get_supplier_control_account(self.sql, supplier_account)
+            creditors_control = self._ledger_control_account(supplier_account, 'purchase')
             logger.debug(f"Using creditors control for supplier {supplier_account}: {creditors_control}")
 
         try:
@@ -3163,13 +4087,16 @@ class OperaSQLImport:
                 warnings.append(f"Bank account '{bank_account}' has not been used before - verify it's correct")
 
             # Validate supplier exists by checking pname (Purchase Ledger Master) first
-            pname_check = self.sql.execute_query(f"""
-                SELECT pn_name FROM pname WITH (NOLOCK)
-                WHERE RTRIM(pn_account) = '{supplier_account}'
-            """)
-            if not pname_check.empty:
-                supplier_name = pname_check.iloc[0]['pn_name'].strip()
+            supplier = self._ledger_account(supplier_account, 'purchase')
+            if supplier is not None:
+                supplier_name = supplier['name']
             else:
+                pname_check = self.sql.execute_query(f"""
+                    SELECT pn_name FROM pname WITH (NOLOCK)
+                    WHERE RTRIM(pn_account) = '{supplier_account}'
+                """)
+                supplier_name = pname_check.iloc[0]['pn_name'].strip() if not pname_check.empty else None
+            if supplier_name is None:
                 # Fall back to atran history if not in pname
                 supplier_check = self.sql.execute_query(f"""
                     SELECT TOP 1 at_account, at_name FROM atran WITH (NOLOCK)
@@ -3463,8 +4390,8 @@ class OperaSQLImport:
                 result_data['entry_number'] = entry_number
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_purchase_payment,
+            self._run_posting(
+                _do_purchase_payment,
                 f"purchase_payment({supplier_account}, £{amount_pounds:.2f})"
             )
             entry_number = result_data['entry_number']
@@ -3636,33 +4563,42 @@ class OperaSQLImport:
                 bank_name = bank_check.iloc[0]['nk_desc'].strip() if bank_check.iloc[0]['nk_desc'] else bank_account
 
             # Validate nominal account exists and read project/department flags
-            nominal_check = self.sql.execute_query(f"""
-                SELECT TOP 1 na_acnt, na_desc,
-                       ISNULL(na_allwprj, 0) as na_allwprj,
-                       ISNULL(na_allwjob, 0) as na_allwjob,
-                       RTRIM(ISNULL(na_project, '')) as na_project,
-                       RTRIM(ISNULL(na_job, '')) as na_job
-                FROM nacnt WITH (NOLOCK)
-                WHERE RTRIM(na_acnt) = '{nominal_account}'
-            """)
-            if nominal_check.empty:
+            nominal = None
+            if self._reference is not None and self._reference.nominal_accounts is not None:
+                nominal = self._reference.nominal_account(nominal_account)
+            else:
+                nominal_check = self.sql.execute_query(f"""
+                    SELECT TOP 1 na_acnt, na_desc,
+                           ISNULL(na_allwprj, 0) as na_allwprj,
+                           ISNULL(na_allwjob, 0) as na_allwjob,
+                           RTRIM(ISNULL(na_project, '')) as na_project,
+                           RTRIM(ISNULL(na_job, '')) as na_job
+                    FROM nacnt WITH (NOLOCK)
+                    WHERE RTRIM(na_acnt) = '{nominal_account}'
+                """)
+                if not nominal_check.empty:
+                    row = nominal_check.iloc[0]
+                    nominal = {
+                        'description': (row['na_desc'] or '').strip(),
+                        'allow_project': int(row.get('na_allwprj', 0) or 0),
+                        'allow_department': int(row.get('na_allwjob', 0) or 0),
+                        'project': (row.get('na_project', '') or '').strip(),
+                        'department': (row.get('na_job', '') or '').strip(),
+                    }
+            if nominal is None:
                 errors.append(f"Nominal account '{nominal_account}' not found in nacnt")
             else:
-                nominal_name = nominal_check.iloc[0]['na_desc'].strip() if nominal_check.iloc[0]['na_desc'] else nominal_account
+                nominal_name = nominal['description'] or nominal_account
 
                 # Project/Department validation
-                na_allwprj = int(nominal_check.iloc[0].get('na_allwprj', 0) or 0)
-                na_allwjob = int(nominal_check.iloc[0].get('na_allwjob', 0) or 0)
+                na_allwprj = nominal['allow_project']
+                na_allwjob = nominal['allow_department']
 
                 # Apply defaults if no code provided — Opera values: 1=Do Not Use, 2=Optional, 3=Mandatory
-                if not project_code and na_allwprj > 1:
-                    default_proj = (nominal_check.iloc[0].get('na_project', '') or '').strip()
-                    if default_proj:
-                        project_code = default_proj
-                if not department_code and na_allwjob > 1:
-                    default_job = (nominal_check.iloc[0].get('na_job', '') or '').strip()
-                    if default_job:
-                        department_code = default_job
+                if not project_code and na_allwprj > 1 and nominal['project']:
+                    project_code = nominal['project']
+                if not department_code and na_allwjob > 1 and nominal['department']:
+                    department_code = nominal['department']
 
                 # Mandatory checks — Opera values: 1=Do Not Use, 2=Optional, 3=Mandatory
                 if na_allwprj == 3 and not project_code:
@@ -4140,8 +5076,8 @@ class OperaSQLImport:
 
                 result_data['entry_number'] = entry_number
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_nominal_entry,
+            self._run_posting(
+                _do_nominal_entry,
                 f"nominal_entry({bank_account}, {nominal_account}, £{amount_pounds:.2f})"
             )
             entry_number = result_data['entry_number']
@@ -4374,8 +5310,8 @@ class OperaSQLImport:
                 """
                 conn.execute(text(cname_sql))
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_stock_adjustment,
+            self._run_posting(
+                _do_stock_adjustment,
                 f"stock_adjustment({stock_ref}, {warehouse}, {quantity:+.2f})"
             )
 
@@ -4612,8 +5548,8 @@ class OperaSQLImport:
 
                 # Note: cname totals not updated - transfer doesn't change overall company stock
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_stock_transfer,
+            self._run_posting(
+                _do_stock_transfer,
                 f"stock_transfer({stock_ref}, {from_warehouse}->{to_warehouse}, {quantity:.2f})"
             )
 
@@ -4647,7 +5583,7 @@ class OperaSQLImport:
         validate_only: bool = False
     ) -> ImportResult:
         """
-        Import multiple purchase payments.
+        Import multiple purchase payments in one set-based posting.
 
         Each payment dictionary should contain:
             - bank_account: Bank account code (e.g., 'BC010')
@@ -4656,46 +5592,14 @@ class OperaSQLImport:
             - reference: Your reference
             - post_date: Posting date (YYYY-MM-DD string or date object)
             - input_by: (optional) User code, defaults to 'IMPORT'
-        """
-        total_processed = 0
-        total_imported = 0
-        total_failed = 0
-        all_errors = []
-        all_warnings = []
-
-        for idx, payment in enumerate(payments, 1):
-            try:
-                result = self.import_purchase_payment(
-                    bank_account=payment['bank_account'],
-                    supplier_account=payment['supplier_account'],
-                    amount_pounds=float(payment['amount']),
-                    reference=payment.get('reference', ''),
-                    post_date=payment['post_date'],
-                    input_by=payment.get('input_by', 'IMPORT'),
-                    validate_only=validate_only
-                )
-
-                total_processed += 1
-                if result.success:
-                    total_imported += 1
-                    all_warnings.extend([f"Payment {idx}: {w}" for w in result.warnings])
-                else:
-                    total_failed += 1
-                    all_errors.extend([f"Payment {idx}: {e}" for e in result.errors])
-
-            except Exception as e:
-                total_processed += 1
-                total_failed += 1
-                all_errors.append(f"Payment {idx}: {str(e)}")
+            - payment_type: (optional) Payment type, defaults to 'Direct Cr'
+            - cbtype: (optional) Payment type code, defaults to the first Payment type
+            - comment: (optional) Cashbook comment
 
-        return ImportResult(
-            success=total_failed == 0,
-            records_processed=total_processed,
-            records_imported=total_imported,
-            records_failed=total_failed,
-            errors=all_errors,
-            warnings=all_warnings
-        )
+        Invalid payments are reported and skipped; the rest are posted together
+        in a single transaction (see _import_cashbook_batch).
+        """
+        return self._import_cashbook_batch('purchase_payment', payments, validate_only)
 
     # =========================================================================
     # PURCHASE REFUND IMPORT (at_type=6 - Money coming IN from supplier)
@@ -4772,8 +5676,7 @@ class OperaSQLImport:
         at_type = CashbookTransactionType.PURCHASE_REFUND  # 6.0
 
         if creditors_control is None:
-            from sql_rag.opera_config import get_supplier_control_account
-            creditors_control = get_supplier_control_account(self.sql, supplier_account)
+            creditors_control = self._ledger_control_account(supplier_account, 'purchase')
             logger.debug(f"Using creditors control for supplier {supplier_account}: {creditors_control}")
 
         try:
@@ -4800,13 +5703,16 @@ class OperaSQLImport:
                 warnings.append(f"Bank account '{bank_account}' has not been used before - verify it's correct")
 
             # Validate supplier exists
-            pname_check = self.sql.execute_query(f"""
-                SELECT pn_name FROM pname WITH (NOLOCK)
-                WHERE RTRIM(pn_account) = '{supplier_account}'
-            """)
-            if not pname_check.empty:
-                supplier_name = pname_check.iloc[0]['pn_name'].strip()
+            supplier = self._ledger_account(supplier_account, 'purchase')
+            if supplier is not None:
+                supplier_name = supplier['name']
             else:
+                pname_check = self.sql.execute_query(f"""
+                    SELECT pn_name FROM pname WITH (NOLOCK)
+                    WHERE RTRIM(pn_account) = '{supplier_account}'
+                """)
+                supplier_name = pname_check.iloc[0]['pn_name'].strip() if not pname_check.empty else None
+            if supplier_name is None:
                 supplier_check = self.sql.execute_query(f"""
                     SELECT TOP 1 at_account, at_name FROM atran WITH (NOLOCK)
                     WHERE RTRIM(at_account) = '{supplier_account}'
@@ -5078,8 +5984,8 @@ class OperaSQLImport:
                 result_data['entry_number'] = entry_number
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_purchase_refund,
+            self._run_posting(
+                _do_purchase_refund,
                 f"purchase_refund({supplier_account}, £{amount_pounds:.2f})"
             )
             entry_number = result_data['entry_number']
@@ -5186,8 +6092,7 @@ class OperaSQLImport:
 
         # Get control account - check customer profile first, then fall back to default
         if debtors_control is None:
-            from sql_rag.opera_config import get_customer_control_account
-            debtors_control = get_customer_control_account(self.sql, customer_account)
+            debtors_control = self._ledger_control_account(customer_account, 'sales')
             logger.debug(f"Using debtors control for customer {customer_account}: {debtors_control}")
 
         try:
@@ -5475,8 +6380,8 @@ class OperaSQLImport:
 
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_sales_invoice,
+            self._run_posting(
+                _do_sales_invoice,
                 f"sales_invoice({customer_account}, {invoice_number}, £{gross_amount:.2f})"
             )
             next_journal = result_data['next_journal']
@@ -5554,8 +6459,7 @@ class OperaSQLImport:
 
         # Get control account - check supplier profile first, then fall back to default
         if purchase_ledger_control is None:
-            from sql_rag.opera_config import get_supplier_control_account
-            purchase_ledger_control = get_supplier_control_account(self.sql, supplier_account)
+            purchase_ledger_control = self._ledger_control_account(supplier_account, 'purchase')
             logger.debug(f"Using creditors control for supplier {supplier_account}: {purchase_ledger_control}")
 
         # Look up VAT nominal account from ztax if not explicitly provided
@@ -5587,13 +6491,16 @@ class OperaSQLImport:
             # =====================
 
             # Validate supplier exists by checking pname (Purchase Ledger Master) first
-            pname_check = self.sql.execute_query(f"""
-                SELECT pn_name FROM pname WITH (NOLOCK)
-                WHERE RTRIM(pn_account) = '{supplier_account}'
-            """)
-            if not pname_check.empty:
-                supplier_name = pname_check.iloc[0]['pn_name'].strip()
+            supplier = self._ledger_account(supplier_account, 'purchase')
+            if supplier is not None:
+                supplier_name = supplier['name']
             else:
+                pname_check = self.sql.execute_query(f"""
+                    SELECT pn_name FROM pname WITH (NOLOCK)
+                    WHERE RTRIM(pn_account) = '{supplier_account}'
+                """)
+                supplier_name = pname_check.iloc[0]['pn_name'].strip() if not pname_check.empty else None
+            if supplier_name is None:
                 # Fall back to atran history if not in pname
                 supplier_check = self.sql.execute_query(f"""
                     SELECT TOP 1 at_account, at_name FROM atran WITH (NOLOCK)
@@ -5783,8 +6690,8 @@ class OperaSQLImport:
 
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_purchase_invoice_posting,
+            self._run_posting(
+                _do_purchase_invoice_posting,
                 f"purchase_invoice_posting({supplier_account}, {invoice_number}, £{gross_amount:.2f})"
             )
             next_journal = result_data['next_journal']
@@ -5971,8 +6878,8 @@ class OperaSQLImport:
 
                 result_data['next_journal'] = next_journal
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_nominal_journal,
+            self._run_posting(
+                _do_nominal_journal,
                 f"nominal_journal({reference}, {len(lines)} lines)"
             )
             next_journal = result_data['next_journal']
@@ -6075,6 +6982,20 @@ class OperaSQLImport:
                 errors=["No payments provided"]
             )
 
+        if self._reference is None:
+            # One reference-data snapshot for the whole batch
+            customers = [p.get('customer_account', '') for p in payments]
+            with self.reference_data(customers=customers):
+                return self.import_gocardless_batch(
+                    bank_account, payments, post_date, reference=reference,
+                    gocardless_fees=gocardless_fees, vat_on_fees=vat_on_fees,
+                    fees_nominal_account=fees_nominal_account, fees_vat_code=fees_vat_code,
+                    fees_payment_type=fees_payment_type, complete_batch=complete_batch,
+                    input_by=input_by, cbtype=cbtype, validate_only=validate_only,
+                    currency=currency, auto_allocate=auto_allocate,
+                    destination_bank=destination_bank, transfer_cbtype=transfer_cbtype
+                )
+
         # Validate currency matches home currency
         if currency:
             home_currency = self.get_home_currency()
@@ -6146,10 +7067,13 @@ class OperaSQLImport:
             )
 
         # Look up cbtype description for ax_comment (e.g., "Cheque", "BACS", "GoCardless")
-        cbtype_desc_result = self.sql.execute_query(f"""
-            SELECT ay_desc FROM atype WITH (NOLOCK) WHERE RTRIM(ay_cbtype) = '{cbtype}'
-        """)
-        cbtype_desc = cbtype_desc_result.iloc[0]['ay_desc'].strip() if cbtype_desc_result is not None and len(cbtype_desc_result) > 0 else 'Cheque'
+        if self._reference.cbtypes is not None:
+            cbtype_desc = (self._reference.cbtypes.get(cbtype.strip()) or {}).get('description') or 'Cheque'
+        else:
+            cbtype_desc_result = self.sql.execute_query(f"""
+                SELECT ay_desc FROM atype WITH (NOLOCK) WHERE RTRIM(ay_cbtype) = '{cbtype}'
+            """)
+            cbtype_desc = cbtype_desc_result.iloc[0]['ay_desc'].strip() if cbtype_desc_result is not None and len(cbtype_desc_result) > 0 else 'Cheque'
 
         # =====================
         # VALIDATE CUSTOMERS
@@ -6162,6 +7086,10 @@ class OperaSQLImport:
                 continue
 
             # Get customer details from sname
+            customer = self._ledger_account(customer_account, 'sales')
+            if customer is not None:
+                customer_info[customer_account] = customer
+                continue
             sname_check = self.sql.execute_query(f"""
                 SELECT sn_name, sn_region, sn_terrtry, sn_custype FROM sname WITH (NOLOCK)
                 WHERE RTRIM(sn_account) = '{customer_account}'
@@ -6215,7 +7143,7 @@ class OperaSQLImport:
             # =====================
             # PERIOD POSTING DECISION
             # =====================
-            from sql_rag.opera_config import get_period_posting_decision, get_customer_control_account
+            from sql_rag.opera_config import get_period_posting_decision
             posting_decision = get_period_posting_decision(self.sql, post_date, 'SL')
 
             if not posting_decision.can_post:
@@ -6315,7 +7243,7 @@ class OperaSQLImport:
                     ntran_pstid = unique_ids[idx * 2 + 1]
 
                     # Get customer's control account
-                    sales_ledger_control = get_customer_control_account(self.sql, customer_account)
+                    sales_ledger_control = self._ledger_control_account(customer_account, 'sales')
                     result_data.setdefault('nominal_accounts', set()).add(sales_ledger_control)
 
                     # INSERT atran
@@ -6865,8 +7793,8 @@ class OperaSQLImport:
                 result_data['vat_nominal_used'] = vat_nominal_used
                 result_data['vat_code_used'] = vat_code_used
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_gocardless_batch,
+            self._run_posting(
+                _do_gocardless_batch,
                 f"gocardless_batch({len(payments)} payments, £{gross_amount:.2f})"
             )
             entry_number = result_data['entry_number']
@@ -6900,6 +7828,10 @@ class OperaSQLImport:
             # Falls back to the batch-level auto_allocate parameter
             allocation_results = []
             if auto_allocate:
+                # Open invoices for every customer in the batch, read once
+                allocation_engine = self.allocation_engine('sales')
+                allocation_engine.prefetch(
+                    p['customer_account'] for p in payments if p.get('auto_allocate', True))
                 for payment in payments:
                     customer_account = payment['customer_account'].strip()
                     amount = float(payment['amount'])
@@ -6919,7 +7851,8 @@ class OperaSQLImport:
                         allocation_date=post_date,
                         bank_account=bank_account,
                         description=description,
-                        gc_payment_id=payment.get('gc_payment_id')
+                        gc_payment_id=payment.get('gc_payment_id'),
+                        allocation_engine=allocation_engine
                     )
 
                     if alloc_result['success']:
@@ -7006,6 +7939,44 @@ class OperaSQLImport:
     # AUTO-ALLOCATION OF RECEIPTS TO INVOICES
     # =========================================================================
 
+    def allocation_engine(self, ledger: str = 'sales') -> AllocationEngine:
+        """
+        Open invoices for auto-allocation ('sales' stran or 'purchase' ptran).
+
+        Pass one engine to every auto_allocate_receipt/payment call of a batch
+        (after prefetch() with the batch's accounts) so each account's open
+        items are read once and kept up to date in memory.
+        """
+        return AllocationEngine(ledger, lambda accounts: self._load_open_invoices(ledger, accounts))
+
+    def _load_open_invoices(self, ledger: str, accounts: List[str]) -> Dict[str, List[OpenItem]]:
+        """Outstanding invoices for the accounts, one query per chunk of accounts."""
+        table, p, alt_ref = ('stran', 'st', 'st_custref') if ledger == 'sales' else ('ptran', 'pt', 'pt_suppref')
+        items: Dict[str, List[OpenItem]] = {}
+        for placeholders, params in in_params('acct', accounts):
+            df = statement(f'opera.allocation.open_invoices.{table}.{len(params)}', f"""
+                SELECT id, {p}_account, {p}_trref, {p}_trbal, {alt_ref}, {p}_trdate, {p}_unique
+                FROM {table} WITH (NOLOCK)
+                WHERE {p}_account IN ({placeholders})
+                  AND {p}_trtype = 'I'
+                  AND {p}_trbal > 0
+                ORDER BY {p}_trdate ASC, {p}_trref ASC
+            """).query(self.sql, params)
+            if df is None:
+                continue
+            for row_id, account, ref, balance, alt, trdate, unique in df[
+                    ['id', f'{p}_account', f'{p}_trref', f'{p}_trbal', alt_ref, f'{p}_trdate', f'{p}_unique']
+            ].itertuples(index=False):
+                items.setdefault((account or '').strip().upper(), []).append(OpenItem(
+                    ref=(ref or '').strip(),
+                    balance=float(balance),
+                    alt_ref=(alt or '').strip(),
+                    date=trdate,
+                    unique=(unique or '').strip(),
+                    row_id=int(row_id),
+                ))
+        return items
+
     def auto_allocate_receipt(
         self,
         customer_account: str,
@@ -7014,7 +7985,9 @@ class OperaSQLImport:
         allocation_date: date,
         bank_account: str = "",
         description: str = None,
-        gc_payment_id: str = None
+        gc_payment_id: str = None,
+        allocation_engine: Optional[AllocationEngine] = None,
+        allow_amount_match: bool = False
     ) -> Dict[str, Any]:
         """
         Automatically allocate a receipt to matching outstanding invoices.
@@ -7027,9 +8000,17 @@ class OperaSQLImport:
            total matches the receipt exactly -> allocate to those specific invoices
         2. If receipt amount equals TOTAL outstanding balance on account AND there are
            1+ invoices -> allocate to ALL invoices (clears whole account, no ambiguity)
+        3. Only with allow_amount_match: if there is no invoice reference and exactly
+           one combination of outstanding invoices totals the receipt -> allocate to
+           those invoices
 
         Does NOT allocate:
-        - Based on amount matching to individual invoices alone (may have duplicates)
+        - Based on amount matching to individual invoices alone, unless
+          allow_amount_match (the matching or closest combination is returned
+          in suggested_invoices instead)
+        - When several invoices or combinations match the amount
+
+        The rules live in sql_rag.allocation_engine.
 
         Args:
             customer_account: Customer code (e.g., 'K009')
@@ -7041,6 +8022,10 @@ class OperaSQLImport:
             gc_payment_id: GoCardless payment ID (e.g., 'PM000XXX') for payment request
                           invoice lookup. When provided, uses stored invoice_refs from
                           the original collection request for precise allocation.
+            allocation_engine: Open items shared by a batch of allocations (see
+                          allocation_engine()); loaded for this account if omitted.
+            allow_amount_match: Allow rule 3. Off by default, when a unique
+                          combination is only returned in suggested_invoices.
 
         Returns:
             Dict with allocation results:
@@ -7049,8 +8034,6 @@ class OperaSQLImport:
             - allocations: List of allocated invoices
             - message: str
         """
-        import re
-
         result = {
             "success": False,
             "allocated_amount": 0.0,
@@ -7087,180 +8070,31 @@ class OperaSQLImport:
                 result["message"] = "Receipt already fully allocated"
                 return result
 
-            # Get outstanding invoices for customer
-            invoices_df = self.sql.execute_query(f"""
-                SELECT id, st_trref, st_trvalue, st_trbal, st_custref, st_trdate, st_unique
-                FROM stran WITH (NOLOCK)
-                WHERE st_account = '{customer_account}'
-                  AND st_trtype = 'I'
-                  AND st_trbal > 0
-                ORDER BY st_trdate ASC, st_trref ASC
-            """)
-
-            if invoices_df is None or len(invoices_df) == 0:
+            # Outstanding invoices for customer (shared across a batch when an engine is passed)
+            engine = allocation_engine or self.allocation_engine('sales')
+            open_items = engine.items(customer_account)
+            if not open_items:
                 result["message"] = "No outstanding invoices found for customer"
                 return result
 
-            # Build list of invoices to allocate
-            invoices_to_allocate = []
-            allocation_method = None
-
-            # Calculate total outstanding on account
-            total_outstanding = round(sum(float(inv['st_trbal']) for _, inv in invoices_df.iterrows()), 2)
-            receipt_rounded = round(receipt_amount, 2)
-
-            # RULE 0: Payment request invoice lookup (GoCardless collections)
-            # If we raised a payment request against specific invoices, use those
-            # invoice refs for precise allocation. Check each invoice's current
-            # state first — skip any already paid manually in Opera.
-            if gc_payment_id and not allocation_method:
-                try:
-                    from sql_rag.gocardless_payments import get_payments_db
-                    payments_db = get_payments_db()
-                    payment_request = payments_db.get_payment_request_by_payment_id(gc_payment_id)
-
-                    if payment_request and payment_request.get('invoice_refs'):
-                        pr_invoice_refs = payment_request['invoice_refs']
-                        logger.info(f"Auto-allocate: payment request {gc_payment_id} has invoice_refs: {pr_invoice_refs}")
-
-                        # Check each invoice's current state in stran
-                        pr_invoices_to_allocate = []
-                        skipped_invoices = []
-                        for inv_ref in pr_invoice_refs:
-                            # Find this invoice in outstanding invoices
-                            found = False
-                            for _, inv in invoices_df.iterrows():
-                                if inv['st_trref'].strip().upper() == inv_ref.strip().upper():
-                                    inv_balance = float(inv['st_trbal'])
-                                    if inv_balance > 0.005:
-                                        pr_invoices_to_allocate.append({
-                                            'ref': inv['st_trref'].strip(),
-                                            'custref': inv['st_custref'].strip() if inv['st_custref'] else '',
-                                            'amount': inv_balance,
-                                            'full_allocation': True,
-                                            'unique': inv['st_unique'].strip() if inv['st_unique'] else '',
-                                            'stran_id': int(inv['id'])
-                                        })
-                                    else:
-                                        skipped_invoices.append(f"{inv_ref} (already paid)")
-                                    found = True
-                                    break
-                            if not found:
-                                skipped_invoices.append(f"{inv_ref} (not found/outstanding)")
-
-                        if pr_invoices_to_allocate:
-                            # Calculate total of invoices still outstanding
-                            total_pr_invoice_balance = round(sum(a['amount'] for a in pr_invoices_to_allocate), 2)
-
-                            if receipt_rounded >= total_pr_invoice_balance:
-                                # Receipt covers all outstanding invoices from the request
-                                # Allocate to those invoices; any excess stays on account
-                                invoices_to_allocate = pr_invoices_to_allocate
-                                allocation_method = "payment_request"
-                                if skipped_invoices:
-                                    logger.info(f"Auto-allocate: skipped invoices (already paid in Opera): {skipped_invoices}")
-                            elif receipt_rounded < total_pr_invoice_balance:
-                                # Receipt is less than outstanding invoices — allocate oldest first
-                                # up to the receipt amount (partial allocation scenario)
-                                remaining = receipt_rounded
-                                for inv_alloc in pr_invoices_to_allocate:
-                                    if remaining <= 0.005:
-                                        break
-                                    alloc_amt = min(inv_alloc['amount'], remaining)
-                                    inv_alloc['amount'] = alloc_amt
-                                    inv_alloc['full_allocation'] = abs(alloc_amt - float(inv_alloc['amount'])) < 0.01
-                                    remaining -= alloc_amt
-                                invoices_to_allocate = [a for a in pr_invoices_to_allocate if a['amount'] > 0.005]
-                                allocation_method = "payment_request"
-                        elif skipped_invoices:
-                            # All invoices from the request are already paid — leave on account
-                            logger.info(f"Auto-allocate: all payment request invoices already paid: {skipped_invoices}")
-                            # Fall through to Rule 1/2 as fallback
-                except Exception as e:
-                    logger.warning(f"Auto-allocate: payment request lookup failed for {gc_payment_id}: {e}")
-                    # Fall through to existing rules
-
-            # RULE 1: Try to match by invoice reference in description
-            inv_matches = []
-            if description:
-                inv_matches = re.findall(r'INV\d+', description.upper())
-
-            if inv_matches:
-                # Found invoice reference(s) - try to match to specific invoices
-                for inv_ref in inv_matches:
-                    for _, inv in invoices_df.iterrows():
-                        if inv['st_trref'].strip().upper() == inv_ref:
-                            inv_balance = float(inv['st_trbal'])
-                            if inv_balance > 0:
-                                invoices_to_allocate.append({
-                                    'ref': inv['st_trref'].strip(),
-                                    'custref': inv['st_custref'].strip() if inv['st_custref'] else '',
-                                    'amount': inv_balance,
-                                    'full_allocation': True,
-                                    'unique': inv['st_unique'].strip() if inv['st_unique'] else '',
-                                    'stran_id': int(inv['id'])
-                                })
-                            break
-
-                if invoices_to_allocate:
-                    # Check if found invoices total matches receipt exactly
-                    total_invoice_balance = round(sum(a['amount'] for a in invoices_to_allocate), 2)
-
-                    if receipt_rounded == total_invoice_balance:
-                        allocation_method = "invoice_reference"
-                    else:
-                        # Invoice refs found but amounts don't match
-                        inv_details = [f"{a['ref']} (£{a['amount']:.2f})" for a in invoices_to_allocate]
-                        result["message"] = (
-                            f"Invoice reference(s) found but amounts do not match: "
-                            f"receipt £{receipt_rounded:.2f} vs invoice total £{total_invoice_balance:.2f}. "
-                            f"Found: {inv_details}"
-                        )
-                        return result
-
-            # RULE 2: If no invoice ref match, check if receipt clears whole account
-            # Now also handles single invoice case - if amount matches exactly, it's safe to allocate
-            if not allocation_method:
-                invoice_count = len(invoices_df)
-
-                if receipt_rounded == total_outstanding and invoice_count >= 1:
-                    # Receipt clears the whole account - allocate to ALL invoices
-                    # For single invoice: amount match is sufficient (no ambiguity about target)
-                    # For multiple invoices: clears entire balance (no ambiguity)
-                    invoices_to_allocate = []
-                    for _, inv in invoices_df.iterrows():
-                        inv_balance = float(inv['st_trbal'])
-                        if inv_balance > 0:
-                            invoices_to_allocate.append({
-                                'ref': inv['st_trref'].strip(),
-                                'custref': inv['st_custref'].strip() if inv['st_custref'] else '',
-                                'amount': inv_balance,
-                                'full_allocation': True,
-                                'unique': inv['st_unique'].strip() if inv['st_unique'] else '',
-                                'stran_id': int(inv['id'])
-                            })
-                    allocation_method = "clears_account" if invoice_count >= 2 else "single_invoice_match"
-                else:
-                    # Cannot allocate - no invoice ref and doesn't clear account
-                    if inv_matches:
-                        result["message"] = f"Invoice reference(s) {inv_matches} not found in outstanding invoices"
-                    else:
-                        result["message"] = (
-                            f"Cannot auto-allocate: no invoice reference in description and "
-                            f"receipt £{receipt_rounded:.2f} does not clear account total £{total_outstanding:.2f}"
-                        )
-                    return result
+            # Payment request invoices (GoCardless collections), then refs in the
+            # description, then clears account, then a unique amount match
+            request_refs = payment_request_invoice_refs(gc_payment_id) if gc_payment_id else None
+            plan = plan_receipt(open_items, receipt_amount, description, request_refs,
+                                allow_amount_match=allow_amount_match)
+            if not plan.method:
+                result["message"] = plan.message
+                if plan.suggestion:
+                    result["suggested_invoices"] = plan.suggestion
+                return result
 
             # Amounts verified - proceed with allocation
             # For payment_request method, the receipt may exceed the outstanding invoices
             # (e.g., some invoices were already paid manually). Only allocate what's outstanding.
-            total_invoice_amount = round(sum(a['amount'] for a in invoices_to_allocate), 2)
-            if allocation_method == "payment_request" and receipt_rounded > total_invoice_amount:
-                total_to_allocate = total_invoice_amount
-                receipt_fully_allocated = False  # Remainder stays on account
-            else:
-                total_to_allocate = receipt_amount
-                receipt_fully_allocated = True
+            invoices_to_allocate = plan.allocations
+            allocation_method = plan.method
+            total_to_allocate = plan.total_to_allocate
+            receipt_fully_allocated = plan.fully_allocated
 
             # Format date
             if isinstance(allocation_date, str):
@@ -7303,12 +8137,7 @@ class OperaSQLImport:
                 # al_ref2 indicates allocation method for audit trail
                 # al_unique = stran row id (Opera convention)
                 if receipt_fully_allocated:
-                    if allocation_method == "payment_request":
-                        alloc_ref2 = "AUTO:GC_REQ"
-                    elif allocation_method == "invoice_reference":
-                        alloc_ref2 = "AUTO:INV_REF"
-                    else:
-                        alloc_ref2 = "AUTO:CLR_ACCT"
+                    alloc_ref2 = allocation_ref2(allocation_method)
                     salloc_id = self._get_next_id(conn, 'salloc')
                     conn.execute(text(f"""
                         INSERT INTO salloc (
@@ -7400,12 +8229,8 @@ class OperaSQLImport:
             result["receipt_fully_allocated"] = receipt_fully_allocated
             result["allocation_method"] = allocation_method
 
-            if allocation_method == "payment_request":
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) from payment request"
-            elif allocation_method == "invoice_reference":
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) by reference"
-            else:  # clears_account / single_invoice_match
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) - clears account"
+            result["message"] = allocation_message(allocation_method, total_to_allocate, len(invoices_to_allocate))
+            engine.consume(customer_account, invoices_to_allocate)
 
             logger.info(f"Auto-allocated receipt {receipt_ref} for {customer_account}: £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoices ({allocation_method})")
 
@@ -7423,7 +8248,9 @@ class OperaSQLImport:
         payment_amount: float,
         allocation_date: date,
         bank_account: str = "",
-        description: str = None
+        description: str = None,
+        allocation_engine: Optional[AllocationEngine] = None,
+        allow_amount_match: bool = False
     ) -> Dict[str, Any]:
         """
         Automatically allocate a payment to matching outstanding supplier invoices.
@@ -7431,12 +8258,16 @@ class OperaSQLImport:
         Same allocation rules as auto_allocate_receipt:
         1. If invoice reference(s) found in description AND their total matches
            the payment exactly -> allocate to those specific invoices
-        2. If payment amount equals TOTAL outstanding balance on account AND there are
-           2+ invoices -> allocate to ALL invoices (clears whole account, no ambiguity)
+        2. If payment amount equals TOTAL outstanding balance on account
+           -> allocate to ALL invoices (clears whole account, no ambiguity)
+        3. Only with allow_amount_match: if there is no invoice reference and exactly
+           one combination of outstanding invoices totals the payment -> allocate to
+           those invoices
 
         Does NOT allocate:
-        - Based on amount matching to individual invoices alone (may have duplicates)
-        - Single invoice with no reference (dangerous assumption)
+        - Based on amount matching to individual invoices alone, unless
+          allow_amount_match (the combination is returned in suggested_invoices)
+        - When several invoices or combinations match the amount
 
         Args:
             supplier_account: Supplier code (e.g., 'P001')
@@ -7445,6 +8276,10 @@ class OperaSQLImport:
             allocation_date: Date to use for allocation
             bank_account: Bank account code for palloc record
             description: Description to search for invoice references (optional)
+            allocation_engine: Open items shared by a batch of allocations (see
+                          allocation_engine()); loaded for this account if omitted.
+            allow_amount_match: Allow rule 3. Off by default, when a unique
+                          combination is only returned in suggested_invoices.
 
         Returns:
             Dict with allocation results:
@@ -7453,8 +8288,6 @@ class OperaSQLImport:
             - allocations: List of allocated invoices
             - message: str
         """
-        import re
-
         result = {
             "success": False,
             "allocated_amount": 0.0,
@@ -7487,120 +8320,26 @@ class OperaSQLImport:
                 result["message"] = "Payment already fully allocated"
                 return result
 
-            # Get outstanding invoices for supplier
-            invoices_df = self.sql.execute_query(f"""
-                SELECT id, pt_trref, pt_trvalue, pt_trbal, pt_suppref, pt_trdate, pt_unique
-                FROM ptran WITH (NOLOCK)
-                WHERE pt_account = '{supplier_account}'
-                  AND pt_trtype = 'I'
-                  AND pt_trbal > 0
-                ORDER BY pt_trdate ASC, pt_trref ASC
-            """)
-
-            if invoices_df is None or len(invoices_df) == 0:
+            # Outstanding invoices for supplier (shared across a batch when an engine is passed)
+            engine = allocation_engine or self.allocation_engine('purchase')
+            open_items = engine.items(supplier_account)
+            if not open_items:
                 result["message"] = "No outstanding invoices found for supplier"
                 return result
 
-            # Build list of invoices to allocate
-            invoices_to_allocate = []
-            allocation_method = None
-
-            # Calculate total outstanding on account
-            total_outstanding = round(sum(float(inv['pt_trbal']) for _, inv in invoices_df.iterrows()), 2)
-            payment_rounded = round(payment_amount, 2)
-
-            # RULE 1: Try to match by invoice reference in description
-            # Look for common invoice patterns (PI, INV, or supplier-specific patterns)
-            inv_matches = []
-            if description:
-                # Try various invoice reference patterns
-                inv_matches = re.findall(r'(?:PI|INV|PINV|P/INV)[\s-]?\d+', description.upper())
-                # Also try generic numeric references that might be supplier invoice numbers
-                if not inv_matches:
-                    # Look for references in ptran pt_suppref format
-                    for _, inv in invoices_df.iterrows():
-                        suppref = inv['pt_suppref'].strip() if inv['pt_suppref'] else ''
-                        if suppref and suppref.upper() in description.upper():
-                            inv_matches.append(suppref)
-
-            if inv_matches:
-                # Found invoice reference(s) - try to match to specific invoices
-                for inv_ref_pattern in inv_matches:
-                    inv_ref_clean = re.sub(r'[\s-]', '', inv_ref_pattern.upper())
-                    for _, inv in invoices_df.iterrows():
-                        inv_trref = inv['pt_trref'].strip().upper()
-                        inv_suppref = (inv['pt_suppref'].strip().upper() if inv['pt_suppref'] else '')
-                        inv_trref_clean = re.sub(r'[\s-]', '', inv_trref)
-                        inv_suppref_clean = re.sub(r'[\s-]', '', inv_suppref)
-
-                        if inv_ref_clean == inv_trref_clean or inv_ref_clean == inv_suppref_clean or inv_ref_pattern.upper() == inv_suppref:
-                            inv_balance = float(inv['pt_trbal'])
-                            if inv_balance > 0:
-                                # Check not already added
-                                already_added = any(a['ref'] == inv['pt_trref'].strip() for a in invoices_to_allocate)
-                                if not already_added:
-                                    invoices_to_allocate.append({
-                                        'ref': inv['pt_trref'].strip(),
-                                        'suppref': inv['pt_suppref'].strip() if inv['pt_suppref'] else '',
-                                        'amount': inv_balance,
-                                        'full_allocation': True,
-                                        'unique': inv['pt_unique'].strip() if inv['pt_unique'] else '',
-                                        'ptran_id': int(inv['id'])
-                                    })
-                            break
-
-                if invoices_to_allocate:
-                    # Check if found invoices total matches payment exactly
-                    total_invoice_balance = round(sum(a['amount'] for a in invoices_to_allocate), 2)
-
-                    if payment_rounded == total_invoice_balance:
-                        allocation_method = "invoice_reference"
-                    else:
-                        # Invoice refs found but amounts don't match
-                        inv_details = [f"{a['ref']} (£{a['amount']:.2f})" for a in invoices_to_allocate]
-                        result["message"] = (
-                            f"Invoice reference(s) found but amounts do not match: "
-                            f"payment £{payment_rounded:.2f} vs invoice total £{total_invoice_balance:.2f}. "
-                            f"Found: {inv_details}"
-                        )
-                        return result
-
-            # RULE 2: If no invoice ref match, check if payment clears whole account
-            # Now also handles single invoice case - if amount matches exactly, it's safe to allocate
-            if not allocation_method:
-                invoice_count = len(invoices_df)
-
-                if payment_rounded == total_outstanding and invoice_count >= 1:
-                    # Payment clears the whole account - allocate to ALL invoices
-                    # For single invoice: amount match is sufficient (no ambiguity about target)
-                    # For multiple invoices: clears entire balance (no ambiguity)
-                    invoices_to_allocate = []
-                    for _, inv in invoices_df.iterrows():
-                        inv_balance = float(inv['pt_trbal'])
-                        if inv_balance > 0:
-                            invoices_to_allocate.append({
-                                'ref': inv['pt_trref'].strip(),
-                                'suppref': inv['pt_suppref'].strip() if inv['pt_suppref'] else '',
-                                'amount': inv_balance,
-                                'full_allocation': True,
-                                'unique': inv['pt_unique'].strip() if inv['pt_unique'] else '',
-                                'ptran_id': int(inv['id'])
-                            })
-                    allocation_method = "clears_account" if invoice_count >= 2 else "single_invoice_match"
-                else:
-                    # Cannot allocate - no invoice ref and doesn't clear account
-                    if inv_matches:
-                        result["message"] = f"Invoice reference(s) {inv_matches} not found in outstanding invoices"
-                    else:
-                        result["message"] = (
-                            f"Cannot auto-allocate: no invoice reference in description and "
-                            f"payment £{payment_rounded:.2f} does not clear account total £{total_outstanding:.2f}"
-                        )
-                    return result
+            plan = plan_payment(open_items, payment_amount, description,
+                                allow_amount_match=allow_amount_match)
+            if not plan.method:
+                result["message"] = plan.message
+                if plan.suggestion:
+                    result["suggested_invoices"] = plan.suggestion
+                return result
 
             # Amounts verified - proceed with allocation
-            total_to_allocate = payment_amount
-            payment_fully_allocated = True
+            invoices_to_allocate = plan.allocations
+            allocation_method = plan.method
+            total_to_allocate = plan.total_to_allocate
+            payment_fully_allocated = plan.fully_allocated
 
             # Format date
             if isinstance(allocation_date, str):
@@ -7642,7 +8381,7 @@ class OperaSQLImport:
                 # pl_ref2 indicates allocation method for audit trail
                 # pl_unique = ptran row id (Opera convention)
                 if payment_fully_allocated:
-                    alloc_ref2 = "AUTO:INV_REF" if allocation_method == "invoice_reference" else "AUTO:CLR_ACCT"
+                    alloc_ref2 = allocation_ref2(allocation_method)
                     palloc_id = self._get_next_id(conn, 'palloc')
                     conn.execute(text(f"""
                         INSERT INTO palloc (
@@ -7729,10 +8468,8 @@ class OperaSQLImport:
             result["payment_fully_allocated"] = payment_fully_allocated
             result["allocation_method"] = allocation_method
 
-            if allocation_method == "invoice_reference":
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) by reference"
-            else:  # clears_account
-                result["message"] = f"Allocated £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoice(s) - clears account"
+            result["message"] = allocation_message(allocation_method, total_to_allocate, len(invoices_to_allocate))
+            engine.consume(supplier_account, invoices_to_allocate)
 
             logger.info(f"Auto-allocated payment {payment_ref} for {supplier_account}: £{total_to_allocate:.2f} to {len(invoices_to_allocate)} invoices ({allocation_method})")
 
@@ -8830,8 +9567,8 @@ class OperaSQLImport:
             # Pre-commit balance snapshot
             pre_bank_balance = self.read_bank_balance_pence(bank_account)
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_complete_batch,
+            self._run_posting(
+                _do_complete_batch,
                 f"complete_batch({entry_number})"
             )
 
@@ -9442,8 +10179,8 @@ class OperaSQLImport:
                 result_data['next_journal'] = next_journal
                 result_data['shared_unique'] = shared_unique
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_bank_transfer,
+            self._run_posting(
+                _do_bank_transfer,
                 f"bank_transfer({source_bank} -> {dest_bank}, £{amount_pounds:.2f})"
             )
             source_entry = result_data['source_entry']
@@ -10286,8 +11023,8 @@ class OperaSQLImport:
                 result_data['entry_number'] = entry_number
                 result_data['nominal_accounts'] = nominal_accounts_used
 
-            execute_with_deadlock_retry(
-                self.sql.engine, _do_recurring_post,
+            self._run_posting(
+                _do_recurring_post,
                 f"recurring_entry({entry_ref}, {bank_account}, {len(parsed_lines)} lines)"
             )
 
@@ -10631,8 +11368,7 @@ class SalesInvoiceFileImport:
             now_str = now.strftime('%Y-%m-%d %H:%M:%S')
 
             # Get control account - check customer profile first, then fall back to default
-            from sql_rag.opera_config import get_customer_control_account
-            debtors_control = get_customer_control_account(self.sql, customer_account)
+            debtors_control = self._ledger_control_account(customer_account, 'sales')
             department = "U999"
 
             ntran_comment = f"{invoice_number[:20]:<20} {description[:29]:<29}"
@@ -11074,8 +11810,7 @@ class PurchaseInvoiceFileImport:
             now_str = now.strftime('%Y-%m-%d %H:%M:%S')
 
             # Get control account - check supplier profile first, then fall back to default
-            from sql_rag.opera_config import get_supplier_control_account
-            purchase_ledger_control = get_supplier_control_account(self.sql, supplier_account)
+            purchase_ledger_control = self._ledger_control_account(supplier_account, 'purchase')
             vat_input_account = vat_nominal if vat_nominal else self._get_any_vat_nominal()
 
             ntran_comment = f"{invoice_number[:20]} {description[:29]:<29}"
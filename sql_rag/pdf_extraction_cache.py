@@ -89,6 +89,24 @@ class PDFExtractionCache:
             logger.warning(f"Cache lookup error: {e}")
         return None
 
+    def get_info(self, pdf_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up only the statement info for a cached PDF (no transactions).
+
+        Used by folder scans, which need balances and bank details but not lines.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT statement_info_json FROM extraction_cache WHERE pdf_hash = ?",
+                    (pdf_hash,)
+                ).fetchone()
+                if row:
+                    return json.loads(row[0])
+        except Exception as e:
+            logger.warning(f"Cache info lookup error: {e}")
+        return None
+
     def put(
         self,
         pdf_hash: str,
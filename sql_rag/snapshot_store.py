@@ -0,0 +1,295 @@
+"""
+Compact Snapshot Storage
+
+Binary container for database snapshots (opera_snapshot, opera3_snapshot and
+the transaction-snapshot tool), replacing indented JSON files.
+
+Layout:
+    MAGIC
+    table block, table block, ...     (zlib-compressed, column-oriented JSON)
+    index                             (zlib-compressed JSON)
+    8-byte offset of the index
+
+Each table's rows are stored column by column ({'columns': [...], 'data':
+[[col0 values], [col1 values], ...]}), which compresses far better than a list
+of row dicts. The index holds everything else about the snapshot (name,
+timestamp, row counts, checksums) plus each block's offset and a digest of its
+rows, so opening a snapshot reads only the index. Rows are decompressed the
+first time a table's 'rows'/'records' are accessed, which means the existing
+diff code only pays for tables whose checksums differ.
+
+Snapshots are plain dicts shaped like before. Tables live either under
+snapshot['tables'][table] or snapshot['databases'][db][table], with their rows
+in 'records' or 'rows'.
+
+dataframe_rows() gives plain result rows the values execute_query()'s
+DataFrame rows had, so snapshots read without pandas store the same values
+as the ones already on disk and diff cleanly against them.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'OPSNAP1\n'
+SNAPSHOT_EXT = '.snap'
+
+_ROW_FIELDS = ('records', 'rows')
+_FOOTER = struct.Struct('<Q')
+
+
+def is_snapshot_file(filepath: str) -> bool:
+    """True if the file is in the binary snapshot format (as opposed to legacy JSON)."""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _to_columns(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    columns: List[str] = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return {'columns': columns, 'data': [[row.get(col) for row in rows] for col in columns]}
+
+
+def _from_columns(block: Dict[str, Any]) -> List[Dict[str, Any]]:
+    columns = block['columns']
+    return [dict(zip(columns, values)) for values in zip(*block['data'])] if columns else []
+
+
+class LazyTable(dict):
+    """
+    Snapshot table entry whose rows are read from the file on first access.
+
+    Behaves like the dict a JSON snapshot would have loaded; ``digest`` is a
+    hash of the stored rows, equal for tables whose rows are identical.
+    """
+
+    def __init__(self, store: 'SnapshotFile', key: str, row_field: Optional[str], digest: Optional[str],
+                 fields: Dict[str, Any]):
+        super().__init__(fields)
+        self._store = store
+        self._key = key
+        self._row_field = row_field
+        self.digest = digest
+
+    def _load(self):
+        if self._row_field and not dict.__contains__(self, self._row_field):
+            dict.__setitem__(self, self._row_field, self._store.read_rows(self._key))
+
+    def __getitem__(self, key):
+        if key == self._row_field:
+            self._load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key == self._row_field:
+            self._load()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return (self._row_field is not None and key == self._row_field) or dict.__contains__(self, key)
+
+    def materialise(self) -> Dict[str, Any]:
+        """Plain dict with rows loaded (e.g. for json.dump)."""
+        self._load()
+        return dict(self)
+
+
+class SnapshotFile:
+    """Open binary snapshot. Reads the index up front and table blocks on demand."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        with open(filepath, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a snapshot file: {filepath}")
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            index_offset = _FOOTER.unpack(f.read(_FOOTER.size))[0]
+            f.seek(index_offset)
+            index_bytes = f.read(os.path.getsize(filepath) - _FOOTER.size - index_offset)
+        self.index = json.loads(zlib.decompress(index_bytes))
+
+    def read_rows(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        entry = self.index['tables'][key]
+        if entry.get('offset') is None:
+            return None
+        with self._lock, open(self.filepath, 'rb') as f:
+            f.seek(entry['offset'])
+            raw = f.read(entry['length'])
+        return _from_columns(json.loads(zlib.decompress(raw)))
+
+    def _table(self, key: str) -> LazyTable:
+        entry = self.index['tables'][key]
+        return LazyTable(self, key, entry['row_field'], entry.get('digest'), entry['fields'])
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        snapshot = dict(self.index['meta'])
+        for key, entry in self.index['tables'].items():
+            if entry.get('database') is not None:
+                db = snapshot.setdefault('databases', {}).setdefault(entry['database'], {})
+                db[entry['table']] = self._table(key)
+            else:
+                snapshot.setdefault('tables', {})[entry['table']] = self._table(key)
+        # Keep empty databases/table sections from the original
+        for db_name in self.index.get('databases', []):
+            snapshot.setdefault('databases', {}).setdefault(db_name, {})
+        if self.index.get('has_tables'):
+            snapshot.setdefault('tables', {})
+        return snapshot
+
+
+def save_snapshot(filepath: str, snapshot: Dict[str, Any], level: int = 6) -> str:
+    """
+    Write a snapshot dict to the binary format.
+
+    Args:
+        filepath: Destination path (conventionally ending in SNAPSHOT_EXT)
+        snapshot: Snapshot with 'tables' and/or 'databases' sections
+        level: zlib compression level
+
+    Returns:
+        filepath
+    """
+    meta = {k: v for k, v in snapshot.items() if k not in ('tables', 'databases')}
+    index: Dict[str, Any] = {
+        'meta': meta,
+        'tables': {},
+        'databases': list((snapshot.get('databases') or {}).keys()),
+        'has_tables': 'tables' in snapshot,
+    }
+
+    sections = [(None, snapshot.get('tables') or {})]
+    sections += [(db_name, tables) for db_name, tables in (snapshot.get('databases') or {}).items()]
+
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for db_name, tables in sections:
+            for table_name, table in tables.items():
+                if isinstance(table, LazyTable):
+                    table = table.materialise()
+                row_field = next((k for k in _ROW_FIELDS if k in table), None)
+                rows = table.get(row_field) if row_field else None
+                entry = {
+                    'database': db_name,
+                    'table': table_name,
+                    'row_field': row_field,
+                    'fields': {k: v for k, v in table.items() if k != row_field},
+                    'offset': None,
+                    'length': 0,
+                    'digest': None,
+                }
+                if rows is not None:
+                    payload = json.dumps(_to_columns(rows), default=str, separators=(',', ':')).encode()
+                    block = zlib.compress(payload, level)
+                    entry['offset'] = f.tell()
+                    entry['length'] = len(block)
+                    entry['digest'] = hashlib.sha1(payload).hexdigest()
+                    f.write(block)
+                key = f"{db_name}/{table_name}" if db_name is not None else table_name
+                index['tables'][key] = entry
+
+        index_offset = f.tell()
+        f.write(zlib.compress(json.dumps(index, default=str, separators=(',', ':')).encode(), level))
+        f.write(_FOOTER.pack(index_offset))
+    os.replace(tmp_path, filepath)
+    return filepath
+
+
+def load_snapshot(filepath: str) -> Dict[str, Any]:
+    """
+    Load a snapshot written by save_snapshot(), or a legacy JSON snapshot.
+
+    Binary snapshots load lazily: table rows are decompressed on first access.
+    """
+    if is_snapshot_file(filepath):
+        return SnapshotFile(filepath).to_snapshot()
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def same_rows(before_table: Dict[str, Any], after_table: Dict[str, Any]) -> bool:
+    """True if both tables came from binary snapshots and their stored rows are identical."""
+    before_digest = getattr(before_table, 'digest', None)
+    return before_digest is not None and before_digest == getattr(after_table, 'digest', None)
+
+
+def _frame_dtype(values: Sequence[Any]) -> str:
+    """The dtype pd.read_sql() gives a column: 'int', 'float', 'bool', 'datetime' or 'object'."""
+    kinds = set()
+    has_null = False
+    for value in values:
+        if value is None:
+            has_null = True
+        elif isinstance(value, bool):
+            kinds.add('bool')
+        elif isinstance(value, int):
+            kinds.add('int')
+        elif isinstance(value, (float, Decimal)):
+            kinds.add('float')  # read_sql's coerce_float turns Decimal into float
+        elif isinstance(value, datetime):
+            kinds.add('datetime')
+        else:
+            kinds.add('object')
+    if kinds == {'int'} and not has_null:
+        return 'int'
+    if kinds and kinds <= {'int', 'float'}:
+        return 'float'
+    if kinds == {'bool'} and not has_null:
+        return 'bool'
+    if kinds == {'datetime'}:
+        return 'datetime'
+    return 'object'
+
+
+def _float(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _timestamp(value):
+    return pd.NaT if value is None else pd.Timestamp(value)
+
+
+def dataframe_rows(columns: List[str], rows: Sequence[tuple]) -> List[tuple]:
+    """
+    Rows with each value as pd.read_sql(...).iterrows() rows held it.
+
+    The column dtypes are worked out as pandas would (integers with a NULL and
+    Decimals become float, NULL numbers NaN, NULL datetimes NaT), and a row of
+    a table whose columns are all int64, float64 or bool holds NumPy scalars
+    of that type, as a DataFrame row does. Text NULLs stay None.
+    """
+    if not rows:
+        return []
+    dtypes = [_frame_dtype(values) for values in zip(*rows)]
+    kinds = set(dtypes)
+    if kinds == {'int'}:
+        converters = [np.int64] * len(columns)
+    elif kinds <= {'int', 'float'}:
+        converters = [lambda v: np.float64(_float(v))] * len(columns)
+    elif kinds == {'bool'}:
+        converters = [np.bool_] * len(columns)
+    else:
+        by_dtype = {'int': int, 'float': _float, 'bool': None, 'datetime': _timestamp, 'object': None}
+        converters = [by_dtype[dtype] for dtype in dtypes]
+    if not any(converters):
+        return [tuple(row) for row in rows]
+    return [tuple(value if convert is None else convert(value) for convert, value in zip(converters, row))
+            for row in rows]
@@ -11,14 +11,16 @@ import configparser
 import os
 import time
 import urllib.parse
+from decimal import Decimal
 from typing import Optional, List, Dict, Any, Union, Tuple, Generator
 
+import numpy as np
 import pandas as pd
 import pyodbc
 import sqlalchemy
-from sqlalchemy import create_engine, text, Table, MetaData
+from sqlalchemy import create_engine, event, text, Table, MetaData
 from sqlalchemy.pool import QueuePool
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import DisconnectionError, SQLAlchemyError
 from contextlib import contextmanager
 
 # Configure logging
@@ -35,8 +37,10 @@ DEFAULT_POOL_SIZE = 5
 DEFAULT_MAX_OVERFLOW = 10
 DEFAULT_POOL_TIMEOUT = 30
 DEFAULT_POOL_RECYCLE = 3600  # 1 hour
+DEFAULT_PING_IDLE_SECONDS = 30  # ping pooled connections idle longer than this on checkout
 MAX_RETRY_ATTEMPTS = 3
 RETRY_DELAY = 1.0  # seconds
+DEFAULT_FETCH_BATCH_SIZE = 10000  # rows per fetchmany() for column batches
 
 class DatabaseType:
     """Enum-like class for supported database types"""
@@ -63,6 +67,19 @@ class QueryError(DatabaseError):
     """Exception raised for query execution issues"""
     pass
 
+def _column_array(values: tuple) -> np.ndarray:
+    """One column of a fetched batch as a NumPy array (numeric dtype when possible)."""
+    if any(isinstance(v, Decimal) for v in values):
+        values = [float(v) if isinstance(v, Decimal) else v for v in values]
+    array = np.asarray(values)
+    if array.dtype.kind in 'biuf':
+        return array
+    # Strings, dates and columns with NULLs stay as Python objects
+    result = np.empty(len(values), dtype=object)
+    result[:] = values
+    return result
+
+
 class SQLConnector:
     """Class for connecting to SQL databases and executing queries with connection pooling."""
     
@@ -161,6 +178,7 @@ class SQLConnector:
             'max_overflow': db_config.getint('max_overflow', DEFAULT_MAX_OVERFLOW),
             'pool_timeout': db_config.getint('pool_timeout', DEFAULT_POOL_TIMEOUT),
             'pool_recycle': db_config.getint('pool_recycle', DEFAULT_POOL_RECYCLE),
+            'ping_idle_seconds': db_config.getint('ping_idle_seconds', DEFAULT_PING_IDLE_SECONDS),
             'connection_timeout': db_config.getint('connection_timeout', DEFAULT_CONNECTION_TIMEOUT),
             'command_timeout': db_config.getint('command_timeout', DEFAULT_COMMAND_TIMEOUT),
             'ssl': db_config.getboolean('ssl', False),
@@ -358,12 +376,12 @@ class SQLConnector:
                 max_overflow=params['max_overflow'],
                 pool_timeout=params['pool_timeout'],
                 pool_recycle=params['pool_recycle'],
-                pool_pre_ping=True,  # Check connection validity before using from pool
                 connect_args={
                     'timeout': params['connection_timeout'],
                     'command_timeout': params['command_timeout']
                 } if self.db_type == DatabaseType.MSSQL else {}
             )
+            self._add_pool_events(engine, params['ping_idle_seconds'])
             
             logger.info(f"Created database engine for {self.db_type} with connection pooling")
             return engine
@@ -372,15 +390,54 @@ class SQLConnector:
             logger.error(f"Failed to create database engine: {e}")
             raise ConnectionError(f"Database engine creation failed: {e}")
     
+    def _read_isolation_level(self) -> Optional[str]:
+        """
+        Isolation level for connections handed out by get_connection().
+
+        For MSSQL databases, the read path runs at READ UNCOMMITTED to prevent
+        locking issues with live ERP data. This allows "dirty reads" which is
+        acceptable for reporting/dashboard queries where absolute consistency
+        is not required. The engine itself stays at the READ COMMITTED
+        default, so posting transactions opened with engine.begin() never
+        read uncommitted rows. Applied with execution_options so the pool
+        resets the level when the connection is checked in.
+        """
+        if self.db_type == DatabaseType.MSSQL:
+            return 'READ UNCOMMITTED'
+        return None
+
+    def _add_pool_events(self, engine: sqlalchemy.engine.Engine, ping_idle_seconds: int):
+        """
+        Per-physical-connection liveness checks.
+
+        Instead of pool_pre_ping on every checkout, a connection is pinged
+        only if it has been idle in the pool for more than ping_idle_seconds;
+        a dead one is replaced by the pool.
+        """
+        @event.listens_for(engine, "checkin")
+        def _mark_idle(dbapi_conn, connection_record):
+            connection_record.info['checked_in_at'] = time.monotonic()
+
+        @event.listens_for(engine, "checkout")
+        def _ping_if_idle(dbapi_conn, connection_record, connection_proxy):
+            checked_in_at = connection_record.info.get('checked_in_at')
+            if checked_in_at is None or time.monotonic() - checked_in_at < ping_idle_seconds:
+                return
+            try:
+                cursor = dbapi_conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+            except Exception as e:
+                # The pool discards this connection and checks out a fresh one
+                raise DisconnectionError(f"Pooled connection failed ping: {e}")
+
     @contextmanager
     def get_connection(self):
         """
         Context manager for database connections from the pool.
 
-        For MSSQL databases, sets READ UNCOMMITTED isolation level to prevent
-        locking issues with live ERP data. This allows "dirty reads" which is
-        acceptable for reporting/dashboard queries where absolute consistency
-        is not required.
+        For MSSQL databases the connection runs at READ UNCOMMITTED (see
+        _read_isolation_level); other engine connections keep the default.
 
         Yields:
             An active database connection from the pool
@@ -391,11 +448,9 @@ class SQLConnector:
         conn = None
         try:
             conn = self.engine.connect()
-            # Set READ UNCOMMITTED isolation level for MSSQL to prevent locking
-            # This is critical for dashboard queries against live Opera 3 data
-            if self.db_type == DatabaseType.MSSQL:
-                conn.execute(text("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED"))
-                logger.debug("Set MSSQL connection to READ UNCOMMITTED isolation level")
+            isolation_level = self._read_isolation_level()
+            if isolation_level:
+                conn = conn.execution_options(isolation_level=isolation_level)
             yield conn
         except SQLAlchemyError as e:
             logger.error(f"Database connection error: {e}")
@@ -532,6 +587,123 @@ class SQLConnector:
             logger.error(f"Error executing query iterator: {e}")
             raise QueryError(f"Query iterator execution failed: {e}")
     
+    def _fetch(self, query: str, params: Optional[Dict], consume, mode: str):
+        """Run a SELECT and pass the SQLAlchemy result to consume(), with retry and error wrapping."""
+        if not query:
+            raise ValueError("Query cannot be empty")
+
+        logger.info(f"Executing query ({mode}): {query}")
+
+        def _execute():
+            with self.get_connection() as conn:
+                result = conn.execute(text(query), params or {})
+                return consume(result)
+
+        try:
+            return self._execute_with_retry(_execute)
+        except Exception as e:
+            logger.error(f"Error executing query: {e}")
+            if isinstance(e, QueryError):
+                raise
+            else:
+                raise QueryError(f"Query execution failed: {e}")
+
+    def execute_query_rows(self, query: str, params: Optional[Dict] = None) -> Tuple[List[str], List[tuple]]:
+        """
+        Execute a SELECT query and return (column_names, rows) with rows as plain tuples.
+
+        The cheapest result mode: values are exactly what the driver returns
+        (None for NULL, Decimal for money/decimal columns), with no DataFrame
+        built.
+
+        Args:
+            query: SQL query string
+            params: Named parameters for the query
+
+        Raises:
+            QueryError: If the query execution fails
+            ValueError: If the query is empty or None
+        """
+        def consume(result):
+            columns = list(result.keys())
+            rows = [tuple(row) for row in result.fetchall()]
+            logger.info(f"Query returned {len(rows)} rows")
+            return columns, rows
+
+        return self._fetch(query, params, consume, 'rows')
+
+    def execute_query_dicts(self, query: str, params: Optional[Dict] = None) -> List[Dict[str, Any]]:
+        """
+        Execute a SELECT query and return a list of dicts built straight from the cursor.
+
+        Equivalent to execute_query(...).to_dict('records') without the
+        DataFrame, except that NULL is None (not NaN) and driver types are kept.
+
+        Args:
+            query: SQL query string
+            params: Named parameters for the query
+
+        Raises:
+            QueryError: If the query execution fails
+            ValueError: If the query is empty or None
+        """
+        columns, rows = self.execute_query_rows(query, params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def execute_query_batches(self, query: str, params: Optional[Dict] = None,
+                              batch_size: int = DEFAULT_FETCH_BATCH_SIZE,
+                              arrow: bool = False) -> Generator[Any, None, None]:
+        """
+        Execute a SELECT query and yield column batches fetched with fetchmany().
+
+        Each batch is a dict of column name -> NumPy array (numeric columns
+        without NULLs get a numeric dtype, Decimals become float as in
+        execute_query; everything else is an object array), or a
+        pyarrow.RecordBatch when arrow=True.
+
+        Args:
+            query: SQL query string
+            params: Named parameters for the query
+            batch_size: Rows fetched per batch
+            arrow: Yield pyarrow RecordBatches (requires pyarrow)
+
+        Raises:
+            QueryError: If the query execution fails
+            ValueError: If the query is empty or None
+            ImportError: If arrow=True and pyarrow is not installed
+        """
+        if not query:
+            raise ValueError("Query cannot be empty")
+        if arrow:
+            try:
+                import pyarrow as pa
+            except ImportError:
+                raise ImportError("pyarrow required for Arrow batches. Install with: pip install pyarrow")
+
+        logger.info(f"Executing query with column batches (batch size: {batch_size}): {query}")
+
+        try:
+            with self.get_connection() as conn:
+                result = conn.execute(text(query), params or {})
+                columns = list(result.keys())
+                total_rows = 0
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    total_rows += len(rows)
+                    values = list(zip(*rows))
+                    if arrow:
+                        yield pa.RecordBatch.from_arrays(
+                            [pa.array(v) for v in values], names=columns
+                        )
+                    else:
+                        yield {col: _column_array(v) for col, v in zip(columns, values)}
+                logger.info(f"Query returned {total_rows} rows in column batches")
+        except SQLAlchemyError as e:
+            logger.error(f"Error executing query batches: {e}")
+            raise QueryError(f"Query batch execution failed: {e}")
+
     def execute_non_query(self, query: str, params: Optional[Union[List, Tuple, Dict]] = None) -> int:
         """
         Execute a non-SELECT query (INSERT, UPDATE, DELETE) and return affected rows.
@@ -0,0 +1,234 @@
+"""
+Named, parameterised SQL statements.
+
+SQL built with f-strings sends a different statement text to SQL Server for
+every literal value, so each call is compiled as a new ad-hoc plan and the
+plan cache fills with single-use entries. Statements registered here have a
+fixed text with bound parameters (``:name``), so the server compiles each one
+once and reuses the plan, and SQLAlchemy reuses its compiled form.
+
+Usage:
+    _NEXTID_SELECT = statement('opera.nextid.select', '''
+        SELECT nextid FROM nextid WITH (UPDLOCK, ROWLOCK)
+        WHERE RTRIM(tablename) = :tablename
+    ''')
+
+    next_val = _NEXTID_SELECT.execute(conn, {'tablename': 'atran'}).scalar()
+    df = _SOME_QUERY.query(sql_connector, {'account': 'A001'})
+
+Each statement records call counts, rows and timing; get_statement_stats()
+returns them for the diagnostics endpoint.
+
+Identifiers (table and column names) cannot be bound. Statements that vary
+by table are registered once per table, and IN lists use in_params(), which
+pads the list to a fixed set of sizes so a handful of plans cover every
+list length.
+"""
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# IN list sizes that get their own statement text; longer lists are chunked
+IN_LIST_SIZES = (1, 4, 16, 64, 256, 1024)
+
+_PARAM_RE = re.compile(r"(?<![:\w]):(\w+)")
+
+
+class StatementStats:
+    """Running totals for one statement."""
+
+    __slots__ = ('calls', 'errors', 'rows', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 2),
+            'avg_ms': round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 2),
+        }
+
+
+class Statement:
+    """A registered SQL statement with ``:name`` parameters."""
+
+    def __init__(self, name: str, sql: str, registry: 'StatementRegistry'):
+        self.name = name
+        self.sql = sql
+        self._registry = registry
+        self._text = text(sql)
+        self._qmark: Optional[Tuple[str, List[str]]] = None
+
+    def __repr__(self):
+        return f"Statement({self.name!r})"
+
+    def execute(self, conn, params: Optional[Dict[str, Any]] = None):
+        """
+        Execute on a SQLAlchemy connection (e.g. inside engine.begin()).
+
+        Returns the SQLAlchemy result.
+        """
+        with self._registry.timed(self.name) as record:
+            result = conn.execute(self._text, params or {})
+            if result.rowcount is not None and result.rowcount >= 0:
+                record(result.rowcount)
+            return result
+
+    def query(self, sql_connector, params: Optional[Dict[str, Any]] = None):
+        """Run as a SELECT through SQLConnector.execute_query and return the DataFrame."""
+        with self._registry.timed(self.name) as record:
+            df = sql_connector.execute_query(self.sql, params or None)
+            if df is not None:
+                record(len(df))
+            return df
+
+    def fetch_dicts(self, cursor, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Run on a raw pyodbc cursor and return rows as dicts.
+
+        pyodbc takes ``?`` placeholders, so the statement is rewritten once
+        and the named parameters are passed positionally.
+        """
+        if self._qmark is None:
+            self._qmark = _to_qmark(self.sql)
+        sql, names = self._qmark
+        with self._registry.timed(self.name) as record:
+            cursor.execute(sql, [(params or {})[n] for n in names])
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            record(len(rows))
+            return rows
+
+
+class StatementRegistry:
+    """Registered statements by name, with per-statement timing and counts."""
+
+    def __init__(self):
+        self._statements: Dict[str, Statement] = {}
+        self._stats: Dict[str, StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, sql: str) -> Statement:
+        """
+        Register a statement, or return the existing one with the same name.
+
+        Raises:
+            ValueError: If the name is already registered with different SQL
+        """
+        with self._lock:
+            existing = self._statements.get(name)
+            if existing is not None:
+                if existing.sql != sql:
+                    raise ValueError(f"SQL statement '{name}' is already registered with different SQL")
+                return existing
+            stmt = Statement(name, sql, self)
+            self._statements[name] = stmt
+            self._stats[name] = StatementStats()
+            return stmt
+
+    def get(self, name: str) -> Statement:
+        with self._lock:
+            return self._statements[name]
+
+    @contextmanager
+    def timed(self, name: str):
+        """Time a call to the named statement. Yields record(rows)."""
+        rows = [0]
+
+        def record(count: int):
+            rows[0] = count
+
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield record
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                stats = self._stats.setdefault(name, StatementStats())
+                stats.calls += 1
+                stats.rows += rows[0]
+                stats.total_ms += elapsed_ms
+                stats.max_ms = max(stats.max_ms, elapsed_ms)
+                if failed:
+                    stats.errors += 1
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-statement totals, slowest total time first."""
+        with self._lock:
+            result = [{'name': name, **stats.to_dict()} for name, stats in self._stats.items()]
+        return sorted(result, key=lambda s: s['total_ms'], reverse=True)
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = StatementStats()
+
+
+def _to_qmark(sql: str) -> Tuple[str, List[str]]:
+    """Rewrite ``:name`` placeholders to ``?``, skipping quoted literals."""
+    names: List[str] = []
+
+    def repl(match):
+        names.append(match.group(1))
+        return '?'
+
+    parts = sql.split("'")
+    for i in range(0, len(parts), 2):
+        parts[i] = _PARAM_RE.sub(repl, parts[i])
+    return "'".join(parts), names
+
+
+def in_params(prefix: str, values: Iterable[Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Bind an IN list as a fixed number of parameters.
+
+    The list is padded (by repeating its last value) to the next size in
+    IN_LIST_SIZES, and lists longer than the largest size are split into
+    chunks. Returns [(placeholders, params), ...], one entry per chunk, where
+    placeholders is ``:prefix0, :prefix1, ...`` for the IN (...) clause.
+    Callers register one statement per placeholder count.
+    """
+    values = list(values)
+    chunks = []
+    largest = IN_LIST_SIZES[-1]
+    for start in range(0, len(values), largest):
+        chunk = values[start:start + largest]
+        size = next(s for s in IN_LIST_SIZES if s >= len(chunk))
+        chunk = chunk + [chunk[-1]] * (size - len(chunk))
+        placeholders = ', '.join(f':{prefix}{i}' for i in range(size))
+        chunks.append((placeholders, {f'{prefix}{i}': v for i, v in enumerate(chunk)}))
+    return chunks
+
+
+# Shared registry
+registry = StatementRegistry()
+
+
+def statement(name: str, sql: str) -> Statement:
+    """Register a statement in the shared registry (idempotent for the same SQL)."""
+    return registry.register(name, sql)
+
+
+def get_statement_stats() -> List[Dict[str, Any]]:
+    """Per-statement call counts and timing from the shared registry."""
+    return registry.stats()
@@ -17,6 +17,8 @@ from pathlib import Path
 from typing import List, Dict, Optional, Tuple, Any
 import logging
 
+from sql_rag.statement_text_layer import extract_and_cache
+
 logger = logging.getLogger(__name__)
 
 # Default config file path
@@ -126,6 +128,9 @@ class StatementReconciler:
                 max_output_tokens=32768,
             )
         )
+
+        # Parse PDFs with a text layer locally before calling Gemini
+        self.text_layer_enabled = config.getboolean('extraction', 'text_layer', fallback=True)
         logger.info(f"StatementReconciler initialized with Gemini model: {self.model_name}")
 
     def find_bank_code_from_statement(self, statement_info: StatementInfo) -> Optional[Dict[str, Any]]:
@@ -505,6 +510,11 @@ class StatementReconciler:
             info_data, _ = cached
             return info_data
 
+        text_result = (extract_and_cache(pdf_bytes, self._calculate_opening_balance, cache, pdf_hash, pdf_path)
+                       if self.text_layer_enabled else None)
+        if text_result:
+            return text_result[0]
+
         prompt = """Extract the statement details from this bank statement PDF.
 
 Bank statements vary in layout — apply this logic:
@@ -575,24 +585,33 @@ RULES:
             logger.warning(f"Statement info extraction failed: {e}")
             return None
 
-    def extract_transactions_from_pdf(self, pdf_path: str) -> Tuple[StatementInfo, List[StatementTransaction]]:
+    def extract_transactions_from_pdf(self, pdf_path: str, cache=None, pdf_bytes: Optional[bytes] = None,
+                                      pdf_hash: Optional[str] = None) -> Tuple[StatementInfo, List[StatementTransaction]]:
         """
         Extract transactions from a bank statement PDF using Gemini Vision.
         Results are cached by PDF content hash to avoid redundant API calls.
 
         Args:
             pdf_path: Path to the PDF file
+            cache: Optional PDFExtractionCache (defaults to the current company's cache).
+                   Background jobs pass the cache pinned at submit time.
+            pdf_bytes: Contents of pdf_path, if the caller has already read them
+            pdf_hash: cache.hash_pdf(pdf_bytes), if the caller has already computed it
 
         Returns:
             Tuple of (StatementInfo, list of StatementTransaction)
         """
         # Read the PDF
-        pdf_bytes = Path(pdf_path).read_bytes()
+        if pdf_bytes is None:
+            pdf_bytes = Path(pdf_path).read_bytes()
+            pdf_hash = None
 
         # Check cache first
-        from sql_rag.pdf_extraction_cache import get_extraction_cache
-        cache = get_extraction_cache()
-        pdf_hash = cache.hash_pdf(pdf_bytes)
+        if cache is None:
+            from sql_rag.pdf_extraction_cache import get_extraction_cache
+            cache = get_extraction_cache()
+        if pdf_hash is None:
+            pdf_hash = cache.hash_pdf(pdf_bytes)
         cached = cache.get(pdf_hash)
         logger.info(f"extract_transactions_from_pdf: hash={pdf_hash[:16]}, cache_path={cache.db_path}, cached={'HIT' if cached else 'MISS'}")
         if cached:
@@ -608,6 +627,11 @@ RULES:
             else:
                 return self._parse_extraction_result(info_data, raw_transactions, pdf_path)
 
+        text_result = (extract_and_cache(pdf_bytes, self._calculate_opening_balance, cache, pdf_hash, pdf_path)
+                       if self.text_layer_enabled else None)
+        if text_result:
+            return self._parse_extraction_result(text_result[0], text_result[1], pdf_path)
+
         # Use Gemini to extract transactions
         extraction_prompt = """You are extracting data from a bank statement PDF. Process ALL pages.
 
@@ -31,6 +31,7 @@ from sql_rag.statement_reconcile import (
     StatementInfo,
     _safe_float
 )
+from sql_rag.statement_text_layer import extract_and_cache
 
 
 class StatementReconcilerOpera3:
@@ -86,6 +87,9 @@ class StatementReconcilerOpera3:
 
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(self.model_name)
+
+        # Parse PDFs with a text layer locally before calling Gemini
+        self.text_layer_enabled = config.getboolean('extraction', 'text_layer', fallback=True)
         logger.info(f"StatementReconcilerOpera3 initialized with Gemini model: {self.model_name}")
 
     def find_bank_code_from_statement(self, statement_info: StatementInfo) -> Optional[Dict[str, Any]]:
@@ -313,6 +317,11 @@ class StatementReconcilerOpera3:
             info_data, _ = cached
             return info_data
 
+        text_result = (extract_and_cache(pdf_bytes, self._calculate_opening_balance, cache, pdf_hash, pdf_path)
+                       if self.text_layer_enabled else None)
+        if text_result:
+            return text_result[0]
+
         prompt = """Look at this bank statement PDF and extract the statement details.
 
 Look carefully for the opening balance. It may be labelled as:
@@ -379,6 +388,11 @@ IMPORTANT: Return actual values from this document, not examples. Return ONLY va
             if not info_data.get('_info_only'):
                 return self._parse_extraction_result(info_data, raw_transactions, pdf_path)
 
+        text_result = (extract_and_cache(pdf_bytes, self._calculate_opening_balance, cache, pdf_hash, pdf_path)
+                       if self.text_layer_enabled else None)
+        if text_result:
+            return self._parse_extraction_result(text_result[0], text_result[1], pdf_path)
+
         # Use Gemini to extract transactions
         extraction_prompt = """You are extracting data from a bank statement PDF. Process ALL pages.
 
@@ -0,0 +1,185 @@
+"""
+Statement Folder Scan Index
+
+Remembers, per PDF path, the file's size/mtime, its SHA256 hash and the
+statement header info (balances, period, bank details) so repeat folder scans
+only need a stat() per file. The index lives in the same per-company SQLite
+database as the PDF extraction cache.
+
+A file whose size or mtime has changed is treated as new: it is read and hashed
+again, and if the extraction cache doesn't already know the hash, the cheap
+header-only probe (extract_statement_info_only) is run. New files are probed
+concurrently.
+"""
+
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROBE_WORKERS = 4
+
+
+@dataclass
+class ScanEntry:
+    """What a folder scan knows about one PDF."""
+    path: str
+    file_size: int
+    mtime: float
+    pdf_hash: Optional[str] = None
+    info: Optional[Dict[str, Any]] = None
+    from_index: bool = False
+
+
+def _has_balances(info: Optional[Dict[str, Any]]) -> bool:
+    return bool(info) and (info.get('opening_balance') is not None or info.get('closing_balance') is not None)
+
+
+class StatementScanIndex:
+    """
+    (path, size, mtime) -> (hash, header info) index for statement folder scans.
+
+    Args:
+        cache: PDFExtractionCache whose database holds the index
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.db_path = cache.db_path
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scan_index (
+                    file_path TEXT PRIMARY KEY,
+                    file_size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    pdf_hash TEXT NOT NULL,
+                    statement_info_json TEXT,
+                    scanned_at TEXT NOT NULL
+                )
+            """)
+
+    def _load(self, paths: List[str]) -> Dict[str, sqlite3.Row]:
+        rows = {}
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for row in conn.execute(
+                    f"SELECT * FROM scan_index WHERE file_path IN ({placeholders})", chunk
+                ):
+                    rows[row['file_path']] = row
+        return rows
+
+    def _store(self, entries: List[ScanEntry], mtimes_ns: Dict[str, int]):
+        if not entries:
+            return
+        now = datetime.utcnow().isoformat()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO scan_index
+                (file_path, file_size, mtime_ns, pdf_hash, statement_info_json, scanned_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                (e.path, e.file_size, mtimes_ns[e.path], e.pdf_hash,
+                 json.dumps(e.info, default=str) if e.info else None, now)
+                for e in entries
+            ])
+
+    def forget(self, file_path: str):
+        """Drop one file from the index (e.g. after its extraction was corrected)."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM scan_index WHERE file_path = ?", (str(file_path),))
+
+    def scan(
+        self,
+        file_paths: Iterable[Path],
+        probe: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+        max_workers: int = DEFAULT_PROBE_WORKERS,
+        with_info: bool = True,
+    ) -> Dict[str, ScanEntry]:
+        """
+        Resolve hash and header info for each PDF.
+
+        Args:
+            file_paths: PDFs to scan
+            probe: Header-only extraction for files the extraction cache doesn't
+                   know yet (normally reconciler.extract_statement_info_only).
+                   When None, uncached files come back with info=None.
+            max_workers: Concurrent probes for new files
+            with_info: When False, only size and mtime are filled in; nothing
+                       is read, hashed or probed and the index is not touched
+
+        Returns:
+            Dict of str(path) -> ScanEntry
+        """
+        entries: Dict[str, ScanEntry] = {}
+        mtimes_ns: Dict[str, int] = {}
+        for file_path in file_paths:
+            st = Path(file_path).stat()
+            key = str(file_path)
+            entries[key] = ScanEntry(path=key, file_size=st.st_size, mtime=st.st_mtime)
+            mtimes_ns[key] = st.st_mtime_ns
+        if not with_info:
+            return entries
+
+        try:
+            indexed = self._load(list(entries))
+        except Exception as e:
+            logger.warning(f"Scan index lookup failed: {e}")
+            indexed = {}
+
+        stale: List[ScanEntry] = []
+        for key, entry in entries.items():
+            row = indexed.get(key)
+            if row and row['file_size'] == entry.file_size and row['mtime_ns'] == mtimes_ns[key]:
+                entry.pdf_hash = row['pdf_hash']
+                entry.from_index = True
+                # The extraction cache may have been corrected since the last scan
+                entry.info = self.cache.get_info(entry.pdf_hash)
+                if entry.info is None and row['statement_info_json']:
+                    entry.info = json.loads(row['statement_info_json'])
+                if _has_balances(entry.info):
+                    continue
+            stale.append(entry)
+
+        def resolve(entry: ScanEntry) -> ScanEntry:
+            try:
+                if entry.pdf_hash is None:
+                    entry.pdf_hash = self.cache.hash_pdf(Path(entry.path).read_bytes())
+                    entry.info = self.cache.get_info(entry.pdf_hash)
+                if not _has_balances(entry.info) and probe is not None:
+                    entry.info = probe(entry.path)
+            except Exception as e:
+                logger.warning(f"Could not probe {Path(entry.path).name}: {e}")
+            return entry
+
+        if stale:
+            workers = max(1, min(max_workers, len(stale)))
+            try:
+                if workers == 1:
+                    for entry in stale:
+                        resolve(entry)
+                else:
+                    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stmt-probe') as pool:
+                        list(pool.map(resolve, stale))
+            finally:
+                # Remember hashes even when the probe found nothing, so the next
+                # scan at least skips reading the file
+                try:
+                    self._store([e for e in stale if e.pdf_hash], mtimes_ns)
+                except Exception as e:
+                    logger.warning(f"Scan index store failed: {e}")
+
+        logger.info(f"Statement scan: {len(entries)} PDF(s), {len(entries) - len(stale)} from index, {len(stale)} resolved")
+        return entries
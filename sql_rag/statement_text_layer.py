@@ -0,0 +1,507 @@
+"""
+Text-Layer Bank Statement Extraction
+
+Fast path for bank statement PDFs produced by the bank's own systems, which
+carry a real text layer. Pulls the text locally (pdfplumber) and parses the
+transaction table deterministically, so the Gemini vision model is only needed
+for scanned or unusual statements.
+
+The parser is deliberately conservative. It works out money in/out from the
+movement of the running balance, not from column positions, and the result is
+only used when the whole balance chain validates (opening + movements =
+every running balance = closing). Anything ambiguous returns None and the
+caller falls back to the LLM.
+
+Output is the same (info_data, raw_transactions) shape the Gemini extraction
+returns, so it goes through the same _parse_extraction_result and cache.
+"""
+
+import io
+import logging
+import re
+from datetime import date, datetime
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sql_rag.bank_parsers import CSVParser
+
+logger = logging.getLogger(__name__)
+
+# Model name recorded in PDFExtractionCache for text-layer results
+TEXT_LAYER_MODEL = 'text-layer'
+
+# Below this many characters per page the PDF is treated as scanned
+MIN_CHARS_PER_PAGE = 200
+
+# Most unlabelled amounts allowed between two running balances
+MAX_UNRESOLVED_GROUP = 8
+
+# Display names for the banks in CSVParser.BANK_FORMATS, plus banks that only
+# issue PDF statements. Matched against the first page to fill bank_name.
+BANK_NAMES = {
+    'barclays': ['Barclays'],
+    'lloyds': ['Lloyds Bank', 'Lloyds'],
+    'hsbc': ['HSBC'],
+    'natwest': ['NatWest', 'National Westminster'],
+    'santander': ['Santander'],
+    'metro': ['Metro Bank'],
+    'starling': ['Starling Bank', 'Starling'],
+    'monzo': ['Monzo'],
+    'nationwide': ['Nationwide'],
+    'revolut': ['Revolut'],
+    'tide': ['Tide'],
+    'rbs': ['Royal Bank of Scotland'],
+    'bank_of_scotland': ['Bank of Scotland'],
+    'tsb': ['TSB'],
+    'coop': ['Co-operative Bank', 'co-operativebank'],
+    'virgin': ['Virgin Money'],
+    'handelsbanken': ['Handelsbanken'],
+    'cashplus': ['Cashplus'],
+}
+
+_MONTHS = r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*'
+
+# Dates as they appear at the start of a statement line
+_LINE_DATE = re.compile(
+    r'^(?P<date>\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{1,2}[\s-]?' + _MONTHS + r'(?:[\s-]?\d{2,4})?)\b\s*',
+    re.IGNORECASE,
+)
+
+# Money amounts always have pence; optional sign, currency and CR/DR marker
+_AMOUNT = r'-?£?\d{1,3}(?:,?\d{3})*\.\d{2}-?(?:\s?(?:CR|DR|D))?'
+_TRAILING_AMOUNTS = re.compile(r'(?P<amounts>(?:\s+' + _AMOUNT + r'){1,3})\s*$', re.IGNORECASE)
+_AMOUNT_TOKEN = re.compile(_AMOUNT, re.IGNORECASE)
+
+_OPENING_LABEL = re.compile(
+    r'balance\s+brought\s+forward|brought\s+forward|opening\s+balance|previous\s+balance|'
+    r'start\s+balance|balance\s+b/?f',
+    re.IGNORECASE,
+)
+_CLOSING_LABEL = re.compile(
+    r'balance\s+carried\s+forward|carried\s+forward|closing\s+balance|end\s+balance|balance\s+c/?f',
+    re.IGNORECASE,
+)
+_TABLE_HEADER = re.compile(r'\bbalance\b', re.IGNORECASE)
+_TOTALS = re.compile(r'^(?:totals?|sub-?totals?|total\s+(?:paid|money|payments|receipts))\b', re.IGNORECASE)
+
+_SORT_CODE = re.compile(r'sort\s*code[:\s]*(\d{2})[-\s]?(\d{2})[-\s]?(\d{2})', re.IGNORECASE)
+_SORT_CODE_BARE = re.compile(r'\b(\d{2})-(\d{2})-(\d{2})\b')
+_ACCOUNT_NO = re.compile(r'account\s*(?:number|no\.?)[:\s]*(\d{8})\b', re.IGNORECASE)
+# Tabular headers: "60-50-06 41638069" or "41638069 60-50-06"
+_ACCOUNT_BESIDE_SORT = re.compile(r'\b\d{2}-\d{2}-\d{2}\s+(\d{8})\b|\b(\d{8})\s+\d{2}-\d{2}-\d{2}\b')
+_PERIOD = re.compile(
+    r'(\d{1,2}[\s-]?' + _MONTHS + r'[\s-]?\d{4}|\d{1,2}/\d{1,2}/\d{4})\s*(?:to|-|–|until)\s*'
+    r'(\d{1,2}[\s-]?' + _MONTHS + r'[\s-]?\d{4}|\d{1,2}/\d{1,2}/\d{4})',
+    re.IGNORECASE,
+)
+
+# Leading codes that identify the transaction type, and which way money moves
+TYPE_CODES = {
+    'DD': 'out', 'D/D': 'out', 'STO': 'out', 'SO': 'out', 'S/O': 'out', 'CHQ': 'out',
+    'DEB': 'out', 'CARD': 'out', 'VIS': 'out', 'BP': 'out', 'FPO': 'out', 'CHG': 'out',
+    'BGC': 'in', 'FPI': 'in', 'CR': 'in', 'TFR': None, 'BACS': None, 'DIR': None,
+    'FP': None, 'EBP': None, 'IBP': None, 'CHP': None,
+}
+
+_DATE_FORMATS = ['%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d-%m-%y', '%d.%m.%Y', '%d.%m.%y',
+                 '%d %b %Y', '%d %B %Y', '%d %b %y', '%d-%b-%Y', '%d-%b-%y', '%d%b%Y', '%d%b%y',
+                 '%d %b', '%d %B', '%d-%b', '%d%b']
+
+_csv_parser = CSVParser()
+
+
+def extract_pdf_text(pdf_bytes: bytes) -> Optional[List[str]]:
+    """
+    Extract the text layer of each page, or None if pdfplumber is not
+    installed or the PDF has no usable text (scanned image).
+    """
+    try:
+        import pdfplumber
+    except ImportError:
+        logger.debug("pdfplumber not installed — text-layer extraction disabled")
+        return None
+
+    try:
+        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+            pages = [(page.extract_text() or '') for page in pdf.pages]
+    except Exception as e:
+        logger.debug(f"Text layer read failed: {e}")
+        return None
+
+    if not pages or sum(len(p) for p in pages) < MIN_CHARS_PER_PAGE * len(pages) / 2:
+        return None
+    return pages
+
+
+def _parse_date(text: str, default_year: Optional[int], period_end: Optional[date]) -> Optional[date]:
+    """Parse a statement date, inferring the year from the period for day/month dates."""
+    cleaned = re.sub(r'\s+', ' ', text.strip())
+    cleaned = re.sub(r'(?i)sept\b', 'Sep', cleaned)
+    for fmt in _DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(cleaned, fmt)
+        except ValueError:
+            continue
+        if '%y' not in fmt.lower():
+            if default_year is None:
+                return None
+            parsed = parsed.replace(year=default_year)
+            # Statements spanning New Year: December lines belong to the prior year
+            if period_end and parsed.date() > period_end:
+                parsed = parsed.replace(year=default_year - 1)
+        return parsed.date()
+    return None
+
+
+def _to_pence(token: str) -> Optional[int]:
+    """Convert an amount token to signed pence (DR / trailing minus = negative)."""
+    token = token.strip()
+    negative = False
+    marker = re.search(r'\s?(CR|DR|D)$', token, re.IGNORECASE)
+    if marker:
+        negative = marker.group(1).upper() in ('DR', 'D')
+        token = token[:marker.start()]
+    if token.endswith('-'):
+        negative = True
+        token = token[:-1]
+    value = _csv_parser._parse_amount(token)
+    if value is None:
+        return None
+    pence = int(round(abs(value) * 100))
+    return -pence if negative or value < 0 else pence
+
+
+def _parse_header(first_pages: str) -> Dict[str, Any]:
+    """Bank name, account details and statement period from the first page(s)."""
+    info: Dict[str, Any] = {'bank_name': 'Unknown', 'account_number': '', 'sort_code': None,
+                            'statement_date': None, 'period_start': None, 'period_end': None}
+
+    lowered = first_pages.lower()
+    best = None
+    for names in BANK_NAMES.values():
+        for name in names:
+            pos = lowered.find(name.lower())
+            if pos >= 0 and (best is None or pos < best[0]):
+                best = (pos, names[0])
+    if best:
+        info['bank_name'] = best[1]
+
+    m = _SORT_CODE.search(first_pages) or _SORT_CODE_BARE.search(first_pages)
+    if m:
+        info['sort_code'] = '-'.join(m.groups())
+    m = _ACCOUNT_NO.search(first_pages) or _ACCOUNT_BESIDE_SORT.search(first_pages)
+    if m:
+        info['account_number'] = next(g for g in m.groups() if g)
+
+    m = _PERIOD.search(first_pages)
+    if m:
+        start = _parse_date(m.group(1), None, None)
+        end = _parse_date(m.group(2), None, None)
+        if start and end and start <= end:
+            info['period_start'] = start.isoformat()
+            info['period_end'] = end.isoformat()
+            info['statement_date'] = end.isoformat()
+    return info
+
+
+def _split_type(description: str) -> Tuple[Optional[str], str]:
+    """Split a leading type code (DD, STO, BGC...) off the description."""
+    parts = description.split(None, 1)
+    if parts and parts[0].upper().rstrip('.') in TYPE_CODES:
+        return parts[0].upper().rstrip('.'), (parts[1] if len(parts) > 1 else '')
+    return None, description
+
+
+def _parse_lines(pages: List[str], info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Walk every line and collect candidate transaction rows.
+
+    Returns dict with 'rows' (date, description, amounts in pence, balance in
+    pence or None), and labelled 'opening'/'closing' balances if present.
+    """
+    period_end = date.fromisoformat(info['period_end']) if info.get('period_end') else None
+    default_year = period_end.year if period_end else None
+
+    rows: List[Dict[str, Any]] = []
+    opening = closing = None
+    current_date: Optional[date] = None
+    pending_text: List[str] = []
+
+    for page in pages:
+        pending_text = []
+        for raw_line in page.splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            date_match = _LINE_DATE.match(line)
+            line_date = None
+            if date_match:
+                line_date = _parse_date(date_match.group('date'), default_year, period_end)
+            rest = line[date_match.end():] if line_date else line
+
+            amounts_match = _TRAILING_AMOUNTS.search(rest)
+            if _OPENING_LABEL.search(rest) and amounts_match:
+                tokens = _AMOUNT_TOKEN.findall(amounts_match.group('amounts'))
+                if opening is None:
+                    opening = _to_pence(tokens[-1])
+                pending_text = []
+                if line_date:
+                    current_date = line_date
+                continue
+            if _CLOSING_LABEL.search(rest) and amounts_match:
+                tokens = _AMOUNT_TOKEN.findall(amounts_match.group('amounts'))
+                closing = _to_pence(tokens[-1])
+                pending_text = []
+                continue
+
+            if line_date:
+                current_date = line_date
+
+            if _TOTALS.match(rest):
+                pending_text = []
+                continue
+
+            if not amounts_match:
+                if _TABLE_HEADER.search(rest) and len(rest.split()) <= 8:
+                    pending_text = []
+                elif current_date is not None:
+                    pending_text = (pending_text + [rest])[-3:]
+                continue
+
+            if current_date is None:
+                continue  # Amounts before any dated line are summary/header figures
+
+            tokens = _AMOUNT_TOKEN.findall(amounts_match.group('amounts'))
+            values = [_to_pence(t) for t in tokens]
+            if any(v is None for v in values):
+                return None
+            description = ' '.join(pending_text + [rest[:amounts_match.start()].strip()]).strip()
+            pending_text = []
+
+            if len(values) == 1:
+                amount, paid_out, paid_in, balance = values[0], None, None, None
+            elif len(values) == 2:
+                amount, paid_out, paid_in, balance = values[0], None, None, values[1]
+            else:
+                # Three columns: paid out, paid in, balance
+                amount, paid_out, paid_in, balance = None, abs(values[0]), abs(values[1]), values[2]
+
+            rows.append({
+                'date': current_date,
+                'description': description,
+                'amount': abs(amount) if amount is not None else None,
+                'negative': amount is not None and amount < 0,
+                'paid_out': paid_out,
+                'paid_in': paid_in,
+                'balance': balance,
+            })
+
+    if not rows:
+        return None
+    return {'rows': rows, 'opening': opening, 'closing': closing}
+
+
+def _hint(description: str) -> Optional[str]:
+    type_code, _ = _split_type(description)
+    return TYPE_CODES.get(type_code) if type_code else None
+
+
+def _resolve_directions(rows: List[Dict[str, Any]], opening: Optional[int]) -> Optional[List[int]]:
+    """
+    Work out the signed movement of each row from the running balance.
+
+    Statements that print debits with a minus sign are taken at face value.
+    Otherwise rows without their own balance are grouped up to the next
+    balance and the single in/out assignment that reaches it is chosen.
+    Returns None if any group is ambiguous or cannot be reconciled.
+    """
+    signed: List[Optional[int]] = [None] * len(rows)
+    previous = opening
+    group: List[int] = []
+    signed_amounts = any(row['negative'] for row in rows)
+
+    for idx, row in enumerate(rows):
+        if row['amount'] is None:
+            # Explicit paid out / paid in columns
+            signed[idx] = (row['paid_in'] or 0) - (row['paid_out'] or 0)
+        elif signed_amounts:
+            signed[idx] = -row['amount'] if row['negative'] else row['amount']
+        group.append(idx)
+        if row['balance'] is None:
+            continue
+
+        unresolved = [i for i in group if signed[i] is None]
+        if len(unresolved) > MAX_UNRESOLVED_GROUP:
+            return None
+        fixed = sum(signed[i] for i in group if signed[i] is not None)
+
+        if previous is None:
+            # First balance with no brought-forward: only type codes can tell us
+            for i in unresolved:
+                hint = _hint(rows[i]['description'])
+                if hint is None:
+                    return None
+                signed[i] = rows[i]['amount'] if hint == 'in' else -rows[i]['amount']
+        else:
+            target = row['balance'] - previous - fixed
+            matches = []
+            for signs in product((1, -1), repeat=len(unresolved)):
+                if sum(s * rows[i]['amount'] for s, i in zip(signs, unresolved)) == target:
+                    matches.append(signs)
+            if not matches:
+                return None
+            if len(matches) > 1:
+                # Equal amounts can swap direction; use type codes to break the tie
+                hinted = [m for m in matches if all(
+                    _hint(rows[i]['description']) in (None, 'in' if s > 0 else 'out')
+                    for s, i in zip(m, unresolved)
+                )]
+                if len({tuple(m) for m in hinted}) != 1:
+                    return None
+                matches = hinted
+            for s, i in zip(matches[0], unresolved):
+                signed[i] = s * rows[i]['amount']
+
+        previous = row['balance']
+        group = []
+
+    if group:
+        # Trailing rows after the last running balance can't be verified
+        return None
+    return signed
+
+
+def _build_result(info: Dict[str, Any], rows: List[Dict[str, Any]], signed: List[int],
+                  opening: Optional[int], closing: Optional[int]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    raw_transactions = []
+    for row, movement in zip(rows, signed):
+        type_code, _ = _split_type(row['description'])
+        raw_transactions.append({
+            'date': row['date'].isoformat(),
+            'description': row['description'],
+            'money_out': round(-movement / 100, 2) if movement < 0 else None,
+            'money_in': round(movement / 100, 2) if movement > 0 else None,
+            'balance': round(row['balance'] / 100, 2) if row['balance'] is not None else None,
+            'type': type_code,
+            'reference': None,
+        })
+
+    last_balance = next((r['balance'] for r in reversed(rows) if r['balance'] is not None), None)
+    closing_pence = closing if closing is not None else last_balance
+    info_data = dict(info)
+    info_data.update({
+        'format': 'running_balance',
+        'transaction_order': 'oldest_first',
+        'summary': {
+            'opening_balance': round(opening / 100, 2) if opening is not None else None,
+            'closing_balance': round(closing / 100, 2) if closing is not None else None,
+            'total_in': None,
+            'total_out': None,
+        },
+        'opening_balance': round(opening / 100, 2) if opening is not None else None,
+        'closing_balance': round(closing_pence / 100, 2) if closing_pence is not None else None,
+        'extraction_method': TEXT_LAYER_MODEL,
+    })
+    if not info_data.get('period_start'):
+        info_data['period_start'] = rows[0]['date'].isoformat()
+        info_data['period_end'] = rows[-1]['date'].isoformat()
+        info_data['statement_date'] = info_data['period_end']
+    return info_data, raw_transactions
+
+
+def _chain_valid(raw_transactions: List[Dict[str, Any]], opening: float, closing: Optional[float]) -> bool:
+    """Every running balance must follow from the opening, and end on the closing."""
+    current = round(opening * 100)
+    for t in raw_transactions:
+        current += round((t['money_in'] or 0) * 100) - round((t['money_out'] or 0) * 100)
+        if t['balance'] is not None and round(t['balance'] * 100) != current:
+            return False
+    return closing is None or round(closing * 100) == current
+
+
+def parse_statement_pages(
+    pages: List[str],
+    calculate_opening: Callable[[List[Dict[str, Any]], Optional[float], Dict[str, Any]], Optional[float]],
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Parse statement text into (info_data, raw_transactions), or None.
+
+    Args:
+        pages: Text of each page
+        calculate_opening: The reconciler's _calculate_opening_balance, used so
+            the opening balance is derived exactly as for LLM extractions
+
+    Only returns a result when the balance chain validates from opening to
+    closing; otherwise the caller should use the LLM.
+    """
+    info = _parse_header('\n'.join(pages[:2]))
+    parsed = _parse_lines(pages, info)
+    if not parsed:
+        return None
+
+    # Statements from some online banks list newest first
+    for rows in (parsed['rows'], list(reversed(parsed['rows']))):
+        signed = _resolve_directions(rows, parsed['opening'])
+        if signed is None:
+            continue
+        info_data, raw_transactions = _build_result(info, rows, signed, parsed['opening'], parsed['closing'])
+        closing = info_data['closing_balance']
+        opening = calculate_opening(raw_transactions, closing, info_data)
+        if opening is None:
+            continue
+        if parsed['opening'] is not None and round(opening * 100) != parsed['opening']:
+            continue
+        if not _chain_valid(raw_transactions, opening, closing):
+            continue
+        info_data['opening_balance'] = opening
+        return info_data, raw_transactions
+    return None
+
+
+def extract_from_text_layer(
+    pdf_bytes: bytes,
+    calculate_opening: Callable[[List[Dict[str, Any]], Optional[float], Dict[str, Any]], Optional[float]],
+    source_label: str = '',
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Try to extract a bank statement from its text layer.
+
+    Returns (info_data, raw_transactions) in the Gemini extraction shape, or
+    None if the PDF has no text layer or the parse does not validate.
+    """
+    pages = extract_pdf_text(pdf_bytes)
+    if not pages:
+        return None
+    try:
+        result = parse_statement_pages(pages, calculate_opening)
+    except Exception as e:
+        logger.warning(f"Text-layer parse error for {source_label}: {e}")
+        return None
+    if result:
+        logger.info(f"Text-layer extraction validated for {source_label}: {len(result[1])} transactions")
+    else:
+        logger.info(f"Text-layer extraction did not validate for {source_label} — using LLM")
+    return result
+
+
+def extract_and_cache(
+    pdf_bytes: bytes,
+    calculate_opening: Callable[[List[Dict[str, Any]], Optional[float], Dict[str, Any]], Optional[float]],
+    cache,
+    pdf_hash: str,
+    source_label: str = '',
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    extract_from_text_layer(), storing a validated result in the
+    PDFExtractionCache under pdf_hash like an LLM extraction.
+
+    Used by the SQL SE and Opera 3 statement reconcilers before they fall
+    back to Gemini.
+    """
+    result = extract_from_text_layer(pdf_bytes, calculate_opening, source_label)
+    if result:
+        info_data, raw_transactions = result
+        cache.put(pdf_hash, info_data, raw_transactions,
+                  model_name=TEXT_LAYER_MODEL, file_size=len(pdf_bytes))
+    return result
@@ -106,7 +106,7 @@ class SupplierExtractionCache:
         return hashlib.md5(content).hexdigest()
 
     @staticmethod
-    def _hash_bytes(data: bytes) -> str:
+    def hash_bytes(data: bytes) -> str:
         """Compute MD5 hash of raw bytes."""
         return hashlib.md5(data).hexdigest()
 
@@ -138,12 +138,28 @@ class SupplierExtractionCache:
             Tuple of (SupplierStatementInfo, list of SupplierStatementLine) or None if not cached.
         """
         try:
-            file_hash = self._hash_bytes(data)
+            file_hash = self.hash_bytes(data)
             return self._get_by_hash(file_hash)
         except Exception as e:
             logger.warning(f"Supplier extraction cache lookup error for bytes: {e}")
             return None
 
+    def get_cached_hash(self, file_hash: str) -> Optional[Tuple[SupplierStatementInfo, List[SupplierStatementLine]]]:
+        """
+        Look up cached extraction result for contents already hashed with hash_bytes().
+
+        Args:
+            file_hash: MD5 hash of the file contents.
+
+        Returns:
+            Tuple of (SupplierStatementInfo, list of SupplierStatementLine) or None if not cached.
+        """
+        try:
+            return self._get_by_hash(file_hash)
+        except Exception as e:
+            logger.warning(f"Supplier extraction cache lookup error for hash: {e}")
+            return None
+
     def _get_by_hash(self, file_hash: str) -> Optional[Tuple[SupplierStatementInfo, List[SupplierStatementLine]]]:
         """
         Look up cached extraction result by hash.
@@ -191,11 +207,24 @@ class SupplierExtractionCache:
             extracted_data: Tuple of (SupplierStatementInfo, list of SupplierStatementLine).
         """
         try:
-            file_hash = self._hash_bytes(data)
+            file_hash = self.hash_bytes(data)
             self._save_by_hash(file_hash, extracted_data)
         except Exception as e:
             logger.warning(f"Supplier extraction cache save error for bytes: {e}")
 
+    def save_cache_hash(self, file_hash: str, extracted_data: Tuple[SupplierStatementInfo, List[SupplierStatementLine]]) -> None:
+        """
+        Save extraction result to cache for contents already hashed with hash_bytes().
+
+        Args:
+            file_hash: MD5 hash of the file contents.
+            extracted_data: Tuple of (SupplierStatementInfo, list of SupplierStatementLine).
+        """
+        try:
+            self._save_by_hash(file_hash, extracted_data)
+        except Exception as e:
+            logger.warning(f"Supplier extraction cache save error for hash: {e}")
+
     def _save_by_hash(self, file_hash: str, extracted_data: Tuple[SupplierStatementInfo, List[SupplierStatementLine]]) -> None:
         """
         Save extraction result to cache by hash.
@@ -297,6 +326,11 @@ class SupplierStatementExtractor:
         self.model = genai.GenerativeModel(model)
         self._cache = SupplierExtractionCache()
 
+    @property
+    def cache(self) -> SupplierExtractionCache:
+        """Extraction cache bound to the company active when the extractor was created."""
+        return self._cache
+
     def extract_from_pdf(self, pdf_path: str) -> Tuple[SupplierStatementInfo, List[SupplierStatementLine]]:
         """
         Extract statement data from a PDF file using Gemini Vision.
@@ -310,21 +344,10 @@ class SupplierStatementExtractor:
         Returns:
             Tuple of (SupplierStatementInfo, list of SupplierStatementLine)
         """
-        # Check cache first
-        cached = self._cache.get_cached(pdf_path)
-        if cached is not None:
-            return cached
-
-        # Read and encode the PDF
-        pdf_bytes = Path(pdf_path).read_bytes()
-        result = self._extract_with_vision(pdf_bytes, "application/pdf")
+        return self.extract_from_pdf_bytes(Path(pdf_path).read_bytes())
 
-        # Cache the result keyed by file contents
-        self._cache.save_cache(pdf_path, result)
-
-        return result
-
-    def extract_from_pdf_bytes(self, pdf_bytes: bytes) -> Tuple[SupplierStatementInfo, List[SupplierStatementLine]]:
+    def extract_from_pdf_bytes(self, pdf_bytes: bytes,
+                               file_hash: Optional[str] = None) -> Tuple[SupplierStatementInfo, List[SupplierStatementLine]]:
         """
         Extract statement data from PDF bytes.
 
@@ -333,19 +356,24 @@ class SupplierStatementExtractor:
 
         Args:
             pdf_bytes: Raw PDF content
+            file_hash: SupplierExtractionCache.hash_bytes(pdf_bytes), if the caller
+                has already computed it
 
         Returns:
             Tuple of (SupplierStatementInfo, list of SupplierStatementLine)
         """
+        if file_hash is None:
+            file_hash = self._cache.hash_bytes(pdf_bytes)
+
         # Check cache first
-        cached = self._cache.get_cached_bytes(pdf_bytes)
+        cached = self._cache.get_cached_hash(file_hash)
         if cached is not None:
             return cached
 
         result = self._extract_with_vision(pdf_bytes, "application/pdf")
 
         # Cache the result keyed by bytes hash
-        self._cache.save_cache_bytes(pdf_bytes, result)
+        self._cache.save_cache_hash(file_hash, result)
 
         return result
 
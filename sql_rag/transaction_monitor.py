@@ -14,6 +14,10 @@ import json
 from typing import Dict, List, Optional, Any, Set
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sql_rag.snapshot_diff import DEFAULT_DIFF_WORKERS, diff_rows
+from sql_rag.sql_statements import in_params, statement
 
 logger = logging.getLogger(__name__)
 
@@ -125,6 +129,17 @@ class OperaMonitorConnection:
         cursor.close()
         return rows
 
+    def execute_statement(self, stmt, params: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Execute a registered statement (sql_rag.sql_statements) and return rows as dicts."""
+        if not self._conn:
+            raise ConnectionError("Not connected")
+        cursor = self._conn.cursor()
+        try:
+            rows = stmt.fetch_dicts(cursor, params)
+        finally:
+            cursor.close()
+        return [{col: self._serialize_value(val) for col, val in row.items()} for row in rows]
+
     @staticmethod
     def _serialize_value(val):
         """Convert values to JSON-safe types."""
@@ -254,11 +269,15 @@ class OperaMonitorConnection:
             if not keys:
                 continue
             key_col = key_columns.get(table, 'id')
-            key_list = ','.join(f"'{str(k).strip()}'" for k in keys)
             try:
-                rows = self.execute_query(
-                    f"SELECT * FROM [{table}] WITH (NOLOCK) WHERE [{key_col}] IN ({key_list})"
-                )
+                rows = []
+                # Bound, padded IN lists: one cached plan per table and list size
+                for placeholders, params in in_params('k', sorted({str(k).strip() for k in keys})):
+                    stmt = statement(
+                        f'monitor.targeted_rows.{table}.{len(params)}',
+                        f"SELECT * FROM [{table}] WITH (NOLOCK) WHERE [{key_col}] IN ({placeholders})",
+                    )
+                    rows.extend(self.execute_statement(stmt, params))
                 if rows:
                     snapshots[table] = rows
             except Exception:
@@ -274,53 +293,36 @@ class OperaMonitorConnection:
 
         Returns {table_name: [{"row_key": k, "changes": [{field, before, after}], "full_row_after": row}, ...]}
         """
-        all_changes = {}
-        for table in before:
-            if table not in after:
-                continue
-            before_rows = before[table]
-            after_rows = after[table]
-            if not before_rows or not after_rows:
-                continue
+        pairs = [
+            (table, before[table], after[table]) for table in before
+            if table in after and before[table] and after[table]
+        ]
 
+        def diff_table(pair):
+            table, before_rows, after_rows = pair
             # Use 'id' as primary key if available, otherwise first column
             key_col = 'id' if 'id' in before_rows[0] else list(before_rows[0].keys())[0]
+            # New rows (INSERTs) are handled by watermark polling
+            table_diff = diff_rows(before_rows, after_rows, key_col, compare='value', strip_key=True,
+                                   fields='after', include_added=False, include_deleted=False)
+            return table, [
+                {
+                    "row_key": row_key,
+                    "changes": [{"field": field, "before": old_val, "after": new_val}
+                                for field, (old_val, new_val) in field_changes.items()],
+                    "full_row_after": row,
+                }
+                for row_key, field_changes, row in table_diff.modified
+            ]
+
+        workers = max(1, min(DEFAULT_DIFF_WORKERS, len(pairs)))
+        if workers == 1:
+            results = [diff_table(pair) for pair in pairs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='monitor-diff') as pool:
+                results = list(pool.map(diff_table, pairs))
 
-            before_by_key = {}
-            for r in before_rows:
-                k = r.get(key_col)
-                if k is not None:
-                    before_by_key[str(k).strip()] = r
-
-            for r in after_rows:
-                k = r.get(key_col)
-                if k is None:
-                    continue
-                key_str = str(k).strip()
-                old = before_by_key.get(key_str)
-                if old is None:
-                    continue  # New row — handled by watermark polling
-
-                # Compare every field
-                row_changes = []
-                for field in r:
-                    old_val = old.get(field)
-                    new_val = r[field]
-                    if old_val != new_val:
-                        row_changes.append({
-                            "field": field,
-                            "before": old_val,
-                            "after": new_val,
-                        })
-                if row_changes:
-                    if table not in all_changes:
-                        all_changes[table] = []
-                    all_changes[table].append({
-                        "row_key": key_str,
-                        "changes": row_changes,
-                        "full_row_after": r,
-                    })
-        return all_changes
+        return {table: rows for table, rows in results if rows}
 
 
 class TransactionMonitor:
@@ -0,0 +1,123 @@
+"""
+Tests for sql_rag/allocation_engine.py
+
+Verifies:
+  1. find_subset() agrees with brute force, including tie-breaking and uniqueness,
+     and a search cut short by its step budget gives the same answer every time
+  2. The allocation rules in priority order, for receipts and payments; an
+     amount match alone is only suggested unless the caller opts in
+  3. An engine reads each account's open items once and tracks balances in memory
+"""
+
+import itertools
+import random
+
+from sql_rag.allocation_engine import (
+    AccountItems, AllocationEngine, OpenItem, find_subset, plan_payment, plan_receipt,
+)
+
+
+def _brute_force(amounts, target):
+    exact = [c for r in range(len(amounts) + 1) for c in itertools.combinations(range(len(amounts)), r)
+             if sum(amounts[i] for i in c) == target]
+    return min(exact, key=lambda c: (len(c), c)) if exact else None, len(exact)
+
+
+def test_find_subset_matches_brute_force():
+    rng = random.Random(7)
+    for _ in range(200):
+        amounts = [rng.randint(1, 40) for _ in range(rng.randint(0, 11))]
+        target = rng.randint(1, 90)
+        best, ways = _brute_force(amounts, target)
+        result = find_subset(amounts, target)
+        assert result.complete
+        if best is None:
+            assert not result.exact
+            assert result.total == max(sum(amounts[i] for i in c)
+                                       for r in range(len(amounts) + 1)
+                                       for c in itertools.combinations(range(len(amounts)), r)
+                                       if sum(amounts[i] for i in c) <= target)
+        else:
+            assert (result.indices, result.unique) == (best, ways == 1)
+
+
+def test_find_subset_large_account_is_bounded():
+    amounts = [10000 + i * 37 for i in range(300)]
+    result = find_subset(amounts, amounts[3] + amounts[250])
+    assert result.exact and not result.unique and result.complete
+
+    cut_short = [find_subset(amounts, amounts[3] + amounts[250], max_steps=1000) for _ in range(3)]
+    assert not cut_short[0].complete and not cut_short[0].exact
+    assert all(r == cut_short[0] for r in cut_short)
+
+
+def _items(ledger='sales'):
+    return AccountItems(ledger, [
+        OpenItem('INV100', 100.00, 'PO-1', unique='U1', row_id=1),
+        OpenItem('INV101', 250.00, 'PO-2', unique='U2', row_id=2),
+        OpenItem('INV102', 75.50, 'AB 123', unique='U3', row_id=3),
+        OpenItem('INV103', 75.50, '', unique='U4', row_id=4),
+    ])
+
+
+def test_receipt_rules():
+    items = _items()
+
+    plan = plan_receipt(items, 350.00, 'Payment INV100 inv101')
+    assert plan.method == 'invoice_reference'
+    assert [a['ref'] for a in plan.allocations] == ['INV100', 'INV101']
+    assert plan.allocations[0] == {'ref': 'INV100', 'custref': 'PO-1', 'amount': 100.0,
+                                   'full_allocation': True, 'unique': 'U1', 'stran_id': 1}
+
+    assert 'do not match' in plan_receipt(items, 349.00, 'INV100 INV101').message
+    assert plan_receipt(items, 501.00, None).method == 'clears_account'
+
+    plan = plan_receipt(items, 325.50, None)
+    assert plan.method is None and 'more than one combination' in plan.message
+
+    # A unique amount match is suggested, and only allocated when asked for
+    plan = plan_receipt(items, 350.00, 'Thanks')
+    assert plan.method is None and plan.suggestion == ['INV100', 'INV101']
+    assert 'not allocated on amount alone' in plan.message
+    plan = plan_receipt(items, 350.00, 'Thanks', allow_amount_match=True)
+    assert (plan.method, [a['ref'] for a in plan.allocations]) == ('amount_match', ['INV100', 'INV101'])
+    assert plan_payment(items, 350.00, None, allow_amount_match=True).method == 'amount_match'
+
+    plan = plan_receipt(items, 120.00, None)
+    assert plan.method is None and plan.suggestion == ['INV100']
+
+    # Payment request refs win, and refs repeated in the description are not added twice
+    plan = plan_receipt(items, 400.00, 'ACME INV100 +1', request_refs=['INV100', 'INV101', 'INV999'])
+    assert plan.method == 'payment_request'
+    assert (plan.total_to_allocate, plan.fully_allocated) == (350.00, False)
+    plan = plan_receipt(items, 150.00, None, request_refs=['INV100', 'INV101'])
+    assert [(a['ref'], a['amount'], a['full_allocation']) for a in plan.allocations] == [
+        ('INV100', 100.0, True), ('INV101', 50.0, False)]
+
+
+def test_payment_rules_match_supplier_refs():
+    items = _items('purchase')
+    plan = plan_payment(items, 75.50, 'BACS ab 123')
+    assert plan.method == 'invoice_reference'
+    assert plan.allocations[0]['ref'] == 'INV102' and plan.allocations[0]['suppref'] == 'AB 123'
+    assert plan_payment(items, 100.00, 'inv-101').message.startswith('Invoice reference(s) found')
+
+
+def test_engine_loads_once_and_consumes():
+    loads = []
+
+    def load(accounts):
+        loads.append(accounts)
+        return {'A001': [OpenItem('INV2', 20.0, date=2), OpenItem('INV1', 10.0, date=1)]}
+
+    engine = AllocationEngine('sales', load)
+    engine.prefetch(['a001 ', 'B002'])
+    items = engine.items('A001')
+    assert [i.ref for i in items.items] == ['INV1', 'INV2']
+    assert len(engine.items('B002')) == 0
+    assert loads == [['A001', 'B002']]
+
+    engine.consume('A001', [{'ref': 'INV1', 'amount': 10.0, 'unique': ''},
+                            {'ref': 'INV2', 'amount': 5.0, 'unique': ''}])
+    assert [(i.ref, i.balance) for i in engine.items('A001').items] == [('INV2', 15.0)]
+    assert plan_receipt(engine.items('A001'), 15.0, None).method == 'single_invoice_match'
@@ -0,0 +1,73 @@
+"""
+Tests for sql_rag/bank_parsers.py
+
+Verifies:
+  1. A CSV file is detected and parsed line by line, with or without a format override
+  2. The CSV column mapping is resolved from the header (split in/out columns, generic amount columns)
+  3. QIF blocks are parsed line by line, including blocks split across reads
+  4. Files that aren't valid UTF-8 are read as latin-1
+"""
+
+from datetime import date
+
+import pytest
+
+from sql_rag.bank_parsers import CSVParser, QIFParser, detect_and_parse, parse_file
+
+
+def _write(tmp_path, name, content, encoding='utf-8'):
+    path = tmp_path / name
+    path.write_text(content, encoding=encoding)
+    return str(path)
+
+
+def test_parse_csv_file(tmp_path):
+    rows = ''.join(f'{(n % 28) + 1:02d}/03/2024,-{n}.50,Direct Debit,PAYEE {n}\tREF{n}\n' for n in range(1, 1001))
+    path = _write(tmp_path, 'big.csv', 'Date,Amount,Subcategory,Memo\n' + rows)
+
+    txns, fmt = detect_and_parse(path)
+
+    assert fmt == 'CSV'
+    assert len(txns) == 1000
+    assert txns[0].name == 'PAYEE 1' and txns[0].reference == 'REF1'
+    assert txns[-1].amount == -1000.50
+    assert [(t.date, t.amount, t.name, t.reference) for t in parse_file(path, 'CSV')] == \
+           [(t.date, t.amount, t.name, t.reference) for t in txns]
+
+
+def test_csv_split_columns_resolved_once():
+    content = '\n\nDate,Type,Description,Paid out,Paid in,Balance\n' \
+              '01/03/2024,DD,GAS,12.50,,100.00\n' \
+              '02/03/2024,CR,"ACME, LTD",,"1,000.00",1100.00\n' \
+              '03/03/2024,CR,NO AMOUNT,,,1100.00\n'
+    txns = CSVParser().parse(content, 'hsbc.csv')
+    assert [(t.date, t.amount, t.name) for t in txns] == [
+        (date(2024, 3, 1), -12.50, 'GAS'),
+        (date(2024, 3, 2), 1000.00, 'ACME, LTD'),
+    ]
+
+
+def test_csv_generic_amount_uses_first_filled_column():
+    content = 'Date,Payee,Value GBP,Sum\n2024-03-01,Foo,,5.00\n2024-03-02,Bar,-3.20,\n'
+    txns = CSVParser().parse(content)
+    assert [t.amount for t in txns] == [5.00, -3.20]
+
+
+def test_qif_blocks_stream_across_lines():
+    lines = ['!Type:Bank\n', 'D03/01/2024\n', 'T-100.00\n', 'PMERCHANT\n', '^\n',
+             'D03/02/2024\n', 'T1,200.00\n', 'PPAYER\n', '^', '\n']
+    txns = list(QIFParser().iter_parse(iter(lines)))
+    assert [(t.amount, t.name) for t in txns] == [(-100.00, 'MERCHANT'), (1200.00, 'PAYER')]
+
+
+def test_latin1_file(tmp_path):
+    path = _write(tmp_path, 'latin.csv', 'Date,Amount,Description\n01/03/2024,-5.00,CAF\xc9 \xa3\n', encoding='latin-1')
+    txns, _ = detect_and_parse(path)
+    assert txns[0].name == 'CAF\xc9 \xa3'
+
+
+def test_missing_and_unknown(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        detect_and_parse(str(tmp_path / 'nope.csv'))
+    with pytest.raises(ValueError):
+        parse_file(_write(tmp_path, 'x.csv', 'Date,Amount\n'), format_name='XLS')
@@ -0,0 +1,112 @@
+"""
+Tests for sql_rag/connection_pools.py
+
+Uses SQLite engines in place of SQLConnector.
+
+Verifies:
+  1. The registry behaves as the dict api.main used, most recently used first
+  2. New pools are warmed in the background, once at a time per pool
+  3. Idle connections of least recently used pools are closed beyond the
+     budget, including when a pool grows under load (not only on warmup)
+"""
+
+import threading
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+from sql_rag.connection_pools import ConnectionPoolRegistry
+
+
+class FakeConnector:
+    def __init__(self, tmp_path, name):
+        self.engine = create_engine(f"sqlite:///{tmp_path / name}.db", poolclass=QueuePool,
+                                    pool_size=5, max_overflow=0)
+        self.closed = False
+
+    def get_pool_status(self):
+        pool = self.engine.pool
+        return {'pool_size': pool.size(), 'checked_out_connections': pool.checkedout(),
+                'overflow': pool.overflow(), 'checkedin': pool.checkedin()}
+
+    def close_all_connections(self):
+        self.closed = True
+        self.engine.dispose()
+
+
+def test_mapping_and_warmup(tmp_path):
+    pools = ConnectionPoolRegistry(max_connections=0, warm_connections=3)
+    a, b = FakeConnector(tmp_path, 'a'), FakeConnector(tmp_path, 'b')
+    pools['opera_A'] = a
+    pools['opera_B'] = b
+    assert 'opera_A' in pools and pools.get('missing') is None
+    assert pools['opera_A'] is a
+    assert pools.recent() == ['opera_A', 'opera_B']
+
+    assert pools.warm('opera_B').result() == 3
+    assert b.get_pool_status()['checkedin'] == 3
+
+    replacement = FakeConnector(tmp_path, 'a2')
+    pools['opera_A'] = replacement
+    assert a.closed and len(pools) == 2
+
+    status = pools.status()
+    assert [p['key'] for p in status['pools']] == ['opera_A', 'opera_B']
+    assert status['open_connections'] == sum(p['open_connections'] for p in status['pools'])
+
+
+def test_warm_while_pending_reuses_warmup(tmp_path):
+    pools = ConnectionPoolRegistry(max_connections=0, warm_connections=0)
+    connector = FakeConnector(tmp_path, 'c')
+    pools['opera_C'] = connector
+    gate = threading.Event()
+    event.listen(connector.engine, 'connect', lambda *args: gate.wait(5))
+
+    first = pools.warm('opera_C', 3)
+    second = pools.warm('opera_C', 3)
+    gate.set()
+    assert second is first and first.result() == 3
+    assert connector.get_pool_status()['checkedin'] == 3
+
+
+def test_budget_releases_least_recently_used(tmp_path):
+    pools = ConnectionPoolRegistry(max_connections=4, warm_connections=0)
+    old, busy, new = (FakeConnector(tmp_path, n) for n in ('old', 'busy', 'new'))
+    pools['old'] = old
+    pools['busy'] = busy
+    pools['new'] = new
+    for key in ('old', 'new'):
+        assert pools.warm(key, connections=2).result() == 2
+    # Opening a connection in 'busy' takes the total over the budget
+    held = busy.engine.connect()
+    try:
+        assert pools.enforce_budget() == []
+        assert old.get_pool_status()['checkedin'] == 0
+        assert new.get_pool_status()['checkedin'] == 2
+        assert busy.get_pool_status()['checked_out_connections'] == 1
+    finally:
+        held.close()
+
+
+def test_budget_enforced_when_pool_grows(tmp_path):
+    pools = ConnectionPoolRegistry(max_connections=3, warm_connections=0)
+    old, new = FakeConnector(tmp_path, 'old'), FakeConnector(tmp_path, 'new')
+    pools['old'] = old
+    pools['new'] = new
+    assert pools.warm('old', connections=2).result() == 2
+
+    held = [new.engine.connect() for _ in range(2)]
+    try:
+        assert old.get_pool_status()['checkedin'] == 0
+        assert new.get_pool_status()['checked_out_connections'] == 2
+    finally:
+        for conn in held:
+            conn.close()
+
+    # A replaced or removed pool is no longer watched
+    del pools['new']
+    assert not pools._listeners.get('new')
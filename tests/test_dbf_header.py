@@ -0,0 +1,64 @@
+"""
+Tests for sql_rag/dbf_header.py
+
+Verifies:
+  1. The header reader returns the record count and field descriptors
+     without reading records (VFP backlink and deleted records included)
+  2. The cache reparses a file only when its mtime or size changes, is
+     shared per data folder, and scan() reports unreadable files per path
+"""
+
+import os
+import struct
+
+from sql_rag.dbf_header import DbfHeaderCache, get_header_cache, read_dbf_header
+
+FIELDS = [('ST_ACCOUNT', 'C', 8, 0), ('ST_TRVALUE', 'N', 14, 2), ('ST_TRDATE', 'D', 8, 0)]
+
+
+def _write_dbf(path, records, fields=FIELDS, backlink=263):
+    header_length = 32 + 32 * len(fields) + 1 + backlink
+    record_length = 1 + sum(length for _, _, length, _ in fields)
+    data = struct.pack('<BBBBIHH20x', 0x30, 126, 3, 1, records, header_length, record_length)
+    for name, ftype, length, decimals in fields:
+        data += struct.pack('<11sc4xBB14x', name.encode('ascii'), ftype.encode('ascii'), length, decimals)
+    data += b'\r' + b'\0' * backlink
+    # Records are never read, so their content does not matter
+    data += b' ' * record_length * records + b'\x1a'
+    path.write_bytes(data)
+
+
+def test_read_header(tmp_path):
+    _write_dbf(tmp_path / 'stran.dbf', 3)
+    header = read_dbf_header(tmp_path / 'stran.dbf')
+
+    assert header.record_count == 3 and header.record_length == 31
+    assert header.fields == [
+        {'name': 'ST_ACCOUNT', 'type': 'C', 'length': 8, 'decimal_count': 0},
+        {'name': 'ST_TRVALUE', 'type': 'N', 'length': 14, 'decimal_count': 2},
+        {'name': 'ST_TRDATE', 'type': 'D', 'length': 8, 'decimal_count': 0},
+    ]
+
+
+def test_cache_revalidates_and_scans(tmp_path):
+    for name in ('stran', 'ptran', 'nname'):
+        _write_dbf(tmp_path / f'{name}.dbf', 1)
+    (tmp_path / 'broken.dbf').write_bytes(b'\x30' * 10)
+
+    cache = DbfHeaderCache(max_workers=4)
+    headers = cache.scan(sorted(tmp_path.glob('*.dbf')))
+    assert isinstance(headers[str(tmp_path / 'broken.dbf')], ValueError)
+    assert headers[str(tmp_path / 'stran.dbf')].record_count == 1
+
+    cache.scan(tmp_path.glob('*.dbf'))
+    assert cache.stats() == {'cached': 3, 'hits': 3, 'misses': 5}
+
+    # Appending a record changes the size (and count) and forces a reparse
+    path = tmp_path / 'stran.dbf'
+    stat = path.stat()
+    _write_dbf(path, 2)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.get(path).record_count == 2
+
+    assert get_header_cache(str(tmp_path)) is get_header_cache(tmp_path / '.')
+    assert get_header_cache(tmp_path) is not get_header_cache(tmp_path, encoding='latin-1')
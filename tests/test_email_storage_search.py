@@ -0,0 +1,193 @@
+"""
+Tests for the full-text search in api/email/storage.py
+
+Verifies:
+  1. Search matches subject, sender, body text and attachment filenames
+  2. Partially typed words match by prefix
+  3. The index follows updates and deletes made to emails
+  4. Keyset cursor pagination walks every email exactly once, newest first,
+     including emails with no received_at (older databases allowed NULL)
+  5. search_emails ranks subject hits above body-only hits
+  6. Emails stored before the index existed are backfilled
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.email.providers.base import EmailMessage, EmailAttachment, ProviderType
+from api.email.storage import EmailStorage
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def storage(tmp_path):
+    """Fresh EmailStorage with one provider and folder."""
+    store = EmailStorage(str(tmp_path / 'email_test.db'))
+    assert store.fts_enabled
+    return store
+
+
+def _setup_provider(store):
+    provider_id = store.add_provider('test', ProviderType.IMAP, {})
+    folder_id = store.add_folder(provider_id, 'INBOX', 'Inbox')
+    return provider_id, folder_id
+
+
+def _make_email(n, subject='Hello', from_address='someone@example.com',
+                body_text='', attachments=None, received_at=None):
+    return EmailMessage(
+        message_id=f'msg-{n}',
+        folder_id='INBOX',
+        from_address=from_address,
+        subject=subject,
+        received_at=received_at or datetime(2026, 3, 1, 9, 0) + timedelta(minutes=n),
+        body_text=body_text,
+        has_attachments=bool(attachments),
+        attachments=attachments or [],
+    )
+
+
+def _search_ids(store, text):
+    return sorted(e['id'] for e in store.get_emails(search=text)['emails'])
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+def test_search_matches_all_indexed_fields(storage):
+    provider_id, folder_id = _setup_provider(storage)
+    by_subject, _ = storage.store_email(provider_id, folder_id, _make_email(1, subject='Remittance advice'))
+    by_sender, _ = storage.store_email(provider_id, folder_id, _make_email(2, from_address='payouts@gocardless.com'))
+    by_body, _ = storage.store_email(provider_id, folder_id, _make_email(3, body_text='Please find the statement enclosed'))
+    by_attachment, _ = storage.store_email(provider_id, folder_id, _make_email(
+        4, attachments=[EmailAttachment('a1', 'Barclays_March.pdf', 'application/pdf', 100)]))
+
+    assert _search_ids(storage, 'remittance') == [by_subject]
+    assert _search_ids(storage, 'gocardless') == [by_sender]
+    assert _search_ids(storage, 'statement') == [by_body]
+    assert _search_ids(storage, 'barclays') == [by_attachment]
+
+    result = storage.get_emails(search='gocardless')
+    assert result['total'] == 1
+
+
+def test_search_matches_word_prefix(storage):
+    provider_id, folder_id = _setup_provider(storage)
+    email_id, _ = storage.store_email(provider_id, folder_id, _make_email(1, subject='GoCardless payout'))
+    assert _search_ids(storage, 'gocard') == [email_id]
+    assert _search_ids(storage, 'gocard payout') == [email_id]
+    assert _search_ids(storage, 'gocard invoice') == []
+
+
+def test_search_operators_are_treated_as_text(storage):
+    provider_id, folder_id = _setup_provider(storage)
+    storage.store_email(provider_id, folder_id, _make_email(1, subject='Invoice NEAR due'))
+    # Quotes, colons and FTS keywords must not raise a syntax error
+    assert storage.get_emails(search='"invoice" NEAR: (')['total'] == 1
+    assert storage.get_emails(search='***')['total'] == 1
+
+
+def test_index_follows_updates_and_deletes(storage):
+    provider_id, folder_id = _setup_provider(storage)
+    email_id, _ = storage.store_email(provider_id, folder_id, _make_email(1, subject='Original'))
+
+    with storage._get_connection() as conn:
+        conn.execute("UPDATE emails SET subject = 'Changed' WHERE id = ?", (email_id,))
+    assert _search_ids(storage, 'original') == []
+    assert _search_ids(storage, 'changed') == [email_id]
+
+    with storage._get_connection() as conn:
+        conn.execute("DELETE FROM emails WHERE id = ?", (email_id,))
+    assert _search_ids(storage, 'changed') == []
+
+
+def test_cursor_pagination_walks_all_emails_once(storage):
+    provider_id, folder_id = _setup_provider(storage)
+    same_time = datetime(2026, 3, 1, 12, 0)
+    ids = []
+    for n in range(7):
+        # Several emails share a timestamp to exercise the id tie-breaker
+        received = same_time if n % 2 else same_time + timedelta(minutes=n)
+        email_id, _ = storage.store_email(provider_id, folder_id, _make_email(n, received_at=received))
+        ids.append(email_id)
+
+    seen = []
+    cursor = None
+    while True:
+        page = storage.get_emails(page_size=3, cursor=cursor, include_total=False)
+        assert page['total'] is None
+        seen.extend(e['id'] for e in page['emails'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(ids)
+    assert len(seen) == len(set(seen))
+    full = storage.get_emails(page_size=50)['emails']
+    assert seen == [e['id'] for e in full]
+
+
+def test_cursor_pagination_includes_emails_without_received_at(tmp_path):
+    db_path = str(tmp_path / 'nullable.db')
+    # Simulate an older database whose emails table allowed a NULL received_at
+    schema = EmailStorage(str(tmp_path / 'schema.db'))
+    with schema._get_connection() as conn:
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'emails'").fetchone()[0]
+    conn = sqlite3.connect(db_path)
+    conn.execute(create_sql.replace('received_at TEXT NOT NULL', 'received_at TEXT'))
+    conn.close()
+
+    store = EmailStorage(db_path)
+    provider_id, folder_id = _setup_provider(store)
+    ids = [store.store_email(provider_id, folder_id,
+                             _make_email(n, received_at=datetime(2026, 3, 1) + timedelta(hours=n)))[0]
+           for n in range(5)]
+    with store._get_connection() as conn:
+        conn.execute("UPDATE emails SET received_at = NULL WHERE id IN (?, ?)", (ids[1], ids[3]))
+
+    seen = []
+    cursor = None
+    while True:
+        page = store.get_emails(page_size=2, cursor=cursor, include_total=False)
+        seen.extend(e['id'] for e in page['emails'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    # Dated emails newest first, then the undated ones
+    assert seen == [ids[4], ids[2], ids[0], ids[3], ids[1]]
+
+
+def test_search_emails_ranks_subject_above_body(storage):
+    provider_id, folder_id = _setup_provider(storage)
+    body_hit, _ = storage.store_email(provider_id, folder_id, _make_email(
+        1, subject='Monthly update', body_text='the overdue invoice is attached'))
+    subject_hit, _ = storage.store_email(provider_id, folder_id, _make_email(
+        2, subject='Overdue invoice reminder'))
+
+    results = storage.search_emails('overdue invoice')
+    assert [r['id'] for r in results] == [subject_hit, body_hit]
+    assert storage.search_emails('   ') == []
+
+
+def test_existing_emails_are_backfilled(tmp_path):
+    db_path = str(tmp_path / 'legacy.db')
+    store = EmailStorage(db_path)
+    provider_id, folder_id = _setup_provider(store)
+    email_id, _ = store.store_email(provider_id, folder_id, _make_email(1, subject='Legacy statement'))
+
+    # Simulate a database created before the search index existed
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE emails_fts")
+    conn.commit()
+    conn.close()
+
+    reopened = EmailStorage(db_path)
+    assert _search_ids(reopened, 'legacy') == [email_id]
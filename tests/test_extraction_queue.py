@@ -0,0 +1,230 @@
+"""
+Tests for sql_rag/extraction_queue.py
+
+Runs ExtractionQueue against stand-in reconcilers, extractors and caches.
+
+Verifies:
+  1. Files are extracted in submission order, across jobs, and cancelling a
+     job drops the files not yet started
+  2. No more than max_workers files are extracted at once
+  3. Each PDF is read and hashed once, the bytes and hash are handed to the
+     extractor, and cached files do not take a rate limiter token
+  4. ModelRateLimiter allows a burst, then one call per 60/rpm seconds per
+     model, and gives up when the job is cancelled
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import sql_rag.pdf_extraction_cache
+from sql_rag import extraction_queue
+from sql_rag.extraction_queue import ExtractionQueue, ModelRateLimiter
+
+BANK_INFO = SimpleNamespace(bank_name='Barclays', account_number='12345678', sort_code='20-00-00',
+                            period_start='2026-03-01', period_end='2026-03-31',
+                            opening_balance=100.0, closing_balance=150.0)
+SUPPLIER_INFO = SimpleNamespace(supplier_name='Acme', account_reference='ACME01', statement_date='2026-03-31',
+                                opening_balance=0.0, closing_balance=250.0)
+
+
+class FakeBankCache:
+    db_path = ':memory:'
+
+    def __init__(self, cached=()):
+        self.cached = set(cached)
+        self.hashed = []
+
+    def hash_pdf(self, pdf_bytes):
+        self.hashed.append(pdf_bytes)
+        return f'sha:{pdf_bytes.decode()}'
+
+    def get(self, pdf_hash):
+        return ({'bank_name': 'Barclays'}, [{'amount': 1.0}]) if pdf_hash in self.cached else None
+
+
+class FakeReconciler:
+    model_name = 'gemini-test'
+
+    def __init__(self, delay=0.0, gate=None):
+        self.delay = delay
+        self.gate = gate
+        self.calls = []
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def extract_transactions_from_pdf(self, pdf_path, cache=None, pdf_bytes=None, pdf_hash=None):
+        with self._lock:
+            self.calls.append((pdf_path, pdf_bytes, pdf_hash))
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        if self.gate is not None:
+            self.gate.wait(5)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return BANK_INFO, [object(), object()]
+
+
+class FakeSupplierCache:
+    def __init__(self, cached=()):
+        self.cached = set(cached)
+        self.hashed = []
+
+    def hash_bytes(self, data):
+        self.hashed.append(data)
+        return f'md5:{data.decode()}'
+
+    def get_cached_hash(self, file_hash):
+        return (SUPPLIER_INFO, [object()]) if file_hash in self.cached else None
+
+
+class FakeSupplierExtractor:
+    model = SimpleNamespace(model_name='gemini-test')
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = []
+
+    def extract_from_pdf_bytes(self, pdf_bytes, file_hash=None):
+        self.calls.append((pdf_bytes, file_hash))
+        return SUPPLIER_INFO, [object(), object(), object()]
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = []
+
+    def acquire(self, model, cancelled=None):
+        self.acquired.append(model)
+        return True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _pdfs(tmp_path, *names):
+    paths = []
+    for name in names:
+        path = tmp_path / f'{name}.pdf'
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def _wait(*jobs):
+    deadline = time.monotonic() + 5
+    while any(job.finished_at is None for job in jobs):
+        assert time.monotonic() < deadline, 'extraction job did not finish'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def bank_cache(monkeypatch):
+    cache = FakeBankCache(cached={'sha:feb'})
+    monkeypatch.setattr(sql_rag.pdf_extraction_cache, 'get_extraction_cache', lambda: cache)
+    return cache
+
+
+def test_files_extracted_in_submission_order(tmp_path, bank_cache):
+    queue = ExtractionQueue(max_workers=1, requests_per_minute=6000)
+    reconciler = FakeReconciler()
+    first = queue.submit_bank_job(reconciler, _pdfs(tmp_path, 'jan', 'feb', 'mar'))
+    second = queue.submit_bank_job(reconciler, _pdfs(tmp_path, 'apr', 'may'))
+    _wait(first, second)
+
+    assert [call[1] for call in reconciler.calls] == [b'jan', b'feb', b'mar', b'apr', b'may']
+    assert [item.status for item in first.items] == ['done', 'cached', 'done']
+    assert first.to_dict()['status'] == 'completed' and first.items[0].transaction_count == 2
+    assert [job.job_id for job in queue.list_jobs()] == [second.job_id, first.job_id]
+
+
+def test_cancel_drops_files_not_started(tmp_path, bank_cache):
+    queue = ExtractionQueue(max_workers=1, requests_per_minute=6000)
+    gate = threading.Event()
+    reconciler = FakeReconciler(gate=gate)
+    job = queue.submit_bank_job(reconciler, _pdfs(tmp_path, 'jan', 'mar', 'apr'))
+    while not reconciler.calls:
+        time.sleep(0.01)
+
+    assert queue.cancel_job(job.job_id)
+    gate.set()
+    _wait(job)
+
+    assert [item.status for item in job.items] == ['done', 'cancelled', 'cancelled']
+    assert len(reconciler.calls) == 1 and job.status == 'cancelled'
+
+
+def test_no_more_than_max_workers_at_once(tmp_path, bank_cache):
+    queue = ExtractionQueue(max_workers=2, requests_per_minute=6000)
+    queue.limiter = ModelRateLimiter(6000, burst=10)
+    reconciler = FakeReconciler(delay=0.05)
+    job = queue.submit_bank_job(reconciler, _pdfs(tmp_path, 'jan', 'mar', 'apr', 'may', 'jun'))
+    _wait(job)
+
+    assert reconciler.most_running == 2
+    assert all(item.status == 'done' for item in job.items)
+
+
+def test_bank_pdf_read_and_hashed_once(tmp_path, bank_cache):
+    queue = ExtractionQueue(max_workers=1)
+    queue.limiter = CountingLimiter()
+    reconciler = FakeReconciler()
+    job = queue.submit_bank_job(reconciler, _pdfs(tmp_path, 'jan', 'feb'))
+    _wait(job)
+
+    assert bank_cache.hashed == [b'jan', b'feb']
+    assert [call[1:] for call in reconciler.calls] == [(b'jan', 'sha:jan'), (b'feb', 'sha:feb')]
+    # Only the uncached file waited for a token
+    assert queue.limiter.acquired == ['gemini-test']
+
+
+def test_supplier_pdf_read_and_hashed_once(tmp_path):
+    queue = ExtractionQueue(max_workers=1)
+    queue.limiter = CountingLimiter()
+    cache = FakeSupplierCache(cached={'md5:feb'})
+    extractor = FakeSupplierExtractor(cache)
+    job = queue.submit_supplier_job(extractor, _pdfs(tmp_path, 'jan', 'feb'))
+    _wait(job)
+
+    assert cache.hashed == [b'jan', b'feb']
+    assert extractor.calls == [(b'jan', 'md5:jan'), (b'feb', 'md5:feb')]
+    assert [item.status for item in job.items] == ['done', 'cached']
+    assert job.items[0].summary['supplier_name'] == 'Acme'
+    assert queue.limiter.acquired == ['gemini-test']
+
+
+def test_rate_limiter_burst_then_steady_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(extraction_queue, 'time', clock)
+    limiter = ModelRateLimiter(requests_per_minute=60, burst=2)
+
+    granted = []
+    for _ in range(4):
+        assert limiter.acquire('gemini-a')
+        granted.append(round(clock.now, 3))
+    assert granted == [0.0, 0.0, 1.0, 2.0]
+
+    # Another model has its own bucket
+    assert limiter.acquire('gemini-b') and clock.now == pytest.approx(2.0)
+
+
+def test_rate_limiter_gives_up_when_cancelled(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(extraction_queue, 'time', clock)
+    limiter = ModelRateLimiter(requests_per_minute=1, burst=1)
+
+    assert limiter.acquire('gemini-a')
+    assert not limiter.acquire('gemini-a', cancelled=lambda: True)
+    assert clock.now == 0.0
@@ -0,0 +1,86 @@
+"""
+Tests for the /api/gocardless/api-payouts route
+
+Verifies:
+  1. Payouts read from the local mirror come back as import batches, with
+     the environment taken from the api_sandbox setting
+  2. The Opera 3 alias returns the same result
+"""
+
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip('multipart', reason='the GoCardless routes need python-multipart')
+
+from apps.gocardless.api import routes  # noqa: E402
+from sql_rag import gocardless_mirror  # noqa: E402
+from sql_rag.gocardless_api import GoCardlessPayment, GoCardlessPayout  # noqa: E402
+
+
+def _payout(payout_id, payments):
+    return GoCardlessPayout(
+        id=payout_id, amount=sum(payments) - 1.0, currency='GBP', status='paid',
+        reference=f'INTSYS-{payout_id}', arrival_date=date(2026, 3, 2), created_at=datetime(2026, 3, 1),
+        deducted_fees=1.0, payout_type='merchant', fees_vat=0.2,
+        payments=[GoCardlessPayment(
+            id=f'PM{i}', amount=amount, currency='GBP', status='paid_out', charge_date=date(2026, 2, 27),
+            customer_name='Acme Ltd', customer_id='CU1', mandate_id='MD1', description='INV001',
+            reference=None, metadata={}) for i, amount in enumerate(payments)],
+    )
+
+
+class StubMirror:
+    def __init__(self, payouts):
+        self.payouts = {p.id: p for p in payouts}
+        self.synced = []
+
+    def sync(self):
+        self.synced.append('sync')
+
+    def sync_if_stale(self):
+        self.synced.append('if_stale')
+
+    def get_payouts(self, status, limit, created_at_gte):
+        return list(self.payouts.values())[:limit], None
+
+    def get_payout_with_payments(self, payout_id):
+        return self.payouts[payout_id]
+
+
+class StubEmailStorage:
+    def is_gocardless_payout_imported(self, payout_id):
+        return payout_id == 'PO_DONE'
+
+    def is_gocardless_reference_imported(self, reference):
+        return False
+
+
+@pytest.fixture
+def mirror(monkeypatch):
+    mirror = StubMirror([_payout('PO1', [60.0, 40.0]), _payout('PO_DONE', [10.0])])
+    monkeypatch.setattr(routes, '_load_gocardless_settings',
+                        lambda: {'api_access_token': 'token', 'api_sandbox': True, 'payout_lookback_days': 30})
+    monkeypatch.setattr(gocardless_mirror, 'get_gocardless_mirror', lambda settings: mirror)
+    monkeypatch.setattr(routes, 'email_storage', StubEmailStorage())
+    monkeypatch.setattr(routes, 'sql_connector', None)
+    return mirror
+
+
+def test_api_payouts_reads_from_mirror(mirror):
+    result = asyncio.run(routes.get_gocardless_api_payouts(status='paid', limit=20, days_back=None, refresh=True))
+
+    assert result['success'], result
+    assert result['environment'] == 'sandbox' and mirror.synced == ['sync']
+    assert result['filter_stats']['filtered_already_in_history'] == 1
+    [batch] = result['batches']
+    assert batch['payout_id'] == 'PO1' and batch['import_status'] == 'ready'
+    assert batch['batch']['gross_amount'] == 100.0 and batch['batch']['net_amount'] == 99.0
+    assert [p['gc_payment_id'] for p in batch['batch']['payments']] == ['PM0', 'PM1']
+
+
+def test_opera3_alias_matches(mirror):
+    se = asyncio.run(routes.get_gocardless_api_payouts(status='paid', limit=20, days_back=None, refresh=False))
+    opera3 = asyncio.run(routes.opera3_get_api_payouts(status='paid', limit=20, days_back=None, refresh=False))
+    assert se == opera3 and se['success'] and mirror.synced == ['if_stale', 'if_stale']
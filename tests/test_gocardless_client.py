@@ -0,0 +1,114 @@
+"""
+Tests for GoCardlessClient request handling (sql_rag/gocardless_api.py)
+
+Runs the client against a local stub API server.
+
+Verifies:
+  1. A 429 is retried after Retry-After and clients share one HTTP session
+  2. RateLimit-Remaining: 0 holds callers until RateLimit-Reset
+  3. paginate() / apaginate() follow cursors across pages
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip('requests')
+
+from sql_rag import gocardless_api
+from sql_rag.gocardless_api import GoCardlessClient, RateLimiter
+
+
+@pytest.fixture
+def stub():
+    state = {'requests': [], 'responses': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            state['requests'].append((time.monotonic(), url.path, query, self.client_address))
+            if state['responses']:
+                status, headers, body = state['responses'].pop(0)
+            else:
+                after = query.get('after', [None])[0]
+                page = {None: (['MD1', 'MD2'], 'c1'), 'c1': (['MD3'], None)}[after]
+                status, headers = 200, {}
+                body = {'mandates': [{'id': i} for i in page[0]], 'meta': {'cursors': {'after': page[1]}}}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['base_url'] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+
+
+def _client(stub, token):
+    client = GoCardlessClient(access_token=token, sandbox=True)
+    client.base_url = stub['base_url']
+    return client
+
+
+def test_429_is_retried_on_shared_session(stub):
+    stub['responses'].append((429, {'Retry-After': '0.2'}, {'error': {'message': 'rate limited'}}))
+    client = _client(stub, 'sandbox_retry')
+    mandates, cursor = client.list_mandates()
+    assert [m['id'] for m in mandates] == ['MD1', 'MD2'] and cursor == 'c1'
+
+    (t1, *_), (t2, *_) = stub['requests']
+    assert t2 - t1 >= 0.2
+    assert _client(stub, 'sandbox_other')._session is client._session
+    # Keep-alive: both requests used the same TCP connection
+    assert stub['requests'][0][3] == stub['requests'][1][3]
+
+
+def test_rate_limit_headers_hold_callers():
+    limiter = RateLimiter(limit=100, period=60)
+    limiter.update({'RateLimit-Limit': '100', 'RateLimit-Remaining': '0', 'RateLimit-Reset': '0.2'})
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.2
+    # Window rolled over: the bucket is full again
+    assert limiter.tokens == pytest.approx(99, abs=0.1)
+
+    limiter = RateLimiter(limit=10, period=1)
+    for _ in range(10):
+        limiter.acquire()
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.05
+
+
+def test_paginate(stub, monkeypatch):
+    client = _client(stub, 'sandbox_pages')
+    assert [m['id'] for m in client.paginate(client.list_mandates, status='active')] == ['MD1', 'MD2', 'MD3']
+
+    async def collect():
+        return [m['id'] async for m in client.apaginate(client.list_mandates)]
+
+    assert asyncio.run(collect()) == ['MD1', 'MD2', 'MD3']
+    assert stub['requests'][0][2]['limit'] == ['500']
+
+
+def test_http_date_header():
+    assert gocardless_api._header_seconds('Thu, 01 Jan 2015 00:00:00 GMT') == 0.0
+    assert gocardless_api._header_seconds('3') == 3.0
+    assert gocardless_api._header_seconds(None) is None
@@ -0,0 +1,110 @@
+"""
+Tests for sql_rag/gocardless_collections.py
+
+Uses a real GoCardlessPaymentsDB and an in-process GoCardless client.
+
+Verifies:
+  1. Requests are validated in one pass (mandate, amount, duplicates, credit)
+  2. Payments are created with idempotency keys and the rows record the outcome
+  3. An unconfirmed request is resumed with the same key on the next run
+"""
+
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+
+from sql_rag.gocardless_api import GoCardlessAPIError
+from sql_rag.gocardless_collections import BulkCollection, build_bacs_reference, build_description
+from sql_rag.gocardless_payments import GoCardlessPaymentsDB
+
+
+class FakeClient:
+    def __init__(self, fail_accounts=(), timeout_accounts=()):
+        self.calls = []
+        self.fail_accounts = set(fail_accounts)
+        self.timeout_accounts = set(timeout_accounts)
+        self._lock = threading.Lock()
+
+    def create_payment(self, amount_pence, mandate_id, description=None, charge_date=None,
+                       reference=None, metadata=None, idempotency_key=None):
+        account = metadata['opera_account']
+        with self._lock:
+            self.calls.append((account, amount_pence, idempotency_key, reference))
+        if account in self.fail_accounts:
+            raise GoCardlessAPIError('Mandate is cancelled', 422, 'validation_failed')
+        if account in self.timeout_accounts:
+            raise GoCardlessAPIError('Request timed out', error_type='timeout')
+        return {'id': f'PM_{account}', 'status': 'pending_submission', 'charge_date': '2030-01-10'}
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = GoCardlessPaymentsDB(tmp_path / 'gc.db')
+    for account in ('A001', 'A002', 'A003', 'A004'):
+        db.link_mandate(opera_account=account, mandate_id=f'MD_{account}', opera_name=f'Customer {account}')
+    db.create_payment_request(mandate_id='MD_A003', opera_account='A003', amount_pence=500,
+                              invoice_refs=['INV30'])
+    return db
+
+
+def test_bulk_collection_report(db):
+    client = FakeClient(fail_accounts={'A002'})
+    balances = {'A001': {'INV10': 100.0, 'INV11': 20.5}, 'A002': {'INV20': 50.0}}
+    report = BulkCollection(db, client, {'request_statement_reference': 'ACME'}).run(
+        [
+            {'opera_account': 'A001', 'invoices': ['INV10', 'INV11']},
+            {'opera_account': 'A002', 'invoices': ['INV20']},
+            {'opera_account': 'A003', 'invoices': ['INV30'], 'amount': 500},
+            {'opera_account': 'A001', 'invoices': ['INV11'], 'amount': 100},
+            {'opera_account': 'NOMANDATE', 'invoices': ['X1'], 'amount': 100},
+            {'opera_account': 'A004', 'invoices': ['INV40'], 'amount': 100},
+        ],
+        invoice_balances=balances,
+        account_credits={'A004': -12.0},
+    )
+
+    statuses = [(r['opera_account'], r['status']) for r in report['results']]
+    assert statuses == [('A001', 'submitted'), ('A002', 'failed'), ('A003', 'invalid'),
+                        ('A001', 'invalid'), ('NOMANDATE', 'invalid'), ('A004', 'invalid')]
+    assert report['summary'] == {'total': 6, 'succeeded': 1, 'failed': 5, 'invalid': 4,
+                                 'unconfirmed': 0, 'amount_pence': 12050}
+    assert 'already requested' in report['results'][2]['error']
+    assert 'more than once' in report['results'][3]['error']
+    assert 'unallocated credit' in report['results'][5]['error']
+
+    # Only valid requests reach GoCardless, each with its own key
+    assert sorted(c[0] for c in client.calls) == ['A001', 'A002']
+    assert len({c[2] for c in client.calls}) == 2
+
+    ok = db.get_payment_request(report['results'][0]['payment_request']['id'])
+    assert (ok['payment_id'], ok['status'], ok['amount_pence']) == ('PM_A001', 'pending_submission', 12050)
+    assert ok['description'] == 'ACME INV10 +1'
+    failed = db.get_payment_request(report['results'][1]['payment_request']['id'])
+    assert failed['status'] == 'failed' and 'Mandate is cancelled' in failed['error_message']
+
+
+def test_unconfirmed_request_is_resumed_with_same_key(db):
+    first = BulkCollection(db, FakeClient(timeout_accounts={'A001'}), {}).run(
+        [{'opera_account': 'A001', 'invoices': ['INV10'], 'amount': 1000}])
+    [result] = first['results']
+    assert result['status'] == 'unconfirmed'
+    assert db.get_payment_request(result['payment_request']['id'])['status'] == 'submitting'
+
+    client = FakeClient()
+    second = BulkCollection(db, client, {}).run(
+        [{'opera_account': 'A001', 'invoices': ['INV10'], 'amount': 1000}])
+    [retry] = second['results']
+    assert retry['status'] == 'submitted'
+    assert retry['payment_request']['id'] == result['payment_request']['id']
+    [open_row] = [r for r in db.list_open_payment_requests(['A001'])]
+    assert client.calls[0][2] == open_row['idempotency_key']
+    assert open_row['payment_id'] == 'PM_A001'
+
+
+def test_reference_helpers():
+    assert build_description(['INV1']) == 'INV1'
+    assert build_description(['INV1', 'INV2'], statement_reference='ACME') == 'ACME INV1 +1'
+    assert build_description(['INV1'], 'Feb fees', 'ACME') == 'ACME Feb fees'
+    assert build_bacs_reference('{company4}{inv_num5}', 'ACMELTD', ['SI-0012345'], 'A001') == 'ACME00123'
@@ -0,0 +1,88 @@
+"""
+Tests for sql_rag/gocardless_matching.py
+
+Verifies:
+  1. The match priority: metadata, mandate, customer id, invoice refs, names
+  2. Contains matches pick the first name in order, as the per-payment loop did
+  3. The per-company index is reused until the mandates change
+"""
+
+from sql_rag.gocardless_matching import CustomerIndex, get_customer_index, normalize_company_name
+from sql_rag.gocardless_payments import GoCardlessPaymentsDB
+
+MANDATES = [
+    {'opera_account': 'A001', 'mandate_id': 'MD1', 'gocardless_customer_id': 'CU1', 'opera_name': 'Acme Ltd'},
+    {'opera_account': 'B001', 'mandate_id': 'MD2', 'gocardless_customer_id': None,
+     'opera_name': 'Bolt & Nut Co', 'gocardless_name': 'Bolt and Nut Company'},
+    {'opera_account': '__UNLINKED__', 'mandate_id': 'MD9', 'opera_name': 'Ghost Ltd'},
+]
+CUSTOMERS = {'A001': 'ACME LIMITED', 'B001': 'Bolt & Nut Co', 'C001': 'Carter Smith Ltd',
+             'C002': 'Carter Smith Holdings', 'D001': 'Delta Foods (UK) Ltd'}
+INVOICES = [('C002', 'INV100'), ('C002', 'INV101'), ('D001', 'INV200'), ('A001', 'INV300'), ('D001', 'INV300')]
+
+
+def _methods(payments):
+    matched, backfill = CustomerIndex(MANDATES, CUSTOMERS, INVOICES).match(payments)
+    return [(p['matched_account'], (p['match_method'] or '').split(':')[0]) for p in matched], backfill
+
+
+def test_match_priority():
+    results, backfill = _methods([
+        {'customer_name': 'Bolt & Nut', 'metadata': {'opera_account': 'D001', 'invoices': 'INV200'}},
+        {'customer_name': 'Someone', 'mandate_id': 'MD2'},
+        {'customer_name': 'Someone', 'customer_id': 'CU1'},
+        {'customer_name': 'Someone', 'invoice_refs': ['INV100', 'INV101']},
+        {'customer_name': 'Someone', 'invoice_refs': ['INV100', 'INV200']},
+        {'customer_name': 'Someone', 'invoice_refs': ['INV300']},
+        {'customer_name': 'Bolt and Nut Company Limited', 'customer_id': 'CU7'},
+        {'customer_name': 'Delta Foods Ltd'},
+        {'customer_name': 'Unknown'},
+        {'customer_name': 'MD9 Ghost Ltd'},
+    ])
+    assert results == [
+        ('D001', 'metadata'),
+        ('B001', 'mandate'),
+        ('A001', 'customer'),
+        ('C002', 'invoice'),
+        (None, ''),             # refs on two accounts
+        (None, ''),             # ref shared by two accounts
+        ('B001', 'name_exact'),
+        ('D001', 'opera_exact'),
+        (None, ''),
+        (None, ''),
+    ]
+    assert backfill == [('B001', 'CU7')]
+
+
+def test_contains_match_takes_first_name_in_order():
+    index = CustomerIndex([], CUSTOMERS)
+    [carter] = index.match([{'customer_name': 'Carter'}])[0]
+    assert (carter['matched_account'], carter['match_method']) == ('C001', 'opera_contains:carter smith')
+    [longer] = index.match([{'customer_name': 'The Acme Trading'}])[0]
+    assert (longer['matched_account'], longer['match_method']) == ('A001', 'opera_contains:acme')
+    assert normalize_company_name('P J Smith (Trading) and Sons Ltd.') == 'pj smith & sons'
+
+    # Same answer as scanning every customer in order
+    names = ['ab', 'b', 'abc', 'bcd', 'cd', 'a', 'dab', '']
+    customers = {f'X{i}': name for i, name in enumerate(names)}
+    index = CustomerIndex([], customers)
+    for query in ['a', 'ab', 'bc', 'abcd', 'dabc', 'zz', 'cda']:
+        expected = next((f'X{i}' for i, n in enumerate(names) if query in n or n in query), None)
+        assert index.match([{'customer_name': query}])[0][0]['matched_account'] == expected
+
+
+def test_index_is_cached_until_mandates_change(tmp_path):
+    db = GoCardlessPaymentsDB(tmp_path / 'gc.db')
+    loads = []
+
+    def load():
+        loads.append(1)
+        return CUSTOMERS, INVOICES
+
+    first = get_customer_index(db, 'sql', load)
+    assert get_customer_index(db, 'sql', load) is first
+    db.link_mandate(opera_account='C001', mandate_id='MD5', opera_name='Carter Smith Ltd')
+    rebuilt = get_customer_index(db, 'sql', load)
+    assert rebuilt is not first and len(loads) == 2
+    [payment] = rebuilt.match([{'customer_name': 'Carter', 'mandate_id': 'MD5'}])[0]
+    assert payment['matched_account'] == 'C001'
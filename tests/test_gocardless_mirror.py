@@ -0,0 +1,199 @@
+"""
+Tests for sql_rag/gocardless_mirror.py
+
+Runs the GoCardless client against a local stub API server.
+
+Verifies:
+  1. The first sync mirrors payouts with their payments, mandates and customers
+  2. Reading a mirrored payout makes no API calls
+  3. A later sync lists only recent payouts and re-fetches objects named in events
+  4. Mirrors for different API accounts (sandbox/live, another creditor) keep
+     separate objects and watermarks in the same database
+"""
+
+import json
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip('requests')
+
+from sql_rag.gocardless_api import GoCardlessClient
+from sql_rag import gocardless_mirror
+from sql_rag.gocardless_mirror import GoCardlessMirror, get_gocardless_mirror
+from sql_rag.gocardless_payments import GoCardlessPaymentsDB
+
+
+def _iso(days_ago):
+    return (datetime.utcnow() - timedelta(days=days_ago)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class StubAPI:
+    def __init__(self):
+        self.requests = []
+        self.events = []
+        self.objects = {
+            'payouts': {
+                'PO1': {'id': 'PO1', 'amount': 1940, 'currency': 'GBP', 'status': 'paid',
+                        'reference': 'ACME-PO1', 'created_at': _iso(3), 'deducted_fees': 60,
+                        'arrival_date': date.today().isoformat(),
+                        'links': {'creditor_bank_account': 'BA1'}},
+            },
+            'payments': {
+                'PM1': {'id': 'PM1', 'amount': 1000, 'status': 'paid_out', 'links': {'mandate': 'MD1'}},
+                'PM2': {'id': 'PM2', 'amount': 1000, 'status': 'paid_out', 'links': {'mandate': 'MD1'}},
+            },
+            'mandates': {'MD1': {'id': 'MD1', 'status': 'active', 'links': {'customer': 'CU1'}}},
+            'customers': {'CU1': {'id': 'CU1', 'company_name': 'Acme Ltd'}},
+            'creditor_bank_accounts': {'BA1': {'id': 'BA1', 'account_number_ending': '11', 'bank_code': '200000'}},
+        }
+        self.payout_items = {
+            'PO1': [{'type': 'payment_paid_out', 'links': {'payment': 'PM1'}},
+                    {'type': 'payment_paid_out', 'links': {'payment': 'PM2'}},
+                    {'type': 'gocardless_fee', 'taxes': [{'amount': '-10'}]}],
+        }
+
+    def handle(self, path, query):
+        self.requests.append((path, query))
+        parts = path.strip('/').split('/')
+        if parts == ['payouts']:
+            since = query.get('created_at[gte]', [''])[0]
+            payouts = [p for p in self.objects['payouts'].values() if p['created_at'] >= since]
+            return {'payouts': payouts, 'meta': {'cursors': {'after': None}}}
+        if parts == ['payout_items']:
+            return {'payout_items': self.payout_items.get(query['payout'][0], [])}
+        if parts == ['events']:
+            since = query.get('created_at[gt]', [''])[0]
+            return {'events': [e for e in self.events if e['created_at'] > since],
+                    'meta': {'cursors': {'after': None}}}
+        if len(parts) == 2 and parts[0] in self.objects:
+            return {parts[0]: self.objects[parts[0]][parts[1]]}
+        raise KeyError(path)
+
+
+def _serve(api):
+    """Run the stub on a local HTTP server for the duration of a fixture."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                body, status = api.handle(url.path, parse_qs(url.query)), 200
+            except KeyError:
+                body, status = {'error': {'message': 'not found'}}, 404
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield api
+    server.shutdown()
+
+
+@pytest.fixture
+def stub():
+    yield from _serve(StubAPI())
+
+
+@pytest.fixture
+def live_stub():
+    api = StubAPI()
+    api.objects['payouts'] = {
+        'PO9': {'id': 'PO9', 'amount': 500, 'currency': 'GBP', 'status': 'paid',
+                'reference': 'LIVE-PO9', 'created_at': _iso(1), 'deducted_fees': 0,
+                'arrival_date': date.today().isoformat(),
+                'links': {'creditor_bank_account': 'BA1'}},
+    }
+    api.payout_items = {'PO9': [{'type': 'payment_paid_out', 'links': {'payment': 'PM1'}}]}
+    yield from _serve(api)
+
+
+@pytest.fixture
+def mirror(stub, tmp_path):
+    client = GoCardlessClient(access_token='sandbox_test', sandbox=True)
+    client.base_url = stub.base_url
+    return GoCardlessMirror(GoCardlessPaymentsDB(tmp_path / 'gc.db'), client)
+
+
+def test_first_sync_then_reads_are_local(stub, mirror):
+    stats = mirror.sync()
+    assert stats['payouts'] == 1 and stats['details'] == 1
+
+    stub.requests.clear()
+    payouts, cursor = mirror.get_payouts(status='paid', created_at_gte=date.today() - timedelta(days=30))
+    payout = mirror.get_payout_with_payments('PO1')
+    assert stub.requests == []
+
+    assert [p.id for p in payouts] == ['PO1'] and cursor is None
+    assert payout.bank_sort_code == '200000'
+    assert [(p.id, p.amount, p.customer_name) for p in payout.payments] == [
+        ('PM1', 10.0, 'Acme Ltd'), ('PM2', 10.0, 'Acme Ltd')]
+    assert payout.fees_vat == pytest.approx(0.10)
+    assert mirror.get_customer('CU1')['company_name'] == 'Acme Ltd'
+    assert stub.requests == []
+
+
+def test_incremental_sync_uses_watermark_and_events(stub, mirror):
+    mirror.sync()
+    stub.requests.clear()
+
+    stub.objects['payments']['PM2']['status'] = 'charged_back'
+    stub.events.append({'id': 'EV1', 'resource_type': 'payments', 'created_at': _iso(-1),
+                        'links': {'payment': 'PM2'}})
+    stub.events.append({'id': 'EV2', 'resource_type': 'payments', 'created_at': _iso(-1),
+                        'links': {'payment': 'PM_UNKNOWN'}})
+    stats = mirror.sync()
+
+    assert stats['events'] == 2 and stats['refreshed'] == 1
+    fetched = [path for path, _ in stub.requests]
+    assert '/payments/PM2' in fetched
+    assert '/payments/PM1' not in fetched and '/payments/PM_UNKNOWN' not in fetched
+    assert '/payout_items' not in fetched
+    # Payouts are listed from the watermark (day before the newest payout)
+    [payout_query] = [q for path, q in stub.requests if path == '/payouts']
+    assert payout_query['created_at[gte]'][0][:10] == (date.today() - timedelta(days=4)).isoformat()
+
+    payout = mirror.get_payout_with_payments('PO1')
+    assert [p.status for p in payout.payments] == ['paid_out', 'charged_back']
+
+
+def test_switching_accounts_keeps_mirrors_apart(stub, live_stub, mirror):
+    mirror.sync()
+    live_client = GoCardlessClient(access_token='live_other', sandbox=False)
+    live_client.base_url = live_stub.base_url
+    live = GoCardlessMirror(mirror.db, live_client)
+
+    # The other account starts from an empty mirror: full listing, own event cursor
+    assert not live.has_synced
+    assert live.sync()['payouts'] == 1
+    assert [p.id for p in live.get_payouts(status='paid')[0]] == ['PO9']
+    assert live.status()['payouts_watermark'] != mirror.status()['payouts_watermark']
+
+    stub.requests.clear()
+    assert [p.id for p in mirror.get_payouts(status='paid')[0]] == ['PO1']
+    assert mirror.status()['objects']['payouts'] == 1
+    assert stub.requests == []
+
+
+def test_get_gocardless_mirror_is_keyed_by_account(tmp_path, monkeypatch):
+    db = GoCardlessPaymentsDB(tmp_path / 'gc.db')
+    monkeypatch.setattr(gocardless_mirror, 'get_payments_db', lambda: db)
+    monkeypatch.setattr(gocardless_mirror, '_mirrors', {})
+
+    sandbox = get_gocardless_mirror({'api_access_token': 'sandbox_abc'})
+    assert get_gocardless_mirror({'api_access_token': 'sandbox_abc'}) is sandbox
+    live = get_gocardless_mirror({'api_access_token': 'live_abc'})
+    other = get_gocardless_mirror({'api_access_token': 'sandbox_xyz'})
+    assert len({sandbox.scope, live.scope, other.scope}) == 3
+    assert sandbox.client.access_token == 'sandbox_abc'
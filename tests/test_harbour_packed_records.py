@@ -0,0 +1,57 @@
+"""
+Tests for the packed record format used by HarbourDBF.read_records
+
+Verifies:
+  1. Rows pack to the fixed-width layout dbfbridge.prg fills and unpack
+     back to the same values (C padded/truncated, D as YYYYMMDD, blanks)
+  2. PackedRecords exposes the buffer as a memoryview and NumPy array
+"""
+
+import struct
+from datetime import date
+
+import pytest
+
+from opera3_agent.harbour_dbf import PackedRecords, RecordLayout
+
+LAYOUT = RecordLayout([
+    ('NT_ACNT', 'C', 8, 1),
+    ('NT_VALUE', 'N', 8, 4),
+    ('NT_PSTDATE', 'D', 8, 7),
+    ('NT_POSTED', 'L', 1, 9),
+])
+
+
+def test_pack_roundtrip():
+    rows = [
+        {'NT_ACNT': 'C110', 'NT_VALUE': -125.5, 'NT_PSTDATE': date(2026, 3, 1), 'NT_POSTED': True},
+        {'NT_ACNT': 'ACCOUNT-TOO-LONG', 'NT_PSTDATE': '20260302'},
+    ]
+    buf = LAYOUT.pack(rows, recnos=[5001, 5002])
+
+    assert LAYOUT.row_size == 4 + 1 + 8 + 8 + 8 + 1 and len(buf) == 2 * LAYOUT.row_size
+    assert struct.unpack_from('<iB8s', buf) == (5001, 0, b'C110    ')
+    assert LAYOUT.unpack_row(buf, 0) == (5001, False, rows[0])
+    assert LAYOUT.unpack_row(buf, 1) == (5002, False, {
+        'NT_ACNT': 'ACCOUNT-', 'NT_VALUE': 0.0, 'NT_PSTDATE': date(2026, 3, 2), 'NT_POSTED': False})
+    assert LAYOUT.unpack_row(LAYOUT.pack([{}]), 0)[2]['NT_PSTDATE'] is None
+
+    with pytest.raises(TypeError):
+        LAYOUT.pack([{'NT_PSTDATE': 'March'}])
+
+
+def test_packed_records_views():
+    np = pytest.importorskip('numpy')
+    buf = LAYOUT.pack([{'NT_ACNT': 'C110', 'NT_VALUE': 10.0}, {'NT_VALUE': -10.0}], recnos=[7, 0])
+    records = PackedRecords(LAYOUT, buf)
+
+    assert len(records) == 2 and records.recnos == [7, 0] and records.deleted == [False, False]
+    assert [r['NT_VALUE'] for r in records] == [10.0, -10.0] and records[-1]['NT_ACNT'] == ''
+    assert records.view().nbytes == len(buf)
+
+    arr = records.array()
+    assert arr['NT_VALUE'].sum() == 0 and list(arr['_recno']) == [7, 0]
+    assert arr['NT_ACNT'][0] == b'C110    '
+    # The array shares the buffer rather than copying it
+    arr['NT_VALUE'][0] = 1.0
+    assert records[0]['NT_VALUE'] == 1.0 and np.shares_memory(arr, np.frombuffer(buf, dtype=np.uint8))
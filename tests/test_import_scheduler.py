@@ -0,0 +1,109 @@
+"""
+Tests for sql_rag/import_scheduler.py
+
+Verifies:
+  1. Jobs for different banks run concurrently, jobs for one bank run in order
+  2. A job that fails on Opera lock contention is retried
+  3. A job waits while another process holds the bank's import lock
+  4. A failed job keeps the result dict its run callable reported
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sql_rag import import_lock
+from sql_rag.import_scheduler import ImportJobFailed, ImportScheduler
+
+
+@pytest.fixture(autouse=True)
+def lock_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(import_lock, '_resolve_db_path', lambda: tmp_path / 'import_locks.db')
+
+
+def _wait(jobs, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not all(j.finished for j in jobs):
+        assert time.monotonic() < deadline, [j.to_dict() for j in jobs]
+        time.sleep(0.01)
+
+
+def test_one_job_per_bank_and_banks_in_parallel():
+    scheduler = ImportScheduler(max_workers=4)
+    active, peak, order = {}, {}, []
+    guard = threading.Lock()
+
+    def make_run(bank, n):
+        def run(job):
+            with guard:
+                active[bank] = active.get(bank, 0) + 1
+                peak['banks'] = max(peak.get('banks', 0), sum(1 for v in active.values() if v))
+                peak[bank] = max(peak.get(bank, 0), active[bank])
+                order.append((bank, n))
+            time.sleep(0.05)
+            with guard:
+                active[bank] -= 1
+            return {'success': True, 'n': n}
+        return run
+
+    jobs = [scheduler.submit(bank, make_run(bank, n), label=f'{bank}-{n}')
+            for n in range(3) for bank in ('BC010', 'BC020', 'BC030')]
+    _wait(jobs)
+
+    assert all(j.status == 'done' for j in jobs)
+    assert peak['banks'] > 1
+    assert all(peak[bank] == 1 for bank in ('BC010', 'BC020', 'BC030'))
+    for bank in ('BC010', 'BC020', 'BC030'):
+        assert [n for b, n in order if b == bank] == [0, 1, 2]
+    assert scheduler.queue_state()['banks'] == []
+
+
+def test_deadlock_is_retried():
+    scheduler = ImportScheduler(max_workers=2, max_attempts=3, retry_delay=0.01)
+    calls = []
+
+    def run(job):
+        calls.append(job.attempts)
+        if len(calls) < 2:
+            raise RuntimeError('(1205) Transaction was deadlocked on lock resources')
+        return {'success': True}
+
+    failing = scheduler.submit('BC010', lambda job: (_ for _ in ()).throw(ValueError('bad file')))
+    job = scheduler.submit('BC010', run)
+    _wait([failing, job])
+
+    assert failing.status == 'failed' and failing.attempts == 1
+    assert job.status == 'done'
+    assert calls == [1, 2]
+
+
+def test_waits_for_bank_import_lock():
+    scheduler = ImportScheduler(max_workers=2, retry_delay=0.01)
+    assert import_lock.acquire_import_lock('BC010', locked_by='user')
+    job = scheduler.submit('BC010', lambda job: {'success': True})
+    time.sleep(0.1)
+    assert job.status == 'waiting'
+    assert job.attempts == 0
+
+    import_lock.release_import_lock('BC010')
+    _wait([job])
+    assert job.status == 'done'
+    assert import_lock.get_active_locks() == []
+
+
+def test_failed_job_keeps_result():
+    scheduler = ImportScheduler(max_workers=2, max_attempts=2, retry_delay=0.01)
+    result = {'success': False, 'error': 'Statement already imported', 'imported_count': 0}
+
+    def run(job):
+        raise ImportJobFailed(result['error'], result)
+
+    job = scheduler.submit('BC010', run)
+    _wait([job])
+
+    assert job.status == 'failed' and job.attempts == 1
+    assert job.error == 'Statement already imported'
+    assert job.to_dict()['result'] == result
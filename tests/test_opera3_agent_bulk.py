@@ -0,0 +1,155 @@
+"""
+Tests for the Opera 3 agent's /bulk endpoint and the importer's held locks
+
+Verifies:
+  1. Operations are validated up front, run under one lock acquisition and
+     streamed back as NDJSON, each with its own WAL record
+  2. stop_on_error skips the rest of the batch
+  3. An operation that raises fails on its own; only a failure to take the
+     locks fails the whole batch
+  4. Bad dates are rejected with the other validation errors
+  5. Postings inside hold_locks() do not try to re-lock tables already held
+"""
+
+import asyncio
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+from opera3_agent import service
+from opera3_agent.write_ahead_log import WriteAheadLog
+from sql_rag.opera3_foxpro_import import Opera3FoxProImport
+
+
+class FakeImporter:
+    def __init__(self, lock_error=None):
+        self.calls = []
+        self.lock_cycles = 0
+        self.lock_error = lock_error
+
+    @contextmanager
+    def hold_locks(self):
+        if self.lock_error:
+            raise self.lock_error
+        self.lock_cycles += 1
+        yield
+
+    def take_written_records(self):
+        return {}
+
+    def import_sales_receipt(self, **kwargs):
+        self.calls.append(('sales_receipt', kwargs['customer_account']))
+        if kwargs['customer_account'] == 'CRASH':
+            raise OSError('stran.dbf: write failed')
+        if kwargs['amount_pounds'] < 0:
+            return {'success': False, 'errors': ['Amount must be positive']}
+        return {'success': True, 'entry_number': f"R{len(self.calls)}"}
+
+    def auto_allocate_receipt(self, **kwargs):
+        self.calls.append(('allocate_receipt', kwargs['customer_account']))
+        raise RuntimeError('stran locked')
+
+
+def _receipt(account, amount=10.0):
+    return {'type': 'sales_receipt', 'params': {
+        'bank_account': 'BC010', 'customer_account': account, 'amount_pounds': amount,
+        'reference': 'REF', 'post_date': '2026-03-01'}}
+
+
+def _run(monkeypatch, tmp_path, operations, stop_on_error=False, importer=None, wal=True):
+    importer = importer or FakeImporter()
+    monkeypatch.setattr(service, 'get_importer', lambda: importer)
+    monkeypatch.setattr(service, 'wal', WriteAheadLog(str(tmp_path / 'wal.db')) if wal else None)
+    monkeypatch.setattr(service, 'safety', None)
+
+    async def collect():
+        resp = await service.bulk(service.BulkRequest(operations=operations, stop_on_error=stop_on_error))
+        return [chunk async for chunk in resp.body_iterator]
+
+    lines = ''.join(asyncio.run(collect())).splitlines()
+    return importer, [json.loads(line) for line in lines]
+
+
+def test_bulk_streams_results_under_one_lock(monkeypatch, tmp_path):
+    allocation = {'type': 'allocate_receipt', 'params': {
+        'customer_account': 'A001', 'receipt_ref': 'REF', 'receipt_amount': 10.0, 'allocation_date': '2026-03-01'}}
+    importer, results = _run(monkeypatch, tmp_path, [_receipt('A001'), allocation, _receipt('B001', -1)])
+
+    assert importer.lock_cycles == 1
+    assert [(r['index'], r['type'], r['success']) for r in results] == [
+        (0, 'sales_receipt', True), (1, 'allocate_receipt', False), (2, 'sales_receipt', False)]
+    assert results[0]['entry_number'] == 'R1' and results[1]['errors'] == ['stran locked']
+    # One WAL record per protected operation; allocations are not WAL-logged
+    assert [op.operation_type for op in service.wal.get_recent_operations()] == ['sales_receipt'] * 2
+
+
+def test_bulk_stop_on_error_and_validation(monkeypatch, tmp_path):
+    importer, results = _run(monkeypatch, tmp_path, [_receipt('A001', -1), _receipt('B001')], stop_on_error=True)
+    assert importer.calls == [('sales_receipt', 'A001')]
+    assert results[1]['skipped'] and not results[1]['success']
+
+    with pytest.raises(HTTPException) as exc:
+        _run(monkeypatch, tmp_path, [_receipt('A001'), {'type': 'sales_receipt', 'params': {}},
+                                     {'type': 'stock_take', 'params': {}}])
+    assert exc.value.status_code == 400
+    assert [d.split(':')[0] for d in exc.value.detail] == ['1', '2']
+
+
+@pytest.mark.parametrize('wal', [True, False])
+def test_raising_operation_fails_alone(monkeypatch, tmp_path, wal):
+    importer, results = _run(monkeypatch, tmp_path, [_receipt('A001'), _receipt('CRASH'), _receipt('B001')],
+                             wal=wal)
+
+    assert [r['success'] for r in results] == [True, False, True]
+    assert results[1]['errors'] == ['stran.dbf: write failed']
+    assert importer.calls == [('sales_receipt', a) for a in ('A001', 'CRASH', 'B001')]
+    if wal:
+        statuses = {op.params['customer_account']: op.status.value for op in service.wal.get_recent_operations()}
+        assert statuses['CRASH'] == 'FAILED' and statuses['B001'] == 'COMPLETED'
+
+
+def test_lock_failure_fails_every_operation(monkeypatch, tmp_path):
+    importer = FakeImporter(lock_error=TimeoutError('stran.dbf is locked'))
+    importer, results = _run(monkeypatch, tmp_path, [_receipt('A001'), _receipt('B001')], importer=importer)
+
+    assert importer.calls == []
+    assert [r['errors'] for r in results] == [['Could not lock tables: stran.dbf is locked']] * 2
+
+
+def test_bad_dates_rejected_before_posting(monkeypatch, tmp_path):
+    bad_receipt = _receipt('B001')
+    bad_receipt['params']['post_date'] = '01/03/2026'
+    allocation = {'type': 'allocate_receipt', 'params': {
+        'customer_account': 'A001', 'receipt_ref': 'REF', 'receipt_amount': 10.0, 'allocation_date': '2026-13-01'}}
+
+    with pytest.raises(HTTPException) as exc:
+        _run(monkeypatch, tmp_path, [_receipt('A001'), bad_receipt, allocation])
+    assert exc.value.status_code == 400
+    assert [d.split(':')[0] for d in exc.value.detail] == ['1', '2']
+    assert 'post_date Invalid date format: 01/03/2026' in exc.value.detail[0]
+    assert 'allocation_date Invalid date format: 2026-13-01' in exc.value.detail[1]
+    assert service.wal.get_recent_operations() == []
+
+
+def test_postings_reuse_held_locks(tmp_path):
+    for name in ('stran', 'salloc', 'atran'):
+        (tmp_path / f'{name}.dbf').touch()
+    # Bypass __init__, which needs the dbf package
+    importer = object.__new__(Opera3FoxProImport)
+    importer.data_path = Path(tmp_path)
+    importer.lock_timeout = 0.2
+    importer._lock_files = {}
+    importer._lock_depth = 0
+    importer._nominal_deltas = None
+    importer._posting_lengths = None
+    importer._written_records = {}
+    importer._table_cache = {}
+
+    with importer.hold_locks(['stran', 'atran']):
+        with importer._transaction_lock(['stran', 'salloc']):
+            assert set(importer._lock_files) == {'stran', 'salloc', 'atran'}
+        assert set(importer._lock_files) == {'stran', 'atran'}
+    assert importer._lock_files == {}
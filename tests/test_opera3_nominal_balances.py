@@ -0,0 +1,138 @@
+"""
+Tests for Opera 3 nominal balance updates made inside a transaction lock
+
+Runs Opera3FoxProImport's nacnt/nhist updates against in-memory tables.
+
+Verifies:
+  1. Changes summed over a posting leave nacnt and nhist as applying each line
+     on its own did
+  2. When the posting fails part way, the changes already made are still
+     written (DBF writes are not rolled back) and none carry over to the next
+     posting
+  3. A nominal account missing from nacnt raises at the line that uses it
+"""
+
+from pathlib import Path
+
+import pytest
+
+from sql_rag.opera3_foxpro_import import Opera3FoxProImport
+
+NOMINAL_LINES = [
+    ('BC010', 100.0, 3), ('BB020', -100.0, 3),
+    ('BC010', -20.5, 3), ('BB020', 20.5, 3),
+    ('BC010', 0.1, 3), ('BC010', 0.2, 3), ('BB020', -0.3, 3),
+    ('BC010', 75.0, 4), ('CA030', -75.0, 4),
+]
+
+
+class FakeRecord:
+    """A dbf record: attribute access, changed inside `with record:`."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeTable(list):
+    def append(self, fields):
+        super().append(FakeRecord(**fields))
+
+
+def _nacnt(account, na_type, na_subt):
+    fields = {'na_acnt': f'{account:<8}', 'na_type': na_type, 'na_subt': na_subt,
+              'na_ptddr': 0.0, 'na_ytddr': 0.0, 'na_ptdcr': 0.0, 'na_ytdcr': 0.0}
+    fields.update({f'na_balc{p:02d}': 0.0 for p in range(1, 25)})
+    return FakeRecord(**fields)
+
+
+def _importer(tmp_path):
+    for name in ('nacnt', 'nhist', 'ntran'):
+        (tmp_path / f'{name}.dbf').touch()
+    # Bypass __init__, which needs the dbf package
+    importer = object.__new__(Opera3FoxProImport)
+    importer.data_path = Path(tmp_path)
+    importer.lock_timeout = 0.2
+    importer._lock_files = {}
+    importer._lock_depth = 0
+    importer._nominal_deltas = None
+    importer._posting_lengths = None
+    importer._written_records = {}
+    importer._table_cache = {}
+    importer._nacnt_type_cache = {}
+    importer._financial_year_cache = 2026
+    importer.tables = {
+        'nacnt': FakeTable([_nacnt('BC010', 'B ', 'BC'), _nacnt('BB020', 'B ', 'BB'),
+                            _nacnt('CA030', 'C ', 'CA')]),
+        'nhist': FakeTable(),
+    }
+    importer._open_table = importer.tables.__getitem__
+    return importer
+
+
+def _state(importer):
+    nacnt = {r.na_acnt.strip(): {k: round(v, 2) for k, v in vars(r).items() if isinstance(v, float) and v}
+             for r in importer.tables['nacnt']}
+    nhist = sorted((r.nh_nacnt.strip(), r.nh_period, round(r.nh_bal, 2),
+                    round(r.nh_ptddr, 2), round(r.nh_ptdcr, 2))
+                   for r in importer.tables['nhist'])
+    return nacnt, nhist
+
+
+def test_summed_changes_match_per_line_updates(tmp_path):
+    per_line = _importer(tmp_path)
+    for account, value, period in NOMINAL_LINES:
+        per_line._update_nacnt_balance(account, value, period, 2026)
+
+    summed = _importer(tmp_path)
+    with summed._transaction_lock(['nacnt', 'nhist', 'ntran']):
+        for account, value, period in NOMINAL_LINES:
+            summed._update_nacnt_balance(account, value, period, 2026)
+        # Nothing written until the lock is released
+        assert _state(summed) == ({'BC010': {}, 'BB020': {}, 'CA030': {}}, [])
+
+    assert _state(summed) == _state(per_line)
+    nacnt, nhist = _state(summed)
+    assert nacnt['BC010'] == {'na_ptddr': 175.3, 'na_ytddr': 175.3, 'na_ptdcr': 20.5, 'na_ytdcr': 20.5,
+                              'na_balc03': 79.8, 'na_balc04': 75.0}
+    assert ('BC010', 3, 79.8, 100.3, -20.5) in nhist
+
+
+def test_failed_posting_writes_changes_made_so_far(tmp_path):
+    importer = _importer(tmp_path)
+    with pytest.raises(RuntimeError, match='ptran write failed'):
+        with importer._transaction_lock(['nacnt', 'nhist', 'ntran']):
+            importer._update_nacnt_balance('BC010', -60.0, 3, 2026)
+            importer._update_nacnt_balance('CA030', 60.0, 3, 2026)
+            raise RuntimeError('ptran write failed')
+
+    nacnt, nhist = _state(importer)
+    assert nacnt['BC010'] == {'na_ptdcr': 60.0, 'na_ytdcr': 60.0, 'na_balc03': -60.0}
+    assert nacnt['CA030'] == {'na_ptddr': 60.0, 'na_ytddr': 60.0, 'na_balc03': 60.0}
+    assert importer._nominal_deltas is None and importer._lock_files == {}
+
+    # The next posting starts from nothing
+    with importer._transaction_lock(['nacnt', 'nhist', 'ntran']):
+        importer._update_nacnt_balance('BC010', 10.0, 3, 2026)
+    nacnt, nhist = _state(importer)
+    assert nacnt['BC010']['na_balc03'] == -50.0 and nacnt['CA030']['na_balc03'] == 60.0
+    assert ('BC010', 3, -50.0, 10.0, -60.0) in nhist
+
+
+def test_missing_account_raises_at_its_line(tmp_path):
+    importer = _importer(tmp_path)
+    posted = []
+    with pytest.raises(ValueError, match='ZZ999 not found in nacnt'):
+        with importer._transaction_lock(['nacnt', 'nhist', 'ntran']):
+            for account, value in (('BC010', 10.0), ('ZZ999', -10.0), ('BB020', 5.0)):
+                importer._update_nacnt_balance(account, value, 3, 2026)
+                posted.append(account)
+
+    assert posted == ['BC010']
+    # The line already written still gets its balance
+    assert _state(importer)[0]['BC010'] == {'na_ptddr': 10.0, 'na_ytddr': 10.0, 'na_balc03': 10.0}
@@ -0,0 +1,203 @@
+"""
+Tests for post-write verification by record number
+
+Verifies:
+  1. The importer reports the record numbers each posting appended
+  2. TransactionSafety.verify reads only those records, and fails a posting
+     whose records are missing or whose ntran rows do not balance
+  3. Deleted records are not counted, whether read one by one or in a batch
+  4. Without written_records, the end of each table is scanned through the
+     Harbour bridge in one read_records call
+  5. The agent passes its Harbour bridge to the safety layer
+"""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from opera3_agent import service
+from opera3_agent.harbour_dbf import PackedRecords, RecordLayout
+from opera3_agent.transaction_safety import TransactionSafety
+from sql_rag.opera3_foxpro_import import Opera3FoxProImport
+
+
+class FakeHarbour:
+    """HarbourDBF stand-in over {alias: [record dict, ...]}; '_deleted' marks a deleted record."""
+
+    has_deleted = True
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.reads = []
+        self.open_aliases = {}
+
+    def open(self, filepath, alias):
+        self.open_aliases[alias] = Path(filepath).stem.lower()
+
+    def close(self, alias):
+        del self.open_aliases[alias]
+
+    def reccount(self, alias):
+        return len(self.tables[self.open_aliases[alias]])
+
+    def goto_record(self, alias, recno):
+        self.current = (self.open_aliases[alias], recno)
+        self.reads.append(self.current)
+
+    def deleted(self, alias):
+        table, recno = self.current
+        return bool(self.tables[table][recno - 1].get('_deleted'))
+
+    def get_field(self, alias, field):
+        table, recno = self.current
+        return str(self.tables[table][recno - 1][field])
+
+    def get_field_n(self, alias, field):
+        table, recno = self.current
+        return float(self.tables[table][recno - 1][field])
+
+
+class FakeBatchHarbour(FakeHarbour):
+    """FakeHarbour with the batch read_records call."""
+
+    has_batch = True
+
+    def read_records(self, alias, recnos, fields):
+        table = self.tables[self.open_aliases[alias]]
+        self.reads.append((self.open_aliases[alias], tuple(recnos)))
+        layout = RecordLayout([
+            (f.upper(), 'N' if isinstance(table[0][f], (int, float)) else 'C', 8, i + 1)
+            for i, f in enumerate(fields)])
+        rows = [{f.upper(): table[r - 1][f] for f in fields} if r <= len(table) else {} for r in recnos]
+        buf = layout.pack(rows, [r if r <= len(table) else 0 for r in recnos])
+        for i, r in enumerate(recnos):
+            if r <= len(table) and table[r - 1].get('_deleted'):
+                buf[i * layout.row_size + 4] = 1
+        return PackedRecords(layout, buf)
+
+
+def test_importer_reports_appended_records():
+    importer = object.__new__(Opera3FoxProImport)
+    importer._lock_files = {}
+    importer._lock_depth = 0
+    importer._nominal_deltas = None
+    importer._posting_lengths = None
+    importer._written_records = {}
+    importer._table_cache = {'ntran': ['n1', 'n2', 'n3'], 'atran': []}
+
+    with importer._transaction_lock([]):
+        importer._open_table('ntran').extend(['n4', 'n5'])
+        importer._open_table('atran').append('a1')
+    with importer._transaction_lock([]):
+        importer._open_table('atran').append('a2')
+
+    assert importer.take_written_records() == {'ntran': [4, 5], 'atran': [1, 2]}
+    assert importer.take_written_records() == {}
+
+
+def _safety(tmp_path, tables, harbour_class=FakeHarbour):
+    for name in tables:
+        (tmp_path / f'{name}.dbf').touch()
+    harbour = harbour_class(tables)
+    return TransactionSafety(str(tmp_path), harbour=harbour), harbour
+
+
+def test_verify_reads_only_written_records(tmp_path):
+    old = [{'ae_entry': 'P100', 'at_entry': 'P100', 'nt_jrnl': 7, 'nt_value': 1.0}] * 5000
+    tables = {
+        'aentry': old + [{'ae_entry': 'P200001'}],
+        'atran': old + [{'at_entry': 'P200001'}],
+        'ntran': old + [{'nt_jrnl': 42, 'nt_value': -125.5}, {'nt_jrnl': 42, 'nt_value': 125.5}],
+    }
+    safety, harbour = _safety(tmp_path, tables)
+    result = {'success': True, 'entry_number': 'P200001', 'journal_number': 42,
+              'written_records': {'aentry': [5001], 'atran': [5001], 'ntran': [5001, 5002]}}
+
+    verification = safety.verify('nominal_entry', result)
+    assert verification.passed, verification.details
+    assert len(harbour.reads) == 6 and harbour.open_aliases == {}
+
+    tables['ntran'][-1] = {'nt_jrnl': 42, 'nt_value': 120.0}
+    verification = safety.verify('nominal_entry', result)
+    assert not verification.passed and 'do not balance: net -5.50' in verification.details
+
+    result['written_records'] = {'aentry': [5001], 'ntran': [5001, 5002]}
+    verification = safety.verify('nominal_entry', result)
+    assert not verification.passed and 'atran (at_entry=P200001: expected 1, found 0)' in verification.details
+
+
+def test_verify_batches_reads_per_table(tmp_path):
+    tables = {
+        'aentry': [{'ae_entry': 'P200001'}],
+        'atran': [{'at_entry': 'P200001'}],
+        'ntran': [{'nt_jrnl': 42, 'nt_value': -125.5}, {'nt_jrnl': 42, 'nt_value': 125.5}],
+    }
+    safety, harbour = _safety(tmp_path, tables, FakeBatchHarbour)
+    result = {'success': True, 'entry_number': 'P200001', 'journal_number': 42,
+              'written_records': {'aentry': [1], 'atran': [1], 'ntran': [1, 2]}}
+
+    verification = safety.verify('nominal_entry', result)
+    assert verification.passed, verification.details
+    assert harbour.reads == [('aentry', (1,)), ('atran', (1,)), ('ntran', (1, 2)), ('ntran', (1, 2))]
+
+    result['written_records']['ntran'] = [1, 3]
+    verification = safety.verify('nominal_entry', result)
+    assert not verification.passed and 'ntran (nt_jrnl=42: expected 2, found 1)' in verification.details
+
+
+@pytest.mark.parametrize('harbour_class', [FakeHarbour, FakeBatchHarbour])
+def test_verify_skips_deleted_records(tmp_path, harbour_class):
+    tables = {
+        'aentry': [{'ae_entry': 'P200001', '_deleted': True}],
+        'atran': [{'at_entry': 'P200001'}],
+        'ntran': [{'nt_jrnl': 42, 'nt_value': -125.5}, {'nt_jrnl': 42, 'nt_value': 125.5}],
+    }
+    safety, harbour = _safety(tmp_path, tables, harbour_class)
+    result = {'success': True, 'entry_number': 'P200001', 'journal_number': 42,
+              'written_records': {'aentry': [1], 'atran': [1], 'ntran': [1, 2]}}
+
+    verification = safety.verify('nominal_entry', result)
+    assert not verification.passed
+    assert 'aentry (ae_entry=P200001: expected 1, found 0)' in verification.details
+
+
+def test_verify_scans_table_ends_in_one_batch(tmp_path):
+    old = [{'ae_entry': 'P100', 'at_entry': 'P100', 'nt_jrnl': 7, 'nt_value': 1.0}] * 1500
+    tables = {
+        'aentry': old + [{'ae_entry': 'P200001'}],
+        'atran': old + [{'at_entry': 'P200001'}, {'at_entry': 'P200001', '_deleted': True}],
+        'ntran': old + [{'nt_jrnl': 42, 'nt_value': -125.5}, {'nt_jrnl': 42, 'nt_value': 125.5}],
+    }
+    safety, harbour = _safety(tmp_path, tables, FakeBatchHarbour)
+    result = {'success': True, 'entry_number': 'P200001', 'journal_number': 42}
+
+    verification = safety.verify('nominal_entry', result)
+    assert verification.passed, verification.details
+    assert [(table, recnos[0], recnos[-1]) for table, recnos in harbour.reads] == [
+        ('aentry', 502, 1501), ('atran', 503, 1502), ('ntran', 503, 1502)]
+    assert [c['found'] for c in verification.checks] == [1, 1, 2]
+
+
+def test_library_without_deleted_flags_not_used(tmp_path):
+    class OldHarbour(FakeHarbour):
+        has_deleted = False
+
+    assert TransactionSafety(str(tmp_path), harbour=OldHarbour({})).harbour is None
+
+
+def test_agent_verifies_through_harbour(monkeypatch, tmp_path):
+    harbour = FakeBatchHarbour({})
+    monkeypatch.setattr(service, '_open_harbour', lambda: harbour)
+    monkeypatch.setattr(service, 'OPERA3_BASE_PATH', str(tmp_path))
+    monkeypatch.setattr(service, 'WAL_DB_PATH', str(tmp_path / 'wal.db'))
+    monkeypatch.setattr(service, '_company_paths', {})
+    # Restored afterwards
+    monkeypatch.setattr(service, 'safety', None)
+    monkeypatch.setattr(service, 'wal', None)
+
+    async def start():
+        async with service.lifespan(service.app):
+            return service.safety
+
+    assert asyncio.run(start()).harbour is harbour
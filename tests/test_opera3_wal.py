@@ -0,0 +1,70 @@
+"""
+Tests for opera3_agent/write_ahead_log.py
+
+Verifies:
+  1. Concurrent operations are all recorded, and a new WriteAheadLog on the
+     same file (as after a crash) sees the incomplete ones
+  2. A failing write only fails its own caller, not the rest of its batch
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from opera3_agent.write_ahead_log import OperationStatus, WriteAheadLog
+
+
+def test_concurrent_operations_are_durable(tmp_path):
+    path = str(tmp_path / 'wal.db')
+    wal = WriteAheadLog(path)
+    ids = []
+
+    def worker(n):
+        for i in range(20):
+            op_id = wal.begin_operation('sales_receipt', {'n': n, 'i': i})
+            wal.mark_in_progress(op_id)
+            if i % 2:
+                wal.mark_completed(op_id, {'success': True})
+            ids.append(op_id)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert wal.get_stats()['by_status'] == {'COMPLETED': 80, 'IN_PROGRESS': 80}
+    # Read back without closing the first log, as the agent would after a crash
+    incomplete = WriteAheadLog(path).get_incomplete_operations()
+    assert len(incomplete) == 80 and {op.status for op in incomplete} == {OperationStatus.IN_PROGRESS}
+    assert wal.get_operation(ids[0]).params['i'] == 0
+
+
+def test_failed_write_does_not_fail_its_batch(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / 'wal.db'))
+    op_id = wal.begin_operation('bank_transfer', {})
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def bad():
+        barrier.wait()
+        try:
+            wal._write("INSERT INTO operations (id) VALUES (?)", (op_id,))
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    def good():
+        barrier.wait()
+        wal.mark_failed(op_id, 'Bank account not found')
+
+    threads = [threading.Thread(target=bad), threading.Thread(target=good)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(errors) == 1
+    assert wal.get_operation(op_id).status == OperationStatus.FAILED
+    with pytest.raises(sqlite3.IntegrityError):
+        wal._write("INSERT INTO operations (id) VALUES (?)", (op_id,))
@@ -0,0 +1,124 @@
+"""
+Tests for sql_rag/opera_reference_data.py
+
+Verifies:
+  1. A snapshot is loaded with one query per reference table
+  2. OperaSQLImport lookups are answered from the snapshot without querying
+  3. Posting transactions fail before commit when the reference version has changed
+"""
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sql_rag.opera_reference_data import StaleReferenceDataError, load_reference_data
+from sql_rag.opera_sql_import import OperaSQLImport, execute_with_deadlock_retry
+
+VERSION = {'nparm_v': 1, 'atype_v': 2, 'nacnt_v': 3, 'ztax_v': 4, 'nclndd_v': 5, 'sname_v': 6}
+
+
+class FakeConnector:
+    """Answers the reference queries by table name and records every query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def execute_query(self, sql):
+        self.queries.append(sql)
+        if 'CHECKSUM_AGG' in sql:
+            return pd.DataFrame([VERSION])
+        if 'FROM nparm' in sql:
+            return pd.DataFrame([{'np_year': 2026, 'np_perno': 3}])
+        if 'FROM atype' in sql:
+            return pd.DataFrame([
+                {'ay_cbtype': 'PR', 'ay_desc': 'Refund', 'ay_type': 'R', 'ay_entry': 'PR00000001'},
+                {'ay_cbtype': 'R2', 'ay_desc': 'BACS Receipt', 'ay_type': 'R', 'ay_entry': 'R200000010'},
+                {'ay_cbtype': 'P1', 'ay_desc': 'Payment', 'ay_type': 'P', 'ay_entry': 'P100000005'},
+            ])
+        if 'FROM nacnt' in sql:
+            return pd.DataFrame([{'na_acnt': 'BC010', 'na_type': 'B ', 'na_subt': 'BC'}])
+        if 'FROM ztax' in sql:
+            return pd.DataFrame([
+                {'tx_code': '1', 'tx_desc': 'Standard', 'tx_rate1': 17.5, 'tx_rate2': 20.0,
+                 'tx_rate1dy': None, 'tx_rate2dy': date(2011, 1, 4), 'tx_nominal': 'CA060',
+                 'tx_trantyp': 'S', 'tx_ctrytyp': 'H'},
+            ])
+        if 'FROM nclndd' in sql:
+            return pd.DataFrame([
+                {'ncd_stdate': date(2026, 3, 1), 'ncd_endate': date(2026, 3, 31), 'ncd_period': 3, 'ncd_year': 2026},
+            ])
+        if 'FROM zxchg' in sql:
+            return pd.DataFrame([{'xc_curr': 'GBP ', 'xc_desc': 'Sterling'}])
+        if 'FROM sname' in sql:
+            return pd.DataFrame([{'account': 'A001', 'name': 'Dormant Ltd', 'dormant': 1}])
+        if 'sprfls' in sql or 'np_dca' in sql or 'pprfls' in sql:
+            return pd.DataFrame([{'debtors_control': 'BB020', 'creditors_control': 'CA030',
+                                  'np_dca': 'BB020', 'np_cca': 'CA030'}])
+        return pd.DataFrame()
+
+
+class FakeConn:
+    def __init__(self, version):
+        self.version = version
+
+    def execute(self, statement, params=None):
+        version = self.version
+
+        class Result:
+            def fetchone(self):
+                return tuple(version.values())
+        return Result()
+
+
+def test_lookups_answered_from_snapshot():
+    sql = FakeConnector()
+    importer = OperaSQLImport(sql)
+    with importer.reference_data(customers=['A001', 'A002']) as ref:
+        assert ref.version == tuple(VERSION.values())
+        loaded = len(sql.queries)
+
+        assert importer.get_period_for_date('2026-03-15') == (3, 2026)
+        assert importer.get_vat_rate('1', 'S', date(2026, 3, 15))['rate'] == 20.0
+        assert importer.get_home_currency()['code'] == 'GBP'
+        assert importer._get_financial_year(None) == 2026
+        assert importer._get_nacnt_type(None, 'BC010 ') == ('B ', 'BC')
+        assert [t['code'] for t in importer.get_available_types('R')] == ['R2', 'PR']
+        assert importer.validate_cbtype('P1', required_category='R')['valid'] is False
+        assert importer.validate_cbtype('R2', required_category='R')['next_entry'] == 'R200000010'
+        assert 'dormant' in importer.check_account_dormant('A001', 'sales')
+        assert importer.check_account_dormant('A002', 'sales') is None
+        assert importer._ledger_account('A001', 'sales')['name'] == 'Dormant Ltd'
+        assert importer._ledger_account('A002', 'sales') is None
+        assert importer._ledger_control_account('A001', 'sales') == 'BB020'
+
+        assert len(sql.queries) == loaded
+    assert importer._reference is None
+
+
+def test_stale_snapshot_fails_before_commit():
+    ref = load_reference_data(FakeConnector(), customers=['A001'])
+    ref.verify_version(FakeConn(VERSION))
+    with pytest.raises(StaleReferenceDataError):
+        ref.verify_version(FakeConn({**VERSION, 'atype_v': 99}))
+
+    class FakeEngine:
+        committed = False
+
+        def begin(self):
+            engine = self
+
+            class Txn:
+                def __enter__(self):
+                    return FakeConn({**VERSION, 'nacnt_v': 0})
+
+                def __exit__(self, exc_type, *args):
+                    engine.committed = exc_type is None
+            return Txn()
+
+    engine = FakeEngine()
+    with pytest.raises(StaleReferenceDataError):
+        execute_with_deadlock_retry(engine, lambda conn: None, 'test', before_commit=ref.verify_version)
+    assert engine.committed is False
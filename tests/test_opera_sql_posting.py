@@ -0,0 +1,572 @@
+"""
+Tests for Opera SQL SE cashbook posting
+
+Runs OperaSQLImport against an in-memory stand-in for the Opera company
+database that records inserted rows and applies the nacnt/nhist/nsubt/ntype
+balance updates, so postings can be compared table by table.
+
+Verifies:
+  1. A sales receipt / purchase payment batch writes the same aentry, atran,
+     ntran, anoml, stran/ptran and njmemo rows, and leaves nacnt with the same
+     DR/CR split, as posting each line with the single-line import
+  2. The batch looks up each nominal account's type once, not once per line
+  3. When the batch transaction fails, nothing is posted and every valid line
+     is reported as not posted
+  4. Nominal balance changes summed over a posting leave nacnt, nhist, nsubt
+     and ntype as applying each line on its own did, with one nacnt update per
+     account and period
+  5. A nominal account missing from nacnt fails the posting at the line that
+     uses it
+  6. Statement lines posted one by one inside reference_data() read customers,
+     suppliers, nominal accounts, type codes and VAT codes from the snapshot,
+     not with a SELECT per line
+"""
+
+import copy
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from sql_rag import opera_config
+from sql_rag import opera_sql_import
+from sql_rag.opera_config import PeriodPostingDecision
+from sql_rag.opera_reference_data import ReferenceData
+from sql_rag.opera_sql_import import OperaSQLImport
+
+NOMINAL_TYPES = {
+    'BC010': ('B ', 'BC'),
+    'BC020': ('B ', 'BC'),
+    'BB020': ('B ', 'BB'),
+    'CA030': ('C ', 'CA'),
+}
+CUSTOMERS = {'A001': 'Alpha Ltd', 'A002': 'Beta Trading'}
+SUPPLIERS = {'S001': 'Gamma Supplies', 'S002': 'Delta Parts'}
+CONTROL = {'sales_receipt': 'BB020', 'purchase_payment': 'CA030'}
+CALENDAR = (
+    (date(2026, 3, 1), date(2026, 3, 31), 3, 2026),
+    (date(2026, 4, 1), date(2026, 4, 30), 4, 2026),
+)
+
+# Differ between any two runs: compared structurally (see _canonical)
+VOLATILE = {'datecreated', 'datemodified', 'sq_crdate', 'sq_crtime'}
+UNIQUE_COLUMNS = ('at_unique', 'nt_pstid', 'ax_unique', 'st_unique', 'pt_unique')
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|[^,]+")
+_DELTA = re.compile(r"(\w+) = ISNULL\(\1, 0\) \+ (-?[\d.]+(?:e-?\d+)?)")
+
+
+def _literal(token):
+    token = token.strip()
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    if token == 'GETDATE()':
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _deltas(sql):
+    return {col: float(value) for col, value in _DELTA.findall(sql)}
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=1):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, statement, params=None):
+        db = self.db
+        raw = str(statement)
+        sql = ' '.join(raw.split())
+        db.statements.append(sql)
+        db.calls.append((sql, params))
+
+        # Matched on the raw text: string literals keep their padding
+        insert = re.match(r"\s*INSERT INTO (\w+) \((.*?)\)\s*VALUES\s*\((.*)\)\s*$", raw, re.S)
+        if insert and insert.group(1) == db.fail_on:
+            raise RuntimeError(f'Cannot insert into {db.fail_on}')
+        if insert:
+            columns = [c.strip() for c in insert.group(2).split(',')]
+            if params:
+                rows = params if isinstance(params, list) else [params]
+            else:
+                rows = [dict(zip(columns, map(_literal, _LITERAL.findall(insert.group(3)))))]
+            db.tables[insert.group(1)].extend(dict(row) for row in rows)
+            return FakeResult(rowcount=len(rows))
+
+        if sql.startswith('SELECT nextid FROM nextid'):
+            return FakeResult([(db.nextid[params['tablename']],)])
+        if sql.startswith('UPDATE nextid'):
+            db.nextid[params['tablename']] = params['nextid']
+            return FakeResult()
+        if sql.startswith('SELECT np_nexjrnl'):
+            return FakeResult([(db.next_journal,)])
+        if sql.startswith('UPDATE nparm'):
+            db.next_journal = next(iter(params.values()))
+            return FakeResult()
+        if sql.startswith('SELECT ay_entry FROM atype'):
+            cbtype = params['cbtype'] if params else re.search(r"ay_cbtype\) = '(\w+)'", sql).group(1)
+            return FakeResult([(db.atype[cbtype],)])
+        if sql.startswith('UPDATE atype'):
+            if params:
+                entry, cbtype = params['next_entry'], params['cbtype']
+            else:
+                entry, cbtype = re.search(r"ay_entry = '(\w+)'.*ay_cbtype\) = '(\w+)'", sql).groups()
+            db.atype[cbtype] = entry
+            return FakeResult()
+        if 'FROM aentry' in sql:
+            used = [(row['ae_entry'],) for row in db.tables['aentry']]
+            return FakeResult(used if sql.startswith('SELECT RTRIM(ae_entry)') else
+                              [u for u in used if f"'{u[0]}'" in sql])
+
+        if sql.startswith('SELECT na_type, na_subt FROM nacnt'):
+            account = re.search(r"na_acnt\) = '(\w+)'", sql).group(1)
+            return FakeResult([db.types[account]] if account in db.types else [])
+        if sql.startswith('UPDATE nacnt'):
+            account = re.search(r"na_acnt\) = '(\w+)'", sql).group(1)
+            if account not in db.nacnt:
+                return FakeResult(rowcount=0)
+            for col, value in _deltas(sql).items():
+                db.nacnt[account][col] = db.nacnt[account].get(col, 0) + value
+            return FakeResult()
+        if sql.startswith('SELECT TOP 1 id FROM nhist'):
+            account, year, period = re.search(
+                r"nh_nacnt\) = '(\w+)'.*nh_year = (\d+) AND nh_period = (\d+)", sql).groups()
+            return FakeResult([(row['id'],) for row in db.tables['nhist']
+                               if row['nh_nacnt'].strip() == account
+                               and (row['nh_year'], row['nh_period']) == (int(year), int(period))][:1])
+        if sql.startswith('UPDATE nhist'):
+            row_id = int(re.search(r'WHERE id = (\d+)', sql).group(1))
+            [row] = [r for r in db.tables['nhist'] if r['id'] == row_id]
+            for col, value in _deltas(sql).items():
+                row[col] += value
+            return FakeResult()
+        if sql.startswith('UPDATE nsubt'):
+            subt, ntype = re.search(r"ns_subt = '(.+?)' AND ns_type = '(.+?)'", sql).groups()
+            db.nsubt[(ntype, subt)] += _deltas(sql)['ns_balance']
+            return FakeResult()
+        if sql.startswith('UPDATE ntype'):
+            ntype = re.search(r"nt_type = '(.+?)'", sql).group(1)
+            db.ntype[ntype] += _deltas(sql)['nt_bal']
+            return FakeResult()
+
+        # Lock timeout, nbank and sname/pname balance updates
+        return FakeResult()
+
+
+class FakeEngine:
+    def __init__(self, db):
+        self.db = db
+
+    @contextmanager
+    def begin(self):
+        saved = self.db.state()
+        try:
+            yield FakeConnection(self.db)
+        except Exception:
+            self.db.restore(saved)
+            raise
+
+
+class FakeOperaDatabase:
+    """
+    Inserted rows per table plus nacnt/nhist/nsubt/ntype balances, with the
+    sql_connector surface (engine, execute_query) OperaSQLImport uses.
+    `fail_on` makes an INSERT into that table raise.
+    """
+
+    def __init__(self, fail_on=None):
+        self.engine = FakeEngine(self)
+        self.types = dict(NOMINAL_TYPES)
+        self.tables = defaultdict(list)
+        self.nacnt = {account: {} for account in NOMINAL_TYPES}
+        self.nsubt = defaultdict(float)
+        self.ntype = defaultdict(float)
+        self.nextid = defaultdict(lambda: 1000)
+        self.next_journal = 5000
+        self.atype = {'R2': 'R200000100', 'P1': 'P100000200'}
+        self.statements = []
+        self.calls = []
+        self.fail_on = fail_on
+
+    def state(self):
+        return copy.deepcopy((self.tables, self.nacnt, self.nsubt, self.ntype,
+                              self.nextid, self.next_journal, self.atype))
+
+    def restore(self, saved):
+        (self.tables, self.nacnt, self.nsubt, self.ntype,
+         self.nextid, self.next_journal, self.atype) = saved
+
+    def execute_query(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.calls.append((sql, params))
+        quoted = list(dict.fromkeys(params.values())) if params else re.findall(r"'(\w+)'", sql)
+        if 'LEFT JOIN sprfls' in sql or 'LEFT JOIN pprfls' in sql:
+            names, kind = (CUSTOMERS, 'sales_receipt') if 'sprfls' in sql else (SUPPLIERS, 'purchase_payment')
+            return pd.DataFrame([
+                {'account': a, 'name': names[a], 'dormant': 0, 'region': 'K', 'terr': '001',
+                 'type': 'DD1', 'control_account': CONTROL[kind]}
+                for a in quoted if a in names])
+        if sql.startswith('SELECT sn_name'):
+            return pd.DataFrame([{'sn_name': CUSTOMERS[quoted[0]], 'sn_region': 'K',
+                                  'sn_terrtry': '001', 'sn_custype': 'DD1'}])
+        if sql.startswith('SELECT pn_name'):
+            return pd.DataFrame([{'pn_name': SUPPLIERS[quoted[0]]}])
+        if sql.startswith('SELECT DISTINCT RTRIM(at_acnt)'):
+            return pd.DataFrame({'acnt': quoted})
+        if sql.startswith('SELECT TOP 1 at_acnt') or sql.startswith('SELECT TOP 1 nt_acnt'):
+            return pd.DataFrame({'acnt': quoted[:1]})
+        if sql.startswith('SELECT RTRIM(st_entry) as entry FROM stran'):
+            return pd.DataFrame({'entry': [row['st_entry'] for row in self.tables['stran']
+                                           if row['st_entry'] in quoted]})
+        raise AssertionError(f'Unexpected query: {sql}')
+
+
+def _load_reference_data(sql, customers=(), suppliers=()):
+    accounts = {}
+    for ledger, names, kind, listed in (('sales', CUSTOMERS, 'sales_receipt', customers),
+                                        ('purchase', SUPPLIERS, 'purchase_payment', suppliers)):
+        for account in listed:
+            accounts[(ledger, account)] = {'name': names[account], 'region': 'K', 'terr': '001',
+                                           'type': 'DD1', 'control': CONTROL[kind]}
+    return ReferenceData(nacnt_types=dict(NOMINAL_TYPES), calendar=CALENDAR, financial_year=2026,
+                         dormant={key: None for key in accounts}, ledger_accounts=accounts)
+
+
+_VERIFY_LEDGER_ENTRIES = OperaSQLImport.verify_ledger_entries_after_import
+_CHECK_RECORDS_LOCKED = opera_sql_import.check_records_locked
+
+
+@pytest.fixture(autouse=True)
+def opera_environment(monkeypatch):
+    decision = PeriodPostingDecision(can_post=True, post_to_nominal=True,
+                                     post_to_transfer_file=True, transfer_file_done_flag='Y')
+    monkeypatch.setattr(opera_config, 'get_period_posting_decision', lambda *a: decision)
+    monkeypatch.setattr(opera_config, 'get_customer_control_account', lambda *a: CONTROL['sales_receipt'])
+    monkeypatch.setattr(opera_config, 'get_supplier_control_account', lambda *a: CONTROL['purchase_payment'])
+    monkeypatch.setattr(opera_sql_import, 'load_reference_data', _load_reference_data)
+    monkeypatch.setattr(opera_sql_import, 'check_record_locked', lambda *a: False)
+    monkeypatch.setattr(opera_sql_import, 'check_records_locked', lambda *a: False)
+    for name in ('validate_cbtype',):
+        monkeypatch.setattr(OperaSQLImport, name, lambda self, *a, **k: {'valid': True})
+    for name in ('check_account_dormant', 'read_bank_balance_pence', 'verify_balance_after_import',
+                 'verify_nominal_balances', 'verify_ledger_after_import',
+                 'verify_ledger_entries_after_import'):
+        monkeypatch.setattr(OperaSQLImport, name, lambda self, *a, **k: None)
+
+
+LINES = {
+    'sales_receipt': [
+        dict(bank_account='BC010', customer_account='A001', amount=100.0, reference='INV1001',
+             post_date='2026-03-10', cbtype='R2', comment='March receipt'),
+        dict(bank_account='BC010', customer_account='A002', amount=50.25, reference='INV1002',
+             post_date='2026-03-12', cbtype='R2'),
+        # Negative line: credits the bank, so BC010 gets both a DR and a CR for period 3
+        dict(bank_account='BC010', customer_account='A001', amount=-20.0, reference='ADJ1',
+             post_date='2026-03-15', cbtype='R2'),
+        dict(bank_account='BC020', customer_account='A002', amount=75.5, reference='INV1003',
+             post_date='2026-04-02', cbtype='R2'),
+    ],
+    'purchase_payment': [
+        dict(bank_account='BC010', supplier_account='S001', amount=300.0, reference='PAY1',
+             post_date='2026-03-10', cbtype='P1', payment_type='BACS'),
+        dict(bank_account='BC010', supplier_account='S002', amount=-45.1, reference='PAY2',
+             post_date='2026-03-20', cbtype='P1'),
+        dict(bank_account='BC020', supplier_account='S001', amount=60.0, reference='PAY3',
+             post_date='2026-04-01', cbtype='P1', comment='April run'),
+    ],
+}
+
+
+def _post_singly(kind, lines, db):
+    importer = OperaSQLImport(db)
+    with importer.reference_data():
+        for line in lines:
+            _post_line(importer, kind, line)
+    return db
+
+
+def _post_line(importer, kind, line):
+    if kind == 'sales_receipt':
+        result = importer.import_sales_receipt(
+            bank_account=line['bank_account'], customer_account=line['customer_account'],
+            amount_pounds=line['amount'], reference=line['reference'],
+            post_date=date.fromisoformat(line['post_date']), cbtype=line['cbtype'],
+            payment_method=line.get('payment_method', 'BACS'), comment=line.get('comment', ''))
+    else:
+        result = importer.import_purchase_payment(
+            bank_account=line['bank_account'], supplier_account=line['supplier_account'],
+            amount_pounds=line['amount'], reference=line['reference'],
+            post_date=date.fromisoformat(line['post_date']), cbtype=line['cbtype'],
+            payment_type=line.get('payment_type', 'Direct Cr'), comment=line.get('comment', ''))
+    assert result.success, result.errors
+
+
+def _post_batch(kind, lines, db):
+    importer = OperaSQLImport(db)
+    if kind == 'sales_receipt':
+        return importer.import_sales_receipts_batch(lines)
+    return importer.import_purchase_payments_batch(lines)
+
+
+def _canonical(db, tables):
+    """
+    Rows per table in id order without timestamps, with Opera unique ids
+    replaced by their order of first use (atran, ntran, anoml, ledger), so
+    rows that share a unique id still have to share it.
+    """
+    labels = {}
+    result = {}
+    for table in tables:
+        rows = []
+        for row in sorted(db.tables[table], key=lambda r: r['id']):
+            row = {k: v for k, v in row.items() if k not in VOLATILE}
+            for col in UNIQUE_COLUMNS:
+                if col in row:
+                    row[col] = labels.setdefault(row[col], f'U{len(labels)}')
+            rows.append(row)
+        result[table] = rows
+    return result
+
+
+def _balances(db):
+    return {account: {col: round(value, 2) for col, value in cols.items()}
+            for account, cols in db.nacnt.items()}
+
+
+@pytest.mark.parametrize('kind', ['sales_receipt', 'purchase_payment'])
+def test_batch_matches_single_imports(kind):
+    lines = LINES[kind]
+    ledger = 'stran' if kind == 'sales_receipt' else 'ptran'
+    tables = ['atran', 'ntran', 'anoml', ledger, 'aentry', 'njmemo']
+
+    single = _post_singly(kind, lines, FakeOperaDatabase())
+    batch = FakeOperaDatabase()
+    result = _post_batch(kind, lines, batch)
+
+    assert result.success and result.records_imported == len(lines), result.errors
+    assert len(batch.tables['ntran']) == 2 * len(lines)
+    assert _canonical(batch, tables) == _canonical(single, tables)
+    assert _balances(batch) == _balances(single)
+
+
+@pytest.mark.parametrize('kind', ['sales_receipt', 'purchase_payment'])
+def test_batch_binds_entry_and_account_values(kind):
+    batch = FakeOperaDatabase()
+    assert _post_batch(kind, LINES[kind], batch).success
+    # The fixture stubs the post-commit checks; run the real one against the fake
+    _VERIFY_LEDGER_ENTRIES(OperaSQLImport(batch), 'stran', 'R2', ['R200000100', 'R200000101'])
+
+    accounts = {line.get('customer_account') or line['supplier_account'] for line in LINES[kind]}
+    literals = accounts | {'R2', 'P1', 'BC010', 'BC020'}
+    checked = [(sql, params) for sql, params in batch.calls
+               if re.match(r'(SELECT .*FROM (atype|aentry|sname|pname|atran|stran)\b|UPDATE (atype|sname|pname))', sql)]
+    assert any('FROM stran' in sql for sql, _ in checked)
+    assert len(checked) >= 6
+    for sql, params in checked:
+        assert params, sql
+        assert not any(f"'{value}'" in sql for value in literals), sql
+    master = [params for sql, params in checked if sql.startswith(('UPDATE sname', 'UPDATE pname'))]
+    assert {p['account'] for p in master} == accounts
+
+
+def test_batch_lock_probe_binds_account_list():
+    db = FakeOperaDatabase()
+
+    class ProbeConnection(FakeConnection):
+        def rollback(self):
+            pass
+
+    @contextmanager
+    def connect():
+        yield ProbeConnection(db)
+
+    db.engine.connect = connect
+    assert _CHECK_RECORDS_LOCKED(db.engine, 'sname', 'sn_account', ['A001', "O'BRIEN", 'A002']) is False
+
+    [(sql, params)] = [(sql, params) for sql, params in db.calls if 'FROM sname' in sql]
+    assert 'IN (:key0, :key1, :key2, :key3)' in sql
+    assert set(params.values()) == {'A001', 'A002', "O'BRIEN"}
+
+
+def test_batch_nacnt_debit_credit_split():
+    batch = FakeOperaDatabase()
+    assert _post_batch('sales_receipt', LINES['sales_receipt'], batch).success
+
+    assert _balances(batch)['BC010'] == {
+        'na_ptddr': 150.25, 'na_ytddr': 150.25,
+        'na_ptdcr': 20.0, 'na_ytdcr': 20.0,
+        'na_balc03': 130.25,
+    }
+    assert _balances(batch)['BB020'] == {
+        'na_ptddr': 20.0, 'na_ytddr': 20.0,
+        'na_ptdcr': 225.75, 'na_ytdcr': 225.75,
+        'na_balc03': -130.25, 'na_balc04': -75.5,
+    }
+    assert _balances(batch)['BC020'] == {'na_ptddr': 75.5, 'na_ytddr': 75.5, 'na_balc04': 75.5}
+
+
+def test_batch_looks_up_each_nominal_type_once(monkeypatch):
+    calls = []
+    lookup = OperaSQLImport._get_nacnt_type
+
+    def counting(self, conn, account):
+        calls.append(account)
+        return lookup(self, conn, account)
+
+    monkeypatch.setattr(OperaSQLImport, '_get_nacnt_type', counting)
+    # Leave out the balance updates, which check the account exists as each line is queued
+    monkeypatch.setattr(OperaSQLImport, 'update_nacnt_balance', lambda self, *a: None)
+    assert _post_batch('sales_receipt', LINES['sales_receipt'], FakeOperaDatabase()).success
+
+    assert sorted(calls) == ['BB020', 'BC010', 'BC020']
+
+
+def test_failed_batch_posts_nothing_and_reports_each_line():
+    db = FakeOperaDatabase(fail_on='stran')
+    result = _post_batch('sales_receipt', LINES['sales_receipt'], db)
+
+    assert not result.success and result.records_imported == 0
+    assert result.errors[0].startswith('Batch posting failed - none of the 4 valid line(s) were posted')
+    assert result.errors[1:] == [f'Receipt {n}: Not posted - batch rolled back' for n in range(1, 5)]
+    assert not db.tables['atran'] and not db.tables['ntran']
+    assert all(not cols for cols in db.nacnt.values())
+
+
+NOMINAL_LINES = [
+    ('BC010', 100.0, 3), ('BB020', -100.0, 3),
+    ('BC010', -20.5, 3), ('BB020', 20.5, 3),
+    ('BC010', 0.1, 3), ('BC010', 0.2, 3), ('BB020', -0.3, 3),
+    ('BC010', 75.0, 4), ('CA030', -75.0, 4),
+]
+
+
+def _nominal_state(db):
+    nhist = sorted(
+        (row['nh_nacnt'].strip(), row['nh_period'],
+         round(row['nh_bal'], 2), round(row['nh_ptddr'], 2), round(row['nh_ptdcr'], 2))
+        for row in db.tables['nhist'])
+    return (_balances(db), nhist,
+            {k: round(v, 2) for k, v in db.nsubt.items()},
+            {k: round(v, 2) for k, v in db.ntype.items()})
+
+
+def test_summed_nominal_deltas_match_per_line_updates():
+    per_line = FakeOperaDatabase()
+    importer = OperaSQLImport(per_line)
+    for account, value, period in NOMINAL_LINES:
+        with per_line.engine.begin() as conn:
+            importer.update_nacnt_balance(conn, account, value, period, 2026)
+
+    summed = FakeOperaDatabase()
+    importer = OperaSQLImport(summed)
+
+    def posting(conn):
+        for account, value, period in NOMINAL_LINES:
+            importer.update_nacnt_balance(conn, account, value, period, 2026)
+
+    importer._run_posting(posting, 'nominal lines')
+
+    assert _nominal_state(summed) == _nominal_state(per_line)
+    assert _balances(summed)['BC010'] == {
+        'na_ptddr': 175.3, 'na_ytddr': 175.3, 'na_ptdcr': 20.5, 'na_ytdcr': 20.5,
+        'na_balc03': 79.8, 'na_balc04': 75.0,
+    }
+    assert sum(1 for sql in summed.statements if sql.startswith('UPDATE nacnt')) == 4
+    assert sum(1 for sql in per_line.statements if sql.startswith('UPDATE nacnt')) == len(NOMINAL_LINES)
+
+
+def test_missing_nominal_account_fails_at_its_line():
+    db = FakeOperaDatabase()
+    importer = OperaSQLImport(db)
+    posted = []
+
+    def posting(conn):
+        for account, value in (('BC010', 10.0), ('ZZ999', -10.0), ('BB020', 5.0)):
+            importer.update_nacnt_balance(conn, account, value, 3, 2026)
+            posted.append(account)
+
+    with pytest.raises(ValueError, match='ZZ999 not found in nacnt'):
+        importer._run_posting(posting, 'missing account')
+
+    assert posted == ['BC010']
+    assert all(not cols for cols in db.nacnt.values())
+    assert not db.tables['nhist']
+
+
+_REFERENCE_SELECT = re.compile(r'SELECT .*\bFROM (sname|pname|nacnt|atype|ztax)\b')
+
+
+def _reference_selects(db):
+    # The UPDLOCK read of the atype entry counter is part of posting, not a lookup
+    return [sql for sql, _ in db.calls if _REFERENCE_SELECT.match(sql) and 'UPDLOCK' not in sql]
+
+
+def test_statement_lines_read_reference_data_from_snapshot():
+    lines = [(kind, line) for kind in ('sales_receipt', 'purchase_payment') for line in LINES[kind]]
+
+    per_line = FakeOperaDatabase()
+    importer = OperaSQLImport(per_line)
+    for kind, line in lines:
+        _post_line(importer, kind, line)
+    assert len(_reference_selects(per_line)) >= len(lines)
+
+    snapshot = FakeOperaDatabase()
+    importer = OperaSQLImport(snapshot)
+    with importer.reference_data(customers=[l['customer_account'] for l in LINES['sales_receipt']],
+                                 suppliers=[l['supplier_account'] for l in LINES['purchase_payment']]):
+        for kind, line in lines:
+            _post_line(importer, kind, line)
+    assert _reference_selects(snapshot) == []
+    assert _canonical(snapshot, ['atran', 'stran', 'ptran']) == _canonical(per_line, ['atran', 'stran', 'ptran'])
+
+
+def test_statement_import_uses_one_snapshot(monkeypatch):
+    pytest.importorskip('pyodbc')
+    from sql_rag.bank_import import BankImportResult, BankStatementImport, BankTransaction
+
+    loads = []
+    monkeypatch.setattr(opera_sql_import, 'load_reference_data',
+                        lambda sql, customers=(), suppliers=(): loads.append((set(customers), set(suppliers)))
+                        or _load_reference_data(sql, customers, suppliers))
+    db = FakeOperaDatabase()
+    importer = BankStatementImport.__new__(BankStatementImport)
+    importer.bank_code = 'BC010'
+    importer.use_fingerprinting = False
+    importer.opera_import = OperaSQLImport(db)
+
+    transactions = []
+    for kind in ('sales_receipt', 'purchase_payment'):
+        for line in LINES[kind]:
+            txn = BankTransaction(row_number=len(transactions) + 1, date=date.fromisoformat(line['post_date']),
+                                  amount=line['amount'], subcategory='', memo=line['reference'],
+                                  name=line['reference'], reference=line['reference'])
+            txn.action = kind
+            txn.matched_account = line.get('customer_account') or line['supplier_account']
+            txn.cbtype = line['cbtype']
+            transactions.append(txn)
+    result = importer.import_approved(BankImportResult(filename='statement.csv', transactions=transactions))
+
+    assert result.imported_transactions == len(transactions), result.errors
+    assert loads == [({'A001', 'A002'}, {'S001', 'S002'})]
+    assert _reference_selects(db) == []
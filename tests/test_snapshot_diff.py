@@ -0,0 +1,120 @@
+"""
+Tests for sql_rag/snapshot_diff.py
+
+Verifies:
+  1. Added, deleted and modified rows match the row-by-row str() comparison
+     the transaction-snapshot tool used before
+  2. None equals None and NaN equals NaN in both modes, but None and NaN differ
+  3. The monitor's mode (stripped keys, after columns, value equality) skips new rows
+  4. diff_snapshots keeps its output shape and table order when run in parallel
+"""
+
+import random
+
+import pytest
+
+from sql_rag.snapshot_diff import diff_rows
+
+
+def _reference_diff(before_rows, after_rows, pk_col):
+    """The per-row loop diff_snapshots used before the vectorised engine."""
+    before_by_pk = {str(r.get(pk_col, '')): r for r in before_rows}
+    after_by_pk = {str(r.get(pk_col, '')): r for r in after_rows}
+    added = [row for pk, row in after_by_pk.items() if pk not in before_by_pk]
+    deleted = [row for pk, row in before_by_pk.items() if pk not in after_by_pk]
+    modified = {}
+    for pk, before_row in before_by_pk.items():
+        if pk in after_by_pk:
+            after_row = after_by_pk[pk]
+            field_changes = {}
+            for field in set(list(before_row.keys()) + list(after_row.keys())):
+                if str(before_row.get(field)) != str(after_row.get(field)):
+                    field_changes[field] = (before_row.get(field), after_row.get(field))
+            if field_changes:
+                modified[pk] = field_changes
+    return added, deleted, modified
+
+
+def _ntran(n):
+    return {'id': float(n), 'nt_acnt': f'N{n % 50:04d}', 'nt_value': round(n * 1.25, 2),
+            'nt_ref': f'REF{n}', 'nt_posttyp': None}
+
+
+def test_matches_reference_diff():
+    rng = random.Random(7)
+    before = [_ntran(n) for n in range(1, 2001)]
+    after = [dict(r) for r in before]
+    for i in rng.sample(range(len(after)), 40):
+        after[i]['nt_value'] = after[i]['nt_value'] + 1
+    for i in rng.sample(range(len(after)), 10):
+        after[i]['nt_posttyp'] = 'S'
+    after = [r for i, r in enumerate(after) if i not in (3, 500, 1999)]
+    after += [_ntran(n) for n in range(2001, 2006)]
+
+    result = diff_rows(before, after, 'id')
+    added, deleted, modified = _reference_diff(before, after, 'id')
+
+    assert result.added == added
+    assert result.deleted == deleted
+    assert {pk: changes for pk, changes, _ in result.modified} == modified
+    assert result.modified_fields == {'nt_value', 'nt_posttyp'}
+
+
+def test_str_comparison_and_missing_values():
+    before = [{'id': 1.0, 'a': 1.0, 'b': None, 'c': float('nan'), 'd': 'x', 'f': None, 'g': float('nan')}]
+    after = [{'id': 1.0, 'a': '1.0', 'b': float('nan'), 'c': None, 'd': 'y', 'e': 5,
+              'f': None, 'g': float('nan')}]
+    result = diff_rows(before, after, 'id')
+    nan_pair = result.modified[0][1]['b']
+    assert [(pk, sorted(changes)) for pk, changes, _ in result.modified] == [('1.0', ['b', 'c', 'd', 'e'])]
+    assert nan_pair[0] is None and nan_pair[1] != nan_pair[1]
+    assert result.modified[0][1]['e'] == (None, 5)
+
+
+@pytest.mark.parametrize('compare', ['str', 'value'])
+def test_none_and_nan_compared_explicitly(compare):
+    before = [{'id': 1, 'same_none': None, 'same_nan': float('nan'), 'to_nan': None, 'to_none': float('nan')}]
+    after = [{'id': 1, 'same_none': None, 'same_nan': float('nan'), 'to_nan': float('nan'), 'to_none': None}]
+    result = diff_rows(before, after, 'id', compare=compare)
+    assert result.modified_fields == {'to_nan', 'to_none'}
+
+
+def test_monitor_mode():
+    before = [{'sn_account': ' A001', 'sn_currbal': 10.0}, {'sn_account': 'B002', 'sn_currbal': 5.0}]
+    after = [{'sn_account': ' A001', 'sn_currbal': 12.5}, {'sn_account': 'C003', 'sn_currbal': 1.0},
+             {'sn_account': None, 'sn_currbal': 0.0}, {'sn_account': 'B002', 'sn_currbal': 5.0}]
+    result = diff_rows(before, after, 'sn_account', compare='value', strip_key=True,
+                       fields='after', include_added=False, include_deleted=False)
+    assert result.added == [] and result.deleted == []
+    assert result.modified == [('A001', {'sn_currbal': (10.0, 12.5)}, after[0])]
+
+
+def test_diff_snapshots_parallel_output():
+    pytest.importorskip('fastapi')
+    from apps.transaction_snapshot.api.routes import diff_snapshots
+
+    def table(rows, checksum):
+        return {'row_count': len(rows), 'checksum': checksum, 'rows': rows}
+
+    before_rows = [_ntran(n) for n in range(1, 6)]
+    after_rows = [dict(r) for r in before_rows]
+    after_rows[1]['nt_ref'] = 'CHANGED'
+    before = {'databases': {'CO': {
+        'ntran': table(before_rows, 1), 'nacnt': table([{'na_acnt': 'N1', 'na_ytddr': 0.0}], 2),
+        'zlock': table([], 0),
+    }}}
+    after = {'databases': {'CO': {
+        'ntran': table(after_rows, 9), 'nacnt': table([{'na_acnt': 'N1', 'na_ytddr': 10.0}], 3),
+        'zlock': table([], 0),
+    }}}
+
+    diff = diff_snapshots(before, after, max_workers=4)
+    assert diff['tables_checked'] == 3
+    assert diff['tables_changed'] == 2
+    assert [c['table'] for c in diff['changes']] == ['nacnt', 'ntran']
+    nacnt, ntran = diff['changes']
+    assert nacnt['modified_rows'] == [{'pk': 'N1', 'pk_column': 'na_acnt',
+                                       'changes': {'na_ytddr': {'before': 0.0, 'after': 10.0}}}]
+    assert ntran['modified_rows'] == [{'pk': '2.0', 'pk_column': 'id',
+                                       'changes': {'nt_ref': {'before': 'REF2', 'after': 'CHANGED'}}}]
+    assert ntran['modified_fields'] == ['nt_ref']
@@ -0,0 +1,137 @@
+"""
+Tests for sql_rag/snapshot_store.py
+
+Verifies:
+  1. Snapshots round-trip ('tables' and 'databases' layouts, rows/records, None rows, errors)
+  2. Table rows are only read from disk when accessed
+  3. Identical tables are recognised by digest without loading rows
+  4. Legacy JSON snapshots still load
+  5. dataframe_rows() gives result rows the values DataFrame rows had
+"""
+
+import json
+from contextlib import nullcontext
+from datetime import date, datetime
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from sql_rag import snapshot_store
+from sql_rag.snapshot_store import SnapshotFile, dataframe_rows, load_snapshot, same_rows, save_snapshot
+
+
+def _transaction_snapshot(amount=10.0):
+    return {
+        'timestamp': '2026-03-01T09:00:00',
+        'source': 'opera_se',
+        'databases': {
+            'CO': {
+                'stran': {'row_count': 2, 'checksum': 123, 'rows': [
+                    {'id': 1.0, 'st_account': 'A001', 'st_trvalue': amount, 'st_trdate': '2026-03-01'},
+                    {'id': 2.0, 'st_account': 'B002', 'st_trvalue': -5.5, 'st_trdate': None},
+                ]},
+                'zaudit': {'row_count': 900000, 'checksum': 456, 'rows': None},
+                'empty': {'row_count': 0, 'checksum': 0, 'rows': []},
+            },
+            'Opera3SESystem': {},
+        },
+    }
+
+
+def test_round_trip_databases_layout(tmp_path):
+    original = _transaction_snapshot()
+    path = save_snapshot(str(tmp_path / 'before.snap'), original)
+
+    loaded = load_snapshot(path)
+    assert loaded['timestamp'] == original['timestamp']
+    assert loaded['databases']['Opera3SESystem'] == {}
+    for table, entry in original['databases']['CO'].items():
+        assert loaded['databases']['CO'][table].get('rows') == entry['rows']
+        assert loaded['databases']['CO'][table]['checksum'] == entry['checksum']
+
+
+def test_round_trip_tables_layout(tmp_path):
+    original = {
+        'name': 'before',
+        'timestamp': '2026-03-01T09:00:00',
+        'tables': {
+            'aentry': {'columns': ['ae_entry'], 'records': [{'ae_entry': 'R200000001'}], 'count': 1},
+            'missing': {'error': 'Invalid object name'},
+        },
+    }
+    loaded = load_snapshot(save_snapshot(str(tmp_path / 'before.snap'), original))
+    assert loaded['tables']['aentry'].get('records', []) == original['tables']['aentry']['records']
+    assert 'error' in loaded['tables']['missing']
+    assert 'records' not in loaded['tables']['missing']
+
+
+def test_rows_load_lazily(tmp_path, monkeypatch):
+    path = save_snapshot(str(tmp_path / 'before.snap'), _transaction_snapshot())
+    reads = []
+    original_read = SnapshotFile.read_rows
+    monkeypatch.setattr(SnapshotFile, 'read_rows', lambda self, key: reads.append(key) or original_read(self, key))
+
+    loaded = load_snapshot(path)
+    stran = loaded['databases']['CO']['stran']
+    assert stran['row_count'] == 2
+    assert reads == []
+    assert stran['rows'][0]['st_account'] == 'A001'
+    assert stran.get('rows')[1]['st_trvalue'] == -5.5
+    assert reads == ['CO/stran']
+
+
+def test_same_rows_by_digest(tmp_path):
+    a = load_snapshot(save_snapshot(str(tmp_path / 'a.snap'), _transaction_snapshot(10.0)))
+    b = load_snapshot(save_snapshot(str(tmp_path / 'b.snap'), _transaction_snapshot(10.0)))
+    c = load_snapshot(save_snapshot(str(tmp_path / 'c.snap'), _transaction_snapshot(11.0)))
+    assert same_rows(a['databases']['CO']['stran'], b['databases']['CO']['stran'])
+    assert not same_rows(a['databases']['CO']['stran'], c['databases']['CO']['stran'])
+    # Tables without stored rows and plain dicts are never assumed equal
+    assert not same_rows(a['databases']['CO']['zaudit'], b['databases']['CO']['zaudit'])
+    assert not same_rows({'rows': []}, {'rows': []})
+
+
+def test_legacy_json_snapshot(tmp_path):
+    path = tmp_path / 'snapshot_before.json'
+    path.write_text(json.dumps(_transaction_snapshot()))
+    assert not snapshot_store.is_snapshot_file(str(path))
+    assert load_snapshot(str(path)) == _transaction_snapshot()
+
+
+MIXED_COLUMNS = ['id', 'st_account', 'st_trvalue', 'st_paid', 'st_trdate', 'st_dueday',
+                 'st_crdate', 'st_hold', 'st_flag', 'st_memo', 'st_doc']
+MIXED_ROWS = [
+    (1, 'A001  ', Decimal('10.50'), None, datetime(2026, 3, 1), date(2026, 3, 31), None, True, True, 'x', b'\x01'),
+    (2, 'B002', Decimal('-5.00'), 3, datetime(2026, 3, 2, 9, 30), date(2026, 4, 30),
+     datetime(2026, 3, 2), False, None, None, None),
+]
+
+
+def _old_values(columns, rows):
+    """What execute_query(...).iterrows() gave, one value per column."""
+    # Text NULLs stayed None before pandas inferred a string dtype for text columns
+    infer_string = (pd.option_context('future.infer_string', False)
+                    if 'infer_string' in dir(pd.options.future) else nullcontext())
+    with infer_string:
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    return [tuple(row[col] for col in columns) for _, row in df.iterrows()]
+
+
+def _typed(rows):
+    return [[(type(v), str(v)) for v in row] for row in rows]
+
+
+@pytest.mark.parametrize('columns, rows', [
+    (MIXED_COLUMNS, MIXED_ROWS),
+    (['id', 'nt_period'], [(1, 3), (2, 4)]),
+    (['id', 'nt_value'], [(1, Decimal('1.25')), (2, None)]),
+    (['id', 'nt_value'], [(1, 2.5), (2, 3.0)]),
+    (['ae_reclnum', 'ae_value'], [(None, 1), (None, 2)]),
+    (['flag'], [(True,), (False,)]),
+    (['id', 'flag'], [(1, True), (2, False)]),
+    (['memo', 'amount'], [('x', Decimal('1.00')), ('y', 'n/a')]),
+])
+def test_dataframe_rows_match_dataframe_values(columns, rows):
+    assert _typed(dataframe_rows(columns, rows)) == _typed(_old_values(columns, rows))
+    assert dataframe_rows(columns, []) == []
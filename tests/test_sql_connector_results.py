@@ -0,0 +1,70 @@
+"""
+Tests for the SQLConnector result modes (rows, dicts, column batches)
+
+Runs against an in-memory SQLite engine.
+
+Verifies:
+  1. Rows come back as plain tuples with column names, NULL as None
+  2. Dicts match execute_query().to_dict('records') apart from NULL handling
+  3. Column batches are split by batch_size with numeric dtypes where possible
+  4. MSSQL READ UNCOMMITTED applies to get_connection() only; engine.begin()
+     transactions (postings) keep the engine default (checked with SQLite,
+     which has the same level)
+"""
+
+import pytest
+
+pytest.importorskip('pyodbc')
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from sql_rag.sql_connector import DatabaseType, SQLConnector
+
+
+@pytest.fixture
+def connector():
+    conn = object.__new__(SQLConnector)
+    conn.db_type = 'sqlite'
+    conn.engine = create_engine('sqlite://')
+    with conn.engine.begin() as c:
+        c.execute(text("CREATE TABLE t (id INTEGER, name TEXT, v REAL)"))
+        c.execute(text("INSERT INTO t VALUES (1, 'a', 1.5), (2, 'b', 2.5), (3, 'c', NULL)"))
+    return conn
+
+
+def test_rows_and_dicts(connector):
+    columns, rows = connector.execute_query_rows("SELECT * FROM t WHERE id >= :i ORDER BY id", {'i': 2})
+    assert columns == ['id', 'name', 'v']
+    assert rows == [(2, 'b', 2.5), (3, 'c', None)]
+    assert all(type(r) is tuple for r in rows)
+
+    dicts = connector.execute_query_dicts("SELECT * FROM t ORDER BY id")
+    records = connector.execute_query("SELECT * FROM t ORDER BY id").to_dict('records')
+    assert [d['name'] for d in dicts] == [r['name'] for r in records]
+    assert dicts[2]['v'] is None
+
+
+def test_column_batches(connector):
+    batches = list(connector.execute_query_batches("SELECT * FROM t ORDER BY id", batch_size=2))
+    assert [len(b['id']) for b in batches] == [2, 1]
+    assert batches[0]['id'].dtype.kind == 'i'
+    assert batches[0]['v'].dtype.kind == 'f'
+    assert list(batches[0]['name']) == ['a', 'b']
+    assert batches[1]['v'].dtype == object
+
+
+def test_read_uncommitted_only_on_read_connections(tmp_path):
+    conn = object.__new__(SQLConnector)
+    conn.db_type = DatabaseType.MSSQL
+    conn.engine = create_engine(f"sqlite:///{tmp_path / 'iso.db'}", poolclass=QueuePool,
+                                pool_size=1, max_overflow=0)
+    with conn.engine.connect() as c:
+        default_level = c.get_isolation_level()
+    assert default_level != 'READ UNCOMMITTED'
+
+    with conn.get_connection() as c:
+        assert c.get_isolation_level() == 'READ UNCOMMITTED'
+    # The pooled connection goes back to the engine default for postings
+    with conn.engine.begin() as c:
+        assert c.get_isolation_level() == default_level
@@ -0,0 +1,81 @@
+"""
+Tests for sql_rag/sql_statements.py
+
+Verifies:
+  1. Registration is idempotent and rejects a name reused with different SQL
+  2. Calls, rows and errors are recorded per statement
+  3. Named parameters are rewritten for pyodbc and IN lists are padded to fixed sizes
+"""
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sql_rag.sql_statements import IN_LIST_SIZES, StatementRegistry, in_params
+
+
+class FakeResult:
+    rowcount = 1
+
+    def scalar(self):
+        return 42
+
+
+class FakeConn:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def execute(self, clause, params):
+        if self.fail:
+            raise RuntimeError('boom')
+        self.calls.append((clause, params))
+        return FakeResult()
+
+
+class FakeCursor:
+    description = [('id',), ('name',)]
+
+    def execute(self, sql, params):
+        self.sql, self.params = sql, params
+
+    def fetchall(self):
+        return [(1, 'a'), (2, 'b')]
+
+
+def test_register_and_stats():
+    registry = StatementRegistry()
+    stmt = registry.register('nextid', 'SELECT nextid FROM nextid WHERE tablename = :t')
+    assert registry.register('nextid', 'SELECT nextid FROM nextid WHERE tablename = :t') is stmt
+    with pytest.raises(ValueError):
+        registry.register('nextid', 'SELECT 1')
+
+    conn = FakeConn()
+    assert stmt.execute(conn, {'t': 'atran'}).scalar() == 42
+    assert stmt.execute(conn, {'t': 'ntran'}).scalar() == 42
+    # The same compiled clause is reused for every call
+    assert conn.calls[0][0] is conn.calls[1][0]
+
+    with pytest.raises(RuntimeError):
+        stmt.execute(FakeConn(fail=True), {'t': 'x'})
+
+    [stats] = registry.stats()
+    assert stats['name'] == 'nextid'
+    assert (stats['calls'], stats['errors'], stats['rows']) == (3, 1, 2)
+
+
+def test_qmark_and_in_params():
+    registry = StatementRegistry()
+    stmt = registry.register('q', "SELECT id, name FROM t WHERE a = :a AND b = ':lit' AND c IN (:a, :c)")
+    cursor = FakeCursor()
+    rows = stmt.fetch_dicts(cursor, {'a': 1, 'c': 3})
+    assert cursor.sql == "SELECT id, name FROM t WHERE a = ? AND b = ':lit' AND c IN (?, ?)"
+    assert cursor.params == [1, 1, 3]
+    assert rows == [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]
+
+    [(placeholders, params)] = in_params('k', ['A', 'B', 'C'])
+    assert placeholders == ':k0, :k1, :k2, :k3'
+    assert params == {'k0': 'A', 'k1': 'B', 'k2': 'C', 'k3': 'C'}
+
+    chunks = in_params('k', range(IN_LIST_SIZES[-1] + 5))
+    assert [len(p) for _, p in chunks] == [IN_LIST_SIZES[-1], 16]
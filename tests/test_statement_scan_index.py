@@ -0,0 +1,117 @@
+"""
+Tests for sql_rag/statement_scan_index.py
+
+Verifies:
+  1. New files are hashed and probed; repeat scans only stat them
+  2. Files already in the extraction cache are not probed
+  3. A changed file (size/mtime) is re-hashed and re-probed
+  4. Corrected extraction cache entries win over the indexed header info
+  5. Without header info (no balance validation) files are only stat()ed
+"""
+
+import os
+
+import pytest
+
+from sql_rag.pdf_extraction_cache import PDFExtractionCache
+from sql_rag.statement_scan_index import StatementScanIndex
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PDFExtractionCache(str(tmp_path / 'cache.db'))
+
+
+def _write_pdf(folder, name, content):
+    path = folder / name
+    path.write_bytes(content)
+    return path
+
+
+class Probe:
+    """Stand-in for extract_statement_info_only that records calls."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(os.path.basename(path))
+        pdf_hash = self.cache.hash_pdf(open(path, 'rb').read())
+        info = {'opening_balance': 100.0, 'closing_balance': 150.0, 'sort_code': '20-12-34', '_info_only': True}
+        self.cache.put(pdf_hash, info, [])
+        return info
+
+
+def test_repeat_scan_only_stats(cache, tmp_path, monkeypatch):
+    files = [_write_pdf(tmp_path, f's{n}.pdf', b'%PDF statement ' + bytes([n])) for n in range(5)]
+    probe = Probe(cache)
+    index = StatementScanIndex(cache)
+
+    first = index.scan(files, probe=probe, max_workers=3)
+    assert sorted(probe.calls) == [f's{n}.pdf' for n in range(5)]
+    assert all(e.info['closing_balance'] == 150.0 for e in first.values())
+    assert not any(e.from_index for e in first.values())
+
+    # Second scan must not read any file contents
+    def no_read(self):
+        raise AssertionError(f"{self} was read")
+    monkeypatch.setattr(type(files[0]), 'read_bytes', no_read)
+    second = StatementScanIndex(cache).scan(files, probe=probe)
+    assert len(probe.calls) == 5
+    assert all(e.from_index for e in second.values())
+    assert {e.pdf_hash for e in second.values()} == {e.pdf_hash for e in first.values()}
+
+
+def test_cached_files_are_not_probed(cache, tmp_path):
+    path = _write_pdf(tmp_path, 'known.pdf', b'%PDF known')
+    cache.put(cache.hash_pdf(path.read_bytes()), {'opening_balance': 1.0, 'closing_balance': 2.0}, [])
+    probe = Probe(cache)
+
+    entry = StatementScanIndex(cache).scan([path], probe=probe)[str(path)]
+    assert probe.calls == []
+    assert entry.info['closing_balance'] == 2.0
+
+
+def test_changed_file_is_reprobed(cache, tmp_path):
+    path = _write_pdf(tmp_path, 'stmt.pdf', b'%PDF v1')
+    probe = Probe(cache)
+    index = StatementScanIndex(cache)
+    old_hash = index.scan([path], probe=probe)[str(path)].pdf_hash
+
+    path.write_bytes(b'%PDF version two')
+    entry = index.scan([path], probe=probe)[str(path)]
+    assert probe.calls == ['stmt.pdf', 'stmt.pdf']
+    assert entry.pdf_hash != old_hash
+    assert not entry.from_index
+
+
+def test_corrected_cache_entry_wins(cache, tmp_path):
+    path = _write_pdf(tmp_path, 'stmt.pdf', b'%PDF v1')
+    index = StatementScanIndex(cache)
+    pdf_hash = index.scan([path], probe=Probe(cache))[str(path)].pdf_hash
+
+    cache.put(pdf_hash, {'opening_balance': 100.0, 'closing_balance': 175.0}, [{'amount': 75.0}])
+    entry = index.scan([path])[str(path)]
+    assert entry.from_index
+    assert entry.info['closing_balance'] == 175.0
+
+
+def test_uncached_file_without_probe_has_no_info(cache, tmp_path):
+    path = _write_pdf(tmp_path, 'new.pdf', b'%PDF new')
+    entry = StatementScanIndex(cache).scan([path])[str(path)]
+    assert entry.info is None
+    assert entry.pdf_hash == cache.hash_pdf(b'%PDF new')
+
+
+def test_without_info_files_are_only_statted(cache, tmp_path, monkeypatch):
+    path = _write_pdf(tmp_path, 'new.pdf', b'%PDF new')
+    probe = Probe(cache)
+
+    def no_read(self):
+        raise AssertionError(f"{self} was read")
+    monkeypatch.setattr(type(path), 'read_bytes', no_read)
+    entry = StatementScanIndex(cache).scan([path], probe=probe, with_info=False)[str(path)]
+
+    assert entry.file_size == len(b'%PDF new') and entry.mtime == path.stat().st_mtime
+    assert entry.pdf_hash is None and entry.info is None and probe.calls == []
@@ -0,0 +1,136 @@
+"""
+Tests for sql_rag/statement_text_layer.py
+
+Verifies:
+  1. A brought-forward statement parses, with money in/out worked out from the running balance
+  2. Rows without their own balance are resolved against the next balance
+  3. Newest-first statements with signed amounts are returned oldest first
+  4. Statements that don't chain to the closing balance are rejected (LLM fallback)
+  5. Statements without running balances are rejected
+  6. extract_and_cache stores only validated results, as the text-layer model
+"""
+
+from sql_rag import statement_text_layer
+from sql_rag.statement_text_layer import TEXT_LAYER_MODEL, extract_and_cache, parse_statement_pages
+
+
+def _calculate_opening(transactions, closing_balance, info_data):
+    """Stand-in for StatementReconciler._calculate_opening_balance (reverse the first movement)."""
+    first = next(t for t in transactions if t['balance'] is not None)
+    return round(first['balance'] + (first['money_out'] or 0) - (first['money_in'] or 0), 2)
+
+
+BROUGHT_FORWARD_PAGES = [
+    """Barclays Bank UK PLC
+Business Current Account
+Sort Code 20-12-34  Account Number 12345678
+Statement 1 Mar 2024 to 31 Mar 2024
+Date Description Money out Money in Balance
+01 Mar Balance brought forward 5,000.00
+04 Mar DD BRITISH GAS 120.50 4,879.50
+BGC ACME LTD INV 1001 1,000.00 5,879.50
+05 Mar CARD PAYMENT TESCO 10.00
+CARD PAYMENT SHELL 10.00
+FPI JONES 25.00 5,884.50
+""",
+    """Page 2
+Date Description Money out Money in Balance
+28 Mar STO RENT 500.00 5,384.50
+28 Mar Balance carried forward 5,384.50
+""",
+]
+
+
+def test_brought_forward_statement():
+    info, txns = parse_statement_pages(BROUGHT_FORWARD_PAGES, _calculate_opening)
+
+    assert info['bank_name'] == 'Barclays'
+    assert info['sort_code'] == '20-12-34'
+    assert info['account_number'] == '12345678'
+    assert info['period_start'] == '2024-03-01'
+    assert info['period_end'] == '2024-03-31'
+    assert info['opening_balance'] == 5000.00
+    assert info['closing_balance'] == 5384.50
+
+    assert [t['description'] for t in txns] == [
+        'DD BRITISH GAS', 'BGC ACME LTD INV 1001', 'CARD PAYMENT TESCO',
+        'CARD PAYMENT SHELL', 'FPI JONES', 'STO RENT',
+    ]
+    assert txns[0]['money_out'] == 120.50 and txns[0]['money_in'] is None
+    assert txns[1]['money_in'] == 1000.00 and txns[1]['money_out'] is None
+    assert txns[0]['date'] == '2024-03-04'
+    assert txns[0]['type'] == 'DD'
+
+
+def test_rows_without_balance_resolved_by_next_balance():
+    _, txns = parse_statement_pages(BROUGHT_FORWARD_PAGES, _calculate_opening)
+    tesco, shell, jones = txns[2], txns[3], txns[4]
+    assert tesco['money_out'] == 10.00 and tesco['balance'] is None
+    assert shell['money_out'] == 10.00 and shell['balance'] is None
+    assert jones['money_in'] == 25.00 and jones['balance'] == 5884.50
+
+
+def test_newest_first_signed_amounts():
+    pages = ["""Transactions from 23-MAR-2026 to 25-MAR-2026
+Account name Account number Sort code
+ACME LTD 41638069 60-50-06
+Date Type Transaction details Debit Credit Balance
+Closing balance 850.00
+25-Mar-2026 D/D NPOWER, A0010545383001 -100.00 850.00
+24-Mar-2026 EBP BUNZL HEALTHCARE, SUPPLIER -50.00 950.00
+XDD00724BAF7IVVXVE
+23-Mar-2026 IBP INV.NO.13253 1,000.00 1,000.00
+Opening balance 0.00
+Totals -150.00 1,000.00
+"""]
+    info, txns = parse_statement_pages(pages, _calculate_opening)
+
+    assert info['account_number'] == '41638069'
+    assert info['opening_balance'] == 0.00
+    assert info['closing_balance'] == 850.00
+    assert [t['date'] for t in txns] == ['2026-03-23', '2026-03-24', '2026-03-25']
+    assert txns[0]['money_in'] == 1000.00
+    assert txns[2]['money_out'] == 100.00
+
+
+def test_broken_chain_is_rejected():
+    pages = ["""Statement 1 Mar 2024 to 31 Mar 2024
+01 Mar Balance brought forward 5,000.00
+04 Mar DD BRITISH GAS 120.50 4,879.50
+05 Mar BGC ACME LTD 1,000.00 5,000.00
+"""]
+    assert parse_statement_pages(pages, _calculate_opening) is None
+
+
+def test_statement_without_running_balance_is_rejected():
+    pages = ["""Statement for account 54-99-45 99997005 from 27/02/2026 to 27/02/2026
+CLOSING BALANCE 136,224.28
+27/02/2026 XEJ007HVBB2644J09K D/D 36.16
+27/02/2026 G&WCT STAFFORDSHIR EBP 2,160.00
+"""]
+    assert parse_statement_pages(pages, _calculate_opening) is None
+
+
+class FakeCache:
+    def __init__(self):
+        self.stored = {}
+
+    def put(self, pdf_hash, info_data, raw_transactions, model_name=None, file_size=None):
+        self.stored[pdf_hash] = (len(raw_transactions), model_name, file_size)
+
+
+def test_extract_and_cache_stores_validated_result(monkeypatch):
+    cache = FakeCache()
+    monkeypatch.setattr(statement_text_layer, 'extract_pdf_text', lambda pdf_bytes: BROUGHT_FORWARD_PAGES)
+    result = extract_and_cache(b'%PDF-1', _calculate_opening, cache, 'abc123', 'march.pdf')
+
+    assert result is not None
+    assert cache.stored == {'abc123': (len(result[1]), TEXT_LAYER_MODEL, 6)}
+
+    monkeypatch.setattr(statement_text_layer, 'extract_pdf_text', lambda pdf_bytes: ["""Statement 1 Mar 2024 to 31 Mar 2024
+01 Mar Balance brought forward 5,000.00
+04 Mar DD BRITISH GAS 120.50 4,879.50
+05 Mar BGC ACME LTD 1,000.00 5,000.00
+"""])
+    assert extract_and_cache(b'%PDF-2', _calculate_opening, cache, 'def456') is None
+    assert list(cache.stored) == ['abc123']
@@ -0,0 +1,221 @@
+"""
+Tests for two-phase (checksum-first) Opera SE transaction snapshots
+
+Runs take_checksum_snapshot_se / complete_checksum_snapshot_se against an
+in-memory stand-in for SQL Server that, like the real thing, rejects
+CHECKSUM(*) on tables with text/ntext/image/xml columns.
+
+Verifies:
+  1. A keyed table with a text column is checksummed through its explicit
+     column list, and an in-place edit is found
+  2. A table that can't be checksummed at all (unkeyed, image column) is
+     compared row by row, so an edit is found and an untouched one is not
+  3. The /before endpoint only keeps a database snapshot when asked for
+     checksum mode, and a failing /after still drops it
+"""
+
+import asyncio
+import copy
+import inspect
+import re
+import zlib
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('fastapi')
+
+from fastapi import HTTPException  # noqa: E402
+
+from apps.transaction_snapshot.api import routes  # noqa: E402
+
+NONCOMPARABLE = {'text', 'ntext', 'image', 'xml'}
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def execution_options(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement):
+        sql = str(statement)
+        created = re.search(r'CREATE DATABASE \[(\w+)\] .* AS SNAPSHOT OF \[(\w+)\]', sql)
+        if created:
+            self.server.databases[created.group(1)] = copy.deepcopy(self.server.databases[created.group(2)])
+        dropped = re.match(r"IF DB_ID\('(\w+)'\) IS NOT NULL DROP DATABASE", sql)
+        if dropped:
+            self.server.databases.pop(dropped.group(1), None)
+
+
+class FakeEngine:
+    def __init__(self, server):
+        self.server = server
+
+    def connect(self):
+        return FakeConnection(self.server)
+
+
+class FakeSQLServer:
+    """
+    {database: {table: {'columns': [(name, type)], 'rows': [tuple]}}}.
+    Tables in `hash_fails` also reject HASHBYTES (e.g. values over 8000
+    bytes before SQL Server 2016).
+    """
+
+    def __init__(self, databases, hash_fails=()):
+        self.databases = databases
+        self.hash_fails = set(hash_fails)
+        self.engine = FakeEngine(self)
+        self.queries = []
+
+    def _table(self, sql):
+        db, table = re.search(r'FROM \[(\w+)\]\.dbo\.\[(\w+)\]', sql).groups()
+        return table, self.databases[db][table]
+
+    def execute_query(self, sql):
+        self.queries.append(sql)
+        if 'DB_NAME()' in sql:
+            return pd.DataFrame({'db_name': ['CO']})
+        db = (re.search(r'\[(\w+)\]\.(?:sys|INFORMATION_SCHEMA|dbo)', sql) or [None, None])[1]
+        if db not in self.databases:
+            raise RuntimeError(f'Database {db} does not exist')
+        tables = self.databases[db]
+        if 'sys.database_files' in sql:
+            return pd.DataFrame({'name': [db], 'physical_name': [f'/data/{db}.mdf']})
+        if "COLUMN_NAME = 'id'" in sql:
+            return pd.DataFrame({'TABLE_NAME': [t for t, spec in tables.items()
+                                                if ('id', 'int') in spec['columns']]})
+        if 'ORDINAL_POSITION' in sql:
+            data = [(t, name, dtype) for t, spec in tables.items()
+                    if any(dt in NONCOMPARABLE for _, dt in spec['columns'])
+                    for name, dtype in spec['columns']]
+            return pd.DataFrame(data, columns=['TABLE_NAME', 'COLUMN_NAME', 'DATA_TYPE'])
+        if 'sys.partitions' in sql:
+            return pd.DataFrame([(t, len(spec['rows'])) for t, spec in sorted(tables.items())],
+                                columns=['TABLE_NAME', 'row_count'])
+        if 'CHECKSUM_AGG' in sql:
+            return self._checksum(sql)
+        raise AssertionError(f'Unexpected query: {sql}')
+
+    def _checksum(self, sql):
+        table, spec = self._table(sql)
+        if 'CHECKSUM(*)' in sql and any(dt in NONCOMPARABLE for _, dt in spec['columns']):
+            raise RuntimeError('The text, ntext, or image data type cannot be used in CHECKSUM')
+        if 'HASHBYTES' in sql and table in self.hash_fails:
+            raise RuntimeError('String or binary data would be truncated')
+
+        def row_checksum(row):
+            return zlib.crc32(repr(row).encode())
+
+        if 'GROUP BY' in sql:
+            buckets = {}
+            for row in spec['rows']:
+                chk, max_id = buckets.get(row[0] // routes.CHECKSUM_RANGE_SIZE, (0, row[0]))
+                buckets[row[0] // routes.CHECKSUM_RANGE_SIZE] = (chk ^ row_checksum(row), max(max_id, row[0]))
+            return pd.DataFrame([(b, chk, m) for b, (chk, m) in buckets.items()],
+                                columns=['bucket', 'chk', 'max_id'])
+        chk = 0
+        for row in spec['rows']:
+            chk ^= row_checksum(row)
+        return pd.DataFrame({'chk': [chk]})
+
+    def execute_query_rows(self, sql):
+        self.queries.append(sql)
+        _, spec = self._table(sql)
+        rows = spec['rows']
+        buckets = re.search(r'IN \(([\d, ]+)\)', sql)
+        if buckets:
+            wanted = {int(b) for b in buckets.group(1).split(',')}
+            rows = [r for r in rows if r[0] // routes.CHECKSUM_RANGE_SIZE in wanted]
+        return [name for name, _ in spec['columns']], list(rows)
+
+
+def _server(**kwargs):
+    return FakeSQLServer({'CO': {
+        'atran': {'columns': [('id', 'int'), ('at_value', 'decimal'), ('at_memo', 'text')],
+                  'rows': [(i, 10.0 * i, f'memo {i}') for i in range(1, 2500)]},
+        'docs': {'columns': [('doc_ref', 'char'), ('doc_image', 'image')],
+                 'rows': [('D1', b'\x01\x02'), ('D2', b'\x03')]},
+        'logos': {'columns': [('logo_ref', 'char'), ('logo_image', 'image')],
+                  'rows': [('L1', b'\x09')]},
+    }}, **kwargs)
+
+
+def _run(server, change):
+    before = routes.take_checksum_snapshot_se(server)
+    assert before['retained'] == {'CO': 'CO_txsnap'}
+    change(server.databases['CO'])
+    before_full, after_full = routes.complete_checksum_snapshot_se(server, before)
+    diff = routes.diff_snapshots(before_full, after_full)
+    return before, {c['table']: c for c in diff['changes']}
+
+
+def _edit(tables):
+    rows = tables['atran']['rows']
+    rows[1499] = (1500, 15000.0, 'memo changed')
+    tables['docs']['rows'][1] = ('D2', b'\x04')
+
+
+def test_text_column_checksummed_by_column_list():
+    server = _server()
+    before, changes = _run(server, _edit)
+
+    atran = before['databases']['CO']['atran']
+    assert atran['key'] == 'id' and len(atran['ranges']) == 3
+    assert any('HASHBYTES' in q and '[at_memo]' in q for q in server.queries)
+    [modified] = changes['atran']['modified_rows']
+    assert modified['changes']['at_memo'] == {'before': 'memo 1500', 'after': 'memo changed'}
+    # Only the changed id block was read back
+    assert sum(1 for q in server.queries if 'SELECT *' in q and '[atran]' in q and 'IN (1)' in q) == 2
+    assert not any('SELECT *' in q and '[atran]' in q and 'IN (' not in q for q in server.queries)
+
+
+def test_unchecksummable_table_compared_by_rows():
+    server = _server(hash_fails={'docs', 'logos'})
+    before, changes = _run(server, _edit)
+
+    assert before['databases']['CO']['docs']['checksum'] is None
+    assert set(changes) == {'atran', 'docs'}
+    docs = changes['docs']
+    assert docs['before_rows'] == docs['after_rows'] == 2
+    assert len(docs['modified_rows']) == 1 and not docs['added_rows'] and not docs['deleted_rows']
+
+
+def _before(**kwargs):
+    return asyncio.run(routes.take_before_snapshot(None, module='cashbook', name='Receipt',
+                                                   description='', **kwargs))
+
+
+def test_failed_after_drops_database_snapshot(tmp_path, monkeypatch):
+    server = _server()
+    monkeypatch.setattr(routes, '_get_snapshot_path', lambda: str(tmp_path))
+    monkeypatch.setattr(routes, '_get_request_sql_connector', lambda request=None: server)
+    monkeypatch.setattr(routes, 'take_snapshot_se', lambda sql: {
+        'timestamp': 'now', 'source': 'opera_se', 'databases': {}})
+
+    # Full mode is the default and creates no database snapshot
+    assert inspect.signature(routes.take_before_snapshot).parameters['mode'].default.default == 'full'
+    _before(mode='full')
+    assert set(server.databases) == {'CO'}
+
+    _before(mode='checksum')
+    assert set(server.databases) == {'CO', 'CO_txsnap'}
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('diff failed')
+
+    monkeypatch.setattr(routes, 'diff_snapshots', fail)
+    with pytest.raises(HTTPException, match='diff failed'):
+        asyncio.run(routes.take_after_snapshot(None))
+
+    assert set(server.databases) == {'CO'}
+    # The pending snapshot can't be completed without its copy, so it is gone too
+    assert not any(tmp_path.iterdir())